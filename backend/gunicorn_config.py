@@ -70,6 +70,9 @@ def pre_fork(server, worker):
 def post_fork(server, worker):
     """Called just after a worker has been forked."""
     server.log.info(f"🚀 Worker {worker.pid} forked successfully")
+    # Threads started while preloading the app do not survive the fork
+    from utils.background_workers import start_background_workers
+    start_background_workers()
 
 def pre_exec(server):
     """Called just before a new master process is forked."""
@@ -11,6 +11,7 @@ from flask_jwt_extended import JWTManager
 from flask_cors import CORS
 from dotenv import load_dotenv
 from scheduler import schedule_daily_notifications
+from utils.background_workers import running_under_gunicorn, start_background_workers
 from config.aws_config import init_aws
 from connection_monitor import start_connection_monitoring, stop_connection_monitoring, get_connection_health
 # Push service removed - will be reimplemented
@@ -497,6 +498,15 @@ def create_app():
 
     # Initialize the scheduler for daily notifications
     schedule_daily_notifications(app)
+
+    # Per-process background threads (exam surge refresher, outbox consumer, ...): never in a gunicorn
+    # master, whose threads would not survive the fork into the workers
+    if running_under_gunicorn():
+        app.before_request(start_background_workers)
+        print("✅ Background workers start in each gunicorn worker")
+    else:
+        start_background_workers()
+        print("✅ Background workers started")
     
     # Initialize Smart Worker Manager (must be done early for Gunicorn compatibility)
     print("🔧 Initializing Smart Worker Manager...")
@@ -606,7 +616,10 @@ def add_dev_routes(app):
         except Exception as e:
             return {'success': False, 'error': str(e)}
 
-app, socketio = create_app()
+# Process pool children started with spawn (e.g. question parsing) re-import this script as
+# __mp_main__; they must not build the app or start its background threads
+if __name__ != "__mp_main__":
+    app, socketio = create_app()
 
 if __name__ == "__main__":
     import platform
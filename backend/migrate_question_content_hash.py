@@ -0,0 +1,83 @@
+"""
+Migration script to backfill content_hash on existing question_bank documents
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from config.database import DatabaseConfig
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+import logging
+
+from utils.question_fingerprint import CONTENT_HASH_FIELD, create_content_hash_index, document_content_hash
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 1000
+
+
+def _write(collection, operations):
+    """Apply a batch; returns (hashed, duplicates)"""
+    try:
+        result = collection.bulk_write(operations, ordered=False)
+        return result.modified_count, 0
+    except BulkWriteError as e:
+        duplicates = sum(1 for error in e.details.get('writeErrors', []) if error.get('code') == 11000)
+        others = len(e.details.get('writeErrors', [])) - duplicates
+        if others:
+            logger.error(f"❌ {others} updates failed: {e.details['writeErrors'][0].get('errmsg')}")
+        return e.details.get('nModified', 0), duplicates
+
+
+def migrate_question_content_hash():
+    """
+    Hash every question_bank document that has question text and no content_hash yet.
+    Oldest first: when a module/level holds the same question more than once, the first
+    copy gets the hash and the later copies are left unhashed (and reported).
+    Safe to re-run, e.g. for questions stored by upload paths that don't set the hash.
+    """
+
+    logger.info("🚀 Starting Question Bank Content Hash Backfill")
+    logger.info("=" * 60)
+
+    mongo_db = DatabaseConfig.get_database()
+    question_bank = mongo_db.question_bank
+    create_content_hash_index(question_bank)
+
+    cursor = question_bank.find(
+        {CONTENT_HASH_FIELD: {'$exists': False}, 'question': {'$nin': [None, '']}},
+        {'question': 1, 'topic_id': 1}
+    ).sort('_id', 1)
+
+    scanned = hashed = duplicates = 0
+    operations = []
+    for doc in cursor:
+        scanned += 1
+        content_hash = document_content_hash(doc)
+        if not content_hash:
+            continue
+        operations.append(UpdateOne({'_id': doc['_id']}, {'$set': {CONTENT_HASH_FIELD: content_hash}}))
+        if len(operations) >= BATCH_SIZE:
+            written, skipped = _write(question_bank, operations)
+            hashed += written
+            duplicates += skipped
+            operations = []
+            logger.info(f"📊 Scanned {scanned} questions")
+    if operations:
+        written, skipped = _write(question_bank, operations)
+        hashed += written
+        duplicates += skipped
+
+    logger.info("\n" + "=" * 60)
+    logger.info(f"✅ Questions scanned: {scanned}")
+    logger.info(f"🔑 Hashes stored: {hashed}")
+    logger.info(f"⚠️ Duplicates left unhashed: {duplicates}")
+    return {'scanned': scanned, 'hashed': hashed, 'duplicates': duplicates}
+
+
+if __name__ == "__main__":
+    migrate_question_content_hash()
@@ -0,0 +1,121 @@
+"""
+Migration script to backfill student_test_summary from existing attempts
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from config.database import DatabaseConfig
+from bson import ObjectId
+from datetime import datetime
+from pymongo import UpdateOne
+import logging
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 1000
+
+
+def _number(value):
+    """Unwrap the extended-JSON number dicts some result documents were stored with"""
+    if isinstance(value, dict):
+        for key in ('$numberDouble', '$numberInt', '$numberLong', 'numberDouble', 'numberInt'):
+            if key in value:
+                value = value[key]
+                break
+    try:
+        return float(value or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _score_percentage(attempt):
+    """Same rule the student test listing used: score_percentage, then average_score (0-1), then percentage"""
+    score = _number(attempt.get('score_percentage'))
+    if score == 0:
+        average = _number(attempt.get('average_score'))
+        if 0 < average <= 1:
+            score = average * 100
+        elif average > 1:
+            score = average
+    if score == 0:
+        score = _number(attempt.get('percentage'))
+    return score
+
+
+def _as_object_id(value):
+    if isinstance(value, ObjectId):
+        return value
+    if value is not None and ObjectId.is_valid(str(value)):
+        return ObjectId(str(value))
+    return None
+
+
+def migrate_student_test_summary():
+    """Aggregate completed attempts into one summary document per (student, test)"""
+
+    logger.info("🚀 Starting Student Test Summary Backfill")
+    logger.info("=" * 60)
+
+    mongo_db = DatabaseConfig.get_database()
+    mongo_db.student_test_summary.create_index([("student_id", 1), ("test_id", 1)], unique=True)
+
+    # (student_id, test_id) -> per-collection counts, best score and latest attempt
+    summaries = {}
+    sources = [
+        ('student_test_attempts', {'status': 'completed'}),
+        ('test_results', {}),
+    ]
+    for collection_name, query in sources:
+        count = 0
+        for attempt in mongo_db[collection_name].find(query):
+            student_id = _as_object_id(attempt.get('user_id') or attempt.get('student_id'))
+            test_id = _as_object_id(attempt.get('test_id'))
+            if not student_id or not test_id:
+                continue
+            entry = summaries.setdefault((student_id, test_id), {
+                'counts': {}, 'best_score': 0.0, 'last_attempt_id': None, 'last_attempt_at': None
+            })
+            entry['counts'][collection_name] = entry['counts'].get(collection_name, 0) + 1
+            entry['best_score'] = max(entry['best_score'], _score_percentage(attempt))
+            submitted_at = attempt.get('submitted_at') or attempt.get('end_time')
+            if isinstance(submitted_at, datetime) and (
+                entry['last_attempt_at'] is None or submitted_at > entry['last_attempt_at']
+            ):
+                entry['last_attempt_at'] = submitted_at
+                entry['last_attempt_id'] = attempt['_id']
+            count += 1
+        logger.info(f"📊 Scanned {count} documents in {collection_name}")
+
+    operations = []
+    written = 0
+    for (student_id, test_id), entry in summaries.items():
+        # Most submissions were stored in both collections; count them once
+        operations.append(UpdateOne(
+            {'student_id': student_id, 'test_id': test_id},
+            {'$set': {
+                'attempt_count': max(entry['counts'].values()),
+                'best_score': entry['best_score'],
+                'last_attempt_id': entry['last_attempt_id'],
+                'last_attempt_at': entry['last_attempt_at'],
+                'updated_at': datetime.utcnow()
+            }},
+            upsert=True
+        ))
+        if len(operations) >= BATCH_SIZE:
+            written += mongo_db.student_test_summary.bulk_write(operations, ordered=False).upserted_count
+            operations = []
+    if operations:
+        written += mongo_db.student_test_summary.bulk_write(operations, ordered=False).upserted_count
+
+    logger.info("\n" + "=" * 60)
+    logger.info(f"✅ Summaries computed: {len(summaries)}")
+    logger.info(f"🆕 New summary documents: {written}")
+    return {'summaries': len(summaries), 'inserted': written}
+
+
+if __name__ == "__main__":
+    migrate_student_test_summary()
@@ -6,9 +6,9 @@ class NotificationPreferences:
     """Model for managing user notification preferences"""
     
     @staticmethod
-    def create_default_preferences(user_id):
-        """Create default notification preferences for a new user"""
-        default_prefs = {
+    def default_preferences_document(user_id):
+        """Default notification preferences document for a new user"""
+        return {
             'user_id': ObjectId(user_id) if isinstance(user_id, str) else user_id,
             'push_notifications': {
                 'enabled': True,
@@ -71,10 +71,23 @@ class NotificationPreferences:
             'created_at': datetime.utcnow(),
             'updated_at': datetime.utcnow()
         }
-        
+
+    @staticmethod
+    def create_default_preferences(user_id):
+        """Create default notification preferences for a new user"""
+        default_prefs = NotificationPreferences.default_preferences_document(user_id)
         result = mongo_db.db.notification_preferences.insert_one(default_prefs)
         return str(result.inserted_id)
 
+    @staticmethod
+    def create_default_preferences_bulk(user_ids):
+        """Create default notification preferences for many new users in one write"""
+        if not user_ids:
+            return 0
+        documents = [NotificationPreferences.default_preferences_document(user_id) for user_id in user_ids]
+        result = mongo_db.db.notification_preferences.insert_many(documents, ordered=False)
+        return len(result.inserted_ids)
+
     @staticmethod
     def get_user_preferences(user_id):
         """Get notification preferences for a user"""
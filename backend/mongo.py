@@ -4,6 +4,8 @@ from bson import ObjectId
 import json
 from datetime import datetime
 from models import BatchCourseInstance
+from utils.reference_cache import ReferenceDataCache
+from utils.question_fingerprint import create_content_hash_index
 
 class MongoDB:
     def __init__(self):
@@ -16,6 +18,8 @@ class MongoDB:
         self.online_exams = self.db.online_exams
         self.student_test_attempts = self.db.student_test_attempts
         self.student_progress = self.db.student_progress
+        # Materialized (student, test) best score / attempt count
+        self.student_test_summary = self.db.student_test_summary
     # Monitoring collection for progress events
         self.progress_events = self.db.progress_events
         self.campuses = self.db.campuses
@@ -31,7 +35,13 @@ class MongoDB:
         self.results_release_settings = self.db.results_release_settings
         self.auto_release_jobs = self.db.auto_release_jobs
         self.release_history = self.db.release_history
+        # Background student upload jobs and their stored rows
+        self.upload_jobs = self.db.upload_jobs
+        self.upload_job_chunks = self.db.upload_job_chunks
         self.notification_settings = self.db.notification_settings
+        self.tts_audio_cache = self.db.tts_audio_cache  # content-addressed generated question audio
+        # Per-worker cache of campuses/courses/batches/modules/levels
+        self.reference_data = ReferenceDataCache(self.db)
         
         # Create indexes for better performance (only once)
         self._create_indexes_once()
@@ -74,6 +84,7 @@ class MongoDB:
             self.users.create_index("campus_id")
             self.users.create_index("course_id")
             self.users.create_index("batch_id")
+            self.users.create_index("mobile_number")  # Duplicate checks of student uploads
             
             # Students collection indexes
             self.students.create_index("user_id", unique=True)
@@ -115,6 +126,16 @@ class MongoDB:
             self.test_results.create_index("submitted_at")
             self.test_results.create_index([("test_id", 1), ("student_id", 1)])
             
+            # Student test summary: one document per (student, test)
+            self.student_test_summary.create_index([("student_id", 1), ("test_id", 1)], unique=True)
+            
+            # Question bank: unique normalized-content hash per module and level
+            try:
+                create_content_hash_index(self.question_bank)
+            except Exception as e:
+                # Keep the other indexes if this one can't be built; log and continue
+                print(f"⚠️ Could not create question_bank content hash index: {e}")
+            
             # Push subscriptions indexes (endpoint uniqueness + lookup by user)
             try:
                 self.push_subscriptions.create_index([('endpoint', 1)], unique=True)
@@ -175,6 +196,86 @@ class MongoDB:
         """Find all students in a course"""
         return list(self.students.find({"course_id": ObjectId(course_id)}))
     
+    def bump_reference_version(self, *kinds):
+        """Invalidate cached reference data (campuses, courses, batches, modules, levels) on every worker"""
+        self.reference_data.bump(*kinds)
+
+    def _name_map(self, kind, ids):
+        """Map _id -> name for the given ids from the reference data cache."""
+        return self.reference_data.names(kind, {i for i in ids if i is not None})
+
+    def resolve_student_contexts(self, ids, key='user_id'):
+        """Resolve students with their user, campus, course and batch in bulk.
+
+        Replaces per-row students/users/campuses/courses/batches find_one calls
+        with two $in queries plus the reference data cache, however many ids
+        are passed. `key` is the student
+        field the ids refer to: 'user_id', '_id' or 'roll_number'.
+
+        Returns a dict keyed by str(id) with 'student', 'user', 'campus_name',
+        'course_name' and 'batch_name'. Ids that match neither a student nor
+        (for key='user_id') a user are left out.
+        """
+        if key not in ('user_id', '_id', 'roll_number'):
+            raise ValueError(f"Unsupported student key: {key}")
+
+        lookup_ids = []
+        for value in ids:
+            if value is None:
+                continue
+            if key == 'roll_number':
+                lookup_ids.append(str(value))
+            elif isinstance(value, ObjectId):
+                lookup_ids.append(value)
+            elif ObjectId.is_valid(str(value)):
+                lookup_ids.append(ObjectId(str(value)))
+        lookup_ids = list(set(lookup_ids))
+        if not lookup_ids:
+            return {}
+
+        students_by_key = {
+            str(student.get(key)): student
+            for student in self.students.find({key: {'$in': lookup_ids}})
+        }
+
+        user_ids = {s.get('user_id') for s in students_by_key.values()}
+        if key == 'user_id':
+            user_ids.update(lookup_ids)
+        user_ids.discard(None)
+        users = {
+            user['_id']: user
+            for user in self.users.find({'_id': {'$in': list(user_ids)}}, {'password_hash': 0})
+        } if user_ids else {}
+
+        pairs = []
+        for lookup_id in lookup_ids:
+            student = students_by_key.get(str(lookup_id))
+            user = users.get(student.get('user_id')) if student else None
+            if user is None and key == 'user_id':
+                user = users.get(lookup_id)
+            if student is None and user is None:
+                continue
+            pairs.append((str(lookup_id), student, user))
+
+        def _ref(student, user, field):
+            value = student.get(field) if student else None
+            return value if value is not None else (user.get(field) if user else None)
+
+        campus_names = self._name_map('campuses', [_ref(s, u, 'campus_id') for _, s, u in pairs])
+        course_names = self._name_map('courses', [_ref(s, u, 'course_id') for _, s, u in pairs])
+        batch_names = self._name_map('batches', [_ref(s, u, 'batch_id') for _, s, u in pairs])
+
+        contexts = {}
+        for lookup_id, student, user in pairs:
+            contexts[lookup_id] = {
+                'student': student,
+                'user': user,
+                'campus_name': campus_names.get(_ref(student, user, 'campus_id')),
+                'course_name': course_names.get(_ref(student, user, 'course_id')),
+                'batch_name': batch_names.get(_ref(student, user, 'batch_id')),
+            }
+        return contexts
+
     def get_students_by_batch(self, batch_id):
         """Get all students for a specific batch with populated campus and course info."""
         try:
@@ -259,6 +360,48 @@ class MongoDB:
         """Find all test attempts for a student"""
         return list(self.student_test_attempts.find({"student_id": ObjectId(student_id)}))
     
+    def record_test_attempt_summary(self, student_id, test_id, score_percentage, attempt_id=None, submitted_at=None):
+        """Fold one submitted attempt into student_test_summary.
+
+        A single upsert keyed by (student_id, test_id) increments attempt_count,
+        keeps the best score with $max and points last_attempt_id at this attempt,
+        so concurrent submissions never lose an update. student_id is the user id
+        the student listing filters on. Failures are logged, never raised, so a
+        submission is not rejected because its summary could not be written.
+        """
+        try:
+            student_id = student_id if isinstance(student_id, ObjectId) else ObjectId(str(student_id))
+            test_id = test_id if isinstance(test_id, ObjectId) else ObjectId(str(test_id))
+            update = {
+                '$inc': {'attempt_count': 1},
+                '$max': {'best_score': float(score_percentage or 0)},
+                '$set': {
+                    'last_attempt_at': submitted_at or datetime.utcnow(),
+                    'updated_at': datetime.utcnow()
+                }
+            }
+            if attempt_id is not None:
+                update['$set']['last_attempt_id'] = attempt_id if isinstance(attempt_id, ObjectId) else ObjectId(str(attempt_id))
+            return self.student_test_summary.update_one(
+                {'student_id': student_id, 'test_id': test_id}, update, upsert=True
+            )
+        except Exception as e:
+            print(f"⚠️ Could not update student test summary for {student_id}/{test_id}: {e}")
+            return None
+
+    def get_test_summaries(self, student_id, test_ids):
+        """Map test_id -> student_test_summary document for one student with a single $in query."""
+        test_ids = [t if isinstance(t, ObjectId) else ObjectId(str(t)) for t in test_ids]
+        if not test_ids:
+            return {}
+        return {
+            summary['test_id']: summary
+            for summary in self.student_test_summary.find({
+                'student_id': ObjectId(str(student_id)),
+                'test_id': {'$in': test_ids}
+            })
+        }
+
     def insert_progress(self, progress_data):
         """Insert or update student progress"""
         try:
@@ -293,6 +436,7 @@ class MongoDB:
         """Insert a new campus"""
         try:
             result = self.campuses.insert_one(campus_data)
+            self.bump_reference_version('campuses')
             return str(result.inserted_id)
         except Exception as e:
             raise Exception(f"Error inserting campus: {str(e)}")
@@ -305,24 +449,25 @@ class MongoDB:
         """Get all courses for a specific campus."""
         try:
             campus_object_id = ObjectId(campus_id)
-            courses_cursor = self.courses.find({'campus_id': campus_object_id})
+            courses = self.reference_data.filter('courses', campus_id=campus_object_id)
+            
+            # Student counts for every course in one aggregation
+            student_counts = {
+                row['_id']: row['count']
+                for row in self.users.aggregate([
+                    {'$match': {'course_id': {'$in': [c['_id'] for c in courses]}, 'role': 'student'}},
+                    {'$group': {'_id': '$course_id', 'count': {'$sum': 1}}}
+                ])
+            } if courses else {}
             
             courses_list = []
-            for course in courses_cursor:
-                course_data = {
+            for course in courses:
+                courses_list.append({
                     'id': str(course['_id']),
                     'name': course.get('name'),
-                    'campus_id': str(course.get('campus_id'))
-                }
-                
-                # Optionally, fetch student count for each course
-                student_count = self.users.count_documents({
-                    'course_id': course['_id'],
-                    'role': 'student'
+                    'campus_id': str(course.get('campus_id')),
+                    'student_count': student_counts.get(course['_id'], 0)
                 })
-                course_data['student_count'] = student_count
-                
-                courses_list.append(course_data)
                 
             return courses_list
         except Exception as e:
@@ -355,10 +500,12 @@ class MongoDB:
     def update_campus(self, campus_id, update_data):
         """Update campus data (name or admin_id)"""
         allowed = {k: v for k, v in update_data.items() if k in ['name', 'admin_id']}
-        return self.campuses.update_one(
+        result = self.campuses.update_one(
             {"_id": ObjectId(campus_id)},
             {"$set": allowed}
         )
+        self.bump_reference_version('campuses')
+        return result
 
     def delete_campus(self, campus_id):
         """Delete a campus and all associated data (courses, batches, students, admins)."""
@@ -395,6 +542,7 @@ class MongoDB:
             
             # 7. Delete the campus itself
             result = self.campuses.delete_one({'_id': campus_object_id})
+            self.bump_reference_version('campuses', 'courses', 'batches')
             
             return {'success': True, 'deleted_count': result.deleted_count}
         except Exception as e:
@@ -420,6 +568,7 @@ class MongoDB:
             'created_at': datetime.utcnow()
         }
         campus_result = self.campuses.insert_one(campus_data)
+        self.bump_reference_version('campuses')
         return str(campus_result.inserted_id), str(admin_id)
 
     def get_all_campuses_with_admin(self):
@@ -455,6 +604,7 @@ class MongoDB:
             'created_at': datetime.utcnow()
         }
         course_result = self.db.courses.insert_one(course_data)
+        self.bump_reference_version('courses')
         return str(course_result.inserted_id), str(admin_id)
 
     def get_courses_by_campus_with_admin(self, campus_id):
@@ -470,10 +620,12 @@ class MongoDB:
 
     def update_course(self, course_id, update_data):
         allowed = {k: v for k, v in update_data.items() if k in ['name', 'admin_id']}
-        return self.db.courses.update_one(
+        result = self.db.courses.update_one(
             {"_id": ObjectId(course_id)},
             {"$set": allowed}
         )
+        self.bump_reference_version('courses')
+        return result
 
     def delete_course(self, course_id):
         """Delete a course and all associated batches and student enrollments."""
@@ -491,6 +643,7 @@ class MongoDB:
             
             # 3. Delete the course itself
             result = self.courses.delete_one({'_id': course_object_id})
+            self.bump_reference_version('courses', 'batches')
             
             return result
         except Exception as e:
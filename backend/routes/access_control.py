@@ -2,6 +2,7 @@ from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from bson import ObjectId
 from mongo import mongo_db
+from utils.request_identity import get_current_user, get_current_permissions, current_user_has_permission
 from config.constants import ROLES, MODULES
 from datetime import datetime
 import pytz
@@ -69,8 +70,8 @@ def require_permission(module=None, action=None):
     def decorator(f):
         @functools.wraps(f)
         def decorated_function(*args, **kwargs):
-            current_user_id = get_jwt_identity()
-            user = mongo_db.find_user_by_id(current_user_id)
+            # Shared with the handler through the request-scoped identity cache
+            user = get_current_user()
 
             if not user:
                 return jsonify({
@@ -124,8 +125,7 @@ def require_permission(module=None, action=None):
 def get_available_modules():
     """Get all available modules for access control"""
     try:
-        current_user_id = get_jwt_identity()
-        user = mongo_db.find_user_by_id(current_user_id)
+        user = get_current_user()
         
         if not user or user.get('role') != 'superadmin':
             return jsonify({
@@ -149,13 +149,11 @@ def get_available_modules():
 def get_admin_permissions(admin_id):
     """Get permissions for a specific admin"""
     try:
-        current_user_id = get_jwt_identity()
-        current_user = mongo_db.find_user_by_id(current_user_id)
+        current_user = get_current_user()
         
         # Check if user is superadmin or has sub superadmin management permission
         if current_user.get('role') != 'superadmin':
-            from models import SubSuperadmin
-            if not SubSuperadmin.has_permission(current_user_id, 'sub_superadmin_management', 'write'):
+            if not current_user_has_permission('sub_superadmin_management', 'write'):
                 return jsonify({
                     'success': False,
                     'message': 'Access denied. Super admin privileges required.'
@@ -194,8 +192,7 @@ def get_admin_permissions(admin_id):
 def update_admin_permissions(admin_id):
     """Update permissions for a specific admin"""
     try:
-        current_user_id = get_jwt_identity()
-        current_user = mongo_db.find_user_by_id(current_user_id)
+        current_user = get_current_user()
         
         # Check if user is superadmin or has sub superadmin management permission
         if current_user.get('role') != 'superadmin':
@@ -207,8 +204,7 @@ def update_admin_permissions(admin_id):
                 parent_dir = os.path.dirname(current_dir)
                 sys.path.append(parent_dir)
 
-                from models import SubSuperadmin
-                if not SubSuperadmin.has_permission(current_user_id, 'sub_superadmin_management', 'write'):
+                if not current_user_has_permission('sub_superadmin_management', 'write'):
                     return jsonify({
                         'success': False,
                         'message': 'Access denied. Super admin privileges required.'
@@ -261,13 +257,11 @@ def update_admin_permissions(admin_id):
 def get_all_admins_with_permissions():
     """Get all admins with their permissions"""
     try:
-        current_user_id = get_jwt_identity()
-        current_user = mongo_db.find_user_by_id(current_user_id)
+        current_user = get_current_user()
         
         # Check if user is superadmin or has sub superadmin management permission
         if current_user.get('role') != 'superadmin':
-            from models import SubSuperadmin
-            if not SubSuperadmin.has_permission(current_user_id, 'sub_superadmin_management', 'write'):
+            if not current_user_has_permission('sub_superadmin_management', 'write'):
                 return jsonify({
                     'success': False,
                     'message': 'Access denied. Super admin privileges required.'
@@ -309,8 +303,7 @@ def get_all_admins_with_permissions():
 def check_permission():
     """Check if current user has permission for a specific module/action"""
     try:
-        current_user_id = get_jwt_identity()
-        user = mongo_db.find_user_by_id(current_user_id)
+        user = get_current_user()
         
         if not user:
             return jsonify({
@@ -336,11 +329,10 @@ def check_permission():
             }), 200
 
         # Check if user is a sub superadmin and has the required permission
-        from models import SubSuperadmin
-        sub_superadmin_permissions = SubSuperadmin.get_user_permissions(current_user_id)
+        sub_superadmin_permissions = get_current_permissions()
 
         if sub_superadmin_permissions:
-            has_permission = SubSuperadmin.has_permission(current_user_id, module, action or 'read')
+            has_permission = current_user_has_permission(module, action or 'read')
             return jsonify({
                 'success': True,
                 'data': {'has_permission': has_permission}
@@ -375,13 +367,11 @@ def check_permission():
 def reset_admin_permissions(admin_id):
     """Reset admin permissions to default for their role"""
     try:
-        current_user_id = get_jwt_identity()
-        current_user = mongo_db.find_user_by_id(current_user_id)
+        current_user = get_current_user()
         
         # Check if user is superadmin or has sub superadmin management permission
         if current_user.get('role') != 'superadmin':
-            from models import SubSuperadmin
-            if not SubSuperadmin.has_permission(current_user_id, 'sub_superadmin_management', 'write'):
+            if not current_user_has_permission('sub_superadmin_management', 'write'):
                 return jsonify({
                     'success': False,
                     'message': 'Access denied. Super admin privileges required.'
@@ -420,7 +410,7 @@ def debug_user():
     """Debug endpoint to check current user's role and permissions"""
     try:
         current_user_id = get_jwt_identity()
-        user = mongo_db.find_user_by_id(current_user_id)
+        user = get_current_user()
         
         if not user:
             return jsonify({
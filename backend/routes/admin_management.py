@@ -63,7 +63,7 @@ def create_admin():
                 }), 400
             
             # Verify campus exists
-            campus = mongo_db.campuses.find_one({'_id': ObjectId(campus_id)})
+            campus = mongo_db.reference_data.get('campuses', ObjectId(campus_id))
             if not campus:
                 return jsonify({
                     'success': False,
@@ -78,7 +78,7 @@ def create_admin():
                 }), 400
             
             # Verify course exists
-            course = mongo_db.courses.find_one({'_id': ObjectId(course_id)})
+            course = mongo_db.reference_data.get('courses', ObjectId(course_id))
             if not course:
                 return jsonify({
                     'success': False,
@@ -105,7 +105,7 @@ def create_admin():
         elif admin_role == 'course_admin':
             admin_user['course_id'] = ObjectId(course_id)
             # Get campus_id from course
-            course = mongo_db.courses.find_one({'_id': ObjectId(course_id)})
+            course = mongo_db.reference_data.get('courses', ObjectId(course_id))
             if course and 'campus_id' in course:
                 admin_user['campus_id'] = course['campus_id']
         
@@ -119,16 +119,16 @@ def create_admin():
             course_name = "N/A"
             
             if admin_role == 'campus_admin' and campus_id:
-                campus = mongo_db.campuses.find_one({'_id': ObjectId(campus_id)})
+                campus = mongo_db.reference_data.get('campuses', ObjectId(campus_id))
                 if campus:
                     campus_name = campus.get('name', 'Unknown Campus')
             elif admin_role == 'course_admin' and course_id:
-                course = mongo_db.courses.find_one({'_id': ObjectId(course_id)})
+                course = mongo_db.reference_data.get('courses', ObjectId(course_id))
                 if course:
                     course_name = course.get('name', 'Unknown Course')
                     # Also get campus name for course admin
                     if course.get('campus_id'):
-                        campus = mongo_db.campuses.find_one({'_id': course['campus_id']})
+                        campus = mongo_db.reference_data.get('campuses', course['campus_id'])
                         if campus:
                             campus_name = campus.get('name', 'Unknown Campus')
             
@@ -219,12 +219,12 @@ def list_admins():
             
             # Add campus/course information
             if admin.get('campus_id'):
-                campus = mongo_db.campuses.find_one({'_id': admin['campus_id']})
+                campus = mongo_db.reference_data.get('campuses', admin['campus_id'])
                 if campus:
                     admin_data['campus_name'] = campus.get('name')
             
             if admin.get('course_id'):
-                course = mongo_db.courses.find_one({'_id': admin['course_id']})
+                course = mongo_db.reference_data.get('courses', admin['course_id'])
                 if course:
                     admin_data['course_name'] = course.get('name')
             
@@ -220,7 +220,7 @@ def login():
         # Populate campus name if campus_id exists
         if user.get('campus_id'):
             try:
-                campus = mongo_db.campuses.find_one({'_id': user['campus_id']})
+                campus = mongo_db.reference_data.get('campuses', user['campus_id'])
                 if campus:
                     user_info['campus_name'] = campus.get('name', 'Unknown Campus')
                 else:
@@ -397,7 +397,7 @@ def get_current_user():
         # Populate campus name if campus_id exists
         if user.get('campus_id'):
             try:
-                campus = mongo_db.campuses.find_one({'_id': user['campus_id']})
+                campus = mongo_db.reference_data.get('campuses', user['campus_id'])
                 if campus:
                     user_info['campus_name'] = campus.get('name', 'Unknown Campus')
                 else:
@@ -1,21 +1,28 @@
 from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from mongo import mongo_db
+from utils.request_identity import get_current_user
 from bson import ObjectId
 from datetime import datetime
-import csv
 import openpyxl
 from werkzeug.utils import secure_filename
 from config.constants import ROLES
 from datetime import datetime
 import pytz
-import io
+from itertools import chain, islice
 from utils.email_service import send_email, render_template
 from utils.sms_service import send_student_credentials_sms
 from utils.upload_optimizer import optimize_upload_process, cleanup_if_needed, log_upload_progress
 from utils.resilient_services import create_resilient_services
 from utils.async_processor import performance_monitor
 from utils.notification_queue import queue_student_credentials, queue_batch_notifications, get_notification_stats
+from utils.student_registration import (
+    register_students, find_existing_roll_numbers, find_existing_mobile_numbers, column_values,
+    prepare_upload_rows, apply_registration_results, credentials_notification_students,
+    queue_credentials_notifications
+)
+from utils.spreadsheet_reader import SpreadsheetReader
+from utils.student_upload_jobs import UPLOAD_JOB_THRESHOLD, create_student_upload_job, job_results, job_summary
 from config.shared import bcrypt
 from socketio_instance import socketio
 from routes.access_control import require_permission
@@ -58,8 +65,7 @@ def safe_isoformat(date_obj):
 def get_batches():
     """Get all batches"""
     try:
-        current_user_id = get_jwt_identity()
-        user = mongo_db.find_user_by_id(current_user_id)
+        user = get_current_user()
         
         # Super admin and sub_superadmin can see all batches
         if user.get('role') in ['superadmin', 'sub_superadmin']:
@@ -106,8 +112,7 @@ def get_batches():
 def create_batch_from_selection():
     """Create a new batch from selected campuses and courses"""
     try:
-        current_user_id = get_jwt_identity()
-        user = mongo_db.find_user_by_id(current_user_id)
+        user = get_current_user()
         
         # Check if user has permission to create batches
         if not user or user.get('role') not in ['superadmin', 'sub_superadmin', 'campus_admin', 'course_admin']:
@@ -143,6 +148,7 @@ def create_batch_from_selection():
             'course_ids': course_ids,
             'created_at': datetime.now(pytz.utc)
         }).inserted_id
+        mongo_db.bump_reference_version('batches')
 
         # Create batch-course instances for each course
         created_instances = []
@@ -215,8 +221,7 @@ def get_batches_for_campus(campus_id):
 def create_batch():
     """Create a new batch and upload student data from an Excel file - SUPER ADMIN ONLY"""
     try:
-        current_user_id = get_jwt_identity()
-        user = mongo_db.find_user_by_id(current_user_id)
+        user = get_current_user()
         
         # Only super admin and sub_superadmin can create batches
         if not user or user.get('role') not in ['superadmin', 'sub_superadmin']:
@@ -249,6 +254,7 @@ def create_batch():
             'created_at': datetime.now(pytz.utc)
         }
         new_batch_id = mongo_db.batches.insert_one(batch_doc).inserted_id
+        mongo_db.bump_reference_version('batches')
 
         # Create batch-course instance
         instance_id = mongo_db.find_or_create_batch_course_instance(new_batch_id, ObjectId(course_id))
@@ -368,6 +374,7 @@ def edit_batch(batch_id):
             {'_id': ObjectId(batch_id)},
             {'$set': {'name': name}}
         )
+        mongo_db.bump_reference_version('batches')
 
         if result.matched_count == 0:
             return jsonify({'success': False, 'message': 'Batch not found.'}), 404
@@ -396,6 +403,7 @@ def delete_batch(batch_id):
         
         # Finally, delete the batch
         result = mongo_db.batches.delete_one({'_id': batch_obj_id})
+        mongo_db.bump_reference_version('batches')
         
         if result.deleted_count == 0:
             return jsonify({'success': False, 'message': 'Batch not found or already deleted.'}), 404
@@ -455,39 +463,10 @@ def _parse_student_file(file):
         raise ValueError('Please upload a valid CSV or Excel file.')
     
     try:
-        if filename.endswith('.csv'):
-            # Read CSV file
-            content = file.read().decode('utf-8-sig')
-            csv_reader = csv.DictReader(io.StringIO(content))
-            rows = list(csv_reader)
-            
-            # Filter out completely empty rows
-            rows = [row for row in rows if any(str(value).strip() for value in row.values() if value is not None)]
-            
-            print(f"CSV parsing: Found {len(rows)} rows after filtering empty rows, headers: {list(rows[0].keys()) if rows else []}")
-        else:
-            # Read Excel file
-            workbook = openpyxl.load_workbook(file, data_only=True)
-            worksheet = workbook.active
-            
-            # Get headers from first row
-            headers = []
-            for cell in worksheet[1]:
-                headers.append(str(cell.value).strip() if cell.value else '')
-            
-            # Get data rows
-            rows = []
-            for row in worksheet.iter_rows(min_row=2):
-                row_data = {}
-                for i, cell in enumerate(row):
-                    if i < len(headers):
-                        row_data[headers[i]] = str(cell.value).strip() if cell.value else ''
-                rows.append(row_data)
-            
-            # Filter out completely empty rows
-            rows = [row for row in rows if any(str(value).strip() for value in row.values() if value is not None)]
-            
-            print(f"Excel parsing: Found {len(rows)} rows after filtering empty rows, headers: {headers}")
+        # Streamed row by row (openpyxl read_only / incremental CSV decoding), empty rows skipped
+        reader = SpreadsheetReader(file, filename)
+        rows = list(reader)
+        print(f"File parsing: Found {len(rows)} rows after filtering empty rows, headers: {reader.headers}")
     except Exception as e:
         print(f"File parsing error: {e}")
         raise ValueError(f"Error reading file: {e}")
@@ -540,14 +519,14 @@ def validate_student_upload():
         if missing_fields:
             return jsonify({'success': False, 'message': f"Invalid file structure. Missing columns: {', '.join(missing_fields)}"}), 400
 
-        # Fetch existing data for validation
-        existing_roll_numbers = set(s['roll_number'] for s in mongo_db.students.find({}, {'roll_number': 1}))
+        # Fetch existing records for the roll/mobile numbers in this file
+        existing_roll_numbers = find_existing_roll_numbers(column_values(rows, 'Roll Number'))
         # Note: Email duplicates are now allowed, so we don't need to check existing emails
         existing_emails = set()  # Empty set since we allow email duplicates
-        existing_mobile_numbers = set(u.get('mobile_number', '') for u in mongo_db.users.find({'mobile_number': {'$exists': True, '$ne': ''}}, {'mobile_number': 1}))
+        existing_mobile_numbers = find_existing_mobile_numbers(column_values(rows, 'Mobile Number'))
         
         # Get campus info for validation
-        campus = mongo_db.campuses.find_one({'_id': ObjectId(campus_id)})
+        campus = mongo_db.reference_data.get('campuses', ObjectId(campus_id))
         if not campus:
             return jsonify({'success': False, 'message': 'Invalid campus ID'}), 400
         
@@ -607,17 +586,22 @@ def upload_students_to_batch():
         if not file or not batch_id or not course_ids:
             return jsonify({'success': False, 'message': 'File, batch ID, and at least one course ID are required.'}), 400
 
-        rows = _parse_student_file(file)
-        current_app.logger.info(f"Parsed {len(rows)} rows from file")
+        # Rows are streamed from the file: only the first UPLOAD_JOB_THRESHOLD are read
+        # here, larger files are passed on to a background job chunk by chunk
+        reader = SpreadsheetReader(file)
+        row_iter = iter(reader)
+        rows = list(islice(row_iter, UPLOAD_JOB_THRESHOLD))
+        more_rows = list(islice(row_iter, 1))
+        current_app.logger.info(f"Read {len(rows)}{'+' if more_rows else ''} rows from file")
         
         if not rows:
             return jsonify({'success': False, 'message': 'File is empty or invalid.'}), 400
         
         # Log first few rows for debugging
-        current_app.logger.info(f"First 3 rows: {rows[:3] if len(rows) >= 3 else rows}")
+        current_app.logger.info(f"First 3 rows: {rows[:3]}")
 
         # Validate columns - support both formats (email is now optional)
-        columns = list(rows[0].keys()) if rows else []
+        columns = reader.headers
         current_app.logger.info(f"File columns: {columns}")
         
         required_fields_v1 = ['Student Name', 'Roll Number', 'Mobile Number']  # Removed Email from required
@@ -636,7 +620,7 @@ def upload_students_to_batch():
         current_app.logger.info(f"Using format v2: {is_v2_format}")
 
         # Fetch batch and campus info
-        batch = mongo_db.batches.find_one({'_id': ObjectId(batch_id)})
+        batch = mongo_db.reference_data.get('batches', ObjectId(batch_id))
         if not batch:
             return jsonify({'success': False, 'message': 'Batch not found.'}), 404
         campus_ids = batch.get('campus_ids', [])
@@ -650,17 +634,27 @@ def upload_students_to_batch():
             if cid not in valid_course_ids:
                 return jsonify({'success': False, 'message': f'Course ID {cid} is not valid for this batch.'}), 400
 
-        # Fetch existing data for validation
-        existing_roll_numbers = set(s['roll_number'] for s in mongo_db.students.find({}, {'roll_number': 1}))
-        # Note: Email duplicates are now allowed, so we don't need to check existing emails
-        existing_emails = set()  # Empty set since we allow email duplicates
-        existing_mobile_numbers = set(u.get('mobile_number', '') for u in mongo_db.users.find({'mobile_number': {'$exists': True, '$ne': ''}}, {'mobile_number': 1}))
+        # Large files are registered by a background job that survives dropped
+        # connections and worker restarts; progress arrives on upload_progress events
+        background = request.form.get('background')
+        if background == 'true' or (background != 'false' and more_rows):
+            job_id, total_students = create_student_upload_job(
+                chain(rows, more_rows, row_iter), batch_id, course_ids, campus_id, is_v2_format, user_id
+            )
+            return jsonify({
+                'success': True,
+                'message': f'Upload of {total_students} students queued. Progress will be reported as they are registered.',
+                'data': {
+                    'job_id': str(job_id),
+                    'total_students': total_students,
+                    'status_url': f'/batch-management/upload-jobs/{job_id}'
+                }
+            }), 202
 
-        # Detailed response tracking
-        detailed_results = []
-        errors = []
+        rows.extend(more_rows)
+        rows.extend(row_iter)
         total_students = len(rows)
-        
+
         # Send initial progress update
         socketio.emit('upload_progress', {
             'user_id': user_id,
@@ -676,22 +670,6 @@ def upload_students_to_batch():
         # Optimize upload process for this batch size
         optimize_upload_process(len(rows))
         
-        # Initialize all student results first
-        detailed_results = []
-        for index, row in enumerate(rows):
-            student_result = {
-                'student_name': '',
-                'roll_number': '',
-                'email': '',
-                'mobile_number': '',
-                'database_registered': False,
-                'email_sent': False,
-                'sms_sent': False,
-                'errors': [],
-                'success': False
-            }
-            detailed_results.append(student_result)
-        
         # PHASE 1: DATABASE REGISTRATION
         current_app.logger.info("🚀 PHASE 1: Starting database registration...")
         socketio.emit('upload_progress', {
@@ -703,184 +681,45 @@ def upload_students_to_batch():
             'message': 'Phase 1: Registering students in database...'
         }, room=str(user_id))
         
-        for index, row in enumerate(rows):
-            student_result = detailed_results[index]
-            
-            # Log every 10th row for debugging
-            if index % 10 == 0:
-                current_app.logger.info(f"Database Phase - Processing row {index + 1}/{len(rows)}: {row}")
-                # Perform cleanup and log progress
-                cleanup_if_needed(index + 1)
-                log_upload_progress(index + 1, len(rows), "Database Phase - ")
-            
-            try:
-                if is_v2_format:
-                    student_name = str(row.get('Student Name', '')).strip()
-                    roll_number = str(row.get('Roll Number', '')).strip()
-                    email = str(row.get('Email', '')).strip().lower() if row.get('Email') else ''  # Make email optional
-                    mobile_number = str(row.get('Mobile Number', '')).strip()
-                    group_name = str(row.get('Group', '')).strip()
-                    
-                    # Find course by group name (assuming group name matches course name)
-                    # Try exact match first, then case-insensitive match
-                    course = mongo_db.courses.find_one({'name': group_name, '_id': {'$in': [ObjectId(cid) for cid in course_ids]}})
-                    if not course:
-                        # Try case-insensitive match
-                        course = mongo_db.courses.find_one({
-                            'name': {'$regex': f'^{group_name}$', '$options': 'i'}, 
-                            '_id': {'$in': [ObjectId(cid) for cid in course_ids]}
-                        })
-                    
-                    if not course:
-                        # Get available courses for better error message
-                        available_courses = list(mongo_db.courses.find({'_id': {'$in': [ObjectId(cid) for cid in course_ids]}}, {'name': 1}))
-                        available_names = [c['name'] for c in available_courses]
-                        student_result['errors'].append(f"Course/Group '{group_name}' not found in this batch. Available courses: {', '.join(available_names)}")
-                        detailed_results.append(student_result)
-                        continue
-                    course_id = str(course['_id'])
-                else:
-                    student_name = str(row.get('Student Name', '')).strip()
-                    roll_number = str(row.get('Roll Number', '')).strip()
-                    email = str(row.get('Email', '')).strip().lower() if row.get('Email') else ''  # Make email optional
-                    mobile_number = str(row.get('Mobile Number', '')).strip()
-                    course_id = course_ids[0]  # Use first course for v1 format
-
-                # Update student result with basic info
-                student_result.update({
-                    'student_name': student_name,
-                    'roll_number': roll_number,
-                    'email': email,
-                    'mobile_number': mobile_number
-                })
+        # Fetch existing records for the roll/mobile numbers in this file
+        existing_roll_numbers = find_existing_roll_numbers(column_values(rows, 'Roll Number'))
+        existing_mobile_numbers = find_existing_mobile_numbers(column_values(rows, 'Mobile Number'))
+        batch_courses = list(mongo_db.courses.find({'_id': {'$in': [ObjectId(cid) for cid in course_ids]}}, {'name': 1}))
+        
+        # Validate rows and collect registrations; passwords are hashed and documents
+        # written in chunks by register_students
+        detailed_results, registrations, registration_rows = prepare_upload_rows(
+            rows, is_v2_format, batch_courses, course_ids, campus_id, batch_id,
+            existing_roll_numbers, existing_mobile_numbers
+        )
 
-            # Validation
-                validation_errors = []
-                
-                # Check for missing required fields (name and roll number)
-                if not student_name or not roll_number or student_name.strip() == '' or roll_number.strip() == '':
-                    validation_errors.append('Missing required fields.')
-                
-                # Skip processing if missing required fields
-                if validation_errors:
-                    student_result['errors'] = validation_errors
-                    detailed_results.append(student_result)
-                    continue
-                
-                # Check for duplicates only if we have valid data
-                if roll_number in existing_roll_numbers:
-                    validation_errors.append('Roll number already exists.')
-                # Note: Email duplicates are now allowed at database level
-                # We can log a warning but don't treat it as an error
-                if email and email.strip() and email in existing_emails:
-                    current_app.logger.warning(f"⚠️ Email {email} already exists for another user, but allowing duplicate")
-                if mobile_number and mobile_number in existing_mobile_numbers:
-                    validation_errors.append('Mobile number already exists.')
-                
-                if validation_errors:
-                    student_result['errors'] = validation_errors
-                    detailed_results.append(student_result)
-                    continue
+        registered_user_ids = {}
 
-                # Database Registration
-                try:
-                    username = roll_number
-                    password = f"{student_name.split()[0][:4].lower()}{roll_number[-4:]}"
-                    password_hash = bcrypt.generate_password_hash(password).decode('utf-8')
-                    
-                    user_doc = {
-                        'username': username,
-                        'email': email if email and email.strip() else None,  # Always include email field
-                        'password_hash': password_hash,
-                        'role': 'student',
-                        'name': student_name,
-                        'mobile_number': mobile_number,
-                        'campus_id': campus_id,
-                        'course_id': ObjectId(course_id),
-                        'batch_id': ObjectId(batch_id),
-                        'is_active': True,
-                        'created_at': datetime.now(pytz.utc),
-                        'mfa_enabled': False
-                    }
-                    
-                    # Insert user first
-                    user_result = mongo_db.users.insert_one(user_doc)
-                    if not user_result.inserted_id:
-                        student_result['errors'].append('Failed to create user account.')
-                        detailed_results.append(student_result)
-                        continue
-                    
-                    user_id_inserted = user_result.inserted_id
-                    
-                    # Create default notification preferences for the new user
-                    try:
-                        from models_notification_preferences import NotificationPreferences
-                        NotificationPreferences.create_default_preferences(user_id_inserted)
-                        current_app.logger.info(f"✅ Created default notification preferences for student: {user_id_inserted}")
-                    except Exception as e:
-                        current_app.logger.warning(f"⚠️ Failed to create default notification preferences for student {user_id_inserted}: {e}")
-                        # Don't fail user creation if notification preferences creation fails
-                    
-                    student_doc = {
-                        'user_id': user_id_inserted,
-                        'name': student_name,
-                        'roll_number': roll_number,
-                        'email': email if email and email.strip() else None,  # Always include email field
-                        'mobile_number': mobile_number,
-                        'campus_id': campus_id,
-                        'course_id': ObjectId(course_id),
-                        'batch_id': ObjectId(batch_id),
-                        'created_at': datetime.now(pytz.utc)
-                    }
-                    
-                    # Insert student profile
-                    student_result_db = mongo_db.students.insert_one(student_doc)
-                    if not student_result_db.inserted_id:
-                        # Rollback user creation if student creation fails
-                        mongo_db.users.delete_one({'_id': user_id_inserted})
-                        student_result['errors'].append('Failed to create student profile.')
-                        detailed_results.append(student_result)
-                        continue
-                    
-                    # Database registration successful
-                    student_result['database_registered'] = True
-                    student_result['username'] = username
-                    student_result['password'] = password
-                    
-                    # Update existing sets to prevent duplicates within the same upload
-                    existing_roll_numbers.add(roll_number)
-                    existing_emails.add(email)
-                    if mobile_number:
-                        existing_mobile_numbers.add(mobile_number)
-                
-                except Exception as e:
-                    student_result['errors'].append(f'Database error: {str(e)}')
-                    current_app.logger.error(f"Database error for student {index + 1}: {e}")
-                    continue
+        def apply_chunk(done, chunk_results):
+            # Map write results back to their rows and report the chunk on the progress feed
+            chunk_rows = registration_rows[done - len(chunk_results):done]
+            registered_user_ids.update(apply_registration_results(detailed_results, chunk_rows, chunk_results))
+            last_result = detailed_results[chunk_rows[-1]]
+            cleanup_if_needed(done)
+            log_upload_progress(done, len(registrations), "Database Phase - ")
+            socketio.emit('upload_progress', {
+                'user_id': user_id,
+                'status': 'processing',
+                'total': total_students,
+                'processed': chunk_rows[-1] + 1,
+                'percentage': int(((chunk_rows[-1] + 1) / total_students) * 100),  # Database phase is 100% of upload
+                'message': f'Uploading: {last_result["student_name"]} - {"✅" if last_result["database_registered"] else "❌"} ({sum(1 for r in chunk_results if not r["error"])}/{len(chunk_results)} registered)',
+                'current_student': {
+                    'name': last_result['student_name'],
+                    'email': last_result['email'],
+                    'username': last_result.get('username', ''),
+                    'database_registered': last_result['database_registered'],
+                    'email_sent': False,
+                    'sms_sent': False
+                }
+            }, room=str(user_id))
 
-                # Send progress update for database phase
-                percentage = int(((index + 1) / total_students) * 100)  # Database phase is 100% of upload
-                socketio.emit('upload_progress', {
-                    'user_id': user_id,
-                    'status': 'processing',
-                    'total': total_students,
-                    'processed': index + 1,
-                    'percentage': percentage,
-                    'message': f'Uploading: {student_name} - {"✅" if student_result["database_registered"] else "❌"}',
-                    'current_student': {
-                        'name': student_name,
-                        'email': email,
-                        'username': username if student_result['database_registered'] else '',
-                        'database_registered': student_result['database_registered'],
-                        'email_sent': False,
-                        'sms_sent': False
-                    }
-                }, room=str(user_id))
-                    
-            except Exception as e:
-                student_result['errors'].append(f'Database error: {str(e)}')
-                current_app.logger.error(f"Database error for student {index + 1}: {e}")
-                continue
+        register_students(registrations, on_chunk=apply_chunk)
 
         # Database upload completed - now queue notifications in background
         current_app.logger.info("✅ Database upload phase completed successfully!")
@@ -896,61 +735,10 @@ def upload_students_to_batch():
             'message': 'Database upload completed! Queueing notifications in background...'
         }, room=str(user_id))
 
-        # Prepare students for notification queueing
-        students_for_notifications = []
-        for index, (row, student_result) in enumerate(zip(rows, detailed_results)):
-            if student_result['database_registered']:
-                # Extract student data for notifications
-                if is_v2_format:
-                    student_name = str(row.get('Student Name', '')).strip()
-                    roll_number = str(row.get('Roll Number', '')).strip()
-                    email = str(row.get('Email', '')).strip().lower() if row.get('Email') else ''
-                    mobile_number = str(row.get('Mobile Number', '')).strip()
-                else:
-                    student_name = str(row.get('Student Name', '')).strip()
-                    roll_number = str(row.get('Roll Number', '')).strip()
-                    email = str(row.get('Email', '')).strip().lower() if row.get('Email') else ''
-                    mobile_number = str(row.get('Mobile Number', '')).strip()
-
-                # Generate username and password (same logic as database registration)
-                username = roll_number
-                password = f"{student_name.split()[0][:4].lower()}{roll_number[-4:]}"
-
-                # Get user_id from the student_result or find it by username
-                user_id_for_student = None
-                try:
-                    # Try to find the user_id by username
-                    user_doc = mongo_db.users.find_one({'username': username})
-                    if user_doc:
-                        user_id_for_student = str(user_doc['_id'])
-                except Exception as e:
-                    current_app.logger.warning(f"Could not find user_id for username {username}: {e}")
-
-                student_data = {
-                    'name': student_name,
-                    'username': username,
-                    'password': password,
-                    'email': email if email and email.strip() else None,
-                    'mobile_number': mobile_number if mobile_number and mobile_number.strip() else None,
-                    'roll_number': roll_number,
-                    'user_id': user_id_for_student  # Add user_id for push notifications
-                }
-                students_for_notifications.append(student_data)
-
         # Create batch job for credentials notifications (same as test creation)
+        students_for_notifications = credentials_notification_students(detailed_results, registered_user_ids)
         if students_for_notifications:
-            try:
-                from utils.batch_processor import create_credentials_batch_job
-                
-                # Create batch job for student credentials notifications
-                batch_result = create_credentials_batch_job(
-                    students=students_for_notifications,
-                    batch_size=100,
-                    interval_minutes=3
-                )
-                
-                current_app.logger.info(f"📧📱 Student credentials batch created: {batch_result}")
-                
+            if queue_credentials_notifications(students_for_notifications):
                 # Update student results with notification status
                 for student_result in detailed_results:
                     if student_result['database_registered']:
@@ -958,45 +746,6 @@ def upload_students_to_batch():
                         student_result['email_queued'] = True  # Will be processed in background
                         student_result['sms_queued'] = True    # Will be processed in background
                         student_result['push_queued'] = True   # Will be processed in background
-                
-                # Send ALL students to notification service at once (fire-and-forget)
-                try:
-                    import requests
-                    import os
-                    notification_service_url = os.getenv('NOTIFICATION_SERVICE_URL', 'http://localhost:3001')
-                    notification_service_url = notification_service_url.rstrip('/api').rstrip('/')
-                    
-                    current_app.logger.info(f"📧📱 Sending {len(students_for_notifications)} students to notification service (batch)")
-                    
-                    # Send email batch (fire-and-forget)
-                    try:
-                        requests.post(
-                            f"{notification_service_url}/api/email/send-credentials-batch",
-                            json={'students': students_for_notifications, 'loginUrl': 'https://crt.pydahsoft.in/login'},
-                            timeout=1  # Fire-and-forget
-                        )
-                        current_app.logger.info(f"✅ Email batch queued in notification service")
-                    except:
-                        pass  # Ignore errors
-                    
-                    # Send SMS batch (fire-and-forget)
-                    try:
-                        requests.post(
-                            f"{notification_service_url}/api/sms/send-credentials-batch",
-                            json={'students': students_for_notifications},
-                            timeout=1  # Fire-and-forget
-                        )
-                        current_app.logger.info(f"✅ SMS batch queued in notification service")
-                    except:
-                        pass  # Ignore errors
-                        
-                except Exception as e:
-                    current_app.logger.warning(f"⚠️ Failed to queue student credentials in notification service: {e}")
-                    # Don't fail the upload if notifications fail
-                    
-            except Exception as e:
-                current_app.logger.error(f"❌ Failed to create credentials batch: {e}")
-                # Don't fail the upload if notifications fail
         else:
             current_app.logger.warning("⚠️ No students available for notification batch creation")
 
@@ -1100,16 +849,55 @@ def upload_students_to_batch():
         current_app.logger.error(f"Traceback: {traceback.format_exc()}")
         return jsonify({'success': False, 'message': f'Failed to upload students. Please check your file format and try again. Error: {str(e)}'}), 500
 
+@batch_management_bp.route('/upload-jobs/<job_id>', methods=['GET'])
+@jwt_required()
+def get_upload_job_status(job_id):
+    """Status of a background student upload job (results with ?include_results=true)"""
+    try:
+        job = mongo_db.upload_jobs.find_one({'_id': ObjectId(job_id)})
+        if not job:
+            return jsonify({'success': False, 'message': 'Upload job not found.'}), 404
+        
+        user = get_current_user() or {}
+        if job['created_by'] != get_jwt_identity() and user.get('role') not in ['superadmin', 'sub_superadmin']:
+            return jsonify({'success': False, 'message': 'Access denied.'}), 403
+        
+        counters = job.get('counters', {})
+        data = {
+            'job_id': str(job['_id']),
+            'status': job['status'],
+            'batch_id': job['batch_id'],
+            'total': job['total'],
+            'processed': counters.get('processed', 0),
+            'percentage': int(counters.get('processed', 0) / job['total'] * 100) if job['total'] else 100,
+            'summary': job.get('summary') or job_summary(job),
+            'error': job.get('last_error'),
+            'created_at': safe_isoformat(job.get('created_at')),
+            'completed_at': safe_isoformat(job.get('completed_at'))
+        }
+        if request.args.get('include_results') == 'true':
+            detailed_results = job_results(job['_id'])
+            data['detailed_results'] = detailed_results
+            data['status_breakdown'] = {
+                'database_only': data['summary']['database_registered'],
+                'complete_failures': data['summary']['complete_failures']
+            }
+        
+        return jsonify({'success': True, 'data': data}), 200
+        
+    except Exception as e:
+        current_app.logger.error(f"Error fetching upload job {job_id}: {e}")
+        return jsonify({'success': False, 'message': f'Failed to fetch upload job: {str(e)}'}), 500
+
 @batch_management_bp.route('/batch/<batch_id>/students', methods=['GET'])
 @jwt_required()
 @require_permission(module='batch_management')
 def get_batch_students(batch_id):
     """Get all students and detailed info for a specific batch."""
     try:
-        current_user_id = get_jwt_identity()
-        user = mongo_db.find_user_by_id(current_user_id)
+        user = get_current_user()
         
-        batch = mongo_db.batches.find_one({'_id': ObjectId(batch_id)})
+        batch = mongo_db.reference_data.get('batches', ObjectId(batch_id))
         if not batch:
             return jsonify({'success': False, 'message': 'Batch not found'}), 404
 
@@ -1160,8 +948,7 @@ def get_filtered_students():
     try:
         current_app.logger.info("get_filtered_students endpoint called")
         print("get_filtered_students endpoint called")
-        current_user_id = get_jwt_identity()
-        user = mongo_db.find_user_by_id(current_user_id)
+        user = get_current_user()
         
         # Get query parameters
         page = int(request.args.get('page', 1))
@@ -1216,16 +1003,12 @@ def get_filtered_students():
         skip = (page - 1) * limit
         students = list(mongo_db.users.find(query).skip(skip).limit(limit))
         
-        # Get additional student details
+        # Get additional student details for the whole page in bulk
+        contexts = mongo_db.resolve_student_contexts([student['_id'] for student in students])
         student_details = []
         for student in students:
-            # Get student profile
-            student_profile = mongo_db.students.find_one({'user_id': student['_id']})
-            
-            # Get campus and course names
-            campus = mongo_db.campuses.find_one({'_id': student.get('campus_id')})
-            course = mongo_db.courses.find_one({'_id': student.get('course_id')})
-            batch = mongo_db.batches.find_one({'_id': student.get('batch_id')})
+            context = contexts.get(str(student['_id']), {})
+            student_profile = context.get('student')
             
             student_details.append({
                 '_id': str(student['_id']),
@@ -1233,9 +1016,9 @@ def get_filtered_students():
                 'email': student.get('email', ''),
                 'roll_number': student_profile.get('roll_number', '') if student_profile else '',
                 'mobile_number': student_profile.get('mobile_number', '') if student_profile else '',
-                'campus_name': campus.get('name', '') if campus else '',
-                'course_name': course.get('name', '') if course else '',
-                'batch_name': batch.get('name', '') if batch else '',
+                'campus_name': context.get('campus_name') or '',
+                'course_name': context.get('course_name') or '',
+                'batch_name': context.get('batch_name') or '',
                 'is_active': student.get('is_active', True),
                 'created_at': student.get('created_at')
             })
@@ -1264,9 +1047,9 @@ def get_student_details(student_id):
             return jsonify({'success': False, 'message': 'Student not found'}), 404
 
         user = mongo_db.users.find_one({'_id': student['user_id']})
-        campus = mongo_db.campuses.find_one({'_id': student['campus_id']})
-        course = mongo_db.courses.find_one({'_id': student['course_id']})
-        batch = mongo_db.batches.find_one({'_id': student['batch_id']})
+        campus = mongo_db.reference_data.get('campuses', student['campus_id'])
+        course = mongo_db.reference_data.get('courses', student['course_id'])
+        batch = mongo_db.reference_data.get('batches', student['batch_id'])
 
         student_details = {
             'id': str(student['_id']),
@@ -1596,10 +1379,14 @@ def create_batch_with_students():
             'created_at': datetime.now(pytz.utc)
         }
         batch_id = mongo_db.batches.insert_one(batch_doc).inserted_id
+        mongo_db.bump_reference_version('batches')
 
         # 2. Create students and users
         created_students_details = []
         errors = []
+        registrations = []
+        registration_details = []
+        seen_mobile_numbers = set()
         
         for student in students_data:
             try:
@@ -1630,45 +1417,46 @@ def create_batch_with_students():
                     if existing_email_user:
                         current_app.logger.warning(f"⚠️ Email {student['email']} already exists for another user, but allowing duplicate")
 
-                # Check for duplicate mobile number if provided
-                if student.get('mobile_number') and mongo_db.users.find_one({'mobile_number': student['mobile_number']}):
+                # Check for duplicate mobile number if provided (in the database or earlier in this upload)
+                if student.get('mobile_number') and (
+                    student['mobile_number'] in seen_mobile_numbers
+                    or mongo_db.users.find_one({'mobile_number': student['mobile_number']})
+                ):
                     errors.append(f"Student with mobile number '{student['mobile_number']}' already exists.")
                     continue
+                if student.get('mobile_number'):
+                    seen_mobile_numbers.add(student['mobile_number'])
 
                 username = student['roll_number']
                 password = f"{student['student_name'].split()[0][:4].lower()}{student['roll_number'][-4:]}"
-                password_hash = bcrypt.generate_password_hash(password).decode('utf-8')
 
-                user_doc = {
-                    'username': username,
-                    'email': student['email'],
-                    'password_hash': password_hash,
-                    'role': ROLES['STUDENT'],
-                    'name': student['student_name'],
-                    'mobile_number': student.get('mobile_number', ''),
-                    'campus_id': campus['_id'],
-                    'course_id': course['_id'],
-                    'batch_id': batch_id,
-                    'is_active': True,
-                    'created_at': datetime.now(pytz.utc),
-                    'mfa_enabled': False
-                }
-                user_id = mongo_db.users.insert_one(user_doc).inserted_id
-
-                student_doc = {
-                    'user_id': user_id,
-                    'name': student['student_name'],
-                    'roll_number': student['roll_number'],
-                    'email': student['email'],
-                    'mobile_number': student.get('mobile_number', ''),
-                    'campus_id': campus['_id'],
-                    'course_id': course['_id'],
-                    'batch_id': batch_id,
-                    'created_at': datetime.now(pytz.utc)
-                }
-                mongo_db.students.insert_one(student_doc)
-
-                created_students_details.append({
+                registrations.append({
+                    'password': password,
+                    'user': {
+                        'username': username,
+                        'email': student['email'],
+                        'role': ROLES['STUDENT'],
+                        'name': student['student_name'],
+                        'mobile_number': student.get('mobile_number', ''),
+                        'campus_id': campus['_id'],
+                        'course_id': course['_id'],
+                        'batch_id': batch_id,
+                        'is_active': True,
+                        'created_at': datetime.now(pytz.utc),
+                        'mfa_enabled': False
+                    },
+                    'student': {
+                        'name': student['student_name'],
+                        'roll_number': student['roll_number'],
+                        'email': student['email'],
+                        'mobile_number': student.get('mobile_number', ''),
+                        'campus_id': campus['_id'],
+                        'course_id': course['_id'],
+                        'batch_id': batch_id,
+                        'created_at': datetime.now(pytz.utc)
+                    }
+                })
+                registration_details.append({
                     "student_name": student['student_name'],
                     "email": student['email'],
                     "username": username,
@@ -1678,6 +1466,13 @@ def create_batch_with_students():
             except Exception as student_error:
                 errors.append(f"An error occurred for student {student.get('student_name', 'N/A')}: {str(student_error)}")
 
+        # Hash passwords in parallel and write users/students in bulk
+        for details, registration_result in zip(registration_details, register_students(registrations)):
+            if registration_result['error']:
+                errors.append(f"Student with roll number '{details['username']}' could not be added: {registration_result['error']}")
+            else:
+                created_students_details.append(details)
+
         # 3. Send emails with progress updates
         current_user_id = get_jwt_identity()
         total_emails = len(created_students_details)
@@ -1770,7 +1565,7 @@ def add_students_to_batch(batch_id):
         if 'student_file' in request.files:
             file = request.files['student_file']
             batch_obj_id = ObjectId(batch_id)
-            batch = mongo_db.batches.find_one({'_id': batch_obj_id})
+            batch = mongo_db.reference_data.get('batches', batch_obj_id)
             if not batch:
                 return jsonify({'success': False, 'message': 'Batch not found.'}), 404
             campus_ids = batch.get('campus_ids', [])
@@ -1783,13 +1578,13 @@ def add_students_to_batch(batch_id):
             if not rows:
                 return jsonify({'success': False, 'message': 'File is empty or invalid.'}), 400
             # Get campus and course info
-            campus = mongo_db.campuses.find_one({'_id': campus_id})
+            campus = mongo_db.reference_data.get('campuses', campus_id)
             valid_course_names = set(c['name'] for c in mongo_db.courses.find({'_id': {'$in': course_ids}}))
-            # Fetch existing data for validation
-            existing_roll_numbers = set(s['roll_number'] for s in mongo_db.students.find({}, {'roll_number': 1}))
+            # Fetch existing records for the roll/mobile numbers in this file
+            existing_roll_numbers = find_existing_roll_numbers(column_values(rows, 'Roll Number'))
             # Note: Email duplicates are now allowed, so we don't need to check existing emails
             existing_emails = set()  # Empty set since we allow email duplicates
-            existing_mobile_numbers = set(u.get('mobile_number', '') for u in mongo_db.users.find({'mobile_number': {'$exists': True, '$ne': ''}}, {'mobile_number': 1}))
+            existing_mobile_numbers = find_existing_mobile_numbers(column_values(rows, 'Mobile Number'))
             preview_data = []
             for row in rows:
                 student_data = {
@@ -1938,7 +1733,7 @@ def add_students_to_batch(batch_id):
         if not students_data:
             return jsonify({'success': False, 'message': 'Student data are required.'}), 400
         batch_obj_id = ObjectId(batch_id)
-        batch = mongo_db.batches.find_one({'_id': batch_obj_id})
+        batch = mongo_db.reference_data.get('batches', batch_obj_id)
         if not batch:
             return jsonify({'success': False, 'message': 'Batch not found.'}), 404
         valid_campus_ids = batch.get('campus_ids', [])
@@ -2042,7 +1837,7 @@ def add_single_student():
         if not all([batch_id, course_id, name, roll_number, email]):
             return jsonify({'success': False, 'message': 'All fields are required.'}), 400
 
-        batch = mongo_db.batches.find_one({'_id': ObjectId(batch_id)})
+        batch = mongo_db.reference_data.get('batches', ObjectId(batch_id))
         if not batch:
             return jsonify({'success': False, 'message': 'Batch not found.'}), 404
         campus_ids = batch.get('campus_ids', [])
@@ -2235,8 +2030,7 @@ def get_student_detailed_insights(student_id):
     """Get comprehensive student insights for admin dashboard"""
     try:
         # Get current admin user
-        current_user_id = get_jwt_identity()
-        user = mongo_db.users.find_one({'_id': ObjectId(current_user_id)})
+        user = get_current_user()
         
         # Check admin permissions
         allowed_roles = ['super_admin', 'superadmin', 'campus_admin', 'course_admin', 'sub_superadmin']
@@ -2328,8 +2122,7 @@ def get_progress_system_monitoring():
     """Get system monitoring data for progress management"""
     try:
         # Get current admin user
-        current_user_id = get_jwt_identity()
-        user = mongo_db.users.find_one({'_id': ObjectId(current_user_id)})
+        user = get_current_user()
         
         # Check admin permissions (only super_admin and campus_admin)
         allowed_roles = ['super_admin', 'campus_admin','sub_superadmin']
@@ -2436,8 +2229,8 @@ def get_batch_course_instance_details(instance_id):
             return jsonify({'success': False, 'message': 'Instance not found'}), 404
         
         # Get batch details
-        batch = mongo_db.batches.find_one({'_id': instance['batch_id']})
-        course = mongo_db.courses.find_one({'_id': instance['course_id']})
+        batch = mongo_db.reference_data.get('batches', instance['batch_id'])
+        course = mongo_db.reference_data.get('courses', instance['course_id'])
         
         # Get students in this instance
         students = list(mongo_db.students.find({'batch_course_instance_id': ObjectId(instance_id)}))
@@ -2502,8 +2295,8 @@ def upload_students_to_instance(instance_id):
             return jsonify({'success': False, 'message': 'Instance not found'}), 404
         
         # Get batch and course details
-        batch = mongo_db.batches.find_one({'_id': instance['batch_id']})
-        course = mongo_db.courses.find_one({'_id': instance['course_id']})
+        batch = mongo_db.reference_data.get('batches', instance['batch_id'])
+        course = mongo_db.reference_data.get('courses', instance['course_id'])
         
         if not batch or not course:
             return jsonify({'success': False, 'message': 'Batch or course not found'}), 404
@@ -2528,8 +2321,8 @@ def upload_students_to_instance(instance_id):
         if missing_fields:
             return jsonify({'success': False, 'message': f"Invalid file structure. Missing columns: {', '.join(missing_fields)}"}), 400
         
-        # Fetch existing data for validation
-        existing_roll_numbers = set(s['roll_number'] for s in mongo_db.students.find({}, {'roll_number': 1}))
+        # Fetch existing records for the roll/mobile numbers in this file
+        existing_roll_numbers = find_existing_roll_numbers(column_values(rows, 'Roll Number'))
         # Note: Email duplicates are now allowed, so we don't need to check existing emails
         existing_emails = set()  # Empty set since we allow email duplicates
         
@@ -2644,7 +2437,7 @@ def verify_students_upload(batch_id):
             return jsonify({'success': False, 'message': 'No student emails or roll numbers provided for verification.'}), 400
         
         batch_obj_id = ObjectId(batch_id)
-        batch = mongo_db.batches.find_one({'_id': batch_obj_id})
+        batch = mongo_db.reference_data.get('batches', batch_obj_id)
         if not batch:
             return jsonify({'success': False, 'message': 'Batch not found.'}), 404
         
@@ -2923,7 +2716,7 @@ def bulk_migrate_students_progress():
     """Bulk migrate all students to new progress system"""
     try:
         current_user_id = get_jwt_identity()
-        current_user = mongo_db.users.find_one({'_id': ObjectId(current_user_id)})
+        current_user = get_current_user()
         
         if not current_user:
             return jsonify({'success': False, 'message': 'User not found'}), 404
@@ -3176,8 +2969,7 @@ def download_student_credentials(student_id):
 def download_all_filtered_students_credentials():
     """Download credentials for all filtered students as CSV"""
     try:
-        current_user_id = get_jwt_identity()
-        user = mongo_db.find_user_by_id(current_user_id)
+        user = get_current_user()
         
         # Get query parameters (same as filtered students endpoint)
         search = request.args.get('search', '')
@@ -3228,9 +3020,9 @@ def download_all_filtered_students_credentials():
             student_profile = mongo_db.students.find_one({'user_id': student['_id']})
             
             # Get campus, course, and batch names
-            campus = mongo_db.campuses.find_one({'_id': student.get('campus_id')})
-            course = mongo_db.courses.find_one({'_id': student.get('course_id')})
-            batch = mongo_db.batches.find_one({'_id': student.get('batch_id')})
+            campus = mongo_db.reference_data.get('campuses', student.get('campus_id'))
+            course = mongo_db.reference_data.get('courses', student.get('course_id'))
+            batch = mongo_db.reference_data.get('batches', student.get('batch_id'))
             
             # Generate password using consistent pattern
             student_name = student.get('name', '')
@@ -3267,15 +3059,15 @@ def download_all_filtered_students_credentials():
         # Generate filename based on filters
         filename_parts = ['students_credentials']
         if campus_id:
-            campus = mongo_db.campuses.find_one({'_id': ObjectId(campus_id)})
+            campus = mongo_db.reference_data.get('campuses', ObjectId(campus_id))
             if campus:
                 filename_parts.append(campus.get('name', '').replace(' ', '_'))
         if course_id:
-            course = mongo_db.courses.find_one({'_id': ObjectId(course_id)})
+            course = mongo_db.reference_data.get('courses', ObjectId(course_id))
             if course:
                 filename_parts.append(course.get('name', '').replace(' ', '_'))
         if batch_id:
-            batch = mongo_db.batches.find_one({'_id': ObjectId(batch_id)})
+            batch = mongo_db.reference_data.get('batches', ObjectId(batch_id))
             if batch:
                 filename_parts.append(batch.get('name', '').replace(' ', '_'))
         if search:
@@ -3299,12 +3091,12 @@ def send_batch_emails(batch_id):
     """Send welcome emails to all students in a batch."""
     try:
         current_user_id = get_jwt_identity()
-        user = mongo_db.find_user_by_id(current_user_id)
+        user = get_current_user()
         if not user:
             return jsonify({'success': False, 'message': 'User not found'}), 404
 
         # Verify batch exists and user has access
-        batch = mongo_db.batches.find_one({'_id': ObjectId(batch_id)})
+        batch = mongo_db.reference_data.get('batches', ObjectId(batch_id))
         if not batch:
             return jsonify({'success': False, 'message': 'Batch not found'}), 404
 
@@ -3426,12 +3218,12 @@ def send_batch_sms(batch_id):
     """Send SMS notifications to all students in a batch."""
     try:
         current_user_id = get_jwt_identity()
-        user = mongo_db.find_user_by_id(current_user_id)
+        user = get_current_user()
         if not user:
             return jsonify({'success': False, 'message': 'User not found'}), 404
 
         # Verify batch exists and user has access
-        batch = mongo_db.batches.find_one({'_id': ObjectId(batch_id)})
+        batch = mongo_db.reference_data.get('batches', ObjectId(batch_id))
         if not batch:
             return jsonify({'success': False, 'message': 'Batch not found'}), 404
 
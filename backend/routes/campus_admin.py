@@ -98,7 +98,7 @@ def get_campus_students():
         
         for student in students:
             # Get course info
-            course = mongo_db.courses.find_one({'_id': student.get('course_id')})
+            course = mongo_db.reference_data.get('courses', student.get('course_id'))
             course_info = {
                 'id': str(course['_id']),
                 'name': course.get('name')
@@ -256,6 +256,7 @@ def create_batch():
             'campus_ids': [ObjectId(campus_id)],
             'course_ids': course_ids
         }).inserted_id
+        mongo_db.bump_reference_version('batches')
         
         return jsonify({'success': True, 'data': {'id': str(batch_id)}}), 201
         
@@ -279,6 +280,7 @@ def edit_batch(batch_id):
     if not name:
         return jsonify({'success': False, 'message': 'Batch name is required'}), 400
     mongo_db.batches.update_one({'_id': ObjectId(batch_id)}, {'$set': {'name': name}})
+    mongo_db.bump_reference_version('batches')
     return jsonify({'success': True, 'message': 'Batch updated successfully'}), 200
 
 @campus_admin_bp.route('/batches/<batch_id>', methods=['DELETE'])
@@ -294,6 +296,7 @@ def delete_batch(batch_id):
     if not batch:
         return jsonify({'success': False, 'message': 'Batch not found or not in your campus'}), 404
     mongo_db.batches.delete_one({'_id': ObjectId(batch_id)})
+    mongo_db.bump_reference_version('batches')
     return jsonify({'success': True, 'message': 'Batch deleted successfully'}), 200
 
 @campus_admin_bp.route('/courses', methods=['GET'])
@@ -330,10 +333,10 @@ def get_courses():
             if not course_id:
                 return jsonify({'success': False, 'message': 'Course not assigned'}), 400
             
-            course = mongo_db.courses.find_one({'_id': ObjectId(course_id)})
+            course = mongo_db.reference_data.get('courses', ObjectId(course_id))
             if course:
                 # Get campus info for this course
-                campus = mongo_db.campuses.find_one({'_id': course.get('campus_id')})
+                campus = mongo_db.reference_data.get('campuses', course.get('campus_id'))
                 course_list.append({
                     'id': str(course['_id']),
                     'name': course.get('name'),
@@ -371,6 +374,7 @@ def create_course():
             'created_at': datetime.now(pytz.utc)
         }
         course_id = mongo_db.courses.insert_one(course).inserted_id
+        mongo_db.bump_reference_version('courses')
         
         return jsonify({'success': True, 'data': {'id': str(course_id)}}), 201
         
@@ -392,6 +396,7 @@ def edit_course(course_id):
     data = request.get_json()
     if 'name' in data:
         mongo_db.courses.update_one({'_id': ObjectId(course_id)}, {'$set': {'name': data['name']}})
+        mongo_db.bump_reference_version('courses')
     if 'admin_email' in data and 'admin_name' in data:
         update_data = {'name': data['admin_name'], 'email': data['admin_email'], 'username': data['admin_name']}
         if 'admin_password' in data and data['admin_password']:
@@ -414,4 +419,5 @@ def delete_course(course_id):
     if not course:
         return jsonify({'success': False, 'message': 'Course not found or not in your campus'}), 404
     mongo_db.courses.delete_one({'_id': ObjectId(course_id)})
+    mongo_db.bump_reference_version('courses')
     return jsonify({'success': True, 'message': 'Course deleted'}), 200 
\ No newline at end of file
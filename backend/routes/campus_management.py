@@ -87,6 +87,7 @@ def create_campus():
             'created_at': datetime.now(pytz.utc)
         }
         campus_id = mongo_db.campuses.insert_one(campus).inserted_id
+        mongo_db.bump_reference_version('campuses')
         
         return jsonify({
             'success': True,
@@ -109,6 +110,7 @@ def update_campus(campus_id):
         # Update campus name
         if 'name' in data:
             mongo_db.campuses.update_one({'_id': ObjectId(campus_id)}, {'$set': {'name': data['name']}})
+            mongo_db.bump_reference_version('campuses')
 
         return jsonify({'success': True, 'message': 'Campus updated successfully'}), 200
     except Exception as e:
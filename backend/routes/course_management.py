@@ -32,7 +32,7 @@ def get_courses():
         
         course_list = []
         for course in courses:
-            campus = mongo_db.campuses.find_one({'_id': course.get('campus_id')})
+            campus = mongo_db.reference_data.get('campuses', course.get('campus_id'))
             
             campus_info = {
                 'id': str(campus['_id']),
@@ -79,7 +79,7 @@ def get_courses_filtered():
 def get_courses_by_batch(batch_id):
     try:
         # Get the batch to find its course_ids
-        batch = mongo_db.batches.find_one({'_id': ObjectId(batch_id)})
+        batch = mongo_db.reference_data.get('batches', ObjectId(batch_id))
         if not batch:
             return jsonify({'success': False, 'message': 'Batch not found'}), 404
         
@@ -149,6 +149,7 @@ def create_course(campus_id):
             'created_at': datetime.now(pytz.utc)
         }
         course_id = mongo_db.courses.insert_one(course).inserted_id
+        mongo_db.bump_reference_version('courses')
 
         return jsonify({
             'success': True,
@@ -170,6 +171,7 @@ def update_course(course_id):
         # Update course name
         if 'name' in data:
             mongo_db.courses.update_one({'_id': ObjectId(course_id)}, {'$set': {'name': data['name']}})
+            mongo_db.bump_reference_version('courses')
 
         return jsonify({'success': True, 'message': 'Course updated'}), 200
     except Exception as e:
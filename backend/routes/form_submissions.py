@@ -6,6 +6,7 @@ import logging
 import json
 
 from config.database import DatabaseConfig
+import mongo as shared_mongo
 from models_forms import FormSubmission, FormResponse, FORMS_COLLECTION, FORM_SUBMISSIONS_COLLECTION
 from routes.test_management import require_superadmin
 from utils.notification_queue import queue_sms, queue_email
@@ -1006,12 +1007,45 @@ def export_form_submissions(form_id):
         submissions = list(mongo_db[FORM_SUBMISSIONS_COLLECTION].find(query).sort('submitted_at', -1))
         print(f"📊 Found {len(submissions)} submissions for export")
         
+        # Resolve students and their campus/course/batch names in bulk by roll number;
+        # only submissions whose roll number has no exact match fall back to per-row lookups
+        contexts = shared_mongo.mongo_db.resolve_student_contexts(
+            [submission.get('student_roll_number') for submission in submissions],
+            key='roll_number'
+        )
+        fallback_students = {}
+        for submission in submissions:
+            student_roll_number = submission.get('student_roll_number')
+            if not student_roll_number or str(student_roll_number) in contexts:
+                continue
+            try:
+                student = get_student_by_roll_number(student_roll_number)
+            except Exception as e:
+                print(f"❌ Error looking up student by roll number: {str(e)}")
+                # Fallback: try to find by student_id if available
+                student = None
+                student_id = submission.get('student_id')
+                if student_id:
+                    try:
+                        if isinstance(student_id, str):
+                            student_id = ObjectId(student_id)
+                        student = mongo_db['students'].find_one({'_id': student_id})
+                    except Exception as e2:
+                        print(f"❌ Fallback student lookup also failed: {str(e2)}")
+            if student:
+                fallback_students[id(submission)] = student['_id']
+        fallback_contexts = shared_mongo.mongo_db.resolve_student_contexts(
+            list(fallback_students.values()), key='_id'
+        ) if fallback_students else {}
+        
         # Prepare export data
         export_data = []
         for submission in submissions:
-            # Get student details using roll_number (same logic as submission viewer)
             student_roll_number = submission.get('student_roll_number')
-            student = None
+            context = contexts.get(str(student_roll_number)) if student_roll_number else None
+            if context is None and id(submission) in fallback_students:
+                context = fallback_contexts.get(str(fallback_students[id(submission)]))
+            student = context['student'] if context else None
             student_name = 'Unknown'
             student_email = 'Unknown'
             student_roll = 'Unknown'
@@ -1020,44 +1054,14 @@ def export_form_submissions(form_id):
             student_batch = 'Unknown'
             student_campus = 'Unknown'
             
-            if student_roll_number:
-                try:
-                    student = get_student_by_roll_number(student_roll_number)
-                    student_name = student.get('name', 'Unknown')
-                    student_email = student.get('email', 'Unknown')
-                    student_roll = student.get('roll_number', 'Unknown')
-                    student_mobile = student.get('mobile_number', 'Unknown')
-                    
-                    # Get course details
-                    course = mongo_db['courses'].find_one({'_id': student.get('course_id')})
-                    if course:
-                        student_course = course.get('name', 'Unknown')
-                    
-                    # Get batch details
-                    batch = mongo_db['batches'].find_one({'_id': student.get('batch_id')})
-                    if batch:
-                        student_batch = batch.get('name', 'Unknown')
-                    
-                    # Get campus details
-                    campus = mongo_db['campuses'].find_one({'_id': student.get('campus_id')})
-                    if campus:
-                        student_campus = campus.get('name', 'Unknown')
-                except Exception as e:
-                    print(f"❌ Error looking up student by roll number: {str(e)}")
-                    # Fallback: try to find by student_id if available
-                    student_id = submission.get('student_id')
-                    if student_id:
-                        try:
-                            if isinstance(student_id, str):
-                                student_id = ObjectId(student_id)
-                            student = mongo_db['students'].find_one({'_id': student_id})
-                            if student:
-                                student_name = student.get('name', 'Unknown')
-                                student_email = student.get('email', 'Unknown')
-                                student_roll = student.get('roll_number', 'Unknown')
-                                student_mobile = student.get('mobile_number', 'Unknown')
-                        except Exception as e2:
-                            print(f"❌ Fallback student lookup also failed: {str(e2)}")
+            if student:
+                student_name = student.get('name', 'Unknown')
+                student_email = student.get('email', 'Unknown')
+                student_roll = student.get('roll_number', 'Unknown')
+                student_mobile = student.get('mobile_number', 'Unknown')
+                student_course = context['course_name'] or 'Unknown'
+                student_batch = context['batch_name'] or 'Unknown'
+                student_campus = context['campus_name'] or 'Unknown'
             
             # Create row data with only essential student information and form fields
             # Order: Roll Number, Name, Campus, Course, Batch, Mobile, Email, then form fields
@@ -7,6 +7,9 @@ from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from routes.access_control import require_permission
 from utils.async_processor import async_processor, db_pool, response_cache, get_all_background_tasks
+from services.compiler_service import compiler_service
+from services.audio_generation_service import audio_generation_service
+from utils.rate_limiter import rate_limiter
 import time
 import psutil
 import threading
@@ -92,6 +95,8 @@ def get_performance_metrics():
             'async_system': async_metrics,
             'database_pool': db_metrics,
             'cache': cache_metrics,
+            'code_execution_cache': compiler_service.get_cache_stats(),
+            'rate_limits': rate_limiter.get_stats(),
             'concurrency': {
                 'max_concurrent_users': async_processor.max_workers * 5000,
                 'current_load': len(async_processor.running_tasks),
@@ -230,7 +235,9 @@ def get_cache_stats():
             'size': len(response_cache.cache),
             'max_size': response_cache.max_size,
             'utilization_percent': (len(response_cache.cache) / response_cache.max_size) * 100,
-            'access_times': len(response_cache._access_times)
+            'access_times': len(response_cache._access_times),
+            'code_execution': compiler_service.get_cache_stats(),
+            'tts_audio': audio_generation_service.get_stats()
         }
         
         return jsonify({
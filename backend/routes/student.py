@@ -1,6 +1,10 @@
 from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from mongo import mongo_db
+from utils.request_identity import get_current_user, get_current_student
+from utils.test_payload_cache import get_processed_test
+from utils.mcq_grading import compile_answer_key, grade_mcq
+from utils.exam_surge import surge_admission
 from config.database_simple import DatabaseConfig
 from bson import ObjectId
 from config.constants import GRAMMAR_CATEGORIES, MODULES, LEVELS
@@ -248,7 +252,7 @@ def dashboard():
     """Student dashboard"""
     try:
         current_user_id = get_jwt_identity()
-        user = mongo_db.find_user_by_id(current_user_id)
+        user = get_current_user()
         
         if not user or user.get('role') != 'student':
             return jsonify({
@@ -291,7 +295,7 @@ def get_student_tests():
     """Get tests available for the logged-in student based on their batch-course instance"""
     try:
         current_user_id = get_jwt_identity()
-        user = mongo_db.users.find_one({'_id': ObjectId(current_user_id)})
+        user = get_current_user()
         
         if not user or user.get('role') != 'student':
             return jsonify({'success': False, 'message': 'Access denied'}), 403
@@ -306,7 +310,7 @@ def get_student_tests():
         current_app.logger.info(f"STUDENT TESTS REQUEST: Current user ID={current_user_id}")
 
         # Get student's record (may or may not have batch_course_instance_id yet)
-        student = mongo_db.students.find_one({'user_id': ObjectId(current_user_id)})
+        student = get_current_student()
         # If no student profile, return empty list gracefully
         if not student:
             current_app.logger.warning(f"Student profile not found for user {current_user_id}")
@@ -501,65 +505,39 @@ def get_student_tests():
         for t in tests:
             current_app.logger.info(f"  Processing test: {t.get('name')} - Module: {t.get('module_id')} - Type: {t.get('test_type')}")
         
+        # Best score, attempt count and last attempt for every listed test in one query
+        test_ids = [test['_id'] for test in tests]
+        summaries = mongo_db.get_test_summaries(current_user_id, test_ids)
+        
+        # Any attempt, in progress ones included, marks a test as attempted (first attempt per test)
+        existing_attempts = {}
+        for attempt in mongo_db.student_test_attempts.find({
+            'test_id': {'$in': test_ids},
+            'student_id': ObjectId(current_user_id),
+            # instance may be missing; include it only if present to avoid over-filtering
+            **({ 'batch_course_instance_id': instance_id } if instance_id else {})
+        }, {'test_id': 1}).sort('_id', 1):
+            existing_attempts.setdefault(attempt['test_id'], attempt['_id'])
+        
+        # Get total number of tests for this module/subcategory
+        total_tests = 1  # Default to 1 for individual tests
+        if module and subcategory:
+            try:
+                total_tests = mongo_db.tests.count_documents({
+                    'module_id': module,
+                    'subcategory': subcategory,
+                    'test_type': 'practice'
+                })
+            except Exception as e:
+                current_app.logger.warning(f"Error counting total tests for {module}/{subcategory}: {e}")
+                total_tests = 1
+        
         test_list = []
         for test in tests:
-            # Check if student has already attempted this test
-            existing_attempt = mongo_db.student_test_attempts.find_one({
-                'test_id': test['_id'],
-                'student_id': ObjectId(current_user_id),
-                # instance may be missing; include it only if present to avoid over-filtering
-                **({ 'batch_course_instance_id': instance_id } if instance_id else {})
-            })
-            
-            # Get completion count and highest score for this test
-            highest_score = 0
-            completed_count = 0
-            # Try both possible collections for historical results
-            try:
-                attempts_primary = list(mongo_db.test_results.find({
-                    'test_id': test['_id'],
-                    'student_id': ObjectId(current_user_id)
-                }))
-            except Exception:
-                attempts_primary = []
-            try:
-                attempts_alt = list(mongo_db.student_test_attempts.find({
-                    'test_id': test['_id'],
-                    'student_id': ObjectId(current_user_id)
-                }))
-            except Exception:
-                attempts_alt = []
-            all_attempts = (attempts_primary or []) + (attempts_alt or [])
-            current_app.logger.info(f"Test {test['_id']}: Found {len(attempts_primary)} attempts in test_results, {len(attempts_alt)} attempts in student_test_attempts")
-            if all_attempts:
-                # Count all attempts (not just completed ones)
-                completed_count = len(all_attempts)
-                
-                # Find highest score from all attempts
-                for attempt in all_attempts:
-                    score = attempt.get('score_percentage', 0)
-                    if score == 0:
-                        avg_score = attempt.get('average_score', 0)
-                        if avg_score > 0:
-                            score = avg_score * 100  # Convert from 0-1 to 0-100 scale
-                    if score > highest_score:
-                        highest_score = score
-                current_app.logger.info(f"Test {test['_id']}: Calculated highest_score = {highest_score}, completed_count = {completed_count}")
-            else:
-                current_app.logger.info(f"Test {test['_id']}: No attempts found")
-            
-            # Get total number of tests for this module/subcategory
-            total_tests = 1  # Default to 1 for individual tests
-            if module and subcategory:
-                try:
-                    total_tests = mongo_db.tests.count_documents({
-                        'module_id': module,
-                        'subcategory': subcategory,
-                        'test_type': 'practice'
-                    })
-                except Exception as e:
-                    current_app.logger.warning(f"Error counting total tests for {module}/{subcategory}: {e}")
-                    total_tests = 1
+            summary = summaries.get(test['_id'], {})
+            completed_count = summary.get('attempt_count', 0)
+            highest_score = summary.get('best_score', 0)
+            existing_attempt_id = existing_attempts.get(test['_id'])
             
             test_list.append({
                 '_id': str(test['_id']),
@@ -570,8 +548,8 @@ def get_student_tests():
                 'instructions': test.get('instructions', ''),
                 'start_date': safe_isoformat(test.get('start_date')),
                 'end_date': safe_isoformat(test.get('end_date')),
-                'has_attempted': existing_attempt is not None,
-                'attempt_id': str(existing_attempt['_id']) if existing_attempt else None,
+                'has_attempted': existing_attempt_id is not None,
+                'attempt_id': str(existing_attempt_id) if existing_attempt_id else None,
                 'highest_score': highest_score,
                 'completed_count': completed_count,
                 'total_tests': total_tests
@@ -593,17 +571,18 @@ def get_student_tests():
 
 @student_bp.route('/tests/<test_id>/start', methods=['POST'])
 @jwt_required()
+@surge_admission
 def start_test(test_id):
     """Start a test for the student"""
     try:
         current_user_id = get_jwt_identity()
-        user = mongo_db.users.find_one({'_id': ObjectId(current_user_id)})
+        user = get_current_user()
         
         if not user or user.get('role') != 'student':
             return jsonify({'success': False, 'message': 'Access denied'}), 403
         
         # Get student profile
-        student = mongo_db.students.find_one({'user_id': ObjectId(current_user_id)})
+        student = get_current_student()
         if not student:
             return jsonify({'success': False, 'message': 'Student profile not found'}), 404
         
@@ -745,7 +724,7 @@ def submit_test(test_id):
     """Submit test answers and calculate score"""
     try:
         current_user_id = get_jwt_identity()
-        user = mongo_db.users.find_one({'_id': ObjectId(current_user_id)})
+        user = get_current_user()
         
         if not user or user.get('role') != 'student':
             return jsonify({'success': False, 'message': 'Access denied'}), 403
@@ -759,7 +738,7 @@ def submit_test(test_id):
             return jsonify({'success': False, 'message': 'Attempt ID is required'}), 400
         
         # Get student profile
-        student = mongo_db.students.find_one({'user_id': ObjectId(current_user_id)})
+        student = get_current_student()
         if not student:
             return jsonify({'success': False, 'message': 'Student profile not found'}), 404
         
@@ -796,110 +775,69 @@ def submit_test(test_id):
         if attempt['status'] == 'completed':
             return jsonify({'success': False, 'message': 'Test already submitted'}), 409
         
-        # Calculate score properly
-        score = 0
-        total_questions = len(test.get('questions', []))
-        correct_answers = 0
-        detailed_results = []
-        
+        questions = test.get('questions', [])
+        total_questions = len(questions)
         current_app.logger.info(f"Calculating score for {total_questions} questions")
-        current_app.logger.info(f"Student answers: {answers}")
         
-        # Process each question and calculate score
-        total_max_score = 0  # For technical tests with variable scoring
-        for i, question in enumerate(test.get('questions', [])):
+        # Every non-compiler question is an MCQ here; grade them all in one pass
+        mcq_grading = grade_mcq(
+            compile_answer_key(questions, include=lambda q: q.get('question_type', 'mcq') not in ['compiler', 'technical']),
+            answers
+        )
+        score = mcq_grading['score']
+        correct_answers = mcq_grading['correct_answers']
+        total_max_score = mcq_grading['graded']  # Technical questions add their own max scores
+        detailed_results = []
+        
+        for i, question in enumerate(questions):
+            question_type = question.get('question_type', 'mcq')
+            if question_type not in ['compiler', 'technical']:
+                detailed_results.append(mcq_grading['by_position'][i])
+                continue
+            
             question_id = str(question.get('_id', i))
             student_answer = answers.get(question_id, '')
-            question_type = question.get('question_type', 'mcq')  # Get question type
-            
-            # Debug logging for compiler questions
-            if question_type in ['compiler', 'technical']:
-                current_app.logger.info(f"Question {i} (type: {question_type}): question_id={question_id}, found_answer={bool(student_answer)}, answer_keys_in_request={list(answers.keys())[:5]}")
+            question_text = question.get('questionTitle') or question.get('question', '')
             
-            # Handle different question types
-            if question_type in ['compiler', 'technical'] and isinstance(student_answer, dict):
-                # Compiler/Technical question with pre-calculated results
-                if student_answer.get('results'):
-                    # Use pre-calculated scores from frontend
-                    result_data = student_answer['results']
-                    question_score = result_data.get('total_score', 0)
-                    question_max_score = result_data.get('max_score', 1)
-                    question_percentage = (question_score / question_max_score * 100) if question_max_score > 0 else 0
-                    
-                    total_max_score += question_max_score
-                    score += question_score
-                    
-                    if question_percentage == 100:
-                        correct_answers += 1
-                    
-                    # Get question title/text for compiler questions
-                    question_text = question.get('questionTitle') or question.get('question', '')
-                    
-                    detailed_results.append({
-                        'question_index': i,
-                        'question_id': question_id,
-                        'question': question_text,
-                        'question_type': 'compiler',
-                        'student_answer': student_answer.get('code', ''),
-                        'language': student_answer.get('language', ''),
-                        'is_correct': question_percentage == 100,
-                        'score': question_score,
-                        'max_score': question_max_score,
-                        'percentage': question_percentage,
-                        'test_results': result_data.get('test_results', [])
-                    })
-                else:
-                    # No results provided, count as wrong
-                    question_text = question.get('questionTitle') or question.get('question', '')
-                    detailed_results.append({
-                        'question_index': i,
-                        'question_id': question_id,
-                        'question': question_text,
-                        'question_type': 'compiler',
-                        'student_answer': student_answer.get('code', '') if isinstance(student_answer, dict) else '',
-                        'language': student_answer.get('language', '') if isinstance(student_answer, dict) else '',
-                        'is_correct': False,
-                        'score': 0,
-                        'max_score': 0,
-                        'percentage': 0
-                    })
-                    
-            else:
-                # MCQ question - traditional scoring
-                correct_answer_letter = question.get('answer', '')  # A, B, C, or D
-                correct_answer_text = ''
-                
-                # Map answer letter to actual option text 
-                if correct_answer_letter == 'A':
-                    correct_answer_text = question.get('optionA', '')
-                elif correct_answer_letter == 'B':
-                    correct_answer_text = question.get('optionB', '')
-                elif correct_answer_letter == 'C':
-                    correct_answer_text = question.get('optionC', '')
-                elif correct_answer_letter == 'D':
-                    correct_answer_text = question.get('optionD', '')
+            if isinstance(student_answer, dict) and student_answer.get('results'):
+                # Use pre-calculated scores from frontend
+                result_data = student_answer['results']
+                question_score = result_data.get('total_score', 0)
+                question_max_score = result_data.get('max_score', 1)
+                question_percentage = (question_score / question_max_score * 100) if question_max_score > 0 else 0
                 
-                # Check if student answer matches correct answer text
-                is_correct = student_answer == correct_answer_text
+                total_max_score += question_max_score
+                score += question_score
                 
-                if is_correct:
+                if question_percentage == 100:
                     correct_answers += 1
-                    score += 1
-                
-                total_max_score += 1
-                
-                current_app.logger.info(f"Question {i}: student='{student_answer}', correct='{correct_answer_text}', is_correct={is_correct}")
                 
                 detailed_results.append({
                     'question_index': i,
                     'question_id': question_id,
-                    'question': question.get('question', ''),
-                    'question_type': 'mcq',
-                    'student_answer': student_answer,
-                    'correct_answer_letter': correct_answer_letter,
-                    'correct_answer_text': correct_answer_text,
-                    'is_correct': is_correct,
-                    'score': 1 if is_correct else 0
+                    'question': question_text,
+                    'question_type': 'compiler',
+                    'student_answer': student_answer.get('code', ''),
+                    'language': student_answer.get('language', ''),
+                    'is_correct': question_percentage == 100,
+                    'score': question_score,
+                    'max_score': question_max_score,
+                    'percentage': question_percentage,
+                    'test_results': result_data.get('test_results', [])
+                })
+            else:
+                # No results provided, count as wrong
+                detailed_results.append({
+                    'question_index': i,
+                    'question_id': question_id,
+                    'question': question_text,
+                    'question_type': 'compiler',
+                    'student_answer': student_answer.get('code', '') if isinstance(student_answer, dict) else '',
+                    'language': student_answer.get('language', '') if isinstance(student_answer, dict) else '',
+                    'is_correct': False,
+                    'score': 0,
+                    'max_score': 0,
+                    'percentage': 0
                 })
         
         # Calculate percentage based on actual scoring system
@@ -951,6 +889,7 @@ def submit_test(test_id):
             {'_id': ObjectId(attempt_id)},
             {'$set': update_data}
         )
+        mongo_db.record_test_attempt_summary(current_user_id, test_id, percentage, attempt_id, end_time)
         
         # Save to test_results collection with proper format
         try:
@@ -1178,13 +1117,13 @@ def get_student_random_test_assignment(test_id):
     """Get student's specific test assignment with randomized questions"""
     try:
         current_user_id = get_jwt_identity()
-        user = mongo_db.users.find_one({'_id': ObjectId(current_user_id)})
+        user = get_current_user()
         
         if not user or user.get('role') != 'student':
             return jsonify({'success': False, 'message': 'Access denied'}), 403
         
         # Get student's batch-course instance
-        student = mongo_db.students.find_one({'user_id': ObjectId(current_user_id)})
+        student = get_current_student()
         if not student or not student.get('batch_course_instance_id'):
             return jsonify({'success': False, 'message': 'Student not assigned to any batch-course instance'}), 404
         
@@ -1269,7 +1208,7 @@ def submit_random_test(test_id):
     """Submit test with randomized questions and calculate score"""
     try:
         current_user_id = get_jwt_identity()
-        user = mongo_db.users.find_one({'_id': ObjectId(current_user_id)})
+        user = get_current_user()
         
         if not user or user.get('role') != 'student':
             return jsonify({'success': False, 'message': 'Access denied'}), 403
@@ -1305,52 +1244,20 @@ def submit_random_test(test_id):
         current_app.logger.info(f"Random test submit resolved by {test_result['resolved_by']}: {test_result['object_id']} / {test_result['test_id']}")
         
 
-        # Calculate score properly
-        score = 0
         total_questions = len(assignment['questions'])
-        correct_answers = 0
-        detailed_results = []
-        
         current_app.logger.info(f"Calculating score for random test: {total_questions} questions")
-        current_app.logger.info(f"Student answers: {answers}")
         
-        for i, question in enumerate(assignment['questions']):
-            question_id = f'question_{i}'
-            student_answer = answers.get(question_id, '')
-            
-            # Get correct answer from question         
-            correct_answer_letter = question.get('answer', '')  # A, B, C, or D
-            correct_answer_text = ''
-            
-            # Map answer letter to actual option text
-            if correct_answer_letter == 'A':
-                correct_answer_text = question.get('optionA', '')
-            elif correct_answer_letter == 'B':   
-                correct_answer_text = question.get('optionB', '')
-            elif correct_answer_letter == 'C':
-                correct_answer_text = question.get('optionC', '')
-            elif correct_answer_letter == 'D':
-                correct_answer_text = question.get('optionD', '')
-            
-            # Check if student answer matches correct answer text
-            is_correct = student_answer == correct_answer_text
-            
-            if is_correct:
-                correct_answers += 1
-                score += 1
-            
-            current_app.logger.info(f"Question {i}: student='{student_answer}', correct='{correct_answer_text}', is_correct={is_correct}")
-            
-            detailed_results.append({
-                'question_index': i,
-                'question_id': question_id,
-                'question': question.get('question', ''),
-                'student_answer': student_answer,
-                'correct_answer_letter': correct_answer_letter,
-                'correct_answer_text': correct_answer_text,
-                'is_correct': is_correct,
-                'score': 1 if is_correct else 0
-            })
+        # Assigned questions are all MCQs, answered as question_<index>
+        mcq_grading = grade_mcq(
+            compile_answer_key(assignment['questions'], include=lambda q: True),
+            answers, lambda i, question_id: f'question_{i}'
+        )
+        score = mcq_grading['score']
+        correct_answers = mcq_grading['correct_answers']
+        detailed_results = [
+            {**result, 'question_id': f"question_{result['question_index']}"}
+            for result in mcq_grading['results']
+        ]
         
         # Calculate percentage
         percentage = (score / total_questions) * 100 if total_questions > 0 else 0
@@ -1373,6 +1280,7 @@ def submit_random_test(test_id):
                 }
             }
         )
+        mongo_db.record_test_attempt_summary(current_user_id, test_id, percentage)
         
         # Save to test_results collection with proper format for random tests
         try:
@@ -1458,13 +1366,13 @@ def get_online_exams():
     """Get available online exams for a student."""
     try:
         current_user_id = get_jwt_identity()
-        user = mongo_db.users.find_one({'_id': ObjectId(current_user_id)})
+        user = get_current_user()
         
         if not user or user.get('role') != 'student':
             return jsonify({'success': False, 'message': 'Access denied'}), 403
 
         # Get student's record to access batch information
-        student = mongo_db.students.find_one({'user_id': ObjectId(current_user_id)})
+        student = get_current_student()
         if not student:
             current_app.logger.warning(f"Student profile not found for user {current_user_id}")
             return jsonify({'success': True, 'data': []}), 200
@@ -1540,11 +1448,12 @@ def get_online_exams():
 
 @student_bp.route('/test/<test_id>', methods=['GET'])
 @jwt_required()
+@surge_admission
 def get_single_test(test_id):
     """Get full details for a single test for a student to take. Supports both MongoDB _id and custom test_id."""
     try:
         current_user_id = get_jwt_identity()
-        user = mongo_db.users.find_one({'_id': ObjectId(current_user_id)})
+        user = get_current_user()
         
         if not user or user.get('role') != 'student':
             return jsonify({'success': False, 'message': 'Access denied'}), 403
@@ -1574,7 +1483,6 @@ def get_single_test(test_id):
         current_app.logger.info(f"Test has questions: {bool(test.get('questions'))}")
         if test.get('questions'):
             current_app.logger.info(f"Number of questions: {len(test['questions'])}")
-            current_app.logger.info(f"First question structure: {test['questions'][0] if test['questions'] else 'No questions'}")
             
             # Special debugging for listening modules
             if test.get('module_id') == 'LISTENING':
@@ -1585,219 +1493,16 @@ def get_single_test(test_id):
                 if text_only_questions:
                     current_app.logger.warning(f"LISTENING MODULE: {len(text_only_questions)} questions missing audio - will use text fallback")
 
-        convert_objectids_to_strings(test)
-
         # --- PROCESS QUESTIONS ---
-        import random
+        # Shuffled once per test revision and shared with the grading paths
         if 'questions' in test and isinstance(test['questions'], list):
-            # Use consistent shuffling for all modules (same as practice tests)
-            test_id_str = str(test['_id'])
-            random.seed(hash(test_id_str) % 1000000)  # Use test ID as seed for consistent order
-            random.shuffle(test['questions'])
-            random.seed()  # Reset seed to prevent affecting other operations
-            current_app.logger.info(f"Questions shuffled with consistent seed for test: {test_id_str}")
-            
-            # Log the shuffled order for debugging
-            for idx, q in enumerate(test['questions']):
-                current_app.logger.info(f"Shuffled question {idx + 1}: {q.get('question_id', q.get('_id'))} - {q.get('question', q.get('sentence', ''))[:50]}...")
-
-            processed_questions = []
-            shuffled_questions = []  # Store shuffled questions for validation
-            
-            for idx, q in enumerate(test['questions']):
-                current_app.logger.info(f"Processing question {idx + 1}: {q.get('question_type', 'unknown')}")
-                
-                if q.get('question_type') == 'mcq':
-                    # Build options dict from optionA...optionD
-                    options = {}
-                    answer_letter = q.get('answer')  # e.g. "C"
-
-                    for opt_key in ['A', 'B', 'C', 'D']:
-                        opt_field = f"option{opt_key}"
-                        if q.get(opt_field) is not None:
-                            options[opt_key] = q[opt_field]
-
-                    # Shuffle options
-                    items = list(options.items())
-                    random.shuffle(items)
-
-                    new_options = {}
-                    answer_map = {}
-                    for new_idx, (old_key, value) in enumerate(items):
-                        new_key = chr(ord('A') + new_idx)
-                        new_options[new_key] = value
-                        answer_map[old_key] = new_key
-
-                    # Build clean question dict for frontend
-                    clean_q = {
-                        "question_id": str(q.get('_id', f"q_{idx+1}")),
-                        "question": q.get('question'),
-                        "question_type": q.get('question_type'),
-                        "instructions": q.get('instructions', ''),
-                        "options": new_options,
-                        # keep correct_answer internally for validation, but don't expose to student
-                        "correct_answer": answer_map.get(answer_letter)
-                    }
-
-                    processed_questions.append(clean_q)
-                    
-                    # Store shuffled question data for validation
-                    shuffled_q = q.copy()
-                    shuffled_q['shuffled_options'] = new_options
-                    shuffled_q['answer_mapping'] = answer_map
-                    shuffled_q['shuffled_answer'] = answer_map.get(answer_letter)
-                    shuffled_questions.append(shuffled_q)
-
-                elif q.get('question_type') in ['compiler', 'technical', 'compiler_integrated']:
-                    # Handle compiler/technical questions with test cases
-                    clean_q = {
-                        "question_id": str(q.get('_id', f"q_{idx+1}")),
-                        "question": q.get('question'),
-                        "questionTitle": q.get('questionTitle', ''),
-                        "problemStatement": q.get('problemStatement', ''),
-                        "question_type": q.get('question_type'),
-                        "instructions": q.get('instructions', ''),
-                        "language": q.get('language', 'python'),
-                        "test_cases": q.get('test_cases', q.get('testCases', []))
-                    }
-                    processed_questions.append(clean_q)
-                    
-                    # Store shuffled question data for validation
-                    shuffled_q = q.copy()
-                    shuffled_questions.append(shuffled_q)
-                    current_app.logger.info(f"Processed compiler question: {clean_q['question'][:50]}...")
-
-                elif q.get('question_type') in ['sentence', 'listening', 'speaking']:
-                    # Handle listening/speaking questions with proper audio support
-                    has_audio = q.get('has_audio', False) or bool(q.get('audio_url'))
-                    
-                    if has_audio:
-                        # For listening module, hide the sentence text from students
-                        if test.get('module_id') == 'LISTENING':
-                            # Convert S3 key to full URL if it's not already a full URL
-                            audio_url = q.get('audio_url')
-                            if audio_url and audio_url.startswith('audio/') and not audio_url.startswith('http'):
-                                from config.aws_config import S3_BUCKET_NAME
-                                audio_url = f"https://{S3_BUCKET_NAME}.s3.amazonaws.com/{audio_url}"
-                                current_app.logger.info(f"Converted S3 key to full URL for listening: {audio_url}")
-                            
-                            clean_q = {
-                                "question_id": str(q.get('_id', f"q_{idx+1}")),
-                                "question": "Listen to the audio and record your response",  # Hide actual sentence
-                                "question_type": "listening",
-                                "instructions": q.get('instructions', ''),
-                                "audio_url": audio_url,
-                                "has_audio": True,
-                                "audio_config": q.get('audio_config', {}),
-                                "module_id": "LISTENING",
-                                "sentence": q.get('sentence', ''),  # Keep for backend reference
-                                "hidden_sentence": q.get('sentence', '')  # Store original sentence
-                            }
-                            current_app.logger.info(f"Listening question processed with hidden sentence: {q.get('sentence', '')[:50]}...")
-                        else:
-                            # For other modules, show the sentence normally
-                            # Convert S3 key to full URL if it's not already a full URL
-                            audio_url = q.get('audio_url')
-                            if audio_url and audio_url.startswith('audio/') and not audio_url.startswith('http'):
-                                from config.aws_config import S3_BUCKET_NAME
-                                audio_url = f"https://{S3_BUCKET_NAME}.s3.amazonaws.com/{audio_url}"
-                                current_app.logger.info(f"Converted S3 key to full URL for other module: {audio_url}")
-                            
-                            clean_q = {
-                                "question_id": str(q.get('_id', f"q_{idx+1}")),
-                                "question": q.get('question') or q.get('sentence', ''),
-                                "question_type": q.get('question_type'),
-                                "instructions": q.get('instructions', ''),
-                                "audio_url": audio_url,
-                                "has_audio": True,
-                                "audio_config": q.get('audio_config', {}),
-                                "module_id": test.get('module_id'),
-                                "sentence": q.get('sentence', '')
-                            }
-                            current_app.logger.info(f"Audio question processed: {q.get('question_type')} with audio_url: {audio_url}")
-                    else:
-                        # For listening module, try to find audio in alternative fields
-                        if test.get('module_id') == 'LISTENING':
-                            # Check for audio in different possible field names
-                            audio_url = (q.get('audio_url') or q.get('audio') or 
-                                       q.get('audio_file') or q.get('file_url') or 
-                                       q.get('question_audio'))
-                            
-                            if audio_url:
-                                # Convert S3 key to full URL if it's not already a full URL
-                                if audio_url.startswith('audio/') and not audio_url.startswith('http'):
-                                    from config.aws_config import S3_BUCKET_NAME
-                                    audio_url = f"https://{S3_BUCKET_NAME}.s3.amazonaws.com/{audio_url}"
-                                    current_app.logger.info(f"Converted S3 key to full URL: {audio_url}")
-                                
-                                clean_q = {
-                                    "question_id": str(q.get('_id', f"q_{idx+1}")),
-                                    "question": "Listen to the audio and record your response",  # Hide actual sentence
-                                    "question_type": "listening",
-                                    "instructions": q.get('instructions', ''),
-                                    "audio_url": audio_url,
-                                    "has_audio": True,
-                                    "audio_config": q.get('audio_config', {}),
-                                    "module_id": "LISTENING",
-                                    "sentence": q.get('sentence', ''),
-                                    "hidden_sentence": q.get('sentence', ''),
-                                    "audio_id": f"audio_{q.get('_id', idx)}_{hash(audio_url)}"  # Unique audio ID
-                                }
-                                current_app.logger.info(f"Listening question with audio found: {audio_url}")
-                            else:
-                                # Fallback for listening questions without audio
-                                clean_q = {
-                                    "question_id": str(q.get('_id', f"q_{idx+1}")),
-                                    "question": q.get('question') or q.get('sentence', ''),
-                                    "question_type": "text_fallback",
-                                    "instructions": q.get('instructions', '') + " (Audio not available - text mode)",
-                                    "original_type": q.get('question_type'),
-                                    "audio_status": "missing",
-                                    "module_id": "LISTENING"
-                                }
-                                current_app.logger.warning(f"Listening question missing audio - using text fallback")
-                        else:
-                            # For other modules, use text fallback
-                            clean_q = {
-                                "question_id": str(q.get('_id', f"q_{idx+1}")),
-                                "question": q.get('question') or q.get('sentence', ''),
-                                "question_type": "text_fallback",
-                                "instructions": q.get('instructions', '') + " (Audio not available - text mode)",
-                                "original_type": q.get('question_type'),
-                                "audio_status": "missing"
-                            }
-                            current_app.logger.warning(f"Audio missing for {q.get('question_type')} question - using text fallback")
-                    
-                    processed_questions.append(clean_q)
-                    current_app.logger.info(f"Processed {q.get('question_type')} question: {clean_q['question'][:50]}...")
-                    
-                    # Store shuffled question data for validation (non-MCQ)
-                    shuffled_q = q.copy()
-                    shuffled_questions.append(shuffled_q)
-
-                else:
-                    # Non-MCQ questions
-                    clean_q = {
-                        "question_id": str(q.get('_id', f"q_{idx+1}")),
-                        "question": q.get('question'),
-                        "question_type": q.get('question_type'),
-                        "instructions": q.get('instructions', '')
-                    }
-                    processed_questions.append(clean_q)
-                    
-                    # Store shuffled question data for validation (non-MCQ)
-                    shuffled_q = q.copy()
-                    shuffled_questions.append(shuffled_q)
-
-            test['questions'] = processed_questions
-            test['shuffled_questions'] = shuffled_questions  # Store shuffled questions for validation
-            current_app.logger.info(f"Successfully processed {len(processed_questions)} questions")
-
-            # Remove correct_answer before sending response
-            for q in test['questions']:
-                if 'correct_answer' in q:
-                    del q['correct_answer']
+            processed = get_processed_test(test)
+            convert_objectids_to_strings(test)
+            test['questions'] = processed['questions']
+            test['shuffled_questions'] = processed['shuffled_questions']  # Store shuffled questions for validation
+            current_app.logger.info(f"Serving {len(processed['questions'])} processed questions for test {test['_id']}")
         else:
+            convert_objectids_to_strings(test)
             current_app.logger.warning(f"No questions found in test {test_id} or questions is not a list")
             test['questions'] = []
 
@@ -3052,7 +2757,7 @@ def get_completed_exams():
     """Get list of completed exam IDs for the student"""
     try:
         current_user_id = get_jwt_identity()
-        user = mongo_db.users.find_one({'_id': ObjectId(current_user_id)})
+        user = get_current_user()
         
         if not user or user.get('role') != 'student':
             return jsonify({'success': False, 'message': 'Access denied'}), 403
@@ -3100,8 +2805,7 @@ def get_unlocked_modules():
     """Return all modules and levels the student is allowed to access."""
     try:
         from config.constants import MODULES, LEVELS
-        current_user_id = get_jwt_identity()
-        student = mongo_db.students.find_one({'user_id': ObjectId(current_user_id)})
+        student = get_current_student()
         
         if not student:
             return jsonify({'success': False, 'message': 'Student profile not found.'}), 404
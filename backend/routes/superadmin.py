@@ -7,6 +7,7 @@ import io
 import json
 import pandas as pd
 from mongo import mongo_db
+from utils.request_identity import get_current_user
 from config.constants import ROLES, MODULES, LEVELS, TEST_TYPES, WRITING_CONFIG
 from datetime import datetime, timedelta
 from routes.test_management import require_superadmin
@@ -53,7 +54,7 @@ def dashboard():
     """Super admin dashboard overview"""
     try:
         current_user_id = get_jwt_identity()
-        user = mongo_db.find_user_by_id(current_user_id)
+        user = get_current_user()
         
         # Debug logging
         current_app.logger.info(f"Dashboard access attempt - User ID: {current_user_id}")
@@ -138,7 +139,7 @@ def debug_roles():
     """Debug endpoint to check user roles"""
     try:
         current_user_id = get_jwt_identity()
-        user = mongo_db.find_user_by_id(current_user_id)
+        user = get_current_user()
         
         # Get all unique roles in the database
         all_roles = mongo_db.users.distinct('role')
@@ -168,8 +169,7 @@ def debug_roles():
 def create_user():
     """Create a new user"""
     try:
-        current_user_id = get_jwt_identity()
-        user = mongo_db.find_user_by_id(current_user_id)
+        user = get_current_user()
         
         if not user or user.get('role') not in ALLOWED_ADMIN_ROLES:
             return jsonify({
@@ -235,8 +235,7 @@ def create_user():
 def get_users():
     """Get all users"""
     try:
-        current_user_id = get_jwt_identity()
-        user = mongo_db.find_user_by_id(current_user_id)
+        user = get_current_user()
         
         if not user or user.get('role') not in ALLOWED_ADMIN_ROLES:
             return jsonify({
@@ -280,7 +279,7 @@ def create_test():
     """Create a new test"""
     try:
         current_user_id = get_jwt_identity()
-        user = mongo_db.find_user_by_id(current_user_id)
+        user = get_current_user()
         
         if not user or user.get('role') != 'superadmin':
             return jsonify({
@@ -329,8 +328,7 @@ def create_test():
 def get_tests():
     """Get all tests with pagination"""
     try:
-        current_user_id = get_jwt_identity()
-        user = mongo_db.find_user_by_id(current_user_id)
+        user = get_current_user()
         
         if not user or user.get('role') != 'superadmin':
             return jsonify({
@@ -402,7 +400,7 @@ def create_online_exam():
     """Create a new online exam"""
     try:
         current_user_id = get_jwt_identity()
-        user = mongo_db.find_user_by_id(current_user_id)
+        user = get_current_user()
         
         if not user or user.get('role') != 'superadmin':
             return jsonify({
@@ -452,8 +450,7 @@ def create_online_exam():
 def get_student_practice_results():
     """Get detailed practice results for all students"""
     try:
-        current_user_id = get_jwt_identity()
-        user = mongo_db.find_user_by_id(current_user_id)
+        user = get_current_user()
         
         if not user or user.get('role') not in ALLOWED_ADMIN_ROLES:
             return jsonify({
@@ -725,8 +722,7 @@ def get_student_practice_results():
 def get_student_online_results():
     """Get detailed online exam results for all students"""
     try:
-        current_user_id = get_jwt_identity()
-        user = mongo_db.find_user_by_id(current_user_id)
+        user = get_current_user()
         
         if not user or user.get('role') not in ALLOWED_ADMIN_ROLES:
             return jsonify({
@@ -996,8 +992,7 @@ def get_student_online_results():
 def get_grammar_analytics():
     """Get detailed grammar practice analytics"""
     try:
-        current_user_id = get_jwt_identity()
-        user = mongo_db.find_user_by_id(current_user_id)
+        user = get_current_user()
         
         if not user or user.get('role') not in ALLOWED_ADMIN_ROLES:
             return jsonify({
@@ -1071,8 +1066,7 @@ def get_grammar_analytics():
 def get_vocabulary_analytics():
     """Get detailed vocabulary practice analytics"""
     try:
-        current_user_id = get_jwt_identity()
-        user = mongo_db.find_user_by_id(current_user_id)
+        user = get_current_user()
         
         if not user or user.get('role') not in ALLOWED_ADMIN_ROLES:
             return jsonify({
@@ -1146,8 +1140,7 @@ def get_vocabulary_analytics():
 def get_practice_overview():
     """Get overview of all practice module usage"""
     try:
-        current_user_id = get_jwt_identity()
-        user = mongo_db.find_user_by_id(current_user_id)
+        user = get_current_user()
         
         if not user or user.get('role') not in ALLOWED_ADMIN_ROLES:
             return jsonify({
@@ -1300,8 +1293,7 @@ def get_student_assigned_modules():
 def get_student_modules():
     """Get all available practice modules for a student (by email or roll number, admin roles only)."""
     try:
-        current_user_id = get_jwt_identity()
-        user = mongo_db.find_user_by_id(current_user_id)
+        user = get_current_user()
         allowed_roles = ['super_admin', 'campus_admin', 'course_admin']
         if not user or user.get('role') not in allowed_roles:
             return jsonify({'success': False, 'message': 'Access denied. Admin privileges required.'}), 403
@@ -1335,8 +1327,7 @@ def get_student_modules():
 @jwt_required()
 def upload_module_to_batch_course(batch_id, course_id):
     # Only admin roles
-    current_user_id = get_jwt_identity()
-    user = mongo_db.find_user_by_id(current_user_id)
+    user = get_current_user()
     if not user or user.get('role') not in ALLOWED_ADMIN_ROLES:
         return jsonify({'success': False, 'message': 'Access denied. Admin privileges required.'}), 403
     # Find or create batch_course_instance
@@ -1346,6 +1337,7 @@ def upload_module_to_batch_course(batch_id, course_id):
     module_data['batch_course_instance_id'] = instance_id
     # Insert module (assume modules collection)
     result = mongo_db.modules.insert_one(module_data)
+    mongo_db.bump_reference_version('modules')
     return jsonify({'success': True, 'message': 'Module uploaded', 'module_id': str(result.inserted_id), 'batch_course_instance_id': str(instance_id)}), 201
 
 # Update result fetching endpoint to filter by batch_course_instance_id
@@ -1353,8 +1345,7 @@ def upload_module_to_batch_course(batch_id, course_id):
 @jwt_required()
 def get_module_results_by_instance(instance_id):
     # Only admin roles
-    current_user_id = get_jwt_identity()
-    user = mongo_db.find_user_by_id(current_user_id)
+    user = get_current_user()
     if not user or user.get('role') not in ALLOWED_ADMIN_ROLES:
         return jsonify({'success': False, 'message': 'Access denied. Admin privileges required.'}), 403
     # Fetch results for this batch_course_instance_id
@@ -1381,7 +1372,7 @@ def writing_upload():
     """Upload writing paragraphs with validation"""
     try:
         current_user_id = get_jwt_identity()
-        user = mongo_db.find_user_by_id(current_user_id)
+        user = get_current_user()
         
         if not user or user.get('role') not in ALLOWED_ADMIN_ROLES:
             return jsonify({
@@ -1539,7 +1530,7 @@ def sentence_upload():
     """Upload sentences for listening and speaking modules with audio support"""
     try:
         current_user_id = get_jwt_identity()
-        user = mongo_db.find_user_by_id(current_user_id)
+        user = get_current_user()
         
         if not user or user.get('role') not in ALLOWED_ADMIN_ROLES:
             return jsonify({
@@ -1757,8 +1748,7 @@ def sentence_upload():
 def get_student_attempts(student_id, test_id):
     """Get detailed attempts for a specific student and test"""
     try:
-        current_user_id = get_jwt_identity()
-        user = mongo_db.find_user_by_id(current_user_id)
+        user = get_current_user()
         
         if not user:
             return jsonify({
@@ -1852,9 +1842,9 @@ def get_student_attempts(student_id, test_id):
         # Student details already retrieved above
         
         # Get campus, course, and batch details
-        campus = mongo_db.campuses.find_one({'_id': student.get('campus_id')}) if student.get('campus_id') else None
-        course = mongo_db.courses.find_one({'_id': student.get('course_id')}) if student.get('course_id') else None
-        batch = mongo_db.batches.find_one({'_id': student.get('batch_id')}) if student.get('batch_id') else None
+        campus = mongo_db.reference_data.get('campuses', student.get('campus_id')) if student.get('campus_id') else None
+        course = mongo_db.reference_data.get('courses', student.get('course_id')) if student.get('course_id') else None
+        batch = mongo_db.reference_data.get('batches', student.get('batch_id')) if student.get('batch_id') else None
         
         # Transform detailed_results to match frontend expectations
         detailed_results = attempt.get('detailed_results', [])
@@ -1961,8 +1951,7 @@ def get_student_attempts(student_id, test_id):
 def export_test_attempts(test_id):
     """Export test attempts for a specific test as Excel"""
     try:
-        current_user_id = get_jwt_identity()
-        user = mongo_db.find_user_by_id(current_user_id)
+        user = get_current_user()
         
         if not user:
             return jsonify({
@@ -2001,9 +1990,9 @@ def export_test_attempts(test_id):
                 continue
             
             # Get campus, course, and batch details
-            campus = mongo_db.campuses.find_one({'_id': student.get('campus_id')}) if student.get('campus_id') else None
-            course = mongo_db.courses.find_one({'_id': student.get('course_id')}) if student.get('course_id') else None
-            batch = mongo_db.batches.find_one({'_id': student.get('batch_id')}) if student.get('batch_id') else None
+            campus = mongo_db.reference_data.get('campuses', student.get('campus_id')) if student.get('campus_id') else None
+            course = mongo_db.reference_data.get('courses', student.get('course_id')) if student.get('course_id') else None
+            batch = mongo_db.reference_data.get('batches', student.get('batch_id')) if student.get('batch_id') else None
             
             # Calculate score - ensure we get clean numeric values
             total_questions = attempt.get('total_questions', 0)
@@ -2206,8 +2195,7 @@ def export_test_attempts(test_id):
 def export_test_attempts_csv(test_id):
     """Export test attempts for a specific test as CSV"""
     try:
-        current_user_id = get_jwt_identity()
-        user = mongo_db.find_user_by_id(current_user_id)
+        user = get_current_user()
         
         if not user:
             return jsonify({
@@ -2235,21 +2223,17 @@ def export_test_attempts_csv(test_id):
                 'message': 'Test not found'
             }), 404
         
+        # Resolve every student's profile and campus/course/batch names in bulk
+        contexts = mongo_db.resolve_student_contexts([attempt['student_id'] for attempt in attempts])
+        
         # Process attempts and get student details
         csv_data = []
         for attempt in attempts:
-            student_id = str(attempt['student_id'])
-            
-            # Get student details
-            student = mongo_db.students.find_one({'user_id': ObjectId(student_id)})
+            context = contexts.get(str(attempt['student_id']))
+            student = context['student'] if context else None
             if not student:
                 continue
             
-            # Get campus, course, and batch details
-            campus = mongo_db.campuses.find_one({'_id': student.get('campus_id')}) if student.get('campus_id') else None
-            course = mongo_db.courses.find_one({'_id': student.get('course_id')}) if student.get('course_id') else None
-            batch = mongo_db.batches.find_one({'_id': student.get('batch_id')}) if student.get('batch_id') else None
-            
             # Calculate score - ensure we get clean numeric values
             total_questions = attempt.get('total_questions', 0)
             correct_answers = attempt.get('correct_answers', 0)
@@ -2293,9 +2277,9 @@ def export_test_attempts_csv(test_id):
                 'Student Email': str(student.get('email', '')),
                 'Roll Number': str(student.get('roll_number', '')),
                 'Mobile Number': str(student.get('mobile_number', '')),
-                'Campus': str(campus.get('name', 'Unknown Campus')) if campus else 'Unknown Campus',
-                'Course': str(course.get('name', 'Unknown Course')) if course else 'Unknown Course',
-                'Batch': str(batch.get('name', 'Unknown Batch')) if batch else 'Unknown Batch',
+                'Campus': str(context['campus_name'] or 'Unknown Campus'),
+                'Course': str(context['course_name'] or 'Unknown Course'),
+                'Batch': str(context['batch_name'] or 'Unknown Batch'),
                 'Test Name': str(test.get('name', 'Unknown Test')),
                 'Total Questions': total_questions,
                 'Correct Answers': correct_answers,
@@ -2350,8 +2334,7 @@ def export_test_attempts_csv(test_id):
 def get_online_tests_overview():
     """Get overview of all online tests with statistics using optimized aggregation"""
     try:
-        current_user_id = get_jwt_identity()
-        user = mongo_db.find_user_by_id(current_user_id)
+        user = get_current_user()
         
         if not user or user.get('role') not in ALLOWED_ADMIN_ROLES:
             return jsonify({
@@ -2527,8 +2510,7 @@ def get_online_tests_overview():
 def get_test_attempts(test_id):
     """Get all student attempts for a specific test including unattempted students"""
     try:
-        current_user_id = get_jwt_identity()
-        user = mongo_db.find_user_by_id(current_user_id)
+        user = get_current_user()
         
         if not user or user.get('role') not in ALLOWED_ADMIN_ROLES:
             return jsonify({
@@ -2759,8 +2741,7 @@ def get_test_attempts(test_id):
 def export_test_attempts_complete(test_id):
     """Export complete test data including both attempted and unattempted students"""
     try:
-        current_user_id = get_jwt_identity()
-        user = mongo_db.find_user_by_id(current_user_id)
+        user = get_current_user()
         
         if not user or user.get('role') not in ALLOWED_ADMIN_ROLES:
             return jsonify({
@@ -2805,129 +2786,52 @@ def export_test_attempts_complete(test_id):
                 'message': 'No students assigned to this test'
             }), 404
         
-        # Use aggregation to get all assigned students with their attempt data
-        pipeline = [
-            {
-                '$match': student_query
-            },
-            {
-                '$lookup': {
-                    'from': 'users',
-                    'localField': 'user_id',
-                    'foreignField': '_id',
-                    'as': 'user_details'
-                }
-            },
-            {
-                '$unwind': '$user_details'
-            },
-            {
-                '$lookup': {
-                    'from': 'campuses',
-                    'localField': 'campus_id',
-                    'foreignField': '_id',
-                    'as': 'campus_details'
-                }
-            },
-            {
-                '$lookup': {
-                    'from': 'courses',
-                    'localField': 'course_id',
-                    'foreignField': '_id',
-                    'as': 'course_details'
-                }
-            },
-            {
-                '$lookup': {
-                    'from': 'batches',
-                    'localField': 'batch_id',
-                    'foreignField': '_id',
-                    'as': 'batch_details'
-                }
-            },
-            {
-                '$lookup': {
-                    'from': 'student_test_attempts',
-                    'let': {'student_id': '$_id', 'user_id': '$user_id'},
-                    'pipeline': [
-                        {
-                            '$match': {
-                                '$expr': {
-                                    '$and': [
-                                        {'$eq': ['$test_id', test_object_id]},
-                                        {'$eq': ['$test_type', 'online']},
-                                        {'$eq': ['$status', 'completed']},
-                                        {
-                                            '$or': [
-                                                {'$eq': ['$student_id', '$$student_id']},
-                                                {'$eq': ['$student_id', '$$user_id']}
-                                            ]
-                                        }
-                                    ]
-                                }
-                            }
-                        },
-                        {
-                            '$project': {
-                                'score': {
-                                    '$cond': [
-                                        {'$gt': ['$total_questions', 0]},
-                                        {'$multiply': [{'$divide': ['$correct_answers', '$total_questions']}, 100]},
-                                        0
-                                    ]
-                                },
-                                'correct_answers': 1,
-                                'total_questions': 1,
-                                'submitted_at': 1,
-                                'created_at': 1,
-                                'duration_seconds': 1,
-                                'time_taken_ms': 1
-                            }
-                        }
-                    ],
-                    'as': 'attempts'
-                }
-            },
-            {
-                '$project': {
-                    'student_id': {'$toString': '$_id'},
-                    'student_name': '$name',
-                    'student_email': '$user_details.email',
-                    'roll_number': 1,
-                    'mobile_number': 1,
-                    'campus_name': {'$arrayElemAt': ['$campus_details.name', 0]},
-                    'course_name': {'$arrayElemAt': ['$course_details.name', 0]},
-                    'batch_name': {'$arrayElemAt': ['$batch_details.name', 0]},
-                    'attempts_count': {'$size': '$attempts'},
-                    'highest_score': {
-                        '$cond': [
-                            {'$gt': [{'$size': '$attempts'}, 0]},
-                            {'$max': '$attempts.score'},
-                            0
-                        ]
-                    },
-                    'average_score': {
-                        '$cond': [
-                            {'$gt': [{'$size': '$attempts'}, 0]},
-                            {'$avg': '$attempts.score'},
-                            0
-                        ]
-                    },
-                    'total_questions': {'$arrayElemAt': ['$attempts.total_questions', 0]},
-                    'correct_answers': {'$arrayElemAt': ['$attempts.correct_answers', 0]},
-                    'latest_attempt': {'$max': '$attempts.submitted_at'},
-                    'has_attempted': {'$gt': [{'$size': '$attempts'}, 0]},
-                    'duration_seconds': {'$arrayElemAt': ['$attempts.duration_seconds', 0]},
-                    'time_taken_ms': {'$arrayElemAt': ['$attempts.time_taken_ms', 0]}
-                }
-            },
-            {
-                '$sort': {'has_attempted': -1, 'highest_score': -1}
-            }
-        ]
-        
-        # Execute aggregation
-        students_data = list(mongo_db.students.aggregate(pipeline))
+        # Fetch the assigned students, then all completed attempts for this test in one query
+        assigned_students = list(mongo_db.students.find(student_query, {'_id': 1, 'user_id': 1}))
+        contexts = mongo_db.resolve_student_contexts([s['_id'] for s in assigned_students], key='_id')
+        
+        attempts_by_student = {}
+        for attempt in mongo_db.student_test_attempts.find(
+            {'test_id': test_object_id, 'test_type': 'online', 'status': 'completed'},
+            {'student_id': 1, 'correct_answers': 1, 'total_questions': 1, 'submitted_at': 1,
+             'created_at': 1, 'duration_seconds': 1, 'time_taken_ms': 1}
+        ):
+            attempts_by_student.setdefault(attempt.get('student_id'), []).append(attempt)
+        
+        students_data = []
+        for assigned in assigned_students:
+            context = contexts.get(str(assigned['_id']))
+            if not context or not context['user']:
+                continue
+            student = context['student']
+            # Attempts may reference either the student document or the user document
+            attempts = attempts_by_student.get(assigned['_id'], []) + attempts_by_student.get(assigned.get('user_id'), [])
+            scores = [
+                (a.get('correct_answers') or 0) / a['total_questions'] * 100 if (a.get('total_questions') or 0) > 0 else 0
+                for a in attempts
+            ]
+            submitted = [a['submitted_at'] for a in attempts if a.get('submitted_at')]
+            first_attempt = attempts[0] if attempts else {}
+            students_data.append({
+                'student_id': str(assigned['_id']),
+                'student_name': student.get('name'),
+                'student_email': context['user'].get('email'),
+                'roll_number': student.get('roll_number'),
+                'mobile_number': student.get('mobile_number'),
+                'campus_name': context['campus_name'],
+                'course_name': context['course_name'],
+                'batch_name': context['batch_name'],
+                'attempts_count': len(attempts),
+                'highest_score': max(scores) if scores else 0,
+                'average_score': sum(scores) / len(scores) if scores else 0,
+                'total_questions': first_attempt.get('total_questions'),
+                'correct_answers': first_attempt.get('correct_answers'),
+                'latest_attempt': max(submitted) if submitted else None,
+                'has_attempted': bool(attempts),
+                'duration_seconds': first_attempt.get('duration_seconds'),
+                'time_taken_ms': first_attempt.get('time_taken_ms')
+            })
+        students_data.sort(key=lambda d: (d['has_attempted'], d['highest_score']), reverse=True)
         
         if not students_data:
             return jsonify({
@@ -3002,8 +2906,7 @@ def export_test_attempts_complete(test_id):
 def export_results():
     """Export test results as CSV"""
     try:
-        current_user_id = get_jwt_identity()
-        user = mongo_db.find_user_by_id(current_user_id)
+        user = get_current_user()
         
         if not user or user.get('role') not in ALLOWED_ADMIN_ROLES:
             return jsonify({
@@ -3310,8 +3213,7 @@ def export_results():
 @jwt_required()
 def migrate_batch_course_instances():
     # Only super admin
-    current_user_id = get_jwt_identity()
-    user = mongo_db.find_user_by_id(current_user_id)
+    user = get_current_user()
     if not user or user.get('role') != 'superadmin':
         return jsonify({'success': False, 'message': 'Access denied. Super admin privileges required.'}), 403
     # Migrate students
@@ -3334,6 +3236,8 @@ def migrate_batch_course_instances():
             instance_id = mongo_db.find_or_create_batch_course_instance(batch_id, course_id)
             mongo_db.modules.update_one({'_id': m['_id']}, {'$set': {'batch_course_instance_id': instance_id}})
             updated_modules += 1
+    if updated_modules:
+        mongo_db.bump_reference_version('modules')
     # Migrate test_results
     results = list(mongo_db.db.test_results.find())
     updated_results = 0
@@ -3351,8 +3255,7 @@ def migrate_batch_course_instances():
 def debug_test_results():
     """Debug endpoint to check test results data"""
     try:
-        current_user_id = get_jwt_identity()
-        user = mongo_db.find_user_by_id(current_user_id)
+        user = get_current_user()
         
         if not user or user.get('role') not in ALLOWED_ADMIN_ROLES:
             return jsonify({
@@ -3434,8 +3337,7 @@ def debug_test_results():
 def get_test_results_simple():
     """Simple endpoint to get test results without complex aggregation"""
     try:
-        current_user_id = get_jwt_identity()
-        user = mongo_db.find_user_by_id(current_user_id)
+        user = get_current_user()
         
         if not user or user.get('role') not in ALLOWED_ADMIN_ROLES:
             return jsonify({
@@ -3511,8 +3413,7 @@ def get_test_results_simple():
 def debug_collections():
     """Debug endpoint to check what collections exist and what data they contain"""
     try:
-        current_user_id = get_jwt_identity()
-        user = mongo_db.find_user_by_id(current_user_id)
+        user = get_current_user()
         
         if not user or user.get('role') not in ALLOWED_ADMIN_ROLES:
             return jsonify({
@@ -3587,8 +3488,7 @@ def debug_collections():
 def verify_database():
     """Comprehensive database verification endpoint"""
     try:
-        current_user_id = get_jwt_identity()
-        user = mongo_db.find_user_by_id(current_user_id)
+        user = get_current_user()
         
         if not user or user.get('role') not in ALLOWED_ADMIN_ROLES:
             return jsonify({
@@ -3719,8 +3619,7 @@ def verify_database():
 def get_database_status():
     """Get comprehensive database status and connection information"""
     try:
-        current_user_id = get_jwt_identity()
-        user = mongo_db.find_user_by_id(current_user_id)
+        user = get_current_user()
         
         if not user or user.get('role') not in ALLOWED_ADMIN_ROLES:
             return jsonify({
@@ -3864,8 +3763,7 @@ def get_database_status():
 def test_database_connection():
     """Simple test endpoint to verify database connection and show sample data"""
     try:
-        current_user_id = get_jwt_identity()
-        user = mongo_db.find_user_by_id(current_user_id)
+        user = get_current_user()
         
         if not user or user.get('role') not in ALLOWED_ADMIN_ROLES:
             return jsonify({
@@ -3948,8 +3846,7 @@ def test_database_connection():
 def debug_database_connection():
     """Debug endpoint to show exact database connection details"""
     try:
-        current_user_id = get_jwt_identity()
-        user = mongo_db.find_user_by_id(current_user_id)
+        user = get_current_user()
         
         if not user or user.get('role') not in ALLOWED_ADMIN_ROLES:
             return jsonify({
@@ -4032,8 +3929,7 @@ def debug_database_connection():
 def force_connect_suma_madam():
     """Force connection to suma_madam database and test collections"""
     try:
-        current_user_id = get_jwt_identity()
-        user = mongo_db.find_user_by_id(current_user_id)
+        user = get_current_user()
         
         if not user or user.get('role') not in ALLOWED_ADMIN_ROLES:
             return jsonify({
@@ -4118,8 +4014,7 @@ def force_connect_suma_madam():
 def get_all_test_results():
     """Get all test results from all collections with detailed information"""
     try:
-        current_user_id = get_jwt_identity()
-        user = mongo_db.find_user_by_id(current_user_id)
+        user = get_current_user()
         
         if not user or user.get('role') not in ALLOWED_ADMIN_ROLES:
             return jsonify({
@@ -4155,7 +4050,7 @@ def get_all_test_results():
                         
                         # Get campus details
                         if student_profile.get('campus_id'):
-                            campus = mongo_db.campuses.find_one({'_id': student_profile['campus_id']})
+                            campus = mongo_db.reference_data.get('campuses', student_profile['campus_id'])
                             if campus:
                                 debug_info['sample_campus'] = {
                                     'id': str(campus['_id']),
@@ -4164,7 +4059,7 @@ def get_all_test_results():
                         
                         # Get course details
                         if student_profile.get('course_id'):
-                            course = mongo_db.courses.find_one({'_id': student_profile['course_id']})
+                            course = mongo_db.reference_data.get('courses', student_profile['course_id'])
                             if course:
                                 debug_info['sample_course'] = {
                                     'id': str(course['_id']),
@@ -4173,7 +4068,7 @@ def get_all_test_results():
                         
                         # Get batch details
                         if student_profile.get('batch_id'):
-                            batch = mongo_db.batches.find_one({'_id': student_profile['batch_id']})
+                            batch = mongo_db.reference_data.get('batches', student_profile['batch_id'])
                             if batch:
                                 debug_info['sample_batch'] = {
                                     'id': str(batch['_id']),
@@ -4537,19 +4432,19 @@ def get_all_test_results():
                             if student_profile:
                                 # Direct lookup for campus
                                 if student_profile.get('campus_id'):
-                                    campus = mongo_db.campuses.find_one({'_id': student_profile['campus_id']})
+                                    campus = mongo_db.reference_data.get('campuses', student_profile['campus_id'])
                                     if campus:
                                         result['campus_name'] = campus.get('name', 'Unknown Campus')
                                 
                                 # Direct lookup for course
                                 if student_profile.get('course_id'):
-                                    course = mongo_db.courses.find_one({'_id': student_profile['course_id']})
+                                    course = mongo_db.reference_data.get('courses', student_profile['course_id'])
                                     if course:
                                         result['course_name'] = course.get('name', 'Unknown Course')
                                 
                                 # Direct lookup for batch
                                 if student_profile.get('batch_id'):
-                                    batch = mongo_db.batches.find_one({'_id': student_profile['batch_id']})
+                                    batch = mongo_db.reference_data.get('batches', student_profile['batch_id'])
                                     if batch:
                                         result['batch_name'] = batch.get('name', 'Unknown Batch')
                                 
@@ -4608,8 +4503,7 @@ def get_all_test_results():
 def get_test_result_details(result_id):
     """Get detailed test result with transcripts and audio URLs"""
     try:
-        current_user_id = get_jwt_identity()
-        user = mongo_db.find_user_by_id(current_user_id)
+        user = get_current_user()
         
         if not user or user.get('role') not in ALLOWED_ADMIN_ROLES:
             return jsonify({
@@ -4745,8 +4639,7 @@ def get_test_result_details(result_id):
 def get_filter_options():
     """Get filter options for results page"""
     try:
-        current_user_id = get_jwt_identity()
-        user = mongo_db.find_user_by_id(current_user_id)
+        user = get_current_user()
         
         if not user or user.get('role') not in ALLOWED_ADMIN_ROLES:
             return jsonify({
@@ -4773,8 +4666,7 @@ def get_filter_options():
         # Get campuses
         campuses = []
         try:
-            campus_cursor = mongo_db.campuses.find({}, {'name': 1})
-            for campus in campus_cursor:
+            for campus in mongo_db.reference_data.all('campuses'):
                 campuses.append({
                     'id': str(campus['_id']),
                     'name': campus['name']
@@ -4785,8 +4677,7 @@ def get_filter_options():
         # Get courses
         courses = []
         try:
-            course_cursor = mongo_db.courses.find({}, {'name': 1})
-            for course in course_cursor:
+            for course in mongo_db.reference_data.all('courses'):
                 courses.append({
                     'id': str(course['_id']),
                     'name': course['name']
@@ -4797,8 +4688,7 @@ def get_filter_options():
         # Get batches
         batches = []
         try:
-            batch_cursor = mongo_db.batches.find({}, {'name': 1})
-            for batch in batch_cursor:
+            for batch in mongo_db.reference_data.all('batches'):
                 batches.append({
                     'id': str(batch['_id']),
                     'name': batch['name']
@@ -4838,8 +4728,7 @@ def get_filter_options():
 def get_all_practice_results():
     """Get all practice test results from both collections for super admin"""
     try:
-        current_user_id = get_jwt_identity()
-        user = mongo_db.find_user_by_id(current_user_id)
+        user = get_current_user()
         
         if not user or user.get('role') not in ALLOWED_ADMIN_ROLES:
             return jsonify({
@@ -4925,8 +4814,7 @@ def get_all_practice_results():
 def get_student_progress(student_id):
     """Get detailed progress for a specific student"""
     try:
-        current_user_id = get_jwt_identity()
-        user = mongo_db.find_user_by_id(current_user_id)
+        user = get_current_user()
         
         if not user or user.get('role') not in ALLOWED_ADMIN_ROLES:
             return jsonify({
@@ -5041,8 +4929,7 @@ def get_student_progress(student_id):
 def get_practice_tests_by_module():
     """Get practice tests grouped by module for progress tracking"""
     try:
-        current_user_id = get_jwt_identity()
-        user = mongo_db.find_user_by_id(current_user_id)
+        user = get_current_user()
         
         if not user or user.get('role') not in ALLOWED_ADMIN_ROLES:
             return jsonify({'success': False, 'message': 'Access denied'}), 403
@@ -5088,8 +4975,7 @@ def get_practice_tests_by_module():
 def get_test_assigned_students(test_id):
     """Get attempted and unattempted students for a specific test"""
     try:
-        current_user_id = get_jwt_identity()
-        user = mongo_db.find_user_by_id(current_user_id)
+        user = get_current_user()
         
         if not user or user.get('role') not in ALLOWED_ADMIN_ROLES:
             return jsonify({'success': False, 'message': 'Access denied'}), 403
@@ -5217,8 +5103,7 @@ def get_test_assigned_students(test_id):
 def get_student_test_progress(student_id, test_id):
     """Get student's progress for a specific test"""
     try:
-        current_user_id = get_jwt_identity()
-        user = mongo_db.find_user_by_id(current_user_id)
+        user = get_current_user()
         
         if not user or user.get('role') not in ALLOWED_ADMIN_ROLES:
             return jsonify({'success': False, 'message': 'Access denied'}), 403
@@ -5327,8 +5212,7 @@ def get_student_test_progress(student_id, test_id):
 def get_superadmin_practice_attempt_details(attempt_id):
     """Get detailed results for a specific practice test attempt (Superadmin access)"""
     try:
-        current_user_id = get_jwt_identity()
-        user = mongo_db.find_user_by_id(current_user_id)
+        user = get_current_user()
         
         if not user or user.get('role') not in ALLOWED_ADMIN_ROLES:
             return jsonify({'success': False, 'message': 'Access denied'}), 403
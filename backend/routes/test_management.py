@@ -34,14 +34,24 @@ except ImportError:
 from difflib import SequenceMatcher
 import json
 from mongo import mongo_db
+from utils.request_identity import get_current_user
+from utils.test_payload_cache import get_processed_test
+from utils.mcq_grading import compile_answer_key, grade_mcq, regrade_result
+from utils.submission_outbox import outbox_consumer, practice_outbox_entry
+from utils.rate_limiter import rate_limited
+from utils.spreadsheet_reader import SpreadsheetReader, iter_chunks, normalize_cell
+from utils.question_fingerprint import CONTENT_HASH_FIELD, question_content_hash
+from utils.audio_grading import GRADING_PENDING, pending_audio_result, pending_audio_entry, submit_grading, requeue_if_stale
 from config.constants import ROLES, MODULES, LEVELS, TEST_TYPES, GRAMMAR_CATEGORIES, CRT_CATEGORIES, QUESTION_TYPES, TEST_CATEGORIES, MODULE_CATEGORIES
 from config.aws_config import s3_client, S3_BUCKET_NAME, get_s3_client_safe
 from utils.audio_generator import generate_audio_from_text, calculate_similarity_score, transcribe_audio
+from services.audio_generation_service import audio_generation_service, is_shared_audio_key
 import functools
 import string
 import random
 from dateutil import tz
 from pymongo import DESCENDING
+from pymongo.errors import BulkWriteError
 from collections import defaultdict
 from utils.email_service import send_email, render_template
 import requests
@@ -83,6 +93,9 @@ def safe_isoformat(date_obj):
 ONECOMPILER_API_KEY = 'f744734571mshb636ee6aecb15e3p16c0e7jsnd142c0e341e6'
 ONECOMPILER_API_HOST = 'onecompiler-apis.p.rapidapi.com'
 
+# Uploaded question rows are validated and inserted this many at a time
+QUESTION_UPLOAD_CHUNK_SIZE = 500
+
 test_management_bp = Blueprint('test_management', __name__)
 
 # Test route to verify blueprint is working
@@ -103,8 +116,7 @@ def generate_unique_test_id(length=6):
 def require_superadmin(f):
     @functools.wraps(f)
     def decorated_function(*args, **kwargs):
-        current_user_id = get_jwt_identity()
-        user = mongo_db.find_user_by_id(current_user_id)
+        user = get_current_user()
         allowed_roles = ['superadmin', 'sub_superadmin', 'campus_admin', 'course_admin']
         if not user or user.get('role') not in allowed_roles:
             return jsonify({
@@ -133,16 +145,12 @@ def convert_objectids(obj):
         return obj
 
 def generate_audio_from_text(text, accent='en-US', speed=1.0):
-    """Generate audio from text using gTTS with custom accent and speed"""
+    """Generate audio from text using gTTS with custom accent and speed (reused if already generated)"""
     try:
-        # Import the utility function instead of duplicating code
-        from utils.audio_generator import generate_audio_from_text as generate_audio_util
-        
         # Convert accent format (en-US -> en)
         lang = accent.split('-')[0] if '-' in accent else accent
         
-        # Call the utility function with proper error handling
-        return generate_audio_util(text, lang, speed)
+        return audio_generation_service.generate(text, lang, speed)
         
     except Exception as e:
         current_app.logger.error(f"AUDIO GENERATION FAILED: {str(e)}", exc_info=True)
@@ -162,43 +170,39 @@ def audio_generation_worker(app, test_id, questions, audio_config):
         try:
             current_app.logger.info(f"Starting audio generation for test {test_id}")
             
-            for i, question in enumerate(questions):
-                question_text = question.get('question', '')
-                if not question_text:
-                    continue
-                
-                # Generate audio
-                accent = audio_config.get('accent', 'en-US')
-                speed = audio_config.get('speed', 1.0)
-                
-                # Ensure speed is a float to prevent type comparison errors
-                try:
-                    speed = float(speed) if speed is not None else 1.0
-                except (ValueError, TypeError):
-                    speed = 1.0
-                    current_app.logger.warning(f"Invalid speed value '{audio_config.get('speed')}', using default 1.0")
-                
-                try:
-                    audio_url = generate_audio_from_text(question_text, accent, speed)
-                    
-                    if audio_url:
-                        # Update the question with audio URL
-                        mongo_db.tests.update_one(
-                            {'_id': ObjectId(test_id)},
-                            {'$set': {f'questions.{i}.audio_url': audio_url}}
-                        )
-                        current_app.logger.info(f"Generated audio for question {i+1}")
-                    else:
-                        current_app.logger.error(f"Failed to generate audio for question {i+1}")
-                        
-                except Exception as audio_error:
-                    current_app.logger.error(f"Failed to generate audio for question {i+1}: {str(audio_error)}")
-                    # Continue with next question instead of failing entire batch
-                    continue
-                
-
+            accent = audio_config.get('accent', 'en-US')
+            speed = audio_config.get('speed', 1.0)
             
-            current_app.logger.info(f"Completed audio generation for test {test_id}")
+            # Ensure speed is a float to prevent type comparison errors
+            try:
+                speed = float(speed) if speed is not None else 1.0
+            except (ValueError, TypeError):
+                speed = 1.0
+                current_app.logger.warning(f"Invalid speed value '{audio_config.get('speed')}', using default 1.0")
+            
+            # Convert accent format (en-US -> en)
+            lang = accent.split('-')[0] if '-' in accent else accent
+            
+            # Generated concurrently, once per distinct sentence, reusing audio of earlier tests
+            pending = [(i, question.get('question', '')) for i, question in enumerate(questions) if question.get('question')]
+            results = audio_generation_service.generate_many([(text, lang, speed) for _, text in pending])
+            
+            audio_updates = {}
+            for (i, _), result in zip(pending, results):
+                if result['audio_url']:
+                    audio_updates[f'questions.{i}.audio_url'] = result['audio_url']
+                else:
+                    # Continue with the other questions instead of failing entire batch
+                    current_app.logger.error(f"Failed to generate audio for question {i+1}: {result['error']}")
+            
+            # All audio URLs in one update
+            if audio_updates:
+                mongo_db.tests.update_one({'_id': ObjectId(test_id)}, {'$set': audio_updates})
+            
+            reused = sum(1 for result in results if result['cached'])
+            current_app.logger.info(
+                f"Completed audio generation for test {test_id}: {len(audio_updates)}/{len(pending)} questions, {reused} reused"
+            )
         except Exception as e:
             current_app.logger.error(f"Error in audio generation worker: {str(e)}")
 
@@ -664,7 +668,11 @@ def delete_test(test_id):
         mcq_modules = ['GRAMMAR', 'VOCABULARY', 'READING']
         if module_id not in mcq_modules:
             questions = test_to_delete.get('questions', [])
-            objects_to_delete = [{'Key': q['audio_url']} for q in questions if 'audio_url' in q and q['audio_url']]
+            # Generated audio under audio/tts/ is shared by every test with the same sentence; keep it
+            objects_to_delete = [
+                {'Key': q['audio_url']} for q in questions
+                if q.get('audio_url') and not is_shared_audio_key(q['audio_url'])
+            ]
             if objects_to_delete:
                 current_s3_client = get_s3_client_safe()
                 if current_s3_client:
@@ -732,7 +740,7 @@ def get_student_count():
                     user = mongo_db.users.find_one({'_id': student['user_id']})
                     if user:
                         # Get course name
-                        course = mongo_db.courses.find_one({'_id': student.get('course_id')})
+                        course = mongo_db.reference_data.get('courses', student.get('course_id'))
                         course_name = course.get('name', 'Unknown Course') if course else 'Unknown Course'
                         
                         student_list.append({
@@ -756,7 +764,7 @@ def get_student_count():
                 user = mongo_db.users.find_one({'_id': student['user_id']})
                 if user:
                     # Get course name
-                    course = mongo_db.courses.find_one({'_id': student.get('course_id')})
+                    course = mongo_db.reference_data.get('courses', student.get('course_id'))
                     course_name = course.get('name', 'Unknown Course') if course else 'Unknown Course'
                     
                     student_list.append({
@@ -784,7 +792,7 @@ def get_student_count():
                     user = mongo_db.users.find_one({'_id': student['user_id']})
                     if user:
                         # Get course name
-                        course = mongo_db.courses.find_one({'_id': student.get('course_id')})
+                        course = mongo_db.reference_data.get('courses', student.get('course_id'))
                         course_name = course.get('name', 'Unknown Course') if course else 'Unknown Course'
                         
                         student_list.append({
@@ -1029,31 +1037,11 @@ def upload_module_questions():
         duplicate_questions = []
         invalid_questions = []
         
-        # Get existing questions for duplicate checking
-        query_filter = {'module_id': module_id}
-        if topic_id:
-            query_filter['topic_id'] = ObjectId(topic_id)
-        elif level_id:
-            query_filter['level_id'] = level_id
-            
-        existing_questions = list(mongo_db.question_bank.find(
-            query_filter,
-            {'question': 1, 'questionTitle': 1, '_id': 0}
-        ))
-        
-        # Create sets for duplicate checking based on question type
-        existing_question_texts = set()
-        existing_question_titles = set()
-        
-        for q in existing_questions:
-            if 'question' in q and q['question']:
-                existing_question_texts.add(q['question'].strip().lower())
-            if 'questionTitle' in q and q['questionTitle']:
-                existing_question_titles.add(q['questionTitle'].strip().lower())
-        
         # Track questions within the file to detect duplicates
-        seen_questions_in_file = set()
+        seen_hashes_in_file = set()
         seen_titles_in_file = set()
+        # content_hash of each valid question, by upload index
+        content_hashes = {}
         
         for i, q in enumerate(questions):
             # Basic validation based on module type
@@ -1090,33 +1078,52 @@ def upload_module_questions():
                 continue
             
             # Check for duplicates within the file first
-            question_text = q.get('question', '').strip().lower()
+            content_hash = question_content_hash(q.get('question'), topic_id)
             question_title = q.get('questionTitle', '').strip().lower()
-            
-            if question_text in seen_questions_in_file or question_title in seen_titles_in_file:
-                duplicate_questions.append({
+            if not content_hash:
+                invalid_questions.append({
                     'index': i + 1,
                     'question': q.get('question', q.get('questionTitle', '')),
-                    'reason': 'Duplicate question within the same file'
+                    'reason': 'Question text is empty'
                 })
                 continue
             
-            # Check for duplicates against database
-            if question_text in existing_question_texts or question_title in existing_question_titles:
+            if content_hash in seen_hashes_in_file or question_title in seen_titles_in_file:
                 duplicate_questions.append({
                     'index': i + 1,
                     'question': q.get('question', q.get('questionTitle', '')),
-                    'reason': 'Question already exists in database'
+                    'reason': 'Duplicate question within the same file'
                 })
                 continue
             
             # Add to valid questions and mark as seen
-            valid_questions.append(q)
-            if question_text:
-                seen_questions_in_file.add(question_text)
+            valid_questions.append((i, q))
+            content_hashes[i] = content_hash
+            seen_hashes_in_file.add(content_hash)
             if question_title:
                 seen_titles_in_file.add(question_title)
         
+        # Check for duplicates against database: one indexed $in on the upload's hashes
+        # (the hash includes the topic, so topic uploads match within their topic)
+        hash_filter = {'module_id': module_id, CONTENT_HASH_FIELD: {'$in': list(content_hashes.values())}}
+        if not topic_id:
+            hash_filter['level_id'] = level_id
+        existing_hashes = {
+            doc[CONTENT_HASH_FIELD]
+            for doc in mongo_db.question_bank.find(hash_filter, {CONTENT_HASH_FIELD: 1, '_id': 0})
+        }
+        new_questions = []
+        for i, q in valid_questions:
+            if content_hashes[i] in existing_hashes:
+                duplicate_questions.append({
+                    'index': i + 1,
+                    'question': q.get('question', q.get('questionTitle', '')),
+                    'reason': 'Question already exists in database'
+                })
+            else:
+                new_questions.append((i, q))
+        valid_questions = new_questions
+        
         if not valid_questions:
             return jsonify({
                 'success': False, 
@@ -1135,8 +1142,8 @@ def upload_module_questions():
         upload_session_id = str(uuid.uuid4())
         
         # Store valid questions in question_bank collection
-        inserted = []
-        for q in valid_questions:
+        docs = []
+        for i, q in valid_questions:
             # Determine question type first
             question_type = None
             if module_id == 'CRT_TECHNICAL' or level_id == 'CRT_TECHNICAL':
@@ -1157,7 +1164,8 @@ def upload_module_questions():
                 'used_count': 0,
                 'last_used': None,
                 'created_at': datetime.utcnow(),
-                'upload_session_id': upload_session_id
+                'upload_session_id': upload_session_id,
+                CONTENT_HASH_FIELD: content_hashes[i]
             }
             
             # Add topic_id if provided (for CRT modules)
@@ -1202,8 +1210,34 @@ def upload_module_questions():
             if 'subcategory' in q:
                 doc['subcategory'] = q['subcategory']
                 
-            mongo_db.question_bank.insert_one(doc)
-            inserted.append(doc['question'])
+            docs.append((i, doc))
+        
+        # Unordered bulk insert; a question stored concurrently since the check above
+        # hits the unique content hash index and is reported as a duplicate
+        failed = {}
+        if docs:
+            try:
+                mongo_db.question_bank.insert_many([doc for _, doc in docs], ordered=False)
+            except BulkWriteError as e:
+                failed = {error['index']: error for error in e.details.get('writeErrors', [])}
+        inserted = []
+        for position, (i, doc) in enumerate(docs):
+            error = failed.get(position)
+            if error is None:
+                inserted.append(doc['question'])
+            elif error.get('code') == 11000:
+                duplicate_questions.append({
+                    'index': i + 1,
+                    'question': doc['question'],
+                    'reason': 'Question already exists in database'
+                })
+            else:
+                current_app.logger.error(f"Failed to store question {i + 1}: {error.get('errmsg')}")
+                invalid_questions.append({
+                    'index': i + 1,
+                    'question': doc['question'],
+                    'reason': f"Database error: {error.get('errmsg', 'write failed')}"
+                })
         
         current_app.logger.info(f"Successfully uploaded {len(inserted)} questions to module bank")
         
@@ -2200,58 +2234,13 @@ def submit_practice_test():
                 'message': 'Test not found'
             }), 404
         
-        # Use consistent shuffling based on test_id (same as online tests)
-        import random
+        # Same shuffled order and answer key the student was served (cached per test revision)
+        mcq_key = None
         if 'questions' in test and isinstance(test['questions'], list):
-            # Use test_id as seed for consistent shuffling (same as online tests)
-            test_id_str = str(test_id)
-            random.seed(hash(test_id_str) % 1000000)
-            
-            # Shuffle questions (same as online tests)
-            random.shuffle(test['questions'])
-            
-            # Process questions with shuffling (same as online tests)
-            shuffled_questions = []
-            
-            for idx, q in enumerate(test['questions']):
-                if q.get('question_type') == 'mcq':
-                    # Build options dict from optionA...optionD
-                    options = {}
-                    answer_letter = q.get('answer')  # e.g. "C"
-
-                    for opt_key in ['A', 'B', 'C', 'D']:
-                        opt_field = f"option{opt_key}"
-                        if q.get(opt_field) is not None:
-                            options[opt_key] = q[opt_field]
-
-                    # Shuffle options
-                    items = list(options.items())
-                    random.shuffle(items)
-
-                    new_options = {}
-                    answer_map = {}
-                    for new_idx, (old_key, value) in enumerate(items):
-                        new_key = chr(ord('A') + new_idx)
-                        new_options[new_key] = value
-                        answer_map[old_key] = new_key
-
-                    # Store shuffled question data for validation
-                    shuffled_q = q.copy()
-                    shuffled_q['shuffled_options'] = new_options
-                    shuffled_q['answer_mapping'] = answer_map
-                    shuffled_q['shuffled_answer'] = answer_map.get(answer_letter)
-                    shuffled_questions.append(shuffled_q)
-                else:
-                    # Non-MCQ questions
-                    shuffled_q = q.copy()
-                    shuffled_questions.append(shuffled_q)
-            
-            # Reset random seed
-            random.seed()
-            
-            # Store shuffled questions for validation
-            test['shuffled_questions'] = shuffled_questions
-            current_app.logger.info(f"Applied consistent shuffling to {len(shuffled_questions)} questions for practice test validation")
+            processed = get_processed_test(test)
+            test['shuffled_questions'] = processed['shuffled_questions']
+            mcq_key = processed['mcq_key']
+            current_app.logger.info(f"Applied consistent shuffling to {len(test['shuffled_questions'])} questions for practice test validation")
         
         # Check if student has access to this test
         current_app.logger.info(f"Looking for student profile with user_id: {current_user_id}")
@@ -2311,6 +2300,7 @@ def submit_practice_test():
         if not shuffled_questions:
             # If no shuffled questions, use original questions but apply same validation logic
             shuffled_questions = test.get('questions', [])
+            mcq_key = None
             current_app.logger.info(f"No shuffled questions found, using original questions")
         
         current_app.logger.info(f"Processing {len(shuffled_questions)} questions for test {test_id}")
@@ -2319,111 +2309,20 @@ def submit_practice_test():
         # Use same validation approach as online tests
         current_app.logger.info(f"Processing questions with standardized matching logic")
         
+        # All MCQs are graded in one pass against the compiled answer key
+        if mcq_key is None:
+            mcq_key = compile_answer_key(shuffled_questions)
+        mcq_grading = grade_mcq(mcq_key, data, lambda i, question_id: f'answer_{i}', include_options=True)
+        
         results = []
-        total_score = 0
-        correct_answers = 0
-        total_marks = len(shuffled_questions)
+        total_score = mcq_grading['score']
+        correct_answers = mcq_grading['correct_answers']
+        pending_audio = []
+        audio_items = []
         
         for i, question in enumerate(shuffled_questions):
-            current_app.logger.info(f"Processing question {i}: type={question.get('question_type')}")
-            current_app.logger.info(f"Question {i} data: {question}")
-            
             if question.get('question_type') == 'mcq':
-                # Handle MCQ question - use answer index format (answer_0, answer_1, etc.)
-                answer_key = f'answer_{i}'
-                current_app.logger.info(f"MCQ question {i}: looking for answer key '{answer_key}' in data")
-                
-                if answer_key in data:
-                    student_answer_text = data[answer_key]
-                    
-                    # Use same logic as online tests - check for shuffled data first
-                    if 'shuffled_answer' in question and 'shuffled_options' in question:
-                        # Use shuffled answer mapping (same as online tests)
-                        correct_answer_letter = question.get('shuffled_answer', '')
-                        shuffled_options = question.get('shuffled_options', {})
-                        correct_answer_text = shuffled_options.get(correct_answer_letter, '')
-                        current_app.logger.info(f"Using shuffled answer mapping: {correct_answer_letter} -> {correct_answer_text}")
-                    else:
-                        # Fall back to original answer mapping (same as online tests)
-                        correct_answer_letter = question.get('answer', '')  # A, B, C, or D
-                        correct_answer_text = ''
-                        
-                        # Map answer letter to actual option text (same as online tests)
-                        if correct_answer_letter == 'A':
-                            correct_answer_text = question.get('optionA', '')
-                        elif correct_answer_letter == 'B':
-                            correct_answer_text = question.get('optionB', '')
-                        elif correct_answer_letter == 'C':
-                            correct_answer_text = question.get('optionC', '')
-                        elif correct_answer_letter == 'D':
-                            correct_answer_text = question.get('optionD', '')
-                        current_app.logger.info(f"Using original answer mapping: {correct_answer_letter} -> {correct_answer_text}")
-                    
-                    # Check if student answer matches correct answer text (same as online tests)
-                    is_correct = student_answer_text == correct_answer_text
-                    score = 1 if is_correct else 0
-                    
-                    current_app.logger.info(f"MCQ question {i}: student_answer='{student_answer_text}', correct_answer_text='{correct_answer_text}', is_correct={is_correct}")
-                    current_app.logger.info(f"Question {i} structure: correct_answer='{correct_answer_letter}', original_answer='{question.get('answer', '')}', options={question.get('optionA', '')[:20]}...")
-                    
-                    if is_correct:
-                        correct_answers += 1
-                    total_score += score
-                    
-                    # Store result in same format as online tests
-                    result_data = {
-                        'question_index': i,
-                        'question_id': str(question.get('_id', i)),
-                        'question': question['question'],
-                        'question_type': 'mcq',
-                        'student_answer': student_answer_text,
-                        'correct_answer_letter': correct_answer_letter,
-                        'correct_answer_text': correct_answer_text,
-                        'is_correct': is_correct,
-                        'score': score
-                    }
-                    
-                    # Add options for display
-                    if 'shuffled_options' in question:
-                        result_data['options'] = question['shuffled_options']
-                    else:
-                        # Fallback to original options
-                        result_data['options'] = {
-                            'A': question.get('optionA', ''),
-                            'B': question.get('optionB', ''),
-                            'C': question.get('optionC', ''),
-                            'D': question.get('optionD', '')
-                        }
-                    
-                    results.append(result_data)
-                else:
-                    current_app.logger.warning(f"MCQ question {i}: answer key '{answer_key}' not found in data. Available keys: {list(data.keys())}")
-                    # Add empty result for missing answer
-                    empty_result = {
-                        'question_index': i,
-                        'question_id': str(question.get('_id', i)),
-                        'question': question['question'],
-                        'question_type': 'mcq',
-                        'student_answer': '',
-                        'correct_answer_letter': question.get('answer', ''),
-                        'correct_answer_text': '',
-                        'is_correct': False,
-                        'score': 0
-                    }
-                    
-                    # Add options for display
-                    if 'shuffled_options' in question:
-                        empty_result['options'] = question['shuffled_options']
-                    else:
-                        # Fallback to original options
-                        empty_result['options'] = {
-                            'A': question.get('optionA', ''),
-                            'B': question.get('optionB', ''),
-                            'C': question.get('optionC', ''),
-                            'D': question.get('optionD', '')
-                        }
-                    
-                    results.append(empty_result)
+                results.append(mcq_grading['by_position'][i])
             elif question.get('question_type') in ['compiler', 'technical']:
                 # Handle compiler/technical question
                 answer_key = f'answer_{i}'
@@ -2534,106 +2433,22 @@ def submit_practice_test():
                 question_identifier = question.get('question_id', f'q_{i}')
                 student_audio_key = f"student_audio/{current_user_id}/{test_id}/{question_identifier}_{uuid.uuid4()}.{file_extension}"
                 
+                # Keep the bytes: grading works from them instead of downloading the upload back
+                audio_bytes = audio_file.read()
                 current_app.logger.info(f"Uploading audio for question {i}: {student_audio_key}")
-                current_s3_client.upload_fileobj(audio_file, S3_BUCKET_NAME, student_audio_key)
+                current_s3_client.upload_fileobj(io.BytesIO(audio_bytes), S3_BUCKET_NAME, student_audio_key)
                 
                 # Create full S3 URL for frontend access
                 student_audio_url = f"https://{S3_BUCKET_NAME}.s3.amazonaws.com/{student_audio_key}"
                 
-                # Download for transcription
-                temp_audio_path = f"temp_student_{question_identifier}_{uuid.uuid4()}.{file_extension}"
-                current_s3_client.download_file(S3_BUCKET_NAME, student_audio_key, temp_audio_path)
-                
-                # Transcribe student audio
-                try:
-                    # Import the utility function to avoid naming conflict
-                    from utils.audio_generator import transcribe_audio as transcribe_audio_util
-                    
-                    current_app.logger.info(f"Starting transcription for question {i}, file: {temp_audio_path}")
-                    
-                    # Check if file exists and has content
-                    if not os.path.exists(temp_audio_path):
-                        current_app.logger.error(f"Temporary audio file not found: {temp_audio_path}")
-                        student_text = ""
-                    elif os.path.getsize(temp_audio_path) == 0:
-                        current_app.logger.error(f"Temporary audio file is empty: {temp_audio_path}")
-                        student_text = ""
-                    else:
-                        current_app.logger.info(f"Audio file size: {os.path.getsize(temp_audio_path)} bytes")
-                        student_text = transcribe_audio_util(temp_audio_path)
-                        
-                        if not student_text:
-                            current_app.logger.warning(f"Transcription returned empty text for question {i}")
-                            student_text = ""
-                        else:
-                            current_app.logger.info(f"Successfully transcribed question {i}: '{student_text[:100]}...'")
-                            
-                except Exception as e:
-                    current_app.logger.error(f"Error transcribing audio for question {i}: {e}")
-                    current_app.logger.error(f"Audio file path: {temp_audio_path}")
-                    current_app.logger.error(f"File exists: {os.path.exists(temp_audio_path) if 'temp_audio_path' in locals() else 'N/A'}")
-                    student_text = ""
-                finally:
-                    # Clean up temporary files
-                    for temp_file in [temp_audio_path]:
-                        if 'temp_file' in locals() and os.path.exists(temp_file):
-                            try:
-                                os.remove(temp_file)
-                                current_app.logger.info(f"Cleaned up temporary file: {temp_file}")
-                            except Exception as cleanup_error:
-                                current_app.logger.error(f"Error cleaning up temporary file: {cleanup_error}")
-                    
-                    # Also clean up converted wav file if it exists
-                    if 'transcription_path' in locals() and transcription_path != temp_audio_path and os.path.exists(transcription_path):
-                        try:
-                            os.remove(transcription_path)
-                            current_app.logger.info(f"Cleaned up converted file: {transcription_path}")
-                        except Exception as cleanup_error:
-                            current_app.logger.error(f"Error cleaning up converted file: {cleanup_error}")
-                
-                # Get the original text to compare against
-                original_text = question.get('question') or question.get('sentence', '')
-                
-                # Calculate similarity score
-                try:
-                    similarity_score = calculate_similarity_score(original_text, student_text)
-                    # Convert percentage to decimal (0-1 scale)
-                    similarity_score = similarity_score / 100.0
-                except Exception as e:
-                    current_app.logger.error(f"Error calculating similarity for question {i}: {e}")
-                    similarity_score = 0.0
-                
-                # Determine if answer is correct based on module type
-                is_correct = False
-                score = 0
-                
-                if test.get('module_id') == 'LISTENING':
-                    # For listening, check if similarity is above threshold
-                    threshold = question.get('transcript_validation', {}).get('tolerance', 0.8)
-                    is_correct = similarity_score >= threshold
-                    score = similarity_score
-                    current_app.logger.info(f"Listening question {i}: original='{original_text[:50]}...', student='{student_text[:50]}...', similarity={similarity_score:.3f}, threshold={threshold}, is_correct={is_correct}")
-                elif test.get('module_id') == 'SPEAKING':
-                    # For speaking, similar logic but with different threshold
-                    threshold = question.get('transcript_validation', {}).get('tolerance', 0.7)
-                    is_correct = similarity_score >= threshold
-                    score = similarity_score
-                    current_app.logger.info(f"Speaking question {i}: original='{original_text[:50]}...', student='{student_text[:50]}...', similarity={similarity_score:.3f}, threshold={threshold}, is_correct={is_correct}")
-                
-                if is_correct:
-                    correct_answers += 1
-                total_score += score
-                
-                results.append({
+                # Transcription and scoring happen in the background grading pool
+                results.append(pending_audio_result(i, question, student_audio_url))
+                pending_audio.append(pending_audio_entry(i, question, student_audio_key, file_extension))
+                audio_items.append({
                     'question_index': i,
-                    'question': question['question'],
-                    'question_type': 'audio',
-                    'student_audio_url': student_audio_url,
-                    'student_text': student_text,
-                    'original_text': original_text,
-                    'similarity_score': similarity_score,
-                    'is_correct': is_correct,
-                    'score': score
+                    'question': question,
+                    'audio_bytes': audio_bytes,
+                    'extension': file_extension
                 })
         
         # Calculate score and percentage - same logic as online tests
@@ -2658,7 +2473,7 @@ def submit_practice_test():
             'level_id': level_id,
             'start_time': current_time,
             'end_time': current_time,
-            'status': 'completed',
+            'status': GRADING_PENDING if audio_items else 'completed',
             'answers': {f'answer_{i}': data.get(f'answer_{i}', '') for i in range(total_questions)},
             'score': total_score,
             'total_questions': total_questions,
@@ -2670,69 +2485,39 @@ def submit_practice_test():
             'duration_seconds': 0,  # Practice tests don't track time
             'submitted_at': current_time
         }
+        if pending_audio:
+            attempt_doc['pending_audio'] = pending_audio
+        else:
+            # test_results copy, progress/unlocks and monitoring are applied by the outbox consumer
+            attempt_doc['outbox'] = practice_outbox_entry(test, student, current_user_id)
         
         current_app.logger.info(f"Saving test attempt: {attempt_doc}")
         
         # Save to student_test_attempts collection
-        mongo_db.student_test_attempts.insert_one(attempt_doc)
+        attempt_id = mongo_db.student_test_attempts.insert_one(attempt_doc).inserted_id
         current_app.logger.info("Test attempt saved to student_test_attempts collection")
-        
-        # Also save to test_results collection for compatibility with existing endpoints
-        test_result_doc = {
-            'test_id': test_id,
-            'student_id': current_user_id,
-            'test_name': test.get('name', f"Practice Test - {test.get('module_id', 'Unknown')}"),
-            'test_type': 'practice',
-            'module_id': test.get('module_id'),
-            'subcategory': test.get('subcategory'),
-            'level_id': test.get('level_id'),
-            'score': total_score,
-            'percentage': percentage,
-            'correct_answers': correct_answers,
-            'total_questions': total_questions,
-            'results': results,
-            'submitted_at': current_time,
-            'time_taken': None,  # Practice tests don't track time
-            'status': 'completed'
-        }
-        
-        try:
-            mongo_db.test_results.insert_one(test_result_doc)
-            current_app.logger.info("Test result also saved to test_results collection")
-        except Exception as e:
-            current_app.logger.warning(f"Could not save to test_results collection: {e}")
+        if not audio_items:
+            outbox_consumer.notify()
+            mongo_db.record_test_attempt_summary(current_user_id, test_id, percentage, attempt_id, current_time)
         
         current_app.logger.info("Test result saved successfully")
         
-        # Update student progress and check for level unlocks
-        try:
-            from utils.student_progress_manager import StudentProgressManager
-            progress_manager = StudentProgressManager(mongo_db)
-            
-            # Get level_id from test
-            level_id = test.get('level_id') or test.get('subcategory')
-            if level_id:
-                # Convert score to percentage if needed
-                score_percentage = percentage if percentage <= 100 else (total_score / total_questions * 100)
-                
-                # Update progress and check for unlocks
-                progress_updated = progress_manager.update_student_progress_on_test_completion(
-                    student_id=student['_id'],
-                    level_id=level_id,
-                    score=score_percentage,
-                    test_id=test_id
-                )
-                
-                if progress_updated:
-                    current_app.logger.info(f"Student progress updated for level {level_id} with score {score_percentage}")
-                else:
-                    current_app.logger.warning(f"Failed to update student progress for level {level_id}")
-            else:
-                current_app.logger.warning("No level_id found in test, skipping progress update")
-                
-        except Exception as progress_error:
-            current_app.logger.error(f"Error updating student progress: {progress_error}")
-            # Don't fail the test submission if progress update fails
+        if audio_items:
+            # Summary, outbox and the final score are written once the recordings are graded
+            submit_grading(attempt_id, audio_items)
+            current_app.logger.info(f"Queued {len(audio_items)} recordings of attempt {attempt_id} for grading")
+            return jsonify({
+                'success': True,
+                'message': 'Test submitted successfully. Your recordings are being graded.',
+                'data': {
+                    'attempt_id': str(attempt_id),
+                    'status': GRADING_PENDING,
+                    'total_questions': total_questions,
+                    'results': results,
+                    'test_type': 'practice',
+                    'module_id': test.get('module_id')
+                }
+            }), 202
         
         return jsonify({
             'success': True,
@@ -2755,6 +2540,46 @@ def submit_practice_test():
             'message': f'Failed to submit test: {str(e)}'
         }), 500
 
+@test_management_bp.route('/attempts/<attempt_id>/grading-status', methods=['GET'])
+@jwt_required()
+def get_attempt_grading_status(attempt_id):
+    """Grading status of a practice attempt; includes the results once graded"""
+    try:
+        current_user_id = get_jwt_identity()
+        if not ObjectId.is_valid(attempt_id):
+            return jsonify({'success': False, 'message': 'Invalid attempt ID'}), 400
+        
+        attempt = mongo_db.student_test_attempts.find_one({
+            '_id': ObjectId(attempt_id),
+            'student_id': ObjectId(current_user_id)
+        })
+        if not attempt:
+            return jsonify({'success': False, 'message': 'Attempt not found'}), 404
+        
+        status = attempt.get('status')
+        data = {'attempt_id': attempt_id, 'status': status}
+        if status == GRADING_PENDING:
+            data['requeued'] = requeue_if_stale(attempt)
+        else:
+            data.update({
+                'score': attempt.get('score', 0),
+                'total_questions': attempt.get('total_questions', 0),
+                'correct_answers': attempt.get('correct_answers', 0),
+                'percentage': attempt.get('percentage', 0),
+                'results': attempt.get('detailed_results', []),
+                'test_type': attempt.get('test_type'),
+                'module_id': attempt.get('module_id')
+            })
+        
+        return jsonify({'success': True, 'data': data}), 200
+        
+    except Exception as e:
+        current_app.logger.error(f"Error fetching grading status for attempt {attempt_id}: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': f'Failed to fetch grading status: {str(e)}'
+        }), 500
+
 @test_management_bp.route('/submit-technical-test', methods=['POST'])
 @jwt_required()
 def submit_technical_test():
@@ -2807,6 +2632,7 @@ def submit_technical_test():
         
         # Insert result
         result_id = mongo_db.test_results.insert_one(result_doc).inserted_id
+        mongo_db.record_test_attempt_summary(get_jwt_identity(), test_id, percentage, result_id)
         
         # Update test usage statistics
         for question_index, answer in answers.items():
@@ -2843,9 +2669,12 @@ def submit_technical_test():
 
 @test_management_bp.route('/run-code', methods=['POST'])
 @jwt_required()
+@rate_limited('code_execution')
 def run_code():
-    """Run code using OneCompiler API"""
+    """Run code on the configured execution backend (OneCompiler API or local sandbox)"""
     try:
+        from services.compiler_service import compiler_service
+        
         data = request.get_json()
         code = data.get('code')
         language = data.get('language', 'python')
@@ -2855,40 +2684,15 @@ def run_code():
         if not code:
             return jsonify({'success': False, 'message': 'Code is required'}), 400
         
-        # Prepare the request for OneCompiler API
-        headers = {
-            'X-RapidAPI-Key': ONECOMPILER_API_KEY,
-            'X-RapidAPI-Host': ONECOMPILER_API_HOST,
-            'Content-Type': 'application/json'
-        }
-        
-        # Create the request body
-        request_body = {
-            'language': language,
-            'stdin': stdin,
-            'files': [{'name': f'main.{get_file_extension(language)}', 'content': code}]
-        }
-        
         # Add test cases if provided
         if test_cases and isinstance(test_cases, list):
-            stdin_data = '\n'.join(test_cases)
-            request_body['stdin'] = stdin_data
-        elif stdin:
-            request_body['stdin'] = stdin
+            stdin = '\n'.join(test_cases)
         
         current_app.logger.info(f"Running code with language: {language}, stdin: {stdin[:100]}...")
         
-        # Make the API call
-        response = requests.post(
-            'https://onecompiler-apis.p.rapidapi.com/api/v1/run',
-            headers=headers,
-            json=request_body,
-            timeout=30  # Add timeout
-        )
+        result = compiler_service.execute(language, code, stdin, get_file_extension(language))
         
-        if response.status_code == 200:
-            result = response.json()
-            
+        if result.get('success'):
             # Check for compilation errors
             if result.get('stderr'):
                 return jsonify({
@@ -2897,7 +2701,7 @@ def run_code():
                     'data': {
                         'stdout': result.get('stdout', ''),
                         'stderr': result.get('stderr', ''),
-                        'executionTime': result.get('executionTime', 0)
+                        'executionTime': result.get('execution_time', 0)
                     }
                 }), 200
             
@@ -2906,23 +2710,23 @@ def run_code():
                 'data': {
                     'stdout': result.get('stdout', ''),
                     'stderr': result.get('stderr', ''),
-                    'executionTime': result.get('executionTime', 0),
-                    'memory': result.get('memory', 0)
+                    'executionTime': result.get('execution_time', 0),
+                    'memory': result.get('memory_used', 0)
                 }
             }), 200
+        elif result.get('timeout'):
+            current_app.logger.error("Code execution timeout")
+            return jsonify({
+                'success': False,
+                'message': 'Code execution timed out. Please try again.'
+            }), 500
         else:
-            current_app.logger.error(f"OneCompiler API error: {response.status_code} - {response.text}")
+            current_app.logger.error(f"Code execution error: {result.get('error')} - {result.get('details', '')}")
             return jsonify({
                 'success': False,
-                'message': f'Code execution failed: {response.text}'
+                'message': f"Code execution failed: {result.get('details') or result.get('error')}"
             }), 500
             
-    except requests.exceptions.Timeout:
-        current_app.logger.error("Code execution timeout")
-        return jsonify({
-            'success': False,
-            'message': 'Code execution timed out. Please try again.'
-        }), 500
     except Exception as e:
         current_app.logger.error(f"Error running code: {str(e)}")
         return jsonify({
@@ -2945,6 +2749,7 @@ def get_file_extension(language):
 
 @test_management_bp.route('/validate-transcript', methods=['POST'])
 @jwt_required()
+@rate_limited('transcript_validation')
 def validate_transcript():
     """Validate student transcript against original text"""
     try:
@@ -2985,6 +2790,7 @@ def validate_transcript():
 
 @test_management_bp.route('/transcribe-audio', methods=['POST'])
 @jwt_required()
+@rate_limited('transcription')
 def transcribe_audio_endpoint():
     """Transcribe uploaded audio file"""
     try:
@@ -4066,17 +3872,27 @@ def upload_questions():
         # Read and parse the file
         questions = []
         
-        if file.filename.endswith('.csv'):
-            import csv
-            import io
-            content = file.read().decode('utf-8')
-            csv_reader = csv.DictReader(io.StringIO(content))
+        filename = file.filename.lower()
+        if filename.endswith(('.csv', '.xlsx', '.xls')):
+            if filename.endswith('.xls'):
+                # Legacy .xls workbooks can't be streamed by openpyxl, read them with pandas
+                try:
+                    df = pd.read_excel(file, engine='xlrd').fillna('')
+                except Exception as e:
+                    return jsonify({'success': False, 'message': f'Failed to read Excel file: {str(e)}'}), 400
+                rows = (
+                    {str(key): normalize_cell(value, strip=False) for key, value in record.items()}
+                    for record in df.to_dict('records')
+                )
+            else:
+                # Rows are streamed from the upload; whitespace is kept for test case input/output
+                rows = SpreadsheetReader(file, strip_values=False)
             
             if is_technical_compiler:
                 # Parse compiler-integrated format
                 questions_dict = {}  # Group test cases by question title
                 
-                for row in csv_reader:
+                for row in rows:
                     question_title = row.get('QuestionTitle', '').strip()
                     if not question_title:
                         continue
@@ -4085,7 +3901,7 @@ def upload_questions():
                     test_case = {
                         'input': row.get('Input', ''),
                         'expected_output': row.get('ExpectedOutput', ''),
-                        'points': int(row.get('Points', 5)),
+                        'points': int(row.get('Points') or 5),
                         'is_sample': row.get('IsSample', 'false').lower() == 'true'
                     }
                     
@@ -4094,7 +3910,7 @@ def upload_questions():
                         questions_dict[question_title] = {
                             'question': f"{question_title}: {row.get('ProblemStatement', '')}",
                             'question_type': 'technical',
-                            'language': row.get('Language', 'python'),
+                            'language': row.get('Language') or 'python',
                             'instructions': row.get('Instructions', ''),
                             'test_cases': []
                         }
@@ -4105,7 +3921,7 @@ def upload_questions():
                 questions = list(questions_dict.values())
             else:
                 # Parse MCQ format
-                for row in csv_reader:
+                for row in rows:
                     question = {
                         'question': row.get('Question', row.get('question', '')),
                         'optionA': row.get('OptionA', row.get('A', '')),
@@ -4116,37 +3932,7 @@ def upload_questions():
                         'instructions': row.get('Instructions', row.get('instructions', ''))
                     }
                     questions.append(question)
-        elif file.filename.endswith(('.xlsx', '.xls')):
-            # Handle Excel files
-            import pandas as pd
-            import io
-            
-            # Read Excel file with proper encoding handling
-            try:
-                # Try different encodings
-                file.seek(0)  # Reset file pointer
-                df = pd.read_excel(file, engine='openpyxl')
-            except Exception as e:
-                # If openpyxl fails, try xlrd for older Excel files
-                file.seek(0)
-                try:
-                    df = pd.read_excel(file, engine='xlrd')
-                except Exception as e2:
-                    return jsonify({'success': False, 'message': f'Failed to read Excel file: {str(e2)}'}), 400
-            
-            # Convert DataFrame to list of dictionaries
-            for _, row in df.iterrows():
-                question = {
-                    'question': str(row.get('Question', row.get('question', ''))),
-                    'optionA': str(row.get('OptionA', row.get('A', ''))),
-                    'optionB': str(row.get('OptionB', row.get('B', ''))),
-                    'optionC': str(row.get('OptionC', row.get('C', ''))),
-                    'optionD': str(row.get('OptionD', row.get('D', ''))),
-                    'answer': str(row.get('Answer', row.get('answer', ''))),
-                    'instructions': str(row.get('Instructions', row.get('instructions', '')))
-                }
-                questions.append(question)
-        elif file.filename.endswith('.txt'):
+        elif filename.endswith('.txt'):
             content = file.read().decode('utf-8')
             # Parse human-readable format
             lines = content.split('\n')
@@ -4457,22 +4243,19 @@ def upload_sentences():
         transcript_validation = json.loads(request.form.get('transcript_validation', '{}'))
         
         # Read and parse the file
-        content = file.read().decode('utf-8')
+        filename = file.filename.lower()
         sentences = []
         
-        if file.filename.endswith('.csv'):
-            import csv
-            import io
-            csv_reader = csv.DictReader(io.StringIO(content))
-            for row in csv_reader:
-                sentence = {
-                    'sentence': row.get('Sentence', row.get('sentence', '')),
-                    'level': row.get('Level', row.get('level', '')),
-                    'instructions': row.get('Instructions', row.get('instructions', ''))
-                }
-                sentences.append(sentence)
-        elif file.filename.endswith('.txt'):
+        if filename.endswith(('.csv', '.xlsx')):
+            # Rows are streamed from the upload and consumed in chunks below
+            sentences = ({
+                'sentence': row.get('Sentence', row.get('sentence', '')),
+                'level': row.get('Level', row.get('level', '')),
+                'instructions': row.get('Instructions', row.get('instructions', ''))
+            } for row in SpreadsheetReader(file))
+        elif filename.endswith('.txt'):
             # Parse text file - one sentence per line
+            content = file.read().decode('utf-8')
             lines = content.split('\n')
             for line in lines:
                 line = line.strip()
@@ -4483,21 +4266,12 @@ def upload_sentences():
                         'instructions': ''
                     })
         
-        # Validate sentences
-        valid_sentences = []
-        for s in sentences:
-            if s['sentence'] and len(s['sentence']) >= 10:
-                valid_sentences.append(s)
-        
-        if not valid_sentences:
-            return jsonify({'success': False, 'message': 'No valid sentences found in file'}), 400
-        
-        # Store sentences in database
+        # Validate and store sentences chunk by chunk
         upload_session_id = str(uuid.uuid4())
         inserted_count = 0
         
-        for s in valid_sentences:
-            doc = {
+        for chunk in iter_chunks(sentences, QUESTION_UPLOAD_CHUNK_SIZE):
+            docs = [{
                 'module_id': module_id,
                 'level_id': level_id,
                 'question_type': 'sentence',
@@ -4514,10 +4288,14 @@ def upload_sentences():
                 'last_used': None,
                 'created_at': datetime.utcnow(),
                 'upload_session_id': upload_session_id
-            }
+            } for s in chunk if s['sentence'] and len(s['sentence']) >= 10]
             
-            mongo_db.question_bank.insert_one(doc)
-            inserted_count += 1
+            if docs:
+                mongo_db.question_bank.insert_many(docs)
+                inserted_count += len(docs)
+        
+        if not inserted_count:
+            return jsonify({'success': False, 'message': 'No valid sentences found in file'}), 400
         
         return jsonify({
             'success': True,
@@ -4552,23 +4330,20 @@ def upload_paragraphs():
         writing_config = json.loads(request.form.get('writing_config', '{}'))
         
         # Read and parse the file
-        content = file.read().decode('utf-8')
+        filename = file.filename.lower()
         paragraphs = []
         
-        if file.filename.endswith('.csv'):
-            import csv
-            import io
-            csv_reader = csv.DictReader(io.StringIO(content))
-            for row in csv_reader:
-                paragraph = {
-                    'topic': row.get('Topic', row.get('topic', '')),
-                    'paragraph': row.get('Paragraph', row.get('paragraph', '')),
-                    'level': row.get('Level', row.get('level', '')),
-                    'instructions': row.get('Instructions', row.get('instructions', ''))
-                }
-                paragraphs.append(paragraph)
-        elif file.filename.endswith('.txt'):
+        if filename.endswith(('.csv', '.xlsx')):
+            # Rows are streamed from the upload and consumed in chunks below
+            paragraphs = ({
+                'topic': row.get('Topic', row.get('topic', '')),
+                'paragraph': row.get('Paragraph', row.get('paragraph', '')),
+                'level': row.get('Level', row.get('level', '')),
+                'instructions': row.get('Instructions', row.get('instructions', ''))
+            } for row in SpreadsheetReader(file))
+        elif filename.endswith('.txt'):
             # Parse text file - paragraphs separated by double newlines
+            content = file.read().decode('utf-8')
             blocks = content.split('\n\n')
             for i, block in enumerate(blocks):
                 block = block.strip()
@@ -4589,21 +4364,12 @@ def upload_paragraphs():
                         'instructions': ''
                     })
         
-        # Validate paragraphs
-        valid_paragraphs = []
-        for p in paragraphs:
-            if p['paragraph'] and len(p['paragraph']) >= 150:
-                valid_paragraphs.append(p)
-        
-        if not valid_paragraphs:
-            return jsonify({'success': False, 'message': 'No valid paragraphs found in file'}), 400
-        
-        # Store paragraphs in database
+        # Validate and store paragraphs chunk by chunk
         upload_session_id = str(uuid.uuid4())
         inserted_count = 0
         
-        for p in valid_paragraphs:
-            doc = {
+        for chunk in iter_chunks(paragraphs, QUESTION_UPLOAD_CHUNK_SIZE):
+            docs = [{
                 'module_id': module_id,
                 'level_id': level_id,
                 'question_type': 'paragraph',
@@ -4617,10 +4383,14 @@ def upload_paragraphs():
                 'last_used': None,
                 'created_at': datetime.utcnow(),
                 'upload_session_id': upload_session_id
-            }
+            } for p in chunk if p['paragraph'] and len(p['paragraph']) >= 150]
             
-            mongo_db.question_bank.insert_one(doc)
-            inserted_count += 1
+            if docs:
+                mongo_db.question_bank.insert_many(docs)
+                inserted_count += len(docs)
+        
+        if not inserted_count:
+            return jsonify({'success': False, 'message': 'No valid paragraphs found in file'}), 400
         
         return jsonify({
             'success': True,
@@ -4654,14 +4424,11 @@ def upload_technical_questions():
             return jsonify({'success': False, 'message': 'module_id and level_id are required'}), 400
         
         # Read and parse the file
-        content = file.read().decode('utf-8')
         questions = []
         
-        if file.filename.endswith('.csv'):
-            import csv
-            import io
-            csv_reader = csv.DictReader(io.StringIO(content))
-            for row in csv_reader:
+        if file.filename.lower().endswith(('.csv', '.xlsx')):
+            # Rows are streamed from the upload; whitespace is kept for test case input/output
+            for row in SpreadsheetReader(file, strip_values=False):
                 if question_type == 'compiler':
                     question = {
                         'questionTitle': row.get('QuestionTitle', row.get('title', '')),
@@ -4796,9 +4563,10 @@ def upload_technical_questions():
                 }
             }), 400
         
-        # Store valid questions in database
+        # Store valid questions in database, QUESTION_UPLOAD_CHUNK_SIZE per insert
         upload_session_id = str(uuid.uuid4())
         inserted_count = 0
+        pending_docs = []
         
         for q in valid_questions:
             if question_type == 'compiler':
@@ -4862,8 +4630,15 @@ def upload_technical_questions():
                     'upload_session_id': upload_session_id
                 }
             
-            mongo_db.question_bank.insert_one(doc)
-            inserted_count += 1
+            pending_docs.append(doc)
+            if len(pending_docs) >= QUESTION_UPLOAD_CHUNK_SIZE:
+                mongo_db.question_bank.insert_many(pending_docs)
+                inserted_count += len(pending_docs)
+                pending_docs = []
+        
+        if pending_docs:
+            mongo_db.question_bank.insert_many(pending_docs)
+            inserted_count += len(pending_docs)
         
         # Prepare detailed response
         response_data = {
@@ -5105,15 +4880,15 @@ def get_test_result(result_id):
         # Add campus and course details if available
         student_profile = mongo_db.students.find_one({'user_id': ObjectId(result.get('student_id'))})
         if student_profile:
-            campus = mongo_db.campuses.find_one({'_id': ObjectId(student_profile.get('campus_id'))})
+            campus = mongo_db.reference_data.get('campuses', ObjectId(student_profile.get('campus_id')))
             if campus:
                 response_data['campus_name'] = campus.get('name', '')
             
-            course = mongo_db.courses.find_one({'_id': ObjectId(student_profile.get('course_id'))})
+            course = mongo_db.reference_data.get('courses', ObjectId(student_profile.get('course_id')))
             if course:
                 response_data['course_name'] = course.get('name', '')
             
-            batch = mongo_db.batches.find_one({'_id': ObjectId(student_profile.get('batch_id'))})
+            batch = mongo_db.reference_data.get('batches', ObjectId(student_profile.get('batch_id')))
             if batch:
                 response_data['batch_name'] = batch.get('name', '')
         
@@ -5146,19 +4921,22 @@ def validate_mcq_result():
         if not result:
             return jsonify({'success': False, 'message': 'Test result not found'}), 404
         
-        # Get the specific question result
+        # Get the specific question result (practice/online attempts store detailed_results)
         if question_index is not None:
-            question_result = result.get('results', [])[question_index] if question_index < len(result.get('results', [])) else None
+            stored_results = result.get('results') or result.get('detailed_results', [])
+            question_result = stored_results[question_index] if question_index < len(stored_results) else None
             if not question_result:
                 return jsonify({'success': False, 'message': 'Question result not found'}), 404
             
-            # Validate MCQ answer
+            # Re-check the stored answer with the shared grading engine
+            # Listening submissions compare answers case-insensitively
+            graded = regrade_result(question_result, case_sensitive=result.get('module_id') != 'LISTENING')
             validation = {
                 'question': question_result.get('question', ''),
                 'student_answer': question_result.get('student_answer', ''),
-                'correct_answer': question_result.get('correct_answer', ''),
-                'is_correct': question_result.get('is_correct', False),
-                'score': question_result.get('score', 0),
+                'correct_answer': question_result.get('correct_answer', graded['correct_answer_text']),
+                'is_correct': graded['is_correct'],
+                'score': graded['score'],
                 'options': question_result.get('options', {}),
                 'explanation': question_result.get('explanation', ''),
                 'time_taken': question_result.get('time_taken', 0)
@@ -5453,6 +5231,7 @@ def submit_online_listening_test():
         
         test = test_result['test']
         current_app.logger.info(f"Online listening test resolved by {test_result['resolved_by']}: {test_result['object_id']} / {test_result['test_id']}")
+        test_id = test['_id']
         
         # Check if this is a listening test
         if test.get('module_id') != 'LISTENING':
@@ -5487,36 +5266,24 @@ def submit_online_listening_test():
                 'message': 'You have already completed this test. Duplicate submissions are not allowed.'
             }), 400
         
+        # MCQs are graded in one pass; listening MCQs store the correct text in correct_answer
+        mcq_grading = grade_mcq(
+            compile_answer_key(test.get('questions', []), correct_field='correct_answer'),
+            data, lambda i, question_id: f'question_{i}', case_sensitive=False
+        )
+        
         # Process each question
         results = []
-        total_score = 0
-        total_marks = 0
+        total_score = mcq_grading['score']
+        total_marks = mcq_grading['graded']
         
         for i, question in enumerate(test.get('questions', [])):
-            current_app.logger.info(f"Processing question {i+1}: {question.get('question_type')}")
-            
             if question.get('question_type') == 'mcq':
-                # Handle MCQ questions
-                answer_key = f'question_{i}'
-                student_answer = data.get(answer_key, '')
-                correct_answer = question.get('correct_answer', '')
-                
-                current_app.logger.info(f"MCQ question {i}: student_answer='{student_answer}', correct_answer='{correct_answer}'")
-                
-                is_correct = student_answer.lower() == correct_answer.lower()
-                score = 1 if is_correct else 0
-                total_score += score
-                total_marks += 1
-                
+                mcq_result = mcq_grading['by_position'][i]
                 results.append({
-                    'question_index': i,
+                    **mcq_result,
                     'question_id': question.get('question_id'),
-                    'question': question.get('question'),
-                    'question_type': 'mcq',
-                    'student_answer': student_answer,
-                    'correct_answer': correct_answer,
-                    'is_correct': is_correct,
-                    'score': score
+                    'correct_answer': mcq_result['correct_answer_text']
                 })
                 
             else:
@@ -5683,8 +5450,9 @@ def submit_online_listening_test():
         current_app.logger.info(f"Saving online listening test result: {result_doc}")
         
         # Save to student_test_attempts collection
-        mongo_db.student_test_attempts.insert_one(result_doc)
+        attempt_id = mongo_db.student_test_attempts.insert_one(result_doc).inserted_id
         current_app.logger.info("Online listening test result saved to student_test_attempts collection")
+        mongo_db.record_test_attempt_summary(current_user_id, test_id, average_score, attempt_id, current_time)
         
         return jsonify({
             'success': True,
@@ -8,7 +8,7 @@ import os
 from mongo import mongo_db
 from routes.test_management import require_superadmin, generate_unique_test_id, convert_objectids
 from config.aws_config import s3_client, S3_BUCKET_NAME
-from utils.audio_generator import generate_audio_from_text
+from services.audio_generation_service import audio_generation_service
 
 audio_test_bp = Blueprint('audio_test_management', __name__)
 
@@ -69,6 +69,34 @@ def create_audio_test():
         # Generate unique test ID
         test_id = generate_unique_test_id()
 
+        # Generate missing listening audio up front: concurrently, once per distinct sentence,
+        # reusing audio generated for earlier tests
+        generated_audio = {}
+        if module_id == 'LISTENING':
+            accent = audio_config.get('accent', 'en-US')
+            speed = audio_config.get('speed', 1.0)
+            
+            # Ensure speed is a float to prevent type comparison errors
+            try:
+                speed = float(speed) if speed is not None else 1.0
+            except (ValueError, TypeError):
+                speed = 1.0
+                current_app.logger.warning(f"Invalid speed value '{audio_config.get('speed')}', using default 1.0")
+            
+            pending = [
+                (i, question.get('sentence') or question.get('question_text') or question.get('question', ''))
+                for i, question in enumerate(questions) if not question.get('audio_url')
+            ]
+            results = audio_generation_service.generate_many([(text, accent, speed) for _, text in pending])
+            for (i, text), result in zip(pending, results):
+                if not result['audio_url']:
+                    current_app.logger.error(f"Audio generation failed for question {i+1}: {result['error']}")
+                    return jsonify({
+                        'success': False, 
+                        'message': f'Failed to generate audio for question: {text}'
+                    }), 500
+                generated_audio[i] = result['audio_url']
+
         # Check for existing questions in database
         existing_questions = list(mongo_db.question_bank.find(
             {'module_id': module_id, 'level_id': level_id, 'question_type': 'sentence'},
@@ -140,25 +168,7 @@ def create_audio_test():
                 if question.get('audio_url'):
                     processed_question['audio_url'] = question['audio_url']
                 else:
-                    # Generate audio from text
-                    accent = audio_config.get('accent', 'en-US')
-                    speed = audio_config.get('speed', 1.0)
-                    
-                    # Ensure speed is a float to prevent type comparison errors
-                    try:
-                        speed = float(speed) if speed is not None else 1.0
-                    except (ValueError, TypeError):
-                        speed = 1.0
-                        current_app.logger.warning(f"Invalid speed value '{audio_config.get('speed')}', using default 1.0")
-                    
-                    audio_url = generate_audio_from_text(processed_question['question'], accent, speed)
-                    if audio_url:
-                        processed_question['audio_url'] = audio_url
-                    else:
-                        return jsonify({
-                            'success': False, 
-                            'message': f'Failed to generate audio for question: {processed_question["question"]}'
-                        }), 500
+                    processed_question['audio_url'] = generated_audio[i]
                 
                 processed_question['audio_config'] = question.get('audio_config', audio_config)
                 processed_question['transcript_validation'] = question.get('transcript_validation', {})
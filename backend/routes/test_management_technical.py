@@ -6,6 +6,7 @@ import pytz
 from mongo import mongo_db
 from routes.test_management import require_superadmin, generate_unique_test_id, convert_objectids
 from services.compiler_service import compiler_service
+from utils.rate_limiter import rate_limited
 
 technical_test_bp = Blueprint('technical_test_management', __name__)
 
@@ -542,6 +543,7 @@ def notify_technical_test_students(test_id):
 
 @technical_test_bp.route('/compile', methods=['POST'])
 @jwt_required()
+@rate_limited('code_execution')
 def compile_code():
     """
     Compile and Run Code
@@ -0,0 +1,99 @@
+"""
+Benchmark: Levenshtein transcript similarity vs the default difflib-based score.
+Run: python backend/scripts/benchmark_similarity.py [--from-db] [pairs]
+
+Reports the speed of both metrics, how far the scores move and how often a pass/fail
+decision changes at the grading tolerances (see SIMILARITY_METRIC in utils/text_similarity).
+
+With --from-db the pairs are the (original_text, student_text) transcripts recorded in
+graded listening/speaking attempts; otherwise transcripts are simulated by perturbing
+a set of reference sentences with dropped, swapped and misspelt words.
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.text_similarity import difflib_similarity_scores, levenshtein_similarity_scores
+
+SENTENCES = [
+    "The quick brown fox jumps over the lazy dog near the river bank",
+    "Please submit your assignment before the end of the week",
+    "Our campus library stays open until nine in the evening",
+    "Regular practice improves both listening and speaking skills",
+    "The meeting has been moved to the conference room on the second floor",
+    "She explained the results of the experiment in simple words",
+    "Students should carry their identity cards at all times",
+    "The train was delayed because of heavy rain in the morning",
+]
+
+
+def simulated_pairs(count):
+    rng = random.Random(42)
+    pairs = []
+    for _ in range(count):
+        reference = rng.choice(SENTENCES)
+        words = reference.split()
+        transcript = []
+        for word in words:
+            roll = rng.random()
+            if roll < 0.08:
+                continue
+            if roll < 0.16 and len(word) > 3:
+                position = rng.randrange(len(word))
+                word = word[:position] + rng.choice('aeiourst') + word[position + 1:]
+            transcript.append(word)
+        if len(transcript) > 3 and rng.random() < 0.2:
+            k = rng.randrange(len(transcript) - 1)
+            transcript[k], transcript[k + 1] = transcript[k + 1], transcript[k]
+        pairs.append((reference, ' '.join(transcript)))
+    return pairs
+
+
+def recorded_pairs(limit):
+    from config.database import DatabaseConfig
+
+    db = DatabaseConfig.get_database()
+    pairs = []
+    cursor = db.student_test_attempts.find(
+        {'detailed_results.student_text': {'$exists': True}}, {'detailed_results': 1}
+    )
+    for attempt in cursor:
+        for result in attempt.get('detailed_results', []):
+            if result.get('original_text') and result.get('student_text'):
+                pairs.append((result['original_text'], result['student_text']))
+                if len(pairs) >= limit:
+                    return pairs
+    return pairs
+
+
+def main():
+    args = [a for a in sys.argv[1:] if not a.startswith('--')]
+    count = int(args[0]) if args else 5000
+    pairs = recorded_pairs(count) if '--from-db' in sys.argv else simulated_pairs(count)
+    if not pairs:
+        print("No transcripts found")
+        return
+
+    started = time.perf_counter()
+    legacy = difflib_similarity_scores(pairs)
+    legacy_s = time.perf_counter() - started
+
+    started = time.perf_counter()
+    batch = levenshtein_similarity_scores(pairs)
+    batch_s = time.perf_counter() - started
+
+    differences = [abs(a - b) for a, b in zip(legacy, batch)]
+    print(f"Pairs: {len(pairs)} ({'recorded' if '--from-db' in sys.argv else 'simulated'})")
+    print(f"difflib (default):   {legacy_s * 1000:.1f}ms ({len(pairs) / legacy_s:,.0f} pairs/s)")
+    print(f"Levenshtein (NumPy): {batch_s * 1000:.1f}ms ({len(pairs) / batch_s:,.0f} pairs/s)")
+    print(f"Score difference:    mean {sum(differences) / len(differences):.2f}, max {max(differences):.2f} points")
+    for threshold in (70, 80):
+        agree = sum((a >= threshold) == (b >= threshold) for a, b in zip(legacy, batch))
+        print(f"Pass/fail agreement at {threshold}%: {agree / len(pairs) * 100:.1f}%")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,261 @@
+"""
+Audio Generation Service for Listening Tests
+Synthesizes question audio with gTTS and stores it, at most TTS_GENERATION_WORKERS
+synthesis + upload jobs at a time per worker process.
+
+Generated audio is content-addressed: the storage key is derived from
+sha256(text, accent, speed) and recorded in the tts_audio_cache collection, so a
+sentence reused across tests is synthesized and uploaded only once. Identical
+sentences within one batch are generated once as well.
+
+Shared audio is never deleted with a test (see is_shared_audio_key). Cache entries
+are checked against storage before they are reused, and an entry whose object has
+gone is dropped and the audio generated again.
+
+Audio is stored on S3 by default. AUDIO_STORAGE_BACKEND=local writes it under
+AUDIO_LOCAL_STORAGE_DIR instead (LocalAudioStorage, for development and tests).
+"""
+
+import hashlib
+import logging
+import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Concurrent synthesis + upload jobs per worker process (gTTS rate limits bursts)
+GENERATION_WORKERS = int(os.getenv('TTS_GENERATION_WORKERS', '4'))
+STORAGE_BACKEND = os.getenv('AUDIO_STORAGE_BACKEND', 's3').lower()
+LOCAL_STORAGE_DIR = os.getenv('AUDIO_LOCAL_STORAGE_DIR', os.path.join('uploads', 'audio'))
+KEY_PREFIX = 'audio/tts'
+
+
+def is_shared_audio_key(key: Optional[str]) -> bool:
+    """Whether a storage key is content-addressed audio that other tests may reference"""
+    return bool(key) and key.startswith(f"{KEY_PREFIX}/")
+
+
+def normalize_speed(speed) -> float:
+    try:
+        return float(speed) if speed is not None else 1.0
+    except (ValueError, TypeError):
+        return 1.0
+
+
+def audio_cache_key(text: str, accent: str, speed) -> str:
+    """Content address of the audio for (text, accent, speed); whitespace in text is normalized"""
+    normalized = ' '.join(str(text or '').split())
+    payload = f"{normalized}\0{accent}\0{normalize_speed(speed):.3f}"
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class S3AudioStorage:
+    """Uploads audio files to the configured S3 bucket"""
+
+    name = 's3'
+
+    def ensure_available(self) -> None:
+        from config.aws_config import is_aws_configured
+
+        if not is_aws_configured():
+            raise Exception("AWS S3 is not configured. Please set AWS_ACCESS_KEY, AWS_SECRET_KEY, AWS_REGION, and AWS_S3_BUCKET environment variables. Audio files can only be stored on AWS S3.")
+
+    def store(self, local_path: str, key: str) -> str:
+        from config.aws_config import S3_BUCKET_NAME, get_s3_client_safe
+
+        client = get_s3_client_safe()
+        if client is None:
+            raise Exception("S3 client is not available. Please check AWS configuration.")
+        client.upload_file(local_path, S3_BUCKET_NAME, key)
+        return key
+
+    def exists(self, key: str) -> bool:
+        from botocore.exceptions import ClientError
+        from config.aws_config import S3_BUCKET_NAME, get_s3_client_safe
+
+        client = get_s3_client_safe()
+        if client is None:
+            return True
+        try:
+            client.head_object(Bucket=S3_BUCKET_NAME, Key=key)
+            return True
+        except ClientError as e:
+            # Only a missing object invalidates the entry, not an unreachable bucket
+            return e.response.get('Error', {}).get('Code') not in ('404', 'NoSuchKey', 'NotFound')
+
+
+class LocalAudioStorage:
+    """Copies audio files under a local directory; stand-in for S3 in development and tests"""
+
+    name = 'local'
+
+    def __init__(self, root: str = LOCAL_STORAGE_DIR):
+        self.root = root
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.root, *key.split('/'))
+
+    def ensure_available(self) -> None:
+        os.makedirs(self.root, exist_ok=True)
+
+    def store(self, local_path: str, key: str) -> str:
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        shutil.copyfile(local_path, path)
+        return key
+
+    def exists(self, key: str) -> bool:
+        return os.path.exists(self.path(key))
+
+
+class AudioGenerationService:
+    """Concurrent, deduplicated text-to-speech generation with a persistent content-addressed cache"""
+
+    def __init__(
+        self,
+        storage=None,
+        cache_collection=None,
+        synthesize: Optional[Callable[[str, str, float], str]] = None,
+        max_workers: int = GENERATION_WORKERS
+    ):
+        self.storage = storage or (LocalAudioStorage() if STORAGE_BACKEND == 'local' else S3AudioStorage())
+        self._cache_collection = cache_collection
+        # synthesize(text, accent, speed) -> path of a temporary mp3 file
+        self._synthesize = synthesize
+        self.max_workers = max(1, max_workers)
+        self._executor = None
+        self._executor_pid = None
+        self._lock = threading.Lock()
+        self.stats = {'requested': 0, 'deduplicated': 0, 'cache_hits': 0, 'stale': 0, 'generated': 0, 'failed': 0}
+
+    @property
+    def cache(self):
+        if self._cache_collection is None:
+            from mongo import mongo_db
+            self._cache_collection = mongo_db.tts_audio_cache
+        return self._cache_collection
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None or self._executor_pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='tts')
+                self._executor_pid = os.getpid()
+            return self._executor
+
+    def _generate_one(self, key: str, text: str, accent: str, speed: float) -> str:
+        synthesize = self._synthesize
+        if synthesize is None:
+            from utils.audio_generator import synthesize_audio as synthesize
+        local_path = synthesize(text, accent, speed)
+        try:
+            storage_key = self.storage.store(local_path, f"{KEY_PREFIX}/{key}.mp3")
+        finally:
+            try:
+                os.remove(local_path)
+            except OSError:
+                pass
+        try:
+            self.cache.update_one(
+                {'_id': key},
+                {'$set': {
+                    'storage': self.storage.name,
+                    'storage_key': storage_key,
+                    'text': text,
+                    'accent': accent,
+                    'speed': speed,
+                    'created_at': datetime.utcnow()
+                }},
+                upsert=True
+            )
+        except Exception as e:
+            # The audio is stored; it is only regenerated next time
+            logger.warning(f"⚠️ Failed to record generated audio {storage_key} in cache: {e}")
+        return storage_key
+
+    def _cached(self, keys: List[str]) -> Dict[str, str]:
+        """Cached storage keys whose objects still exist in storage"""
+        try:
+            cached = {
+                doc['_id']: doc['storage_key']
+                for doc in self.cache.find(
+                    {'_id': {'$in': keys}, 'storage': self.storage.name}, {'storage_key': 1}
+                )
+            }
+        except Exception as e:
+            logger.warning(f"⚠️ Audio cache lookup failed, generating all audio: {e}")
+            return {}
+        if not cached:
+            return cached
+
+        def exists(storage_key: str) -> bool:
+            try:
+                return self.storage.exists(storage_key)
+            except Exception as e:
+                logger.warning(f"⚠️ Could not verify cached audio {storage_key}, reusing it: {e}")
+                return True
+
+        present = dict(zip(cached, self._get_executor().map(exists, cached.values())))
+        stale = [key for key, ok in present.items() if not ok]
+        if stale:
+            logger.warning(f"⚠️ {len(stale)} cached audio files are missing from storage, regenerating them")
+            self.stats['stale'] += len(stale)
+            try:
+                self.cache.delete_many({'_id': {'$in': stale}})
+            except Exception as e:
+                logger.warning(f"⚠️ Failed to drop stale audio cache entries: {e}")
+        return {key: storage_key for key, storage_key in cached.items() if present[key]}
+
+    def generate_many(self, items: Sequence[Tuple[str, str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Audio for each (text, accent, speed), in order:
+        {'audio_url': storage key or None, 'error': message or None, 'cached': bool}.
+        Cached audio is reused; the rest is generated concurrently, once per distinct item.
+        """
+        keys = [audio_cache_key(*item) for item in items]
+        unique: Dict[str, Tuple[str, str, float]] = {}
+        for key, (text, accent, speed) in zip(keys, items):
+            unique.setdefault(key, (text, accent, normalize_speed(speed)))
+        self.stats['requested'] += len(items)
+        self.stats['deduplicated'] += len(items) - len(unique)
+
+        outcomes = {
+            key: {'audio_url': storage_key, 'error': None, 'cached': True}
+            for key, storage_key in self._cached(list(unique)).items()
+        }
+        self.stats['cache_hits'] += len(outcomes)
+        missing = [key for key in unique if key not in outcomes]
+        if missing:
+            try:
+                self.storage.ensure_available()
+                executor = self._get_executor()
+                futures = {key: executor.submit(self._generate_one, key, *unique[key]) for key in missing}
+            except Exception as e:
+                futures = {}
+                for key in missing:
+                    outcomes[key] = {'audio_url': None, 'error': str(e), 'cached': False}
+                self.stats['failed'] += len(missing)
+            for key, future in futures.items():
+                try:
+                    outcomes[key] = {'audio_url': future.result(), 'error': None, 'cached': False}
+                    self.stats['generated'] += 1
+                except Exception as e:
+                    outcomes[key] = {'audio_url': None, 'error': str(e), 'cached': False}
+                    self.stats['failed'] += 1
+        return [dict(outcomes[key]) for key in keys]
+
+    def generate(self, text: str, accent: str = 'en', speed=1.0) -> str:
+        """Storage key of the audio for text; raises if it can't be generated"""
+        result = self.generate_many([(text, accent, speed)])[0]
+        if result['error']:
+            raise Exception(result['error'])
+        return result['audio_url']
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, 'storage': self.storage.name, 'max_workers': self.max_workers}
+
+
+audio_generation_service = AudioGenerationService()
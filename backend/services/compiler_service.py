@@ -1,14 +1,39 @@
 """
 Compiler Service for Technical Test Module
-Integrates with OneCompiler API via RapidAPI
+Integrates with OneCompiler API via RapidAPI, or runs code locally in rlimited
+subprocesses (COMPILER_BACKEND=local, see sandbox_executor)
 Supports: Python, C, C++, Java, HTML
 """
 
 import requests
 import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 from typing import Dict, List, Any, Optional
 import json
 
+from services.execution_cache import ExecutionResultCache
+
+# Test cases of one submission run concurrently, at most this many API calls at a time per worker
+MAX_CONCURRENCY = int(os.getenv('COMPILER_MAX_CONCURRENCY', '4'))
+REQUEST_TIMEOUT = float(os.getenv('COMPILER_REQUEST_TIMEOUT', '30'))
+# 'onecompiler' (OneCompiler API) or 'local' (services.sandbox_executor, OneCompiler as fallback)
+EXECUTION_BACKEND = os.getenv('COMPILER_BACKEND', 'onecompiler').lower()
+# Results of identical runs (language, code, stdin) are reused for this long; 0 entries disables caching
+RESULT_CACHE_SIZE = int(os.getenv('COMPILER_RESULT_CACHE_SIZE', '2000'))
+RESULT_CACHE_TTL = float(os.getenv('COMPILER_RESULT_CACHE_TTL', '600'))
+
+# Compiler / interpreter messages that fail every test case the same way
+COMPILE_ERROR_PATTERNS = {
+    'python': re.compile(r'^(SyntaxError|IndentationError|TabError)\b', re.MULTILINE),
+    'c': re.compile(r'\berror:'),
+    'cpp': re.compile(r'\berror:'),
+    'java': re.compile(r'\.java:\d+: error:|\berror: '),
+}
+
 class CompilerService:
     """Service to compile and execute code using OneCompiler API"""
     
@@ -16,6 +41,17 @@ class CompilerService:
         self.api_key = os.getenv('RAPIDAPI_KEY', 'f744734571mshb636ee6aecb15e3p16c0e7jsnd142c0e341e6')
         self.api_host = os.getenv('RAPIDAPI_HOST', 'onecompiler-apis.p.rapidapi.com')
         self.api_url = 'https://onecompiler-apis.p.rapidapi.com/api/v1/run'
+        self.max_concurrency = max(1, MAX_CONCURRENCY)
+        self.request_timeout = REQUEST_TIMEOUT
+        self.backend = EXECUTION_BACKEND
+        self._local_backend = None
+        self.result_cache = ExecutionResultCache(RESULT_CACHE_SIZE, RESULT_CACHE_TTL)
+        
+        # Keep-alive session and test-case pool, created per process (neither survives a fork)
+        self._session = None
+        self._executor = None
+        self._resources_pid = None
+        self._resources_lock = threading.Lock()
         
         # Language configuration
         self.supported_languages = {
@@ -47,9 +83,35 @@ class CompilerService:
             }
         }
     
+    def _ensure_resources(self) -> None:
+        if self._resources_pid == os.getpid():
+            return
+        with self._resources_lock:
+            if self._resources_pid == os.getpid():
+                return
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_concurrency)
+            session.mount('https://', adapter)
+            session.headers.update({
+                'x-rapidapi-key': self.api_key,
+                'x-rapidapi-host': self.api_host,
+                'Content-Type': 'application/json'
+            })
+            self._session = session
+            self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix='compiler')
+            self._resources_pid = os.getpid()
+    
+    def _get_session(self) -> requests.Session:
+        self._ensure_resources()
+        return self._session
+    
+    def _get_executor(self) -> ThreadPoolExecutor:
+        self._ensure_resources()
+        return self._executor
+    
     def compile_and_run(self, language: str, code: str, stdin: str = '') -> Dict[str, Any]:
         """
-        Compile and execute code using OneCompiler API
+        Compile and execute code with the configured execution backend
         
         Args:
             language: Programming language (python, c, cpp, java, html)
@@ -81,30 +143,70 @@ class CompilerService:
             if lang_config.get('syntax_only'):
                 return self._validate_html(code)
             
-            # Prepare API request
-            headers = {
-                'x-rapidapi-key': self.api_key,
-                'x-rapidapi-host': self.api_host,
-                'Content-Type': 'application/json'
+            return self.execute(language, code, stdin, lang_config['extension'])
+                
+        except Exception as e:
+            return {
+                'success': False,
+                'error': f'Compilation failed: {str(e)}'
             }
-            
+    
+    def _get_local_backend(self):
+        if self._local_backend is None:
+            from services.sandbox_executor import LocalSandboxBackend
+            self._local_backend = LocalSandboxBackend()
+        return self._local_backend
+    
+    def prewarm(self) -> None:
+        """Start the local backend's idle interpreters (no-op for OneCompiler)"""
+        if self.backend == 'local':
+            self._get_local_backend().prewarm()
+    
+    def execute(self, language: str, code: str, stdin: str = '', extension: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Run code on the configured backend without language validation.
+        With COMPILER_BACKEND=local, languages without a local toolchain (and local
+        backend failures) go to OneCompiler. Identical runs are served from the result
+        cache, and identical concurrent runs share one execution.
+        """
+        key = self.result_cache.key(self.backend, language, code, stdin)
+        return self.result_cache.get_or_run(key, lambda: self._execute(language, code, stdin, extension))
+    
+    def _execute(self, language: str, code: str, stdin: str = '', extension: Optional[str] = None) -> Dict[str, Any]:
+        if self.backend == 'local':
+            from services.sandbox_executor import SandboxUnavailable
+            local_backend = self._get_local_backend()
+            if local_backend.supports(language):
+                try:
+                    result = local_backend.run(language, code, stdin)
+                    result['backend'] = local_backend.name
+                    return result
+                except (SandboxUnavailable, OSError) as e:
+                    print(f"⚠️ Local execution of {language} failed, using OneCompiler: {e}")
+        result = self._run_onecompiler(language, code, stdin, extension)
+        result['backend'] = 'onecompiler'
+        return result
+    
+    def _run_onecompiler(self, language: str, code: str, stdin: str = '', extension: Optional[str] = None) -> Dict[str, Any]:
+        """Execute code using OneCompiler API"""
+        try:
+            # Prepare API request (auth headers are set on the pooled session)
             payload = {
                 'language': language,
                 'stdin': stdin,
                 'files': [
                     {
-                        'name': f'main.{lang_config["extension"]}',
+                        'name': f'main.{extension or self.supported_languages.get(language, {}).get("extension", "txt")}',
                         'content': code
                     }
                 ]
             }
             
-            # Make API request
-            response = requests.post(
+            # Make API request over a kept-alive connection
+            response = self._get_session().post(
                 self.api_url,
-                headers=headers,
                 json=payload,
-                timeout=30
+                timeout=self.request_timeout
             )
             
             if response.status_code == 200:
@@ -127,6 +229,7 @@ class CompilerService:
         except requests.exceptions.Timeout:
             return {
                 'success': False,
+                'timeout': True,
                 'error': 'Execution timeout. Code took too long to run.'
             }
         except requests.exceptions.RequestException as e:
@@ -134,11 +237,6 @@ class CompilerService:
                 'success': False,
                 'error': f'Network error: {str(e)}'
             }
-        except Exception as e:
-            return {
-                'success': False,
-                'error': f'Compilation failed: {str(e)}'
-            }
     
     def _normalize_output(self, output: str) -> str:
         """
@@ -164,11 +262,87 @@ class CompilerService:
         # Join back with newlines
         return '\n'.join(lines)
     
+    def _is_compile_error(self, language: str, execution_result: Dict[str, Any]) -> bool:
+        """True when the code failed to compile/parse, so every test case fails the same way"""
+        pattern = COMPILE_ERROR_PATTERNS.get(language)
+        if not pattern or not execution_result.get('success'):
+            return False
+        if execution_result.get('stdout') or not execution_result.get('exit_code'):
+            return False
+        return bool(pattern.search(execution_result.get('stderr') or ''))
+    
+    def _runner(self, language: str, code: str):
+        """
+        Callable running this program against one stdin input. On the local backend C, C++
+        and Java are compiled here, once (artifacts are cached by content hash).
+        """
+        lang_config = self.supported_languages.get(language, {})
+        if self.backend == 'local' and lang_config and not lang_config.get('syntax_only') and code and code.strip():
+            from services.sandbox_executor import SandboxUnavailable
+            local_backend = self._get_local_backend()
+            if local_backend.supports(language):
+                try:
+                    artifact = local_backend.build(language, code)
+                except (SandboxUnavailable, OSError) as e:
+                    print(f"⚠️ Local build of {language} failed, using OneCompiler: {e}")
+                else:
+                    def run_artifact(stdin: str) -> Dict[str, Any]:
+                        try:
+                            result = local_backend.run_artifact(artifact, stdin)
+                            result['backend'] = local_backend.name
+                            return result
+                        except OSError as e:
+                            print(f"⚠️ Local execution of {language} failed, using OneCompiler: {e}")
+                            return {**self._run_onecompiler(language, code, stdin), 'backend': 'onecompiler'}
+                    
+                    def run_local(stdin: str) -> Dict[str, Any]:
+                        key = self.result_cache.key(self.backend, language, code, stdin)
+                        return self.result_cache.get_or_run(key, lambda: run_artifact(stdin))
+                    return run_local
+        return lambda stdin: self.compile_and_run(language, code, stdin)
+    
+    def _run_test_case(self, runner, language: str, test_input: str, stop: threading.Event) -> Optional[Dict[str, Any]]:
+        """Run one test case, timed; None when skipped after another case hit a compile error"""
+        if stop.is_set():
+            return None
+        started = time.perf_counter()
+        execution_result = runner(test_input)
+        execution_result['latency_ms'] = round((time.perf_counter() - started) * 1000, 1)
+        if self._is_compile_error(language, execution_result):
+            stop.set()
+        return execution_result
+    
+    def run_many(self, language: str, code: str, inputs: List[str]) -> List[Dict[str, Any]]:
+        """
+        Run one program against many stdin inputs, results in input order.
+        
+        The program is compiled at most once, inputs run concurrently (at most
+        max_concurrency at a time), and once an input reports a compile error the inputs
+        that have not started yet are not run and get that error.
+        """
+        runner = self._runner(language, code)
+        stop = threading.Event()
+        if len(inputs) > 1 and not self.supported_languages.get(language, {}).get('syntax_only'):
+            executor = self._get_executor()
+            futures = [executor.submit(self._run_test_case, runner, language, stdin, stop) for stdin in inputs]
+            results = [future.result() for future in futures]
+        else:
+            results = [self._run_test_case(runner, language, stdin, stop) for stdin in inputs]
+        compile_error = next((r for r in results if r and self._is_compile_error(language, r)), None)
+        return [r if r is not None else {**compile_error, 'latency_ms': 0} for r in results]
+    
+    def _normalize_outputs(self, outputs: List[str]) -> List[str]:
+        """_normalize_output for a list of outputs"""
+        return [self._normalize_output(output) for output in outputs]
+    
     def validate_against_test_cases(self, language: str, code: str, test_cases: List[Dict]) -> Dict[str, Any]:
         """
         Run code against multiple test cases and validate outputs
         Handles multi-line inputs and outputs properly
         
+        Test cases run through run_many: the code is compiled once and the cases run
+        concurrently; after a compile error the remaining cases are not run.
+        
         Args:
             language: Programming language
             code: Source code
@@ -178,25 +352,33 @@ class CompilerService:
             Dict with test results and score
         """
         try:
+            started = time.perf_counter()
             results = []
             total_score = 0
             max_score = 0
             passed_count = 0
             failed_count = 0
             
-            for idx, test_case in enumerate(test_cases):
+            # Run code with every test case input, compiling it once
+            execution_results = self.run_many(language, code, [tc.get('input', '') for tc in test_cases])
+            compile_error = any(self._is_compile_error(language, r) for r in execution_results)
+            
+            # Normalize every output for comparison in one pass
+            expected_outputs = self._normalize_outputs([tc.get('expected_output', '') for tc in test_cases])
+            actual_outputs = self._normalize_outputs([
+                r.get('stdout', '') if r['success'] else '' for r in execution_results
+            ])
+            
+            for idx, (test_case, execution_result) in enumerate(zip(test_cases, execution_results)):
                 test_input = test_case.get('input', '')
-                expected_output = self._normalize_output(test_case.get('expected_output', ''))
+                expected_output = expected_outputs[idx]
                 points = test_case.get('points', 1)
                 is_sample = test_case.get('is_sample', False)
                 
                 max_score += points
                 
-                # Run code with this test case input
-                execution_result = self.compile_and_run(language, code, test_input)
-                
                 if execution_result['success']:
-                    actual_output = self._normalize_output(execution_result.get('stdout', ''))
+                    actual_output = actual_outputs[idx]
                     
                     # Compare normalized outputs
                     passed = actual_output == expected_output
@@ -216,6 +398,7 @@ class CompilerService:
                         'points': points,
                         'points_earned': points if passed else 0,
                         'execution_time': execution_result.get('execution_time', 0),
+                        'latency_ms': execution_result.get('latency_ms', 0),
                         'is_sample': is_sample,
                         'error': execution_result.get('stderr', '')
                     })
@@ -231,6 +414,7 @@ class CompilerService:
                         'points': points,
                         'points_earned': 0,
                         'execution_time': 0,
+                        'latency_ms': execution_result.get('latency_ms', 0),
                         'is_sample': is_sample,
                         'error': execution_result.get('error', 'Execution failed')
                     })
@@ -242,7 +426,9 @@ class CompilerService:
                 'max_score': max_score,
                 'passed_count': passed_count,
                 'failed_count': failed_count,
-                'percentage': (total_score / max_score * 100) if max_score > 0 else 0
+                'percentage': (total_score / max_score * 100) if max_score > 0 else 0,
+                'compile_error': compile_error,
+                'elapsed_ms': round((time.perf_counter() - started) * 1000, 1)
             }
             
         except Exception as e:
@@ -300,6 +486,10 @@ class CompilerService:
                 'error': f'HTML validation failed: {str(e)}'
             }
     
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """Result cache counters (hits, misses, coalesced runs, evictions) of this worker"""
+        return self.result_cache.get_stats()
+    
     def get_supported_languages(self) -> List[Dict[str, str]]:
         """Get list of supported languages"""
         return [
@@ -0,0 +1,112 @@
+"""
+Code Execution Result Cache
+Content-addressed LRU/TTL cache for CompilerService runs, keyed by
+sha256(backend, language, code, stdin).
+
+Identical concurrent runs are coalesced: the first caller executes, the others wait
+for its result instead of starting their own execution. Only completed runs are
+cached (including compile and runtime errors); timeouts and API/network failures
+are not, so they are retried by the next request.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+
+class _InFlight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[BaseException] = None
+
+
+class ExecutionResultCache:
+    """LRU cache with expiry and per-key request coalescing"""
+
+    def __init__(self, max_entries: int = 2000, ttl_seconds: float = 600):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: 'OrderedDict[str, tuple]' = OrderedDict()
+        self._in_flight: Dict[str, _InFlight] = {}
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'coalesced': 0, 'evictions': 0, 'expired': 0, 'not_cached': 0}
+
+    @staticmethod
+    def key(backend: str, language: str, code: str, stdin: str) -> str:
+        digest = hashlib.sha256()
+        for part in (backend, language, code or '', stdin or ''):
+            digest.update(part.encode('utf-8'))
+            digest.update(b'\0')
+        return digest.hexdigest()
+
+    @staticmethod
+    def _cacheable(result: Dict[str, Any]) -> bool:
+        return bool(result.get('success')) and not result.get('timeout')
+
+    def get_or_run(self, key: str, run: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+        """Cached result for key, or the result of run() (shared with concurrent callers)"""
+        if self.max_entries <= 0:
+            return run()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, result = entry
+                if expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.stats['hits'] += 1
+                    return {**result, 'cached': True}
+                del self._entries[key]
+                self.stats['expired'] += 1
+            in_flight = self._in_flight.get(key)
+            if in_flight is not None:
+                self.stats['coalesced'] += 1
+                leader = False
+            else:
+                in_flight = self._in_flight[key] = _InFlight()
+                self.stats['misses'] += 1
+                leader = True
+
+        if not leader:
+            in_flight.done.wait()
+            if in_flight.error is not None:
+                raise in_flight.error
+            return dict(in_flight.result)
+
+        try:
+            result = run()
+            in_flight.result = result
+        except BaseException as e:
+            in_flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+                if in_flight.result is not None and self._cacheable(in_flight.result):
+                    self._entries[key] = (time.monotonic() + self.ttl_seconds, dict(in_flight.result))
+                    self._entries.move_to_end(key)
+                    while len(self._entries) > self.max_entries:
+                        self._entries.popitem(last=False)
+                        self.stats['evictions'] += 1
+                elif in_flight.result is not None:
+                    self.stats['not_cached'] += 1
+            in_flight.done.set()
+        return dict(result)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.stats['hits'] + self.stats['misses'] + self.stats['coalesced']
+            return {
+                **self.stats,
+                'size': len(self._entries),
+                'max_size': self.max_entries,
+                'ttl_seconds': self.ttl_seconds,
+                'in_flight': len(self._in_flight),
+                'hit_ratio': ((self.stats['hits'] + self.stats['coalesced']) / lookups) if lookups else 0
+            }
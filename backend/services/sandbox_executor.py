@@ -0,0 +1,576 @@
+"""
+Local Sandboxed Code Execution
+Runs Python, C, C++ and Java submissions in subprocesses on this host instead of the
+OneCompiler API (selected with COMPILER_BACKEND=local, see CompilerService).
+
+Every run gets its own temporary workspace and is limited with rlimits:
+    SANDBOX_CPU_SECONDS   CPU time per run (default 5)
+    SANDBOX_MEMORY_MB     address space per run, JVM heap for Java (default 256)
+    SANDBOX_OUTPUT_KB     stdout/stderr size; output goes to workspace files capped by
+                          RLIMIT_FSIZE (default 256)
+    SANDBOX_WALL_SECONDS  wall-clock limit, the process group is killed after it (default 10)
+
+    SANDBOX_MAX_PROCESSES processes/threads of the sandbox user at a time (RLIMIT_NPROC,
+                          shared by all concurrent runs; default 128)
+
+Programs, and the compilers building them, run as SANDBOX_USER (default nobody) with a
+minimal environment, their own session and, where the host allows network namespaces, no network. Running them as a
+separate user requires the server to run as root; otherwise the local backend refuses
+every language and CompilerService uses OneCompiler, since programs running as the
+application user could read its secrets (/proc/<pid>/environ) and signal its processes.
+Each worker is a child subreaper: processes that leave their run's process group
+(setsid, double fork) are reparented to it and killed once their run is over.
+This is still not a complete security boundary against hostile code: hosts that accept
+untrusted submissions should additionally run the workers in a container.
+
+C, C++ and Java sources are compiled once per content hash (SANDBOX_ARTIFACT_CACHE
+programs per worker, LRU) and the artifact is run for every input. Python interpreters
+are started ahead of time (SANDBOX_WARM_PYTHON per worker) and wait for their job on
+stdin, so a run does not pay interpreter start-up.
+"""
+
+import hashlib
+import logging
+import os
+import shutil
+import signal
+import subprocess
+import tempfile
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, Dict, List, Optional
+
+try:
+    import ctypes
+    import pwd
+    import resource
+    POSIX_AVAILABLE = True
+except ImportError:  # Windows development machines
+    POSIX_AVAILABLE = False
+
+try:
+    _libc = ctypes.CDLL(None, use_errno=True) if POSIX_AVAILABLE else None
+except (OSError, AttributeError):
+    _libc = None
+
+logger = logging.getLogger(__name__)
+
+CPU_SECONDS = int(os.getenv('SANDBOX_CPU_SECONDS', '5'))
+MEMORY_MB = int(os.getenv('SANDBOX_MEMORY_MB', '256'))
+OUTPUT_KB = int(os.getenv('SANDBOX_OUTPUT_KB', '256'))
+WALL_SECONDS = float(os.getenv('SANDBOX_WALL_SECONDS', '10'))
+COMPILE_SECONDS = float(os.getenv('SANDBOX_COMPILE_SECONDS', '30'))
+WARM_PYTHON = int(os.getenv('SANDBOX_WARM_PYTHON', '2'))
+MAX_PROCESSES = int(os.getenv('SANDBOX_MAX_PROCESSES', '128'))
+SANDBOX_USER = os.getenv('SANDBOX_USER', 'nobody')
+SANDBOX_ROOT = os.getenv('SANDBOX_ROOT') or None
+# Compiled programs kept per worker, by content hash
+ARTIFACT_CACHE_SIZE = int(os.getenv('SANDBOX_ARTIFACT_CACHE', '64'))
+
+SANDBOX_ENV = {'PATH': '/usr/local/bin:/usr/bin:/bin', 'LANG': 'C.UTF-8', 'HOME': '/tmp'}
+
+CLONE_NEWNET = 0x40000000
+PR_SET_CHILD_SUBREAPER = 36
+
+# The runner reads "<code length>\n<code><stdin>", then executes the code as __main__
+_PYTHON_BOOTSTRAP = (
+    "import io, sys\n"
+    "data = sys.stdin.buffer.read()\n"
+    "header, _, rest = data.partition(b'\\n')\n"
+    "size = int(header)\n"
+    "_code = rest[:size]\n"
+    "sys.stdin = io.TextIOWrapper(io.BytesIO(rest[size:]), encoding='utf-8')\n"
+    "sys.argv = ['main.py']\n"
+    "del data, header, rest, size\n"
+    "exec(compile(_code, 'main.py', 'exec'), {'__name__': '__main__', '__file__': 'main.py', "
+    "'__builtins__': __builtins__})\n"
+)
+
+
+class SandboxUnavailable(Exception):
+    """The local backend cannot run this language here; the caller should fall back"""
+
+
+def _sandbox_identity():
+    """(uid, gid) to run programs as; None unless the server runs as root and SANDBOX_USER is another user"""
+    if not POSIX_AVAILABLE or os.geteuid() != 0 or not SANDBOX_USER:
+        return None
+    try:
+        entry = pwd.getpwnam(SANDBOX_USER)
+    except KeyError:
+        return None
+    if entry.pw_uid == 0:
+        return None
+    return entry.pw_uid, entry.pw_gid
+
+
+def _unshare_network():
+    """Move the calling process into a new network namespace (loopback only, down)"""
+    if _libc.unshare(CLONE_NEWNET) != 0:
+        errno = ctypes.get_errno()
+        raise OSError(errno, os.strerror(errno))
+
+
+_network_isolation = None
+
+
+def _network_isolation_available() -> bool:
+    """Whether programs can be started without network access (needs CAP_SYS_ADMIN)"""
+    global _network_isolation
+    if _network_isolation is None:
+        true = shutil.which('true', path=SANDBOX_ENV['PATH'])
+        try:
+            _network_isolation = bool(_libc and true) and subprocess.run(
+                [true], preexec_fn=_unshare_network, timeout=5
+            ).returncode == 0
+        except Exception:
+            _network_isolation = False
+        if not _network_isolation:
+            logger.warning("⚠️ Network namespaces are not available: sandboxed programs keep network access")
+    return _network_isolation
+
+
+def _limit_process(memory: bool = True, cpu_seconds: int = CPU_SECONDS, identity=None):
+    """preexec_fn applying the run limits inside the child"""
+    isolate_network = identity is not None and _network_isolation_available()
+
+    def apply():
+        os.setsid()
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu_seconds, cpu_seconds + 1))
+        output_bytes = OUTPUT_KB * 1024
+        resource.setrlimit(resource.RLIMIT_FSIZE, (output_bytes, output_bytes))
+        resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+        if memory:
+            memory_bytes = MEMORY_MB * 1024 * 1024
+            resource.setrlimit(resource.RLIMIT_AS, (memory_bytes, memory_bytes))
+        if identity:
+            if isolate_network:
+                _unshare_network()
+            # Counted per user, i.e. across every concurrent program of the sandbox user
+            resource.setrlimit(resource.RLIMIT_NPROC, (MAX_PROCESSES, MAX_PROCESSES))
+            os.setgroups([])
+            os.setgid(identity[1])
+            os.setuid(identity[0])
+    return apply
+
+
+# Run leaders and idle interpreters of this worker; every other child running as the
+# sandbox user is left over from a finished run
+_live_pids = set()
+_live_lock = threading.Lock()
+_subreaper_pid = None
+
+
+def _become_subreaper() -> bool:
+    """Have orphaned descendants reparented to this worker instead of init (Linux)"""
+    global _subreaper_pid
+    if _subreaper_pid != os.getpid():
+        if _libc is None or _libc.prctl(PR_SET_CHILD_SUBREAPER, 1, 0, 0, 0) != 0:
+            return False
+        _subreaper_pid = os.getpid()
+    return True
+
+
+def _spawn(command: List[str], identity, **kwargs) -> subprocess.Popen:
+    """Popen a program; it is tracked as live before a sweep can see it run as the sandbox user"""
+    if identity:
+        _become_subreaper()
+    with _live_lock:
+        process = subprocess.Popen(command, **kwargs)
+        _live_pids.add(process.pid)
+    return process
+
+
+def _kill_leftovers(identity) -> int:
+    """Kill and reap this worker's children running as the sandbox user that belong to no live run"""
+    if not identity or _subreaper_pid != os.getpid():
+        return 0
+    killed = 0
+    with _live_lock:
+        for entry in os.listdir('/proc'):
+            if not entry.isdigit() or int(entry) in _live_pids:
+                continue
+            pid = int(entry)
+            try:
+                if os.stat(f'/proc/{pid}').st_uid != identity[0]:
+                    continue
+                with open(f'/proc/{pid}/stat') as handle:
+                    parent = int(handle.read().rsplit(')', 1)[1].split()[1])
+            except (OSError, ValueError, IndexError):
+                continue
+            if parent != os.getpid():
+                continue
+            try:
+                os.kill(pid, signal.SIGKILL)
+                os.waitpid(pid, 0)
+            except (ProcessLookupError, ChildProcessError):
+                pass
+            killed += 1
+    if killed:
+        logger.warning(f"⚠️ Killed {killed} sandboxed processes left over from finished runs")
+    return killed
+
+
+class _Workspace:
+    """Per-run temporary directory with the program's output files"""
+
+    def __init__(self, identity=None):
+        self.path = tempfile.mkdtemp(prefix='sandbox-', dir=SANDBOX_ROOT)
+        if identity:
+            os.chown(self.path, *identity)
+        self.stdout = open(os.path.join(self.path, 'stdout'), 'wb+')
+        self.stderr = open(os.path.join(self.path, 'stderr'), 'wb+')
+
+    def file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def read_output(self):
+        outputs = []
+        for handle in (self.stdout, self.stderr):
+            handle.flush()
+            handle.seek(0)
+            outputs.append(handle.read(OUTPUT_KB * 1024).decode('utf-8', errors='replace'))
+        return outputs
+
+    def close(self):
+        for handle in (self.stdout, self.stderr):
+            try:
+                handle.close()
+            except Exception:
+                pass
+        shutil.rmtree(self.path, ignore_errors=True)
+
+
+def _wait(process: subprocess.Popen, stdin_bytes: Optional[bytes], wall_seconds: float):
+    """
+    Feed stdin, wait with a wall-clock limit, then kill what is left of the process group.
+    Returns (exit code, timed out, max RSS KB, seconds).
+    """
+    started = time.perf_counter()
+    timed_out = threading.Event()
+
+    def kill():
+        timed_out.set()
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass
+
+    timer = threading.Timer(wall_seconds, kill)
+    timer.start()
+    try:
+        if process.stdin:
+            try:
+                process.stdin.write(stdin_bytes or b'')
+                process.stdin.close()
+            except (BrokenPipeError, OSError):
+                pass
+        # Wait without reaping, so the group id cannot be reused before its stragglers are killed
+        os.waitid(os.P_PID, process.pid, os.WEXITED | os.WNOWAIT)
+        elapsed = time.perf_counter() - started
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass
+        _, status, usage = os.wait4(process.pid, 0)
+    finally:
+        timer.cancel()
+        with _live_lock:
+            _live_pids.discard(process.pid)
+    process.returncode = os.waitstatus_to_exitcode(status)
+    return process.returncode, timed_out.is_set(), usage.ru_maxrss, elapsed
+
+
+class _WarmPythonPool:
+    """Interpreters started ahead of time, each waiting for one job on stdin"""
+
+    def __init__(self, size: int, interpreter: Optional[str] = None):
+        self.size = size
+        self.interpreter = interpreter
+        self._idle = deque()
+        self._lock = threading.Lock()
+        self._pid = None
+        self._refilling = False
+
+    def _spawn(self):
+        identity = _sandbox_identity()
+        workspace = _Workspace(identity)
+        process = _spawn(
+            [self.interpreter, '-I', '-c', _PYTHON_BOOTSTRAP], identity,
+            stdin=subprocess.PIPE, stdout=workspace.stdout, stderr=workspace.stderr,
+            cwd=workspace.path, env=SANDBOX_ENV, close_fds=True,
+            preexec_fn=_limit_process(identity=identity)
+        )
+        return process, workspace
+
+    def _refill(self):
+        with self._lock:
+            if self._refilling:
+                return
+            self._refilling = True
+        try:
+            while True:
+                with self._lock:
+                    if len(self._idle) >= self.size or self._pid != os.getpid():
+                        return
+                warm = self._spawn()
+                with self._lock:
+                    self._idle.append(warm)
+        except Exception:
+            pass
+        finally:
+            with self._lock:
+                self._refilling = False
+
+    def prewarm(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                self._idle = deque()
+                self._pid = os.getpid()
+        threading.Thread(target=self._refill, daemon=True).start()
+
+    def acquire(self):
+        """A ready interpreter (started now if none is idle); refills in the background"""
+        warm = None
+        with self._lock:
+            if self._pid != os.getpid():
+                # Interpreters started by the parent belong to it
+                self._idle = deque()
+                self._pid = os.getpid()
+            while self._idle and warm is None:
+                process, workspace = self._idle.popleft()
+                if process.poll() is None:
+                    warm = (process, workspace)
+                else:
+                    with _live_lock:
+                        _live_pids.discard(process.pid)
+                    workspace.close()
+        if self.size > 0:
+            threading.Thread(target=self._refill, daemon=True).start()
+        return warm or self._spawn()
+
+
+class Artifact:
+    """A compiled program (or its compile error), keyed by the hash of language + source"""
+
+    def __init__(self, language: str, digest: str, path: Optional[str], command: Optional[List[str]],
+                 failure: Optional[Dict[str, Any]], code: Optional[str] = None):
+        self.language = language
+        self.digest = digest
+        self.path = path
+        self.command = command
+        self.failure = failure
+        self.code = code
+
+
+class LocalSandboxBackend:
+    """Runs code in rlimited subprocesses on this host"""
+
+    name = 'local'
+
+    SOURCE_FILES = {'python': 'main.py', 'c': 'main.c', 'cpp': 'main.cpp', 'java': 'Main.java'}
+    TOOLCHAINS = {
+        'python': ['python3'],
+        'c': ['gcc'],
+        'cpp': ['g++'],
+        'java': ['javac', 'java'],
+    }
+
+    def __init__(self, warm_python: int = WARM_PYTHON):
+        self._tools: Dict[str, Optional[str]] = {}
+        self._artifacts: 'OrderedDict[str, Artifact]' = OrderedDict()
+        self._artifact_dir = None
+        self._artifact_pid = None
+        self._artifact_lock = threading.Lock()
+        self._build_locks: Dict[str, threading.Lock] = {}
+        self.stats = {'compilations': 0, 'cache_hits': 0, 'leftovers_killed': 0}
+        self._refusal_logged = False
+        # The system interpreter, not the server's virtualenv: programs may run as another user
+        self._python_pool = _WarmPythonPool(warm_python, os.getenv('SANDBOX_PYTHON') or self._tool('python3'))
+
+    def _tool(self, name: str) -> Optional[str]:
+        if name not in self._tools:
+            self._tools[name] = shutil.which(name, path=SANDBOX_ENV['PATH'])
+        return self._tools[name]
+
+    def supports(self, language: str) -> bool:
+        if not POSIX_AVAILABLE or language not in self.TOOLCHAINS:
+            return False
+        if _sandbox_identity() is None:
+            if not self._refusal_logged:
+                logger.warning(f"⚠️ Local code execution needs the server to run as root and SANDBOX_USER "
+                               f"({SANDBOX_USER!r}) to be a separate user; using OneCompiler")
+                self._refusal_logged = True
+            return False
+        return all(self._tool(tool) for tool in self.TOOLCHAINS[language])
+
+    def prewarm(self) -> None:
+        """Start this worker's idle Python interpreters"""
+        if self.supports('python'):
+            self._python_pool.prewarm()
+
+    # ------------------------------------------------------------------
+
+    def _result(self, workspace: _Workspace, exit_code: int, timed_out: bool,
+                max_rss_kb: int, seconds: float) -> Dict[str, Any]:
+        stdout, stderr = workspace.read_output()
+        if timed_out or exit_code == -signal.SIGXCPU:
+            return {
+                'success': False,
+                'timeout': True,
+                'error': 'Execution timeout. Code took too long to run.'
+            }
+        if exit_code == -signal.SIGXFSZ:
+            stderr = (stderr + '\nOutput limit exceeded').strip()
+        elif exit_code < 0:
+            stderr = (stderr + f'\nProcess terminated by signal {-exit_code}').strip()
+        return {
+            'success': True,
+            'stdout': stdout,
+            'stderr': stderr,
+            'exit_code': exit_code,
+            'execution_time': int(seconds * 1000),
+            'memory_used': max_rss_kb
+        }
+
+    def _compile(self, command: List[str], cwd: str, identity) -> Optional[Dict[str, Any]]:
+        """Run a compiler as the sandbox user; returns a failed-run result on compile errors, None on success"""
+        with tempfile.TemporaryFile() as stderr:
+            process = _spawn(
+                command, identity, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=stderr,
+                cwd=cwd, env=SANDBOX_ENV, close_fds=True,
+                preexec_fn=_limit_process(memory=False, cpu_seconds=int(COMPILE_SECONDS), identity=identity)
+            )
+            try:
+                exit_code, timed_out, _, _ = _wait(process, None, COMPILE_SECONDS)
+            finally:
+                self.stats['leftovers_killed'] += _kill_leftovers(identity)
+            if timed_out or exit_code == -signal.SIGXCPU:
+                return {'success': False, 'timeout': True, 'error': 'Compilation timeout.'}
+            if exit_code == 0:
+                return None
+            stderr.seek(0)
+            return {
+                'success': True,
+                'stdout': '',
+                'stderr': stderr.read(OUTPUT_KB * 1024).decode('utf-8', errors='replace'),
+                'exit_code': exit_code if exit_code > 0 else 1,
+                'execution_time': 0,
+                'memory_used': 0
+            }
+
+    def _artifact_root(self) -> str:
+        if self._artifact_pid != os.getpid():
+            # The parent's cache directory is not ours to evict from
+            self._artifact_dir = tempfile.mkdtemp(prefix='sandbox-artifacts-', dir=SANDBOX_ROOT)
+            os.chmod(self._artifact_dir, 0o755)
+            self._artifacts = OrderedDict()
+            self._artifact_pid = os.getpid()
+        return self._artifact_dir
+
+    def _compile_artifact(self, language: str, code: str, digest: str) -> Artifact:
+        identity = _sandbox_identity()
+        if identity is None:
+            raise SandboxUnavailable('Compilers only run as the sandbox user')
+        path = tempfile.mkdtemp(prefix=f'{language}-{digest[:12]}-', dir=self._artifact_root())
+        # Compilers run inside the artifact directory so messages mention main.c, not temp paths
+        source = self.SOURCE_FILES[language]
+        with open(os.path.join(path, source), 'w', encoding='utf-8') as handle:
+            handle.write(code)
+        # The compiler only gets to write its output here, as the sandbox user: the source cannot
+        # #include files only the server user may read
+        os.chown(path, *identity)
+        os.chmod(path, 0o755)
+        if language == 'java':
+            failure = self._compile([self._tool('javac'), '-encoding', 'UTF-8', source], path, identity)
+            command = [self._tool('java'), f'-Xmx{MEMORY_MB}m', '-XX:+UseSerialGC', '-cp', path, 'Main']
+        else:
+            failure = self._compile(
+                [self._tool('gcc' if language == 'c' else 'g++'), '-O2', '-o', 'main', source, '-lm'], path, identity
+            )
+            command = [os.path.join(path, 'main')]
+        # Hand the artifact back to the server user, so programs of later runs cannot replace it
+        for name in [''] + os.listdir(path):
+            target = os.path.join(path, name)
+            os.lchown(target, os.getuid(), os.getgid())
+            if not os.path.islink(target):
+                os.chmod(target, 0o755)
+        self.stats['compilations'] += 1
+        return Artifact(language, digest, path, command, failure)
+
+    def build(self, language: str, code: str) -> Artifact:
+        """
+        Compile code once per content hash. The artifact (or the compile error) is reused
+        by every run of the same source until it is evicted from the LRU cache.
+        """
+        if not self.supports(language):
+            raise SandboxUnavailable(f'No local toolchain for {language}')
+        digest = hashlib.sha256(f'{language}\0{code}'.encode('utf-8')).hexdigest()
+        if language == 'python':
+            return Artifact(language, digest, None, None, None, code=code)
+
+        with self._artifact_lock:
+            self._artifact_root()
+            artifact = self._artifacts.get(digest)
+            if artifact is not None:
+                self._artifacts.move_to_end(digest)
+                self.stats['cache_hits'] += 1
+                return artifact
+            # Concurrent builds of the same source wait for one compilation
+            build_lock = self._build_locks.setdefault(digest, threading.Lock())
+        with build_lock:
+            with self._artifact_lock:
+                artifact = self._artifacts.get(digest)
+            if artifact is None:
+                artifact = self._compile_artifact(language, code, digest)
+                if artifact.failure and artifact.failure.get('timeout'):
+                    # A compile timeout may be load, not the source: let the next run retry
+                    shutil.rmtree(artifact.path, ignore_errors=True)
+                    with self._artifact_lock:
+                        self._build_locks.pop(digest, None)
+                    return artifact
+                with self._artifact_lock:
+                    self._artifacts[digest] = artifact
+                    while len(self._artifacts) > ARTIFACT_CACHE_SIZE:
+                        _, evicted = self._artifacts.popitem(last=False)
+                        shutil.rmtree(evicted.path, ignore_errors=True)
+            else:
+                self.stats['cache_hits'] += 1
+        with self._artifact_lock:
+            self._build_locks.pop(digest, None)
+        return artifact
+
+    def run_artifact(self, artifact: Artifact, stdin: str = '') -> Dict[str, Any]:
+        """Run a built program against one stdin input"""
+        if artifact.failure is not None:
+            return dict(artifact.failure)
+        if artifact.language == 'python':
+            return self._run_python(artifact.code, stdin)
+        identity = _sandbox_identity()
+        workspace = _Workspace(identity)
+        try:
+            process = _spawn(
+                artifact.command, identity, stdin=subprocess.PIPE, stdout=workspace.stdout, stderr=workspace.stderr,
+                cwd=workspace.path, env=SANDBOX_ENV, close_fds=True,
+                # The JVM reserves far more address space than it uses: its heap is capped with -Xmx instead
+                preexec_fn=_limit_process(memory=artifact.language != 'java', identity=identity)
+            )
+            return self._result(workspace, *_wait(process, (stdin or '').encode('utf-8'), WALL_SECONDS))
+        finally:
+            workspace.close()
+            self.stats['leftovers_killed'] += _kill_leftovers(identity)
+
+    def _run_python(self, code: str, stdin: str) -> Dict[str, Any]:
+        process, workspace = self._python_pool.acquire()
+        try:
+            code_bytes = code.encode('utf-8')
+            job = str(len(code_bytes)).encode() + b'\n' + code_bytes + (stdin or '').encode('utf-8')
+            return self._result(workspace, *_wait(process, job, WALL_SECONDS))
+        finally:
+            workspace.close()
+            self.stats['leftovers_killed'] += _kill_leftovers(_sandbox_identity())
+
+    def run(self, language: str, code: str, stdin: str = '') -> Dict[str, Any]:
+        """Run code with stdin; result in the same shape as CompilerService.compile_and_run"""
+        return self.run_artifact(self.build(language, code), stdin)
@@ -0,0 +1,57 @@
+"""
+Shared fixtures: an in-memory MongoDB (mongomock) in place of the application database.
+
+The `mongo` module connects to the configured database on import, so it is replaced
+by a placeholder before the modules under test import `mongo_db` from it; each test
+then patches its own mongomock database into those modules.
+"""
+
+import os
+import sys
+import types
+
+import mongomock
+import pytest
+from pymongo import InsertOne, UpdateOne
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if 'mongo' not in sys.modules:
+    placeholder = types.ModuleType('mongo')
+    placeholder.mongo_db = None
+    sys.modules['mongo'] = placeholder
+
+COLLECTIONS = (
+    'students', 'student_test_attempts', 'test_results', 'progress_events', 'student_test_summary'
+)
+
+
+def _with_bulk_write_fallback(collection):
+    """
+    mongomock builds bulk updates with options newer pymongo releases no longer accept;
+    apply such batches one request at a time instead.
+    """
+    bulk_write = collection.bulk_write
+
+    def bulk_write_compat(requests, ordered=True, **kwargs):
+        try:
+            return bulk_write(requests, ordered=ordered, **kwargs)
+        except TypeError:
+            for request in requests:
+                if isinstance(request, UpdateOne):
+                    collection.update_one(request._filter, request._doc, upsert=request._upsert)
+                elif isinstance(request, InsertOne):
+                    collection.insert_one(request._doc)
+                else:
+                    raise
+            return None
+
+    collection.bulk_write = bulk_write_compat
+    return collection
+
+
+@pytest.fixture
+def db():
+    database = mongomock.MongoClient().versant_test
+    return types.SimpleNamespace(**{
+        name: _with_bulk_write_fallback(database[name]) for name in COLLECTIONS
+    })
@@ -0,0 +1,78 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from bson import ObjectId
+
+from utils import audio_grading
+from utils.audio_grading import GRADING_FAILED, GRADING_PENDING, STALE_AFTER, StaleGradingSweeper
+
+
+@pytest.fixture
+def requeued(db, monkeypatch):
+    """Attempts handed to _requeue (S3 is not reachable from the tests)"""
+    monkeypatch.setattr(audio_grading, 'mongo_db', db)
+    monkeypatch.setattr(audio_grading, '_in_flight', set())
+    handed_over = []
+    monkeypatch.setattr(audio_grading, '_requeue', lambda attempt: handed_over.append(attempt['_id']) or True)
+    return handed_over
+
+
+def _pending_attempt(db, submitted_ago: timedelta, **fields):
+    return db.student_test_attempts.insert_one({
+        'student_id': ObjectId(),
+        'test_id': ObjectId(),
+        'status': GRADING_PENDING,
+        'submitted_at': datetime.now(timezone.utc) - submitted_ago,
+        'pending_audio': [],
+        **fields
+    }).inserted_id
+
+
+def test_grading_error_fails_the_attempt(db, monkeypatch):
+    monkeypatch.setattr(audio_grading, 'mongo_db', db)
+    monkeypatch.setattr(audio_grading, '_in_flight', set())
+    attempt_id = _pending_attempt(db, timedelta(0))
+
+    def transcription_down(attempt_id, audio_items):
+        raise RuntimeError('transcription service unavailable')
+
+    monkeypatch.setattr(audio_grading, 'grade_pending_attempt', transcription_down)
+    audio_grading._in_flight.add(str(attempt_id))
+    audio_grading._run(attempt_id, [])
+
+    attempt = db.student_test_attempts.find_one({'_id': attempt_id})
+    assert attempt['status'] == GRADING_FAILED
+    assert attempt['grading_error'] == 'transcription service unavailable'
+    assert str(attempt_id) not in audio_grading._in_flight
+
+
+def test_sweep_requeues_only_stale_attempts_once(db, requeued):
+    stale = _pending_attempt(db, STALE_AFTER + timedelta(minutes=1))
+    _pending_attempt(db, timedelta(seconds=10))
+    _pending_attempt(db, STALE_AFTER + timedelta(minutes=1), status='completed')
+    sweeper = StaleGradingSweeper()
+
+    assert sweeper.sweep() == 1
+    assert requeued == [stale]
+    # Claimed: not stale again until another full window has passed
+    assert sweeper.sweep() == 0
+    assert requeued == [stale]
+
+
+def test_sweep_skips_attempts_graded_recently_or_in_this_worker(db, requeued):
+    _pending_attempt(db, STALE_AFTER * 3, grading_started_at=datetime.now(timezone.utc) - timedelta(seconds=5))
+    in_flight = _pending_attempt(db, STALE_AFTER * 3)
+    audio_grading._in_flight.add(str(in_flight))
+    lost = _pending_attempt(db, STALE_AFTER * 3, grading_started_at=datetime.now(timezone.utc) - STALE_AFTER * 2)
+
+    assert StaleGradingSweeper().sweep() == 1
+    assert requeued == [lost]
+
+
+def test_poll_requeues_a_stale_attempt_once(db, requeued):
+    attempt_id = _pending_attempt(db, STALE_AFTER + timedelta(minutes=1))
+    attempt = db.student_test_attempts.find_one({'_id': attempt_id})
+
+    assert audio_grading.requeue_if_stale(attempt)
+    assert not audio_grading.requeue_if_stale(attempt)
+    assert requeued == [attempt_id]
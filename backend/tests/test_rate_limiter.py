@@ -0,0 +1,49 @@
+import pytest
+from flask import Flask, jsonify
+from flask_jwt_extended import JWTManager, create_access_token, jwt_required
+
+from utils import rate_limiter as rate_limiter_module
+from utils.rate_limiter import RateLimiter, rate_limited
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(rate_limiter_module, 'rate_limiter', RateLimiter())
+    app = Flask(__name__)
+    app.config['JWT_SECRET_KEY'] = 'test-secret-key-of-at-least-32-bytes'
+    JWTManager(app)
+
+    @app.route('/compile', methods=['POST'])
+    @jwt_required()
+    @rate_limited('code_execution')
+    def compile_code():
+        return jsonify({'success': True})
+
+    with app.app_context():
+        tokens = {user: create_access_token(identity=user) for user in ('student-1', 'student-2')}
+    test_client = app.test_client()
+    return lambda user, body=None: test_client.post(
+        '/compile', json=body or {}, headers={'Authorization': f'Bearer {tokens[user]}'}
+    )
+
+
+def test_burst_then_retry_after(client):
+    burst = int(rate_limiter_module.rate_limiter.limits['code_execution'][0])
+
+    for _ in range(burst):
+        assert client('student-1').status_code == 200
+    limited = client('student-1')
+
+    assert limited.status_code == 429
+    assert int(limited.headers['Retry-After']) >= 1
+    assert limited.headers['X-RateLimit-Remaining'] == '0'
+    # Other students keep their own bucket
+    assert client('student-2').status_code == 200
+
+
+def test_request_fields_do_not_buy_extra_calls(client):
+    burst = int(rate_limiter_module.rate_limiter.limits['code_execution'][0])
+    statuses = [client('student-1', {'validation_run_id': 'same'}).status_code for _ in range(burst + 5)]
+
+    assert statuses.count(200) == burst
+    assert statuses.count(429) == 5
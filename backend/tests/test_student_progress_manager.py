@@ -0,0 +1,102 @@
+from datetime import datetime
+
+from bson import ObjectId
+
+from utils import student_progress_manager
+from utils.student_progress_manager import StudentProgressManager
+
+
+def _student(db, levels=('LISTENING_BEGINNER',)):
+    return db.students.insert_one({
+        'user_id': ObjectId(),
+        'authorized_levels': [{'level_id': level_id, 'authorized_by': 'default'} for level_id in levels],
+        'module_progress': {},
+        'unlock_history': []
+    }).inserted_id
+
+
+def test_completion_unlocks_next_level_above_threshold(db):
+    student_id = _student(db)
+    manager = StudentProgressManager(db)
+
+    assert manager.update_student_progress_on_test_completion(student_id, 'LISTENING_BEGINNER', 75, attempt_id=ObjectId())
+
+    student = db.students.find_one({'_id': student_id})
+    assert [level['level_id'] for level in student['authorized_levels']] == ['LISTENING_BEGINNER', 'LISTENING_INTERMEDIATE']
+    assert student['module_progress']['LISTENING']['attempts_count'] == 1
+    assert student['module_progress']['LISTENING']['highest_score'] == 75
+
+
+def test_completion_below_threshold_only_records_progress(db):
+    student_id = _student(db)
+    manager = StudentProgressManager(db)
+
+    assert manager.update_student_progress_on_test_completion(student_id, 'LISTENING_BEGINNER', 40, attempt_id=ObjectId())
+
+    student = db.students.find_one({'_id': student_id})
+    assert [level['level_id'] for level in student['authorized_levels']] == ['LISTENING_BEGINNER']
+    assert student['module_progress']['LISTENING']['last_score'] == 40
+    assert len(student['unlock_history']) == 1
+
+
+def test_replayed_attempt_is_applied_once(db):
+    student_id = _student(db)
+    manager = StudentProgressManager(db)
+    attempt_id = ObjectId()
+
+    for _ in range(3):
+        assert manager.update_student_progress_on_test_completion(student_id, 'LISTENING_BEGINNER', 75, attempt_id=attempt_id)
+
+    student = db.students.find_one({'_id': student_id})
+    assert student['module_progress']['LISTENING']['attempts_count'] == 1
+    assert student['module_progress']['LISTENING']['total_score'] == 75
+    assert len(student['unlock_history']) == 1
+    assert [level['level_id'] for level in student['authorized_levels']].count('LISTENING_INTERMEDIATE') == 1
+    assert student['progress_attempt_ids'] == [attempt_id]
+
+
+def test_distinct_attempts_are_all_counted(db):
+    student_id = _student(db)
+    manager = StudentProgressManager(db)
+
+    manager.update_student_progress_on_test_completion(student_id, 'LISTENING_BEGINNER', 50, attempt_id=ObjectId())
+    manager.update_student_progress_on_test_completion(student_id, 'LISTENING_BEGINNER', 90, attempt_id=ObjectId())
+
+    progress = db.students.find_one({'_id': student_id})['module_progress']['LISTENING']
+    assert progress['attempts_count'] == 2
+    assert progress['total_score'] == 140
+    assert progress['highest_score'] == 90
+
+
+def test_missing_student_reports_failure(db):
+    manager = StudentProgressManager(db)
+
+    assert not manager.update_student_progress_on_test_completion(ObjectId(), 'LISTENING_BEGINNER', 90, attempt_id=ObjectId())
+    assert db.students.count_documents({}) == 0
+
+
+def test_insights_summary_is_cached_until_the_next_submission(db, monkeypatch):
+    monkeypatch.setattr(student_progress_manager, '_insights_cache', student_progress_manager.OrderedDict())
+    user_id = ObjectId()
+    student = {'_id': ObjectId(), 'user_id': user_id}
+    db.student_test_summary.insert_one({'student_id': user_id, 'attempt_count': 1, 'updated_at': datetime(2026, 1, 1)})
+    manager = StudentProgressManager(db)
+    aggregations = []
+
+    def aggregate(pipeline, **kwargs):
+        aggregations.append(pipeline)
+        return iter([{'counts': [{'_id': 'practice', 'count': len(aggregations)}], 'tests': [], 'modules': []}])
+
+    monkeypatch.setattr(db.student_test_attempts, 'aggregate', aggregate)
+    or_clauses = [{'student_id': user_id}]
+
+    first = manager._get_attempt_summary(student, or_clauses)
+    assert manager._get_attempt_summary(student, or_clauses) is first
+    assert len(aggregations) == 1
+
+    db.student_test_summary.update_one(
+        {'student_id': user_id}, {'$inc': {'attempt_count': 1}, '$set': {'updated_at': datetime(2026, 1, 2)}}
+    )
+    refreshed = manager._get_attempt_summary(student, or_clauses)
+    assert len(aggregations) == 2
+    assert refreshed['total_attempts'] == 2
@@ -0,0 +1,139 @@
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+
+from utils import submission_outbox
+from utils.submission_outbox import MAX_ATTEMPTS, OutboxConsumer, practice_outbox_entry
+
+
+@pytest.fixture
+def consumer(db, monkeypatch):
+    monkeypatch.setattr(submission_outbox, 'mongo_db', db)
+    return OutboxConsumer()
+
+
+def _submit(db, student_id=None, percentage=80):
+    """A completed practice attempt with its pending outbox entry, as the submit route writes it"""
+    user_id = ObjectId()
+    if student_id is None:
+        student_id = db.students.insert_one({
+            'user_id': user_id,
+            'authorized_levels': [{'level_id': 'LISTENING_BEGINNER', 'authorized_by': 'default'}],
+            'module_progress': {},
+            'unlock_history': []
+        }).inserted_id
+    test = {'_id': ObjectId(), 'name': 'Listening Practice', 'module_id': 'LISTENING', 'level_id': 'LISTENING_BEGINNER'}
+    return db.student_test_attempts.insert_one({
+        'test_id': test['_id'],
+        'student_id': user_id,
+        'test_type': 'practice',
+        'module_id': 'LISTENING',
+        'score': 4,
+        'percentage': percentage,
+        'correct_answers': 4,
+        'total_questions': 5,
+        'submitted_at': datetime.utcnow(),
+        'outbox': practice_outbox_entry(test, {'_id': student_id}, user_id)
+    }).inserted_id
+
+
+def _outbox(db, attempt_id):
+    return db.student_test_attempts.find_one({'_id': attempt_id})['outbox']
+
+
+def test_batch_runs_every_step_once(db, consumer):
+    attempt_id = _submit(db)
+
+    assert consumer.process_batch() == 1
+
+    outbox = _outbox(db, attempt_id)
+    assert outbox['status'] == 'done'
+    assert sorted(outbox['completed_steps']) == sorted(submission_outbox.STEPS)
+    assert 'lease_token' not in outbox
+    assert db.test_results.count_documents({'attempt_id': attempt_id}) == 1
+    assert db.progress_events.count_documents({'details.attempt_id': str(attempt_id)}) == 1
+    student = db.students.find_one({'_id': outbox['payload']['student_profile_id']})
+    assert student['module_progress']['LISTENING']['attempts_count'] == 1
+    assert consumer.process_batch() == 0
+
+
+def test_replayed_entry_does_not_repeat_its_effects(db, consumer):
+    attempt_id = _submit(db)
+    consumer.process_batch()
+
+    # Redelivery, e.g. a worker that crashed after the steps but before marking the entry done
+    db.student_test_attempts.update_one({'_id': attempt_id}, {'$set': {
+        'outbox.status': 'pending', 'outbox.completed_steps': [], 'outbox.next_attempt_at': datetime.utcnow()
+    }})
+    assert consumer.process_batch() == 1
+
+    outbox = _outbox(db, attempt_id)
+    assert outbox['status'] == 'done'
+    assert db.test_results.count_documents({'attempt_id': attempt_id}) == 1
+    assert db.progress_events.count_documents({'details.attempt_id': str(attempt_id)}) == 1
+    student = db.students.find_one({'_id': outbox['payload']['student_profile_id']})
+    assert student['module_progress']['LISTENING']['attempts_count'] == 1
+    assert len(student['unlock_history']) == 1
+
+
+def test_lost_lease_stops_before_the_next_step(db, consumer, monkeypatch):
+    attempt_id = _submit(db)
+    project_test_results = consumer._project_test_results
+
+    def project_then_lose_lease(attempts):
+        failed = project_test_results(attempts)
+        # The lease expired meanwhile and another worker claimed the entry
+        db.student_test_attempts.update_one({'_id': attempt_id}, {'$set': {'outbox.lease_token': 'other-worker'}})
+        return failed
+
+    monkeypatch.setattr(consumer, '_project_test_results', project_then_lose_lease)
+    consumer.process_batch()
+
+    outbox = _outbox(db, attempt_id)
+    assert outbox['status'] == 'processing'
+    assert outbox['lease_token'] == 'other-worker'
+    assert outbox['completed_steps'] == ['test_results']
+    assert db.progress_events.count_documents({}) == 0
+    student = db.students.find_one({'_id': outbox['payload']['student_profile_id']})
+    assert 'LISTENING' not in student['module_progress']
+    assert consumer.stats['leases_lost'] == 1
+
+
+def test_failed_step_is_retried_with_backoff(db, consumer):
+    # A missing student profile makes the progress step fail
+    attempt_id = _submit(db, student_id=ObjectId())
+
+    before = datetime.utcnow()
+    consumer.process_batch()
+    outbox = _outbox(db, attempt_id)
+    assert outbox['status'] == 'pending'
+    assert outbox['attempts'] == 1
+    assert 'progress' not in outbox['completed_steps']
+    assert before + timedelta(seconds=2) <= outbox['next_attempt_at'] <= datetime.utcnow() + timedelta(seconds=2)
+    assert 'lease_token' not in outbox
+
+    # Not claimed again before it is due
+    assert consumer.process_batch() == 0
+
+    db.student_test_attempts.update_one({'_id': attempt_id}, {'$set': {'outbox.next_attempt_at': datetime.utcnow()}})
+    before = datetime.utcnow()
+    consumer.process_batch()
+    outbox = _outbox(db, attempt_id)
+    assert outbox['attempts'] == 2
+    assert outbox['next_attempt_at'] >= before + timedelta(seconds=4)
+    assert db.test_results.count_documents({'attempt_id': attempt_id}) == 1
+    assert consumer.stats['retried'] == 2
+
+
+def test_entry_fails_after_max_attempts(db, consumer):
+    attempt_id = _submit(db, student_id=ObjectId())
+    db.student_test_attempts.update_one({'_id': attempt_id}, {'$set': {'outbox.attempts': MAX_ATTEMPTS - 1}})
+
+    consumer.process_batch()
+
+    outbox = _outbox(db, attempt_id)
+    assert outbox['status'] == 'failed'
+    assert outbox['attempts'] == MAX_ATTEMPTS
+    assert consumer.stats['failed'] == 1
+    assert consumer.process_batch() == 0
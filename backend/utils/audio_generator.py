@@ -18,21 +18,30 @@ except ImportError:
     PYDUB_AVAILABLE = False
     print("Warning: pydub package not available. Audio processing will not work.")
 
-def generate_audio_from_text(text, accent='en', speed=1.0, max_retries=3):
-    """Generate audio from text using gTTS with custom accent and speed"""
+def _audio_error(e):
+    """Exception with a user-facing message for a failed generation step"""
+    if "gTTS" in str(e):
+        return Exception(f"Text-to-speech conversion failed: {str(e)}. Please check the text content and try again.")
+    elif "AudioSegment" in str(e):
+        return Exception(f"Audio processing failed: {str(e)}. Please check if the audio file was generated correctly.")
+    elif "S3" in str(e) or "AWS" in str(e):
+        return Exception(f"AWS S3 error: {str(e)}. Please check AWS configuration and try again.")
+    else:
+        return Exception(f"Audio generation failed: {str(e)}. Please try again or contact support.")
+
+def synthesize_audio(text, accent='en', speed=1.0, max_retries=3):
+    """
+    Synthesize text with gTTS at the given accent and speed.
+    Returns the path of a temporary mp3 file; the caller removes it.
+    """
     if not GTTS_AVAILABLE:
         raise Exception("Audio generation not available - gTTS package is missing. Please install it using: pip install gtts")
     
     if not PYDUB_AVAILABLE:
         raise Exception("Audio generation not available - pydub package is missing. Please install it using: pip install pydub")
     
-    # Check if S3 is configured
-    s3_available = is_aws_configured()
-    
-    if not s3_available:
-        raise Exception("AWS S3 is not configured. Please set AWS_ACCESS_KEY, AWS_SECRET_KEY, AWS_REGION, and AWS_S3_BUCKET environment variables. Audio files can only be stored on AWS S3.")
-    
     for attempt in range(max_retries):
+        temp_filename = f"temp_{uuid.uuid4()}.mp3"
         try:
             # Ensure speed is a float to prevent type comparison errors
             try:
@@ -50,7 +59,6 @@ def generate_audio_from_text(text, accent='en', speed=1.0, max_retries=3):
             tts = gTTS(text=text, lang=accent, slow=(speed < 1.0))
             
             # Generate temporary file
-            temp_filename = f"temp_{uuid.uuid4()}.mp3"
             tts.save(temp_filename)
             
             # Load audio and adjust speed if needed
@@ -64,23 +72,7 @@ def generate_audio_from_text(text, accent='en', speed=1.0, max_retries=3):
             # Save adjusted audio
             adjusted_filename = f"adjusted_{uuid.uuid4()}.mp3"
             audio.export(adjusted_filename, format="mp3")
-            
-            # Upload to AWS S3 (no fallback to local storage)
-            current_s3_client = get_s3_client_safe()
-            if current_s3_client is None:
-                raise Exception("S3 client is not available. Please check AWS configuration.")
-            
-            s3_key = f"audio/practice_tests/{uuid.uuid4()}.mp3"
-            current_s3_client.upload_file(adjusted_filename, S3_BUCKET_NAME, s3_key)
-            
-            # Clean up temporary files
-            try:
-                os.remove(temp_filename)
-                os.remove(adjusted_filename)
-            except Exception as cleanup_error:
-                print(f"Warning: Failed to cleanup temporary files: {cleanup_error}")
-            
-            return s3_key
+            return adjusted_filename
             
         except Exception as e:
             if "429" in str(e) or "Too Many Requests" in str(e):
@@ -93,18 +85,51 @@ def generate_audio_from_text(text, accent='en', speed=1.0, max_retries=3):
                     continue
                 else:
                     raise Exception(f"Google TTS API rate limit exceeded after {max_retries} attempts. Please wait a few minutes and try again.")
-            elif "gTTS" in str(e):
-                raise Exception(f"Text-to-speech conversion failed: {str(e)}. Please check the text content and try again.")
-            elif "AudioSegment" in str(e):
-                raise Exception(f"Audio processing failed: {str(e)}. Please check if the audio file was generated correctly.")
-            elif "S3" in str(e) or "AWS" in str(e):
-                raise Exception(f"AWS S3 error: {str(e)}. Please check AWS configuration and try again.")
-            else:
-                raise Exception(f"Audio generation failed: {str(e)}. Please try again or contact support.")
+            raise _audio_error(e)
+        finally:
+            # Clean up the raw gTTS file
+            try:
+                if os.path.exists(temp_filename):
+                    os.remove(temp_filename)
+            except Exception as cleanup_error:
+                print(f"Warning: Failed to cleanup temporary files: {cleanup_error}")
     
     # If we get here, all retries failed
     raise Exception("Audio generation failed after all retry attempts")
 
+def generate_audio_from_text(text, accent='en', speed=1.0, max_retries=3):
+    """Generate audio from text using gTTS with custom accent and speed"""
+    if not GTTS_AVAILABLE:
+        raise Exception("Audio generation not available - gTTS package is missing. Please install it using: pip install gtts")
+    
+    if not PYDUB_AVAILABLE:
+        raise Exception("Audio generation not available - pydub package is missing. Please install it using: pip install pydub")
+    
+    # Check if S3 is configured
+    s3_available = is_aws_configured()
+    
+    if not s3_available:
+        raise Exception("AWS S3 is not configured. Please set AWS_ACCESS_KEY, AWS_SECRET_KEY, AWS_REGION, and AWS_S3_BUCKET environment variables. Audio files can only be stored on AWS S3.")
+    
+    adjusted_filename = synthesize_audio(text, accent, speed, max_retries)
+    try:
+        # Upload to AWS S3 (no fallback to local storage)
+        current_s3_client = get_s3_client_safe()
+        if current_s3_client is None:
+            raise Exception("S3 client is not available. Please check AWS configuration.")
+        
+        s3_key = f"audio/practice_tests/{uuid.uuid4()}.mp3"
+        current_s3_client.upload_file(adjusted_filename, S3_BUCKET_NAME, s3_key)
+        return s3_key
+    except Exception as e:
+        raise _audio_error(e)
+    finally:
+        # Clean up temporary files
+        try:
+            os.remove(adjusted_filename)
+        except Exception as cleanup_error:
+            print(f"Warning: Failed to cleanup temporary files: {cleanup_error}")
+
 def is_audio_generation_available():
     """Check if audio generation is available"""
     # Audio generation is available if we have the required packages
@@ -142,49 +167,10 @@ def get_audio_generation_status():
     }
 
 def calculate_similarity(original_text, student_audio_text):
-    """Calculate similarity score between original and student audio text"""
+    """Calculate similarity score (0-100) between original and student audio text"""
     try:
-        from difflib import SequenceMatcher
-        
-        print(f"Calculating similarity between:")
-        print(f"  Original: '{original_text}'")
-        print(f"  Student: '{student_audio_text}'")
-        
-        # Handle empty texts
-        if not original_text or not student_audio_text:
-            print("One or both texts are empty, returning 0.0")
-            return 0.0
-        
-        # Convert to lowercase for better comparison
-        original_lower = original_text.lower().strip()
-        student_lower = student_audio_text.lower().strip()
-        
-        print(f"  Original (lower): '{original_lower}'")
-        print(f"  Student (lower): '{student_lower}'")
-        
-        # Calculate similarity using SequenceMatcher
-        similarity = SequenceMatcher(None, original_lower, student_lower).ratio()
-        print(f"  SequenceMatcher similarity: {similarity}")
-        
-        # Calculate word-level accuracy
-        original_words = set(original_lower.split())
-        student_words = set(student_lower.split())
-        
-        print(f"  Original words: {original_words}")
-        print(f"  Student words: {student_words}")
-        
-        if not original_words:
-            print("No original words found, returning 0.0")
-            return 0.0
-        
-        word_accuracy = len(original_words.intersection(student_words)) / len(original_words)
-        print(f"  Word accuracy: {word_accuracy}")
-        
-        # Combine similarity and word accuracy
-        final_score = (similarity * 0.7) + (word_accuracy * 0.3)
-        print(f"  Final score: {final_score}")
-        
-        return round(final_score * 100, 2)
+        from utils.text_similarity import similarity_score
+        return similarity_score(original_text, student_audio_text)
     except Exception as e:
         print(f"Error calculating similarity: {str(e)}")
         return 0.0
@@ -195,68 +181,15 @@ calculate_similarity_score = calculate_similarity
 def transcribe_audio(audio_file_path):
     """Transcribe audio file to text using speech recognition"""
     try:
-        # Try to import speech_recognition, but make it optional
-        try:
-            import speech_recognition as sr
-        except ImportError:
-            print("Warning: speech_recognition package not available. Audio transcription will not work.")
-            return ""
-        
-        # Check if pydub is available for format conversion
-        if not PYDUB_AVAILABLE:
-            print("Warning: pydub package not available. Audio format conversion will not work.")
-            return ""
-        
-        recognizer = sr.Recognizer()
+        from utils.transcription_engine import transcribe_clip
         
-        # Convert audio to WAV format if needed
-        temp_wav_path = None
-        try:
-            # Load audio with pydub to handle different formats
-            print(f"Loading audio file: {audio_file_path}")
-            audio_segment = AudioSegment.from_file(audio_file_path)
-            print(f"Audio loaded successfully: {len(audio_segment)}ms, {audio_segment.frame_rate}Hz, {audio_segment.channels} channels")
-            
-            # Convert to WAV format with proper parameters
-            temp_wav_path = f"temp_converted_{uuid.uuid4()}.wav"
-            print(f"Converting to WAV: {temp_wav_path}")
-            
-            # Set proper audio parameters for speech recognition
-            audio_segment = audio_segment.set_frame_rate(16000).set_channels(1)
-            audio_segment.export(temp_wav_path, format="wav")
-            
-            print(f"WAV conversion completed: {os.path.getsize(temp_wav_path)} bytes")
-            
-            # Use the converted WAV file for transcription
-            with sr.AudioFile(temp_wav_path) as source:
-                # Adjust for ambient noise
-                recognizer.adjust_for_ambient_noise(source, duration=0.5)
-                audio = recognizer.record(source)
-                print(f"Audio recorded for transcription: {len(audio.frame_data)} bytes")
-                text = recognizer.recognize_google(audio)
-                print(f"Transcription successful: '{text}'")
-                return text
-                
-        except Exception as conversion_error:
-            print(f"Error converting audio format: {str(conversion_error)}")
-            # Fallback: try direct transcription if conversion fails
-            try:
-                with sr.AudioFile(audio_file_path) as source:
-                    recognizer.adjust_for_ambient_noise(source, duration=0.5)
-                    audio = recognizer.record(source)
-                    text = recognizer.recognize_google(audio)
-                    return text
-            except Exception as fallback_error:
-                print(f"Fallback transcription also failed: {str(fallback_error)}")
-                return ""
-        finally:
-            # Clean up temporary file
-            if temp_wav_path and os.path.exists(temp_wav_path):
-                try:
-                    os.remove(temp_wav_path)
-                except Exception as cleanup_error:
-                    print(f"Warning: Failed to cleanup temporary file: {cleanup_error}")
-                    
+        with open(audio_file_path, 'rb') as f:
+            audio_bytes = f.read()
+        extension = os.path.splitext(audio_file_path)[1].lstrip('.') or None
+        result = transcribe_clip(audio_bytes, extension)
+        if result['error']:
+            print(f"Error transcribing audio: {result['error']}")
+        return result['text']
     except Exception as e:
         print(f"Error transcribing audio: {str(e)}")
-        return "" 
\ No newline at end of file
+        return ""
@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+"""
+Asynchronous Audio Answer Grading
+Listening/speaking submissions persist the recordings and create the attempt in the
+`grading_pending` state; transcription and similarity scoring run here, in a bounded
+background pool, from the bytes the request already received (no S3 round trip).
+Queued attempts hold their recordings in memory, so at most MAX_PENDING attempts per
+process wait for or run in the pool; past that an attempt is graded in the request.
+
+When grading finishes the attempt is completed together with its post-submission
+outbox entry (test_results copy, level progress, monitoring - see submission_outbox),
+the test summary is updated, and a `grading_complete` Socket.IO event is sent to the
+student's room. Clients without a socket poll the grading-status endpoint.
+
+A grading error marks the attempt `grading_failed`. Attempts whose grading was lost
+with its worker (restart, crash) are picked up again by a sweeper thread in every
+worker once they have been pending for STALE_AFTER since grading last started; the
+window is shorter than the time clients keep polling, so the student waiting for the
+result still receives it. An attempt is claimed atomically before it is re-queued,
+and only one grader can complete it, so workers never apply a result twice.
+"""
+
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from bson import ObjectId
+
+from mongo import mongo_db
+from utils.submission_outbox import outbox_consumer, practice_outbox_entry
+from utils.text_similarity import similarity_scores
+from utils.transcription_engine import transcribe_clips
+
+logger = logging.getLogger(__name__)
+
+GRADING_PENDING = 'grading_pending'
+GRADING_FAILED = 'grading_failed'
+
+MAX_WORKERS = int(os.getenv('AUDIO_GRADING_WORKERS', '4'))
+MAX_PENDING = int(os.getenv('AUDIO_GRADING_MAX_PENDING', str(MAX_WORKERS * 4)))
+# Attempts still pending this long after grading started were most likely lost with their
+# worker; must stay well below the client's polling timeout (5 minutes, services/api.js)
+STALE_AFTER = timedelta(seconds=int(os.getenv('AUDIO_GRADING_STALE_SECONDS', '120')))
+SWEEP_SECONDS = int(os.getenv('AUDIO_GRADING_SWEEP_SECONDS', '30'))
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+_in_flight = set()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    """Pool for this process (executors do not survive a gunicorn fork)"""
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix='audio-grading')
+            _executor_pid = os.getpid()
+        return _executor
+
+
+def score_audio_answers(answers: List[Tuple[Dict[str, Any], str]], module_id: Optional[str]) -> List[Dict[str, Any]]:
+    """Similarity score (0-1 scale) and correctness of (question, transcribed text) pairs, scored in one batch"""
+    original_texts = [question.get('question') or question.get('sentence', '') for question, _ in answers]
+    try:
+        similarities = similarity_scores(
+            [(original_text, student_text) for original_text, (_, student_text) in zip(original_texts, answers)]
+        ) / 100.0
+    except Exception as e:
+        logger.error(f"Error calculating similarity: {e}")
+        similarities = [0.0] * len(answers)
+
+    graded = []
+    for (question, _), original_text, similarity_score in zip(answers, original_texts, similarities):
+        similarity_score = float(similarity_score)
+        is_correct = False
+        score = 0
+        if module_id == 'LISTENING':
+            threshold = question.get('transcript_validation', {}).get('tolerance', 0.8)
+            is_correct = similarity_score >= threshold
+            score = similarity_score
+        elif module_id == 'SPEAKING':
+            threshold = question.get('transcript_validation', {}).get('tolerance', 0.7)
+            is_correct = similarity_score >= threshold
+            score = similarity_score
+        graded.append({
+            'original_text': original_text,
+            'similarity_score': similarity_score,
+            'is_correct': is_correct,
+            'score': score
+        })
+    return graded
+
+
+def pending_audio_result(index: int, question: Dict[str, Any], student_audio_url: str) -> Dict[str, Any]:
+    """Placeholder result stored until the recording has been graded"""
+    return {
+        'question_index': index,
+        'question': question['question'],
+        'question_type': 'audio',
+        'student_audio_url': student_audio_url,
+        'student_text': '',
+        'original_text': question.get('question') or question.get('sentence', ''),
+        'similarity_score': 0.0,
+        'is_correct': False,
+        'score': 0,
+        'grading_status': 'pending'
+    }
+
+
+def pending_audio_entry(index: int, question: Dict[str, Any], s3_key: str, extension: str) -> Dict[str, Any]:
+    """What the attempt keeps so grading can be redone from S3 if the worker is lost"""
+    return {
+        'question_index': index,
+        's3_key': s3_key,
+        'extension': extension,
+        'question': {
+            'question': question.get('question'),
+            'sentence': question.get('sentence', ''),
+            'transcript_validation': question.get('transcript_validation', {})
+        }
+    }
+
+
+def _notify(user_id, payload: Dict[str, Any]) -> None:
+    try:
+        from socketio_instance import socketio
+        socketio.emit('grading_complete', payload, room=str(user_id))
+    except Exception as e:
+        logger.warning(f"⚠️ Could not emit grading_complete for {user_id}: {e}")
+
+
+def grade_pending_attempt(attempt_id, audio_items: List[Dict[str, Any]]) -> None:
+    """
+    Transcribe and score the audio answers of a pending attempt, then complete it.
+
+    audio_items: [{'question_index', 'question', 'audio_bytes', 'extension'}]
+    """
+    attempt = mongo_db.student_test_attempts.find_one({'_id': attempt_id})
+    if not attempt or attempt.get('status') != GRADING_PENDING:
+        return
+    test = mongo_db.tests.find_one({'_id': attempt['test_id']})
+    if not test:
+        logger.error(f"❌ Test {attempt['test_id']} not found while grading attempt {attempt_id}")
+        mongo_db.student_test_attempts.update_one({'_id': attempt_id}, {'$set': {'status': GRADING_FAILED}})
+        return
+
+    results = list(attempt.get('detailed_results', []))
+    by_index = {r.get('question_index'): pos for pos, r in enumerate(results)}
+    transcriptions = transcribe_clips([(item['audio_bytes'], item['extension']) for item in audio_items])
+    for item, transcription in zip(audio_items, transcriptions):
+        if transcription['error']:
+            logger.error(f"Error transcribing audio for question {item['question_index']} "
+                         f"of attempt {attempt_id}: {transcription['error']}")
+    scored = score_audio_answers(
+        [(item['question'], transcription['text']) for item, transcription in zip(audio_items, transcriptions)],
+        test.get('module_id')
+    )
+    for item, transcription, graded in zip(audio_items, transcriptions, scored):
+        pos = by_index.get(item['question_index'])
+        if pos is None:
+            continue
+        results[pos] = {
+            **results[pos], **graded,
+            'student_text': transcription['text'],
+            'grading_status': 'graded',
+            'transcription_ms': transcription['timings']['total_ms']
+        }
+
+    total_questions = attempt.get('total_questions') or len(results)
+    total_score = sum(r.get('score', 0) for r in results)
+    correct_answers = sum(1 for r in results if r.get('is_correct'))
+    percentage = (total_score / total_questions) * 100 if total_questions > 0 else 0
+    completed_at = datetime.now(timezone.utc)
+
+    update = {
+        'status': 'completed',
+        'detailed_results': results,
+        'score': total_score,
+        'correct_answers': correct_answers,
+        'percentage': percentage,
+        'score_percentage': percentage,
+        'average_score': percentage / 100.0,
+        'graded_at': completed_at,
+        'outbox': practice_outbox_entry(
+            test, mongo_db.students.find_one({'user_id': attempt['student_id']}, {'_id': 1}), attempt['student_id']
+        )
+    }
+    # Only the grader that wins the pending -> completed transition records the outcome;
+    # the outbox entry is written in the same update
+    claimed = mongo_db.student_test_attempts.update_one(
+        {'_id': attempt_id, 'status': GRADING_PENDING},
+        {'$set': update, '$unset': {'pending_audio': ''}}
+    )
+    if claimed.modified_count == 0:
+        return
+
+    outbox_consumer.notify()
+    mongo_db.record_test_attempt_summary(
+        attempt['student_id'], attempt['test_id'], percentage, attempt_id, attempt.get('submitted_at')
+    )
+
+    logger.info(f"✅ Graded attempt {attempt_id}: {percentage:.2f}% ({len(audio_items)} recordings)")
+    _notify(attempt['student_id'], {
+        'attempt_id': str(attempt_id),
+        'test_id': str(attempt['test_id']),
+        'status': 'completed',
+        'score': total_score,
+        'total_questions': total_questions,
+        'correct_answers': correct_answers,
+        'percentage': percentage
+    })
+
+
+def _mark_failed(attempt_id, error: str) -> None:
+    """Give up on a pending attempt; the student is told to submit again"""
+    try:
+        failed = mongo_db.student_test_attempts.find_one_and_update(
+            {'_id': attempt_id, 'status': GRADING_PENDING},
+            {'$set': {'status': GRADING_FAILED, 'grading_error': error[:500]}},
+            {'student_id': 1, 'test_id': 1}
+        )
+    except Exception as e:
+        logger.error(f"❌ Could not mark attempt {attempt_id} as {GRADING_FAILED}: {e}")
+        return
+    if failed:
+        _notify(failed['student_id'], {
+            'attempt_id': str(attempt_id),
+            'test_id': str(failed['test_id']),
+            'status': GRADING_FAILED
+        })
+
+
+def _run(attempt_id, audio_items) -> None:
+    try:
+        # Restarts the stale window, so a long queue is not mistaken for a lost job
+        mongo_db.student_test_attempts.update_one(
+            {'_id': attempt_id, 'status': GRADING_PENDING},
+            {'$set': {'grading_started_at': datetime.now(timezone.utc)}}
+        )
+        grade_pending_attempt(attempt_id, audio_items)
+    except Exception as e:
+        logger.error(f"❌ Audio grading failed for attempt {attempt_id}: {e}")
+        _mark_failed(attempt_id, str(e))
+    finally:
+        _in_flight.discard(str(attempt_id))
+
+
+def submit_grading(attempt_id, audio_items: List[Dict[str, Any]]) -> None:
+    """Queue a pending attempt for background grading; graded in the calling thread when the pool is full"""
+    key = str(attempt_id)
+    with _executor_lock:
+        if key in _in_flight:
+            return
+        queue_full = len(_in_flight) >= MAX_PENDING
+        _in_flight.add(key)
+    if queue_full:
+        logger.warning(f"⚠️ {MAX_PENDING} attempts already queued for grading, grading attempt {attempt_id} in the request")
+        _run(attempt_id, audio_items)
+        return
+    _get_executor().submit(_run, attempt_id, audio_items)
+
+
+def _claim_stale(query: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Atomically take over one stale pending attempt matching query (only one worker gets it)"""
+    now = datetime.now(timezone.utc)
+    cutoff = now - STALE_AFTER
+    return mongo_db.student_test_attempts.find_one_and_update(
+        {
+            **query,
+            'status': GRADING_PENDING,
+            'submitted_at': {'$lte': cutoff},
+            '$or': [{'grading_started_at': {'$exists': False}}, {'grading_started_at': {'$lte': cutoff}}]
+        },
+        {'$set': {'grading_started_at': now}}
+    )
+
+
+def _requeue(attempt: Dict[str, Any]) -> bool:
+    """Fetch the recordings of a claimed attempt back from S3 and queue its grading"""
+    from config.aws_config import S3_BUCKET_NAME, get_s3_client_safe
+
+    s3_client = get_s3_client_safe()
+    if s3_client is None:
+        return False
+
+    audio_items = []
+    try:
+        for pending in attempt.get('pending_audio', []):
+            body = s3_client.get_object(Bucket=S3_BUCKET_NAME, Key=pending['s3_key'])['Body'].read()
+            audio_items.append({
+                'question_index': pending['question_index'],
+                'question': pending['question'],
+                'audio_bytes': body,
+                'extension': pending['extension']
+            })
+    except Exception as e:
+        logger.error(f"❌ Could not fetch the recordings of attempt {attempt['_id']}: {e}")
+        _mark_failed(attempt['_id'], f"Recordings could not be fetched: {e}")
+        return False
+    logger.info(f"🔁 Re-queueing stale grading for attempt {attempt['_id']}")
+    submit_grading(attempt['_id'], audio_items)
+    return True
+
+
+def requeue_if_stale(attempt: Dict[str, Any]) -> bool:
+    """
+    Re-queue a pending attempt whose grading was lost (e.g. the worker restarted),
+    fetching the recordings back from S3. Returns True when it was re-queued.
+    """
+    if attempt.get('status') != GRADING_PENDING or str(attempt['_id']) in _in_flight:
+        return False
+    claimed = _claim_stale({'_id': attempt['_id']})
+    return claimed is not None and _requeue(claimed)
+
+
+class StaleGradingSweeper:
+    """Per-worker thread re-queueing attempts whose grading was lost, whether or not a client polls"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._indexes_ready = False
+
+    def ensure_running(self) -> None:
+        """Start the sweeper in this process (threads do not survive a gunicorn fork)"""
+        if self._pid == os.getpid() and self._thread and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='audio-grading-sweeper', daemon=True)
+            self._thread.start()
+            logger.info(f"🔁 Stale audio grading sweeper started in worker {self._pid}")
+
+    def _run(self) -> None:
+        while True:
+            try:
+                self.sweep()
+            except Exception as e:
+                logger.error(f"❌ Stale audio grading sweep failed: {e}")
+            time.sleep(SWEEP_SECONDS)
+
+    def _ensure_indexes(self) -> None:
+        if self._indexes_ready:
+            return
+        mongo_db.student_test_attempts.create_index([('status', 1), ('submitted_at', 1)])
+        self._indexes_ready = True
+
+    def sweep(self) -> int:
+        """Re-queue up to MAX_PENDING stale attempts; returns how many were re-queued"""
+        self._ensure_indexes()
+        requeued = 0
+        for _ in range(MAX_PENDING):
+            in_flight = [ObjectId(key) for key in list(_in_flight)]
+            attempt = _claim_stale({'_id': {'$nin': in_flight}})
+            if attempt is None:
+                break
+            requeued += _requeue(attempt)
+        return requeued
+
+
+stale_grading_sweeper = StaleGradingSweeper()
@@ -0,0 +1,68 @@
+"""
+Per-process background threads.
+
+Threads do not survive a fork, and with gunicorn's preload_app the app is created
+in the master process, which must not run them (it serves no requests and would
+compete with the workers for queued work). create_app() therefore starts them
+directly only outside gunicorn. Under gunicorn every worker starts them from the
+post_fork hook (gunicorn_config.py) or, for configs without that hook, on its
+first request.
+"""
+
+import logging
+import os
+import sys
+
+logger = logging.getLogger(__name__)
+
+_started_pid = None
+
+
+def running_under_gunicorn() -> bool:
+    return (
+        'gunicorn' in os.environ.get('SERVER_SOFTWARE', '')
+        or os.path.basename(sys.argv[0] if sys.argv else '').startswith('gunicorn')
+    )
+
+
+def start_background_workers() -> None:
+    """Start this process's background threads (idempotent, cheap after the first call)"""
+    global _started_pid
+    if _started_pid == os.getpid():
+        return
+    _started_pid = os.getpid()
+
+    # Pre-warm scheduled online exams shortly before they open
+    try:
+        from utils.exam_surge import surge_manager
+        surge_manager.ensure_running()
+    except Exception as e:
+        logger.warning(f"⚠️ Exam surge refresher failed to start: {e}")
+
+    # Apply post-submission work (test_results copies, progress, monitoring) in the background
+    try:
+        from utils.submission_outbox import outbox_consumer
+        outbox_consumer.ensure_running()
+    except Exception as e:
+        logger.warning(f"⚠️ Submission outbox consumer failed to start: {e}")
+
+    # Re-queue audio grading lost with a previous worker
+    try:
+        from utils.audio_grading import stale_grading_sweeper
+        stale_grading_sweeper.ensure_running()
+    except Exception as e:
+        logger.warning(f"⚠️ Stale audio grading sweeper failed to start: {e}")
+
+    # Resume queued/interrupted student upload jobs
+    try:
+        from utils.student_upload_jobs import student_upload_jobs
+        student_upload_jobs.ensure_running()
+    except Exception as e:
+        logger.warning(f"⚠️ Student upload job worker failed to start: {e}")
+
+    # Start idle interpreters when code runs on the local execution backend
+    try:
+        from services.compiler_service import compiler_service
+        compiler_service.prewarm()
+    except Exception as e:
+        logger.warning(f"⚠️ Compiler backend pre-warm failed: {e}")
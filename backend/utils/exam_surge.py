@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+"""
+Exam-start Surge Mode
+When a scheduled online exam opens, every assigned student hits the start and
+test-fetch endpoints within a few seconds. This module prepares for that spike and
+smooths it out.
+
+A background refresher in each worker watches `online_exams.start_date` and the
+`startDateTime` of online tests. A few minutes before an exam opens it pre-loads the
+test document, the processed (shuffled) payload and the assigned-student set, and
+makes sure the attempt lookup index exists.
+
+During the opening window, `surge_admission` admits a fixed number of requests per
+second per test across all workers. It uses a shared per-second counter in Mongo,
+because sync gunicorn workers cannot see each other's in-flight requests. Requests
+over the budget get a 503 with a Retry-After hint that spreads them over the next
+seconds instead of queueing them inside the workers.
+"""
+
+import copy
+import logging
+import math
+import os
+import random
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from functools import wraps
+from typing import Any, Dict, Optional, Set
+
+from bson import ObjectId
+from flask import jsonify
+from flask_jwt_extended import get_jwt_identity
+from pymongo import ReturnDocument
+
+from mongo import mongo_db
+from utils.test_payload_cache import get_processed_test
+
+logger = logging.getLogger(__name__)
+
+LEAD_MINUTES = int(os.getenv('EXAM_SURGE_LEAD_MINUTES', '5'))
+WINDOW_MINUTES = int(os.getenv('EXAM_SURGE_WINDOW_MINUTES', '3'))
+REFRESH_SECONDS = int(os.getenv('EXAM_SURGE_REFRESH_SECONDS', '30'))
+ADMIT_PER_SECOND = int(os.getenv('EXAM_SURGE_ADMIT_PER_SECOND', '40'))
+MAX_RETRY_AFTER = 30
+
+ADMISSIONS_COLLECTION = 'exam_surge_admissions'
+
+
+def _as_utc_naive(value) -> Optional[datetime]:
+    """Dates are stored either as datetimes or as ISO strings (online_exams); normalise to naive UTC"""
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        except ValueError:
+            return None
+    if not isinstance(value, datetime):
+        return None
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _as_object_id(value) -> Optional[ObjectId]:
+    if isinstance(value, ObjectId):
+        return value
+    if value is not None and ObjectId.is_valid(str(value)):
+        return ObjectId(str(value))
+    return None
+
+
+class ExamSurgeManager:
+    """Per-worker pre-warmed state for exams that are about to open or just opened"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._warm: Dict[str, Dict[str, Any]] = {}
+        self._aliases: Dict[str, str] = {}
+        self._thread = None
+        self._pid = None
+        self._indexes_ready = False
+        self.stats = {'refreshes': 0, 'warmed': 0, 'served_from_warm': 0, 'admitted': 0, 'deferred': 0}
+
+    # ------------------------------------------------------------------
+    # Background refresher
+    # ------------------------------------------------------------------
+
+    def ensure_running(self) -> None:
+        """Start the refresher in this process (threads do not survive a gunicorn fork)"""
+        if self._pid == os.getpid() and self._thread and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='exam-surge-refresher', daemon=True)
+            self._thread.start()
+            logger.info(f"🚦 Exam surge refresher started in worker {self._pid}")
+
+    def _run(self) -> None:
+        while True:
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error(f"❌ Exam surge refresh failed: {e}")
+            time.sleep(REFRESH_SECONDS)
+
+    def _ensure_indexes(self) -> None:
+        if self._indexes_ready:
+            return
+        mongo_db.student_test_attempts.create_index([('test_id', 1), ('student_id', 1)])
+        mongo_db.db[ADMISSIONS_COLLECTION].create_index('created_at', expireAfterSeconds=600)
+        self._indexes_ready = True
+
+    def _upcoming_exams(self, now: datetime) -> Dict[ObjectId, datetime]:
+        """test _id -> opening time for exams opening within the lead time or still in the window"""
+        earliest = now - timedelta(minutes=WINDOW_MINUTES)
+        latest = now + timedelta(minutes=LEAD_MINUTES)
+        upcoming = {}
+
+        # online_exams stores start_date as submitted (often an ISO string), so compare in Python
+        for exam in mongo_db.online_exams.find(
+            {'status': {'$in': ['scheduled', 'active']}}, {'test_id': 1, 'start_date': 1}
+        ):
+            opens_at = _as_utc_naive(exam.get('start_date'))
+            test_oid = _as_object_id(exam.get('test_id'))
+            if test_oid and opens_at and earliest <= opens_at <= latest:
+                upcoming[test_oid] = opens_at
+
+        for test in mongo_db.tests.find(
+            {'test_type': 'online', 'status': 'active', 'startDateTime': {'$gte': earliest, '$lte': latest}},
+            {'startDateTime': 1}
+        ):
+            opens_at = _as_utc_naive(test.get('startDateTime'))
+            if opens_at:
+                upcoming.setdefault(test['_id'], opens_at)
+        return upcoming
+
+    def _assigned_students(self, test: Dict[str, Any]) -> Optional[Set[str]]:
+        """
+        User ids of the students an online test is assigned to (same campus/course rule
+        as start_test), or None when assignment is not decided by campus and course.
+        """
+        if test.get('test_type') != 'online':
+            return None
+        campus_ids = [c for c in (_as_object_id(c) for c in test.get('campus_ids', [])) if c]
+        course_ids = [c for c in (_as_object_id(c) for c in test.get('course_ids', [])) if c]
+        if not campus_ids or not course_ids:
+            return None
+        query = {'campus_id': {'$in': campus_ids}, 'course_id': {'$in': course_ids}}
+        return {str(s['user_id']) for s in mongo_db.students.find(query, {'user_id': 1}) if s.get('user_id')}
+
+    def refresh(self) -> None:
+        """Warm exams that are about to open and drop the ones whose window has passed"""
+        self.stats['refreshes'] += 1
+        now = datetime.utcnow()
+        upcoming = self._upcoming_exams(now)
+        if upcoming:
+            self._ensure_indexes()
+
+        warm = {}
+        aliases = {}
+        for test_oid, opens_at in upcoming.items():
+            key = str(test_oid)
+            entry = self._warm.get(key)
+            test = mongo_db.tests.find_one({'_id': test_oid})
+            if not test:
+                continue
+            # Builds (or reuses) the shuffled payload so the first GET is served from memory
+            get_processed_test(test)
+            warm[key] = {
+                'test': test,
+                'opens_at': opens_at,
+                'window_ends': opens_at + timedelta(minutes=WINDOW_MINUTES),
+                'assigned': self._assigned_students(test)
+            }
+            if test.get('test_id'):
+                aliases[str(test['test_id'])] = key
+            if entry is None:
+                self.stats['warmed'] += 1
+                logger.info(f"🔥 Pre-warmed online exam {key} opening at {opens_at} "
+                            f"({len(warm[key]['assigned'] or ())} assigned students)")
+
+        with self._lock:
+            self._warm = warm
+            self._aliases = aliases
+
+    # ------------------------------------------------------------------
+    # Accessors
+    # ------------------------------------------------------------------
+
+    def _entry(self, test_identifier) -> Optional[Dict[str, Any]]:
+        key = str(test_identifier)
+        with self._lock:
+            entry = self._warm.get(key) or self._warm.get(self._aliases.get(key, ''))
+        if entry and datetime.utcnow() <= entry['window_ends']:
+            return entry
+        return None
+
+    def get_test(self, test_identifier) -> Optional[Dict[str, Any]]:
+        """Private copy of a warm test document (callers mutate what they get), or None"""
+        entry = self._entry(test_identifier)
+        if entry is None:
+            return None
+        self.stats['served_from_warm'] += 1
+        return copy.deepcopy(entry['test'])
+
+    def is_assigned(self, test_identifier, user_id) -> Optional[bool]:
+        """True/False for a warm online exam, None when it is not warm or not campus/course assigned"""
+        entry = self._entry(test_identifier)
+        if entry is None or entry['assigned'] is None:
+            return None
+        return str(user_id) in entry['assigned']
+
+    def in_opening_window(self, test_identifier) -> bool:
+        entry = self._entry(test_identifier)
+        return entry is not None and entry['opens_at'] <= datetime.utcnow()
+
+    # ------------------------------------------------------------------
+    # Admission control
+    # ------------------------------------------------------------------
+
+    def admit(self, test_identifier) -> Optional[int]:
+        """
+        Take a slot in this second's budget for the test.
+        Returns None when admitted, otherwise the number of seconds to wait.
+        """
+        entry = self._entry(test_identifier)
+        if entry is None:
+            return None
+        key = str(entry['test']['_id'])
+        second = int(time.time())
+        try:
+            slot = mongo_db.db[ADMISSIONS_COLLECTION].find_one_and_update(
+                {'_id': f"{key}:{second}"},
+                {'$inc': {'count': 1}, '$setOnInsert': {'created_at': datetime.utcnow()}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+        except Exception as e:
+            # Never block an exam because the counter is unavailable
+            logger.warning(f"⚠️ Surge admission counter unavailable for {key}: {e}")
+            return None
+
+        position = slot.get('count', 1)
+        if position <= ADMIT_PER_SECOND:
+            self.stats['admitted'] += 1
+            return None
+
+        # Spread the overflow over the following seconds, with jitter so retries do not re-align
+        self.stats['deferred'] += 1
+        wait = math.ceil((position - ADMIT_PER_SECOND) / ADMIT_PER_SECOND) + random.randint(0, 2)
+        return min(max(wait, 1), MAX_RETRY_AFTER)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self.stats,
+                'warm_exams': {
+                    key: {
+                        'opens_at': entry['opens_at'].isoformat(),
+                        'window_ends': entry['window_ends'].isoformat(),
+                        'assigned_students': len(entry['assigned'] or ())
+                    }
+                    for key, entry in self._warm.items()
+                }
+            }
+
+
+surge_manager = ExamSurgeManager()
+
+
+def surge_admission(view):
+    """
+    Admission gate for exam-start endpoints taking a `test_id` argument.
+    Outside an exam's opening window it is a no-op.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        surge_manager.ensure_running()
+        test_id = kwargs.get('test_id')
+        if test_id is None or not surge_manager.in_opening_window(test_id):
+            return view(*args, **kwargs)
+
+        # Students outside the exam's campus/course are turned away without using a slot
+        if surge_manager.is_assigned(test_id, get_jwt_identity()) is False:
+            return jsonify({'success': False, 'message': 'Test not assigned to your campus or course'}), 403
+
+        retry_after = surge_manager.admit(test_id)
+        if retry_after is None:
+            return view(*args, **kwargs)
+
+        response = jsonify({
+            'success': False,
+            'message': 'The exam is opening for many students right now, please retry shortly',
+            'retry_after': retry_after
+        })
+        response.headers['Retry-After'] = str(retry_after)
+        return response, 503
+    return wrapper
@@ -0,0 +1,98 @@
+"""
+In-memory level dependency graph for score-based unlocking.
+
+Built from the LEVELS constants, overlaid with any documents of the `levels`
+collection (matched on level_id), and indexed by module and by prerequisite so that
+unlock checks are dictionary lookups. The graph is rebuilt only when the reference
+data cache reloads the `levels` collection, i.e. when its shared version is bumped.
+
+The graph is shared between requests and must be treated as read-only.
+"""
+
+import logging
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from config.constants import LEVELS
+
+logger = logging.getLogger(__name__)
+
+LEVEL_FIELDS = ('name', 'module_id', 'order', 'depends_on', 'unlock_threshold')
+DEFAULT_UNLOCK_THRESHOLD = 60
+
+
+class LevelGraph:
+    """Levels by id, levels of each module in order, and the levels each level unlocks"""
+
+    def __init__(self, levels: Dict[str, Dict[str, Any]]):
+        self.levels = levels
+        self.module_levels: Dict[str, List[str]] = {}
+        self.dependents: Dict[str, List[Tuple[str, float]]] = {}
+        for level_id, level in sorted(levels.items(), key=lambda item: item[1].get('order', 0)):
+            if level.get('module_id'):
+                self.module_levels.setdefault(level['module_id'], []).append(level_id)
+            if level.get('depends_on'):
+                threshold = level.get('unlock_threshold', DEFAULT_UNLOCK_THRESHOLD)
+                self.dependents.setdefault(level['depends_on'], []).append((level_id, threshold))
+
+    def module_of(self, level_id: str) -> Optional[str]:
+        return self.levels.get(level_id, {}).get('module_id')
+
+    def levels_of(self, module_id: str) -> List[str]:
+        return list(self.module_levels.get(module_id, []))
+
+    def next_level(self, level_id: str, authorized: Iterable[str]) -> Optional[str]:
+        """First level depending on level_id that is not authorized yet"""
+        authorized = set(authorized)
+        for dependent, _ in self.dependents.get(level_id, []):
+            if dependent not in authorized:
+                return dependent
+        return None
+
+    def unlocks(self, completed_level_id: str, score: float, authorized: Iterable[str]) -> List[str]:
+        """Levels that completing completed_level_id with this score newly unlocks"""
+        authorized = set(authorized)
+        return [
+            level_id for level_id, threshold in self.dependents.get(completed_level_id, [])
+            if level_id not in authorized and score >= threshold
+        ]
+
+
+def _build_levels(documents: Iterable[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    levels = {level_id: dict(level) for level_id, level in LEVELS.items() if isinstance(level, dict)}
+    for document in documents:
+        level_id = document.get('level_id')
+        if not level_id:
+            continue
+        overrides = {field: document[field] for field in LEVEL_FIELDS if document.get(field) is not None}
+        levels[level_id] = {**levels.get(level_id, {}), **overrides}
+    return levels
+
+
+_graph: Optional[LevelGraph] = None
+_graph_source = None
+_graph_lock = threading.Lock()
+
+
+def get_level_graph(db=None) -> LevelGraph:
+    """
+    Current level graph. With the application MongoDB wrapper the `levels` collection
+    is read through its reference data cache; otherwise only the constants are used.
+    """
+    global _graph, _graph_source
+    reference_data = getattr(db, 'reference_data', None)
+    source = 'constants'
+    documents: Iterable[Dict[str, Any]] = ()
+    if reference_data is not None:
+        try:
+            # The cache replaces this map whenever the levels version changes
+            source = reference_data.get_map('levels')
+            documents = source.values()
+        except Exception as e:
+            logger.warning(f"⚠️ Could not read levels collection, using LEVELS constants: {e}")
+    with _graph_lock:
+        if _graph is None or _graph_source is not source:
+            _graph = LevelGraph(_build_levels(documents))
+            _graph_source = source
+            logger.info(f"🔄 Built level graph with {len(_graph.levels)} levels")
+        return _graph
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+MCQ Grading Engine
+One implementation of multiple-choice grading for every submission endpoint.
+
+A test's MCQ questions are compiled once into an answer key: parallel arrays of
+question positions, ids, correct option letters and texts (after the per-test option
+shuffle, when the questions carry one) and the displayed options. `grade_mcq`
+compares a submitted answers dict against the key in one vectorized pass and returns
+per-question results plus totals.
+"""
+
+from typing import Any, Callable, Dict, Optional, Sequence
+
+import numpy as np
+
+OPTION_LETTERS = ('A', 'B', 'C', 'D')
+
+
+def is_mcq(question: Dict[str, Any]) -> bool:
+    return question.get('question_type') == 'mcq'
+
+
+def _original_options(question: Dict[str, Any]) -> Dict[str, Any]:
+    return {letter: question.get(f'option{letter}', '') for letter in OPTION_LETTERS}
+
+
+def compile_answer_key(questions: Sequence[Dict[str, Any]],
+                       correct_field: Optional[str] = None,
+                       include: Callable[[Dict[str, Any]], bool] = is_mcq) -> Dict[str, Any]:
+    """
+    Compile the MCQ questions of `questions` into an answer key.
+
+    By default the correct answer is the option named by the `answer` letter, or by
+    `shuffled_answer` within `shuffled_options` when the question was shuffled.
+    With correct_field the correct answer text is read from that field instead.
+    """
+    positions, question_ids, texts, letters, correct_texts, options = [], [], [], [], [], []
+    for i, question in enumerate(questions):
+        if not include(question):
+            continue
+        if correct_field:
+            letter = ''
+            correct_text = question.get(correct_field, '') or ''
+            question_options = question.get('shuffled_options') or _original_options(question)
+        elif 'shuffled_answer' in question and 'shuffled_options' in question:
+            letter = question.get('shuffled_answer') or ''
+            question_options = question.get('shuffled_options') or {}
+            correct_text = question_options.get(letter, '')
+        else:
+            letter = question.get('answer', '') or ''
+            question_options = _original_options(question)
+            correct_text = question_options.get(letter, '') if letter in OPTION_LETTERS else ''
+        positions.append(i)
+        question_ids.append(str(question.get('_id', i)))
+        texts.append(question.get('question', ''))
+        letters.append(letter)
+        correct_texts.append('' if correct_text is None else str(correct_text))
+        options.append(question_options)
+
+    return {
+        'positions': np.array(positions, dtype=np.int64),
+        'question_ids': question_ids,
+        'questions': texts,
+        'correct_letters': letters,
+        'correct_texts': np.array(correct_texts, dtype=object),
+        'options': options,
+        'total_questions': len(questions)
+    }
+
+
+def grade_mcq(answer_key: Dict[str, Any], answers: Dict[str, Any],
+              answer_field: Callable[[int, str], str] = lambda position, question_id: question_id,
+              case_sensitive: bool = True,
+              include_options: bool = False) -> Dict[str, Any]:
+    """
+    Grade submitted answers against a compiled key.
+
+    answer_field(position, question_id) names the key under which the answer to a
+    question was submitted, e.g. lambda i, qid: f'answer_{i}'.
+
+    Returns {'results': [...], 'by_position': {position: result}, 'score', 'correct_answers', 'graded'}
+    """
+    positions = answer_key['positions']
+    question_ids = answer_key['question_ids']
+    answers = answers or {}
+
+    submitted = np.empty(len(positions), dtype=object)
+    submitted[:] = [
+        '' if value is None else str(value)
+        for value in (answers.get(answer_field(int(position), question_id))
+                      for position, question_id in zip(positions, question_ids))
+    ]
+    correct = answer_key['correct_texts']
+
+    if not len(positions):
+        matches = np.zeros(0, dtype=bool)
+    elif case_sensitive:
+        matches = np.asarray(submitted == correct, dtype=bool)
+    else:
+        matches = np.char.lower(submitted.astype(str)) == np.char.lower(correct.astype(str))
+    # A question without a configured answer never scores
+    matches &= np.asarray(correct != '', dtype=bool)
+
+    results = []
+    for k, position in enumerate(positions):
+        result = {
+            'question_index': int(position),
+            'question_id': question_ids[k],
+            'question': answer_key['questions'][k],
+            'question_type': 'mcq',
+            'student_answer': submitted[k],
+            'correct_answer_letter': answer_key['correct_letters'][k],
+            'correct_answer_text': correct[k],
+            'is_correct': bool(matches[k]),
+            'score': int(matches[k])
+        }
+        if include_options:
+            result['options'] = answer_key['options'][k]
+        results.append(result)
+
+    correct_count = int(matches.sum())
+    return {
+        'results': results,
+        'by_position': {result['question_index']: result for result in results},
+        'score': correct_count,
+        'correct_answers': correct_count,
+        'graded': len(results)
+    }
+
+
+def regrade_result(question_result: Dict[str, Any], case_sensitive: bool = True) -> Dict[str, Any]:
+    """Re-check a stored MCQ result against the correct answer text stored with it"""
+    correct_text = question_result.get('correct_answer_text', question_result.get('correct_answer', ''))
+    key = {
+        'positions': np.array([question_result.get('question_index', 0)], dtype=np.int64),
+        'question_ids': [str(question_result.get('question_id', ''))],
+        'questions': [question_result.get('question', '')],
+        'correct_letters': [question_result.get('correct_answer_letter', '')],
+        'correct_texts': np.array([correct_text or ''], dtype=object),
+        'options': [question_result.get('options', {})],
+        'total_questions': 1
+    }
+    answers = {key['question_ids'][0]: question_result.get('student_answer')}
+    return grade_mcq(key, answers, case_sensitive=case_sensitive, include_options=True)['results'][0]
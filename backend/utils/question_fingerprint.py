@@ -0,0 +1,44 @@
+"""
+Content hashes of question bank questions for duplicate detection.
+
+Each question uploaded to a module bank stores content_hash: a sha256 of its
+normalized question text (case and whitespace insensitive) and of its topic, if
+any. A unique index on (module_id, level_id, content_hash) rejects duplicates,
+and an upload checks for existing questions with one indexed $in on the hashes
+it contains instead of loading the whole level.
+
+Questions stored before the hash existed are backfilled by
+migrate_question_content_hash.py.
+"""
+
+import hashlib
+from typing import Any, Dict, Optional
+
+CONTENT_HASH_FIELD = 'content_hash'
+
+
+def normalize_question_text(text: Optional[str]) -> str:
+    return ' '.join(str(text or '').lower().split())
+
+
+def question_content_hash(text: Optional[str], topic_id: Any = None) -> Optional[str]:
+    """Hash of a question's text within its topic, None for empty text"""
+    normalized = normalize_question_text(text)
+    if not normalized:
+        return None
+    return hashlib.sha256(f"{topic_id or ''}\n{normalized}".encode('utf-8')).hexdigest()
+
+
+def document_content_hash(doc: Dict[str, Any]) -> Optional[str]:
+    """content_hash of a stored question_bank document"""
+    return question_content_hash(doc.get('question'), doc.get('topic_id'))
+
+
+def create_content_hash_index(collection) -> None:
+    # Partial: documents stored by other upload paths without a hash are not constrained
+    collection.create_index(
+        [('module_id', 1), ('level_id', 1), (CONTENT_HASH_FIELD, 1)],
+        unique=True,
+        partialFilterExpression={CONTENT_HASH_FIELD: {'$exists': True}},
+        name='module_level_content_hash_unique'
+    )
@@ -1,21 +1,46 @@
 """
 Question Processing Utilities
 Handles file upload processing, question type detection, and question parsing
+
+iter_file_questions / iter_text_content yield questions as they are parsed; large
+documents are split into block batches that are parsed in a process pool.
+
+The pool uses the spawn start method, whose children re-import the main script as
+__mp_main__: main.py does not create the app in that case, and any other entry point
+that parses large documents must guard its start-up the same way.
 """
 
 import os
 import re
 import logging
-from typing import List, Dict, Any, Optional, Tuple
+import multiprocessing
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Any, Iterable, Iterator, Optional, Tuple
 from datetime import datetime
 import pytz
 from bson import ObjectId
 
+from utils.spreadsheet_reader import iter_chunks
+
 logger = logging.getLogger(__name__)
 
+# Documents at least this long are parsed in a process pool, in batches of PARSE_BATCH_SIZE blocks
+PARALLEL_MIN_CHARS = int(os.getenv('QUESTION_PARSE_PARALLEL_MIN_CHARS', '200000'))
+PARSE_BATCH_SIZE = 200
+PARSE_WORKERS = int(os.getenv('QUESTION_PARSE_WORKERS', '0')) or min(4, os.cpu_count() or 1)
+
+PATTERN_FLAGS = re.MULTILINE | re.DOTALL | re.IGNORECASE
+BLOCK_SEPARATOR = re.compile(r'\n\s*\n|\n\s*Question\s*\d+:')
+
+
 class QuestionProcessor:
     """Processes uploaded question files and detects question types"""
     
+    # Detection order: the first type with a matching pattern wins
+    TYPE_ORDER = ('MCQ', 'Audio', 'Paragraph', 'Sentence')
+    
     def __init__(self):
         self.question_patterns = {
             'MCQ': [
@@ -37,145 +62,263 @@ class QuestionProcessor:
                 r'Question\s*\d+:\s*Audio\s*Question\s*\n\s*(.+?)\s*\n\s*Answer:\s*(.+?)(?:\n|$)'
             ]
         }
+        # Compiled once; every block is matched against these
+        self.compiled_patterns = {
+            question_type: [re.compile(pattern, PATTERN_FLAGS) for pattern in patterns]
+            for question_type, patterns in self.question_patterns.items()
+        }
+        self._builders = {
+            'MCQ': self._build_mcq_question,
+            'Sentence': self._build_sentence_question,
+            'Paragraph': self._build_paragraph_question,
+            'Audio': self._build_audio_question
+        }
+        self._pool = None
+        self._pool_pid = None
+        self._pool_lock = threading.Lock()
+    
+    def _search(self, question_type: str, text: str):
+        for pattern in self.compiled_patterns[question_type]:
+            match = pattern.search(text)
+            if match:
+                return match
+        return None
     
     def detect_question_type(self, text: str) -> str:
         """Detect question type based on text patterns"""
         text = text.strip()
-        
-        # Check for MCQ patterns
-        for pattern in self.question_patterns['MCQ']:
-            if re.search(pattern, text, re.MULTILINE | re.DOTALL | re.IGNORECASE):
-                return 'MCQ'
-        
-        # Check for Audio patterns
-        for pattern in self.question_patterns['Audio']:
-            if re.search(pattern, text, re.MULTILINE | re.DOTALL | re.IGNORECASE):
-                return 'Audio'
-        
-        # Check for Paragraph patterns
-        for pattern in self.question_patterns['Paragraph']:
-            if re.search(pattern, text, re.MULTILINE | re.DOTALL | re.IGNORECASE):
-                return 'Paragraph'
-        
-        # Check for Sentence patterns
-        for pattern in self.question_patterns['Sentence']:
-            if re.search(pattern, text, re.MULTILINE | re.DOTALL | re.IGNORECASE):
-                return 'Sentence'
+        for question_type in self.TYPE_ORDER:
+            if self._search(question_type, text):
+                return question_type
         
         # Default to Sentence if no pattern matches
         return 'Sentence'
     
-    def parse_mcq_question(self, text: str) -> Optional[Dict[str, Any]]:
-        """Parse MCQ question from text"""
-        for pattern in self.question_patterns['MCQ']:
-            match = re.search(pattern, text, re.MULTILINE | re.DOTALL | re.IGNORECASE)
+    @staticmethod
+    def _build_mcq_question(groups: Tuple[str, ...]) -> Optional[Dict[str, Any]]:
+        if len(groups) < 6:
+            return None
+        return {
+            'question_text': groups[0].strip(),
+            'options': [groups[i].strip() for i in range(1, 5)],
+            'correct_answer': groups[5].strip(),
+            'question_type': 'MCQ',
+            'marks': 1
+        }
+    
+    @staticmethod
+    def _build_sentence_question(groups: Tuple[str, ...]) -> Optional[Dict[str, Any]]:
+        if len(groups) < 2:
+            return None
+        return {
+            'question_text': groups[0].strip(),
+            'correct_answer': groups[1].strip(),
+            'question_type': 'Sentence',
+            'marks': 1
+        }
+    
+    @staticmethod
+    def _build_paragraph_question(groups: Tuple[str, ...]) -> Optional[Dict[str, Any]]:
+        if len(groups) < 2:
+            return None
+        return {
+            'question_text': f"Passage: {groups[0].strip()}\n\nQuestions: {groups[1].strip()}",
+            'correct_answer': 'Open-ended response',
+            'question_type': 'Paragraph',
+            'marks': 2
+        }
+    
+    @staticmethod
+    def _build_audio_question(groups: Tuple[str, ...]) -> Optional[Dict[str, Any]]:
+        if len(groups) < 2:
+            return None
+        return {
+            'question_text': groups[0].strip(),
+            'correct_answer': groups[1].strip(),
+            'question_type': 'Audio',
+            'marks': 1,
+            'audio_required': True
+        }
+    
+    def _parse(self, question_type: str, text: str) -> Optional[Dict[str, Any]]:
+        match = self._search(question_type, text)
+        return self._builders[question_type](match.groups()) if match else None
+    
+    def parse_block(self, block: str) -> Optional[Dict[str, Any]]:
+        """
+        Detect the type of a question block and parse it in one pass: the match that
+        decides the type is the one parsed (same result as detect_question_type
+        followed by the parse_* method of that type). None if nothing matches.
+        """
+        text = block.strip()
+        for question_type in self.TYPE_ORDER:
+            match = self._search(question_type, text)
             if match:
-                groups = match.groups()
-                if len(groups) >= 6:
-                    return {
-                        'question_text': groups[0].strip(),
-                        'options': [groups[i].strip() for i in range(1, 5)],
-                        'correct_answer': groups[5].strip(),
-                        'question_type': 'MCQ',
-                        'marks': 1
-                    }
+                return self._builders[question_type](match.groups())
         return None
     
+    def parse_mcq_question(self, text: str) -> Optional[Dict[str, Any]]:
+        """Parse MCQ question from text"""
+        return self._parse('MCQ', text)
+    
     def parse_sentence_question(self, text: str) -> Optional[Dict[str, Any]]:
         """Parse Sentence question from text"""
-        for pattern in self.question_patterns['Sentence']:
-            match = re.search(pattern, text, re.MULTILINE | re.DOTALL | re.IGNORECASE)
-            if match:
-                groups = match.groups()
-                if len(groups) >= 2:
-                    return {
-                        'question_text': groups[0].strip(),
-                        'correct_answer': groups[1].strip(),
-                        'question_type': 'Sentence',
-                        'marks': 1
-                    }
-        return None
+        return self._parse('Sentence', text)
     
     def parse_paragraph_question(self, text: str) -> Optional[Dict[str, Any]]:
         """Parse Paragraph question from text"""
-        for pattern in self.question_patterns['Paragraph']:
-            match = re.search(pattern, text, re.MULTILINE | re.DOTALL | re.IGNORECASE)
-            if match:
-                groups = match.groups()
-                if len(groups) >= 2:
-                    return {
-                        'question_text': f"Passage: {groups[0].strip()}\n\nQuestions: {groups[1].strip()}",
-                        'correct_answer': 'Open-ended response',
-                        'question_type': 'Paragraph',
-                        'marks': 2
-                    }
-        return None
+        return self._parse('Paragraph', text)
     
     def parse_audio_question(self, text: str) -> Optional[Dict[str, Any]]:
         """Parse Audio question from text"""
-        for pattern in self.question_patterns['Audio']:
-            match = re.search(pattern, text, re.MULTILINE | re.DOTALL | re.IGNORECASE)
-            if match:
-                groups = match.groups()
-                if len(groups) >= 2:
-                    return {
-                        'question_text': groups[0].strip(),
-                        'correct_answer': groups[1].strip(),
-                        'question_type': 'Audio',
-                        'marks': 1,
-                        'audio_required': True
-                    }
-        return None
+        return self._parse('Audio', text)
+    
+    def parse_blocks(
+        self,
+        numbered_blocks: Iterable[Tuple[int, str]],
+        source_file: str,
+        processed_at: datetime,
+        min_block_length: int = 0
+    ) -> List[Dict[str, Any]]:
+        """Questions of (question number, block) pairs; blocks that don't parse are flagged for review"""
+        questions = []
+        for number, block in numbered_blocks:
+            if len(block) < min_block_length:  # Skip very short blocks
+                continue
+            
+            parsed_question = self.parse_block(block)
+            if parsed_question:
+                parsed_question['question_number'] = number
+                parsed_question['source_file'] = source_file
+                parsed_question['processed_at'] = processed_at
+                questions.append(parsed_question)
+            else:
+                # If parsing fails, create a basic question
+                questions.append({
+                    'question_text': block[:200] + '...' if len(block) > 200 else block,
+                    'correct_answer': 'Manual review required',
+                    'question_type': 'Sentence',
+                    'marks': 1,
+                    'question_number': number,
+                    'source_file': source_file,
+                    'processed_at': processed_at,
+                    'needs_review': True
+                })
+        return questions
+    
+    @staticmethod
+    def iter_blocks(content: str) -> Iterator[Tuple[int, str]]:
+        """(question number, block) of each non-empty question block, split lazily"""
+        number = 0
+        start = 0
+        for separator in BLOCK_SEPARATOR.finditer(content):
+            block = content[start:separator.start()].strip()
+            start = separator.end()
+            if block:
+                number += 1
+                yield number, block
+        block = content[start:].strip()
+        if block:
+            yield number + 1, block
+    
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._pool_lock:
+            if self._pool is None or self._pool_pid != os.getpid():
+                # spawn: forking a multi-threaded server worker is unsafe
+                self._pool = ProcessPoolExecutor(
+                    max_workers=PARSE_WORKERS, mp_context=multiprocessing.get_context('spawn')
+                )
+                self._pool_pid = os.getpid()
+            return self._pool
+    
+    def iter_text_content(
+        self,
+        content: str,
+        source_file: str,
+        min_block_length: int = 10,
+        parallel: Optional[bool] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Yield the questions of text content in document order, as they are parsed.
+        
+        Blocks are parsed in batches of PARSE_BATCH_SIZE. Large documents (see
+        PARALLEL_MIN_CHARS, or parallel=True) are parsed in a process pool with at most
+        two batches per worker in flight, so the first questions can be validated
+        while the rest of the document is still being parsed.
+        """
+        processed_at = datetime.now(pytz.utc)
+        batches = iter_chunks(self.iter_blocks(content), PARSE_BATCH_SIZE)
+        if parallel is None:
+            parallel = len(content) >= PARALLEL_MIN_CHARS
+        if not parallel or PARSE_WORKERS < 2:
+            for batch in batches:
+                yield from self.parse_blocks(batch, source_file, processed_at, min_block_length)
+            return
+        
+        in_flight = deque()
+        pool = self._get_pool()
+        for batch in batches:
+            try:
+                future = pool.submit(_parse_batch_in_worker, batch, source_file, processed_at, min_block_length)
+            except Exception as e:
+                logger.warning(f"⚠️ Question parsing pool unavailable, parsing in-process: {e}")
+                future = None
+            in_flight.append((batch, future))
+            if len(in_flight) >= PARSE_WORKERS * 2:
+                yield from self._batch_result(*in_flight.popleft(), source_file, processed_at, min_block_length)
+        while in_flight:
+            yield from self._batch_result(*in_flight.popleft(), source_file, processed_at, min_block_length)
+    
+    def _batch_result(self, batch, future, source_file, processed_at, min_block_length) -> List[Dict[str, Any]]:
+        if future is not None:
+            try:
+                return future.result()
+            except Exception as e:
+                # e.g. a killed pool process; the batch is parsed here instead
+                logger.warning(f"⚠️ Parallel question parsing failed, parsing batch in-process: {e}")
+        return self.parse_blocks(batch, source_file, processed_at, min_block_length)
+    
+    def _read_text_file(self, file_path: str) -> str:
+        with open(file_path, 'r', encoding='utf-8') as file:
+            return file.read()
+    
+    def _read_docx_file(self, file_path: str) -> str:
+        import docx
+        
+        doc = docx.Document(file_path)
+        # Text of all non-empty paragraphs
+        return '\n'.join(paragraph.text.strip() for paragraph in doc.paragraphs if paragraph.text.strip())
+    
+    def _read_pdf_file(self, file_path: str) -> str:
+        import PyPDF2
+        
+        with open(file_path, 'rb') as file:
+            pdf_reader = PyPDF2.PdfReader(file)
+            return '\n'.join(page.extract_text() for page in pdf_reader.pages)
+    
+    def iter_file_questions(self, file_path: str, file_type: str = '', parallel: Optional[bool] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Yield the questions of an uploaded .txt, .docx or .pdf file as they are parsed,
+        e.g. for an upload endpoint that validates questions batch by batch. Errors
+        (unreadable file, missing library) are raised to the caller.
+        """
+        source_file = os.path.basename(file_path)
+        file_type = (file_type or '').lower()
+        if file_type == 'application/vnd.openxmlformats-officedocument.wordprocessingml.document' or file_path.endswith('.docx'):
+            yield from self.iter_text_content(self._read_docx_file(file_path), source_file, parallel=parallel)
+        elif file_type == 'application/pdf' or file_path.endswith('.pdf'):
+            yield from self.iter_text_content(self._read_pdf_file(file_path), source_file, parallel=parallel)
+        else:
+            # Plain text files keep their short blocks
+            yield from self.iter_text_content(
+                self._read_text_file(file_path), source_file, min_block_length=0, parallel=parallel
+            )
     
     def process_text_file(self, file_path: str) -> List[Dict[str, Any]]:
         """Process a text file and extract questions"""
         try:
-            with open(file_path, 'r', encoding='utf-8') as file:
-                content = file.read()
-            
-            # Split content into potential questions
-            # Look for question separators
-            question_blocks = re.split(r'\n\s*\n|\n\s*Question\s*\d+:', content)
-            question_blocks = [block.strip() for block in question_blocks if block.strip()]
-            
-            questions = []
-            for i, block in enumerate(question_blocks):
-                if not block:
-                    continue
-                
-                # Detect question type
-                question_type = self.detect_question_type(block)
-                
-                # Parse based on type
-                parsed_question = None
-                if question_type == 'MCQ':
-                    parsed_question = self.parse_mcq_question(block)
-                elif question_type == 'Sentence':
-                    parsed_question = self.parse_sentence_question(block)
-                elif question_type == 'Paragraph':
-                    parsed_question = self.parse_paragraph_question(block)
-                elif question_type == 'Audio':
-                    parsed_question = self.parse_audio_question(block)
-                
-                if parsed_question:
-                    parsed_question['question_number'] = i + 1
-                    parsed_question['source_file'] = os.path.basename(file_path)
-                    parsed_question['processed_at'] = datetime.now(pytz.utc)
-                    questions.append(parsed_question)
-                else:
-                    # If parsing fails, create a basic question
-                    questions.append({
-                        'question_text': block[:200] + '...' if len(block) > 200 else block,
-                        'correct_answer': 'Manual review required',
-                        'question_type': 'Sentence',
-                        'marks': 1,
-                        'question_number': i + 1,
-                        'source_file': os.path.basename(file_path),
-                        'processed_at': datetime.now(pytz.utc),
-                        'needs_review': True
-                    })
-            
-            return questions
+            content = self._read_text_file(file_path)
+            return list(self.iter_text_content(content, os.path.basename(file_path), min_block_length=0))
             
         except Exception as e:
             logger.error(f"Error processing text file {file_path}: {e}")
@@ -184,18 +327,7 @@ class QuestionProcessor:
     def process_docx_file(self, file_path: str) -> List[Dict[str, Any]]:
         """Process a DOCX file and extract questions"""
         try:
-            import docx
-            
-            doc = docx.Document(file_path)
-            content = []
-            
-            # Extract text from all paragraphs
-            for paragraph in doc.paragraphs:
-                if paragraph.text.strip():
-                    content.append(paragraph.text.strip())
-            
-            # Join content and process as text
-            text_content = '\n'.join(content)
+            text_content = self._read_docx_file(file_path)
             return self.process_text_content(text_content, os.path.basename(file_path))
             
         except ImportError:
@@ -208,16 +340,7 @@ class QuestionProcessor:
     def process_pdf_file(self, file_path: str) -> List[Dict[str, Any]]:
         """Process a PDF file and extract questions"""
         try:
-            import PyPDF2
-            
-            with open(file_path, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                content = []
-                
-                for page in pdf_reader.pages:
-                    content.append(page.extract_text())
-            
-            text_content = '\n'.join(content)
+            text_content = self._read_pdf_file(file_path)
             return self.process_text_content(text_content, os.path.basename(file_path))
             
         except ImportError:
@@ -229,48 +352,7 @@ class QuestionProcessor:
     
     def process_text_content(self, content: str, source_file: str) -> List[Dict[str, Any]]:
         """Process text content and extract questions"""
-        # Split content into potential questions
-        question_blocks = re.split(r'\n\s*\n|\n\s*Question\s*\d+:', content)
-        question_blocks = [block.strip() for block in question_blocks if block.strip()]
-        
-        questions = []
-        for i, block in enumerate(question_blocks):
-            if not block or len(block) < 10:  # Skip very short blocks
-                continue
-            
-            # Detect question type
-            question_type = self.detect_question_type(block)
-            
-            # Parse based on type
-            parsed_question = None
-            if question_type == 'MCQ':
-                parsed_question = self.parse_mcq_question(block)
-            elif question_type == 'Sentence':
-                parsed_question = self.parse_sentence_question(block)
-            elif question_type == 'Paragraph':
-                parsed_question = self.parse_paragraph_question(block)
-            elif question_type == 'Audio':
-                parsed_question = self.parse_audio_question(block)
-            
-            if parsed_question:
-                parsed_question['question_number'] = i + 1
-                parsed_question['source_file'] = source_file
-                parsed_question['processed_at'] = datetime.now(pytz.utc)
-                questions.append(parsed_question)
-            else:
-                # If parsing fails, create a basic question
-                questions.append({
-                    'question_text': block[:200] + '...' if len(block) > 200 else block,
-                    'correct_answer': 'Manual review required',
-                    'question_type': 'Sentence',
-                    'marks': 1,
-                    'question_number': i + 1,
-                    'source_file': source_file,
-                    'processed_at': datetime.now(pytz.utc),
-                    'needs_review': True
-                })
-        
-        return questions
+        return list(self.iter_text_content(content, source_file))
     
     def process_uploaded_file(self, file_path: str, file_type: str) -> Dict[str, Any]:
         """Process an uploaded file and return questions with metadata"""
@@ -314,5 +396,10 @@ class QuestionProcessor:
                 'processed_at': datetime.now(pytz.utc)
             }
 
+def _parse_batch_in_worker(batch, source_file, processed_at, min_block_length):
+    """Process pool entry point: parse one batch with the worker process's processor"""
+    return question_processor.parse_blocks(batch, source_file, processed_at, min_block_length)
+
+
 # Global instance
 question_processor = QuestionProcessor()
@@ -0,0 +1,216 @@
+"""
+Per-user token-bucket rate limiting for expensive endpoints.
+
+Buckets are keyed by JWT identity (client address for anonymous calls) and endpoint
+class, so one student spamming "Run" only drains their own code-execution bucket.
+A rejected call returns 429 with Retry-After right away instead of tying up one
+of the few sync gunicorn workers.
+
+Buckets live in worker memory by default (each worker enforces its own limit).
+Set RATE_LIMIT_BACKEND=redis (RATE_LIMIT_REDIS_URL, default REDIS_URL) to share
+them between workers and instances; if Redis is unreachable the in-memory buckets
+are used.
+
+Limits are configured per class as "<burst>,<per_minute>", e.g.
+RATE_LIMIT_CODE_EXECUTION=30,30 allows bursts of 30 runs and 30 runs a minute.
+Every call takes a token. The code_execution burst covers validating an answer
+against all test cases of a question (one call per test case); longer validations
+are paced by the client retrying after Retry-After.
+"""
+
+import logging
+import math
+import os
+import threading
+import time
+from functools import wraps
+from typing import Any, Dict, Tuple
+
+from flask import jsonify, make_response, request
+
+logger = logging.getLogger(__name__)
+
+# endpoint class -> (burst capacity, tokens refilled per minute)
+DEFAULT_LIMITS = {
+    'code_execution': (30, 30),
+    'transcription': (5, 10),
+    'transcript_validation': (20, 60),
+}
+
+# In-memory buckets untouched for this long are full again and are dropped
+PRUNE_INTERVAL_SECONDS = 300
+# After a Redis error the in-memory buckets are used for this long before Redis is tried again
+REDIS_RETRY_SECONDS = 30
+
+_REDIS_TOKEN_BUCKET = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(bucket[1]) or capacity
+local updated = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+local allowed = 0
+local retry_after = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+else
+    retry_after = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return {allowed, tostring(tokens), tostring(retry_after)}
+"""
+
+
+def _parse_limit(endpoint_class: str, default: Tuple[int, int]) -> Tuple[float, float]:
+    value = os.getenv(f'RATE_LIMIT_{endpoint_class.upper()}')
+    if not value:
+        return default
+    try:
+        burst, per_minute = (float(part) for part in value.split(','))
+        if burst < 1 or per_minute <= 0:
+            raise ValueError(value)
+        return burst, per_minute
+    except ValueError:
+        logger.warning(f"⚠️ Invalid RATE_LIMIT_{endpoint_class.upper()}={value!r}, using {default}")
+        return default
+
+
+class RateLimiter:
+    """Token buckets per (identity, endpoint class), in memory or in Redis"""
+
+    def __init__(self):
+        self.enabled = os.getenv('RATE_LIMIT_ENABLED', 'true').lower() != 'false'
+        self.limits = {name: _parse_limit(name, default) for name, default in DEFAULT_LIMITS.items()}
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+        self._last_prune = time.monotonic()
+        self._redis = None
+        self._redis_script = None
+        self._redis_pid = None
+        self._redis_retry_at = 0.0
+        self.stats: Dict[str, Dict[str, int]] = {
+            name: {'allowed': 0, 'limited': 0} for name in self.limits
+        }
+        self.backend_errors = 0
+
+    def _get_redis(self):
+        """Redis client of this process, or None for in-memory buckets"""
+        if os.getenv('RATE_LIMIT_BACKEND', 'memory').lower() != 'redis':
+            return None
+        if self._redis_pid == os.getpid():
+            return self._redis
+        self._redis_pid = os.getpid()
+        try:
+            import redis
+            url = os.getenv('RATE_LIMIT_REDIS_URL') or os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+            self._redis = redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+            self._redis_script = self._redis.register_script(_REDIS_TOKEN_BUCKET)
+            logger.info("✅ Rate limiter using Redis buckets")
+        except ImportError:
+            logger.warning("⚠️ Redis not available - rate limiting with in-memory buckets")
+            self._redis = None
+        return self._redis
+
+    def _take_memory(self, key: str, capacity: float, rate: float) -> Tuple[bool, float, float]:
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_prune > PRUNE_INTERVAL_SECONDS:
+                self._buckets = {
+                    k: v for k, v in self._buckets.items() if now - v[1] < PRUNE_INTERVAL_SECONDS
+                }
+                self._last_prune = now
+            tokens, updated = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now)
+                return True, tokens - 1, 0.0
+            self._buckets[key] = (tokens, now)
+            return False, tokens, (1 - tokens) / rate
+
+    def _take_redis(self, client, key: str, capacity: float, rate: float) -> Tuple[bool, float, float]:
+        allowed, tokens, retry_after = self._redis_script(
+            keys=[f'rate_limit:{key}'], args=[capacity, rate, time.time()], client=client
+        )
+        return bool(int(allowed)), float(tokens), float(retry_after)
+
+    def take(self, endpoint_class: str, identity: str) -> Tuple[bool, float, float]:
+        """Take one token; returns (allowed, tokens remaining, seconds until the next token)"""
+        capacity, per_minute = self.limits[endpoint_class]
+        rate = per_minute / 60.0
+        key = f'{endpoint_class}:{identity}'
+        client = self._get_redis() if time.monotonic() >= self._redis_retry_at else None
+        result = None
+        if client is not None:
+            try:
+                result = self._take_redis(client, key, capacity, rate)
+            except Exception as e:
+                self.backend_errors += 1
+                self._redis_retry_at = time.monotonic() + REDIS_RETRY_SECONDS
+                logger.warning(f"⚠️ Redis rate limit check failed, using in-memory bucket: {e}")
+        if result is None:
+            result = self._take_memory(key, capacity, rate)
+        self.stats[endpoint_class]['allowed' if result[0] else 'limited'] += 1
+        return result
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'enabled': self.enabled,
+            'backend': 'redis' if self._redis is not None else 'memory',
+            'backend_errors': self.backend_errors,
+            'tracked_buckets': len(self._buckets),
+            'classes': {
+                name: {
+                    **self.stats[name],
+                    'burst': self.limits[name][0],
+                    'per_minute': self.limits[name][1]
+                } for name in self.limits
+            }
+        }
+
+
+rate_limiter = RateLimiter()
+
+
+def _identity() -> str:
+    from flask_jwt_extended import get_jwt_identity
+
+    try:
+        identity = get_jwt_identity()
+    except Exception:
+        identity = None
+    return f'user:{identity}' if identity else f'ip:{request.remote_addr}'
+
+
+def rate_limited(endpoint_class: str):
+    """
+    Limit a view per user with the endpoint class's token bucket.
+    Apply below @jwt_required() so the JWT identity is available.
+    """
+    if endpoint_class not in DEFAULT_LIMITS:
+        raise ValueError(f'Unknown rate limit class: {endpoint_class}')
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if not rate_limiter.enabled:
+                return view(*args, **kwargs)
+            allowed, remaining, retry_after = rate_limiter.take(endpoint_class, _identity())
+            capacity = rate_limiter.limits[endpoint_class][0]
+            if not allowed:
+                retry_seconds = max(1, math.ceil(retry_after))
+                response = make_response(jsonify({
+                    'success': False,
+                    'message': f'Too many requests. Please try again in {retry_seconds} seconds.',
+                    'retry_after': retry_seconds
+                }), 429)
+                response.headers['Retry-After'] = str(retry_seconds)
+            else:
+                response = make_response(view(*args, **kwargs))
+            response.headers['X-RateLimit-Limit'] = str(int(capacity))
+            response.headers['X-RateLimit-Remaining'] = str(int(max(0, remaining)))
+            return response
+        return wrapper
+    return decorator
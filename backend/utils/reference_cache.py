@@ -0,0 +1,148 @@
+"""
+Per-worker reference data cache for campuses, courses, batches, modules and levels.
+
+These collections change a few times a day but are read on almost every dashboard,
+export and filter request. Each worker keeps id -> document maps in memory and
+checks a shared version counter (the `reference_data_versions` collection) at most
+once per `poll_interval` seconds. Write handlers call `bump()`, so every worker
+reloads a changed collection within a second without querying Mongo on each read.
+
+Cached documents are shared between requests and must be treated as read-only.
+"""
+
+import logging
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+from bson import ObjectId
+
+logger = logging.getLogger(__name__)
+
+REFERENCE_COLLECTIONS = ('campuses', 'courses', 'batches', 'modules', 'levels')
+VERSIONS_COLLECTION = 'reference_data_versions'
+
+
+class ReferenceDataCache:
+    """Version-invalidated in-memory copy of the reference collections"""
+
+    def __init__(self, db, poll_interval: float = 1.0):
+        self.db = db
+        self.poll_interval = poll_interval
+        self._lock = threading.RLock()
+        self._maps: Dict[str, Dict[Any, Dict[str, Any]]] = {}
+        self._name_index: Dict[str, Dict[str, Any]] = {}
+        self._loaded_versions: Dict[str, int] = {}
+        self._remote_versions: Dict[str, int] = {}
+        self._last_poll = 0.0
+        self.stats = {'hits': 0, 'reloads': 0, 'version_polls': 0}
+
+    # ------------------------------------------------------------------
+    # Invalidation
+    # ------------------------------------------------------------------
+
+    def bump(self, *kinds: str) -> None:
+        """Increment the shared version of the given collections after a write"""
+        for kind in kinds:
+            if kind not in REFERENCE_COLLECTIONS:
+                raise ValueError(f"Unknown reference collection: {kind}")
+            try:
+                self.db[VERSIONS_COLLECTION].update_one(
+                    {'_id': kind}, {'$inc': {'version': 1}}, upsert=True
+                )
+            except Exception as e:
+                logger.warning(f"⚠️ Could not bump reference version for {kind}: {e}")
+            with self._lock:
+                # Drop the local copy right away so this worker never serves stale data
+                self._loaded_versions.pop(kind, None)
+                self._last_poll = 0.0
+
+    def _poll_versions(self) -> None:
+        now = time.monotonic()
+        if now - self._last_poll < self.poll_interval:
+            return
+        self._last_poll = now
+        self.stats['version_polls'] += 1
+        try:
+            self._remote_versions = {
+                doc['_id']: doc.get('version', 0)
+                for doc in self.db[VERSIONS_COLLECTION].find({'_id': {'$in': list(REFERENCE_COLLECTIONS)}})
+            }
+        except Exception as e:
+            logger.warning(f"⚠️ Could not read reference data versions: {e}")
+
+    def _ensure_loaded(self, kind: str) -> None:
+        if kind not in REFERENCE_COLLECTIONS:
+            raise ValueError(f"Unknown reference collection: {kind}")
+        with self._lock:
+            self._poll_versions()
+            remote_version = self._remote_versions.get(kind, 0)
+            if self._loaded_versions.get(kind) == remote_version and kind in self._maps:
+                self.stats['hits'] += 1
+                return
+            documents = {doc['_id']: doc for doc in self.db[kind].find()}
+            self._maps[kind] = documents
+            self._name_index[kind] = {
+                str(doc.get('name')).strip().lower(): doc
+                for doc in documents.values() if doc.get('name')
+            }
+            self._loaded_versions[kind] = remote_version
+            self.stats['reloads'] += 1
+            logger.info(f"🔄 Loaded {len(documents)} {kind} into reference cache (version {remote_version})")
+
+    # ------------------------------------------------------------------
+    # Read accessors
+    # ------------------------------------------------------------------
+
+    def get_map(self, kind: str) -> Dict[Any, Dict[str, Any]]:
+        """id -> document map for a reference collection"""
+        self._ensure_loaded(kind)
+        return self._maps[kind]
+
+    def all(self, kind: str) -> List[Dict[str, Any]]:
+        return list(self.get_map(kind).values())
+
+    def get(self, kind: str, doc_id: Any) -> Optional[Dict[str, Any]]:
+        """Document by id; accepts ObjectId or its string form"""
+        documents = self.get_map(kind)
+        if doc_id is None:
+            return None
+        document = documents.get(doc_id)
+        if document is None and not isinstance(doc_id, ObjectId) and ObjectId.is_valid(str(doc_id)):
+            document = documents.get(ObjectId(str(doc_id)))
+        return document
+
+    def name_of(self, kind: str, doc_id: Any, default: Optional[str] = None) -> Optional[str]:
+        document = self.get(kind, doc_id)
+        return document.get('name', default) if document else default
+
+    def names(self, kind: str, doc_ids: Iterable[Any]) -> Dict[Any, Optional[str]]:
+        """id -> name for many ids, ids that are not found are left out"""
+        result = {}
+        for doc_id in doc_ids:
+            document = self.get(kind, doc_id)
+            if document is not None:
+                result[doc_id] = document.get('name')
+        return result
+
+    def find_by_name(self, kind: str, name: str) -> Optional[Dict[str, Any]]:
+        """Case-insensitive lookup by name"""
+        if not name:
+            return None
+        self._ensure_loaded(kind)
+        return self._name_index[kind].get(str(name).strip().lower())
+
+    def filter(self, kind: str, **criteria) -> List[Dict[str, Any]]:
+        """Documents whose fields equal the given values, e.g. filter('courses', campus_id=oid)"""
+        return [
+            doc for doc in self.get_map(kind).values()
+            if all(doc.get(field) == value for field, value in criteria.items())
+        ]
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self.stats,
+                'loaded_versions': dict(self._loaded_versions),
+                'sizes': {kind: len(docs) for kind, docs in self._maps.items()}
+            }
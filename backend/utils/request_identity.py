@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Request-scoped Identity Loader
+Memoizes the current user, student and sub-superadmin permission documents on
+flask.g so decorators and handlers share one read per request
+"""
+
+import logging
+from typing import Optional, Dict, Any
+from bson import ObjectId
+from flask import g, has_request_context
+from flask_jwt_extended import get_jwt_identity
+from mongo import mongo_db
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+def _identity_cache() -> Dict[str, Any]:
+    """Per-request cache dict, reset whenever the JWT identity changes"""
+    identity = get_jwt_identity()
+    cache = getattr(g, '_identity_cache', None)
+    if cache is None or cache.get('identity') != identity:
+        cache = {'identity': identity}
+        g._identity_cache = cache
+    return cache
+
+
+def _memoize(name: str, loader):
+    if not has_request_context():
+        return loader()
+    cache = _identity_cache()
+    value = cache.get(name, _MISSING)
+    if value is _MISSING:
+        value = loader()
+        cache[name] = value
+    return value
+
+
+def get_current_user_id() -> Optional[str]:
+    """JWT identity of the current request"""
+    return get_jwt_identity()
+
+
+def get_current_user() -> Optional[Dict[str, Any]]:
+    """User document of the current JWT identity, read once per request"""
+    def load():
+        user_id = get_jwt_identity()
+        if not user_id or not ObjectId.is_valid(str(user_id)):
+            return None
+        return mongo_db.find_user_by_id(user_id)
+    return _memoize('user', load)
+
+
+def get_current_student() -> Optional[Dict[str, Any]]:
+    """Student profile linked to the current user, read once per request"""
+    def load():
+        user = get_current_user()
+        if not user:
+            return None
+        return mongo_db.students.find_one({'user_id': user['_id']})
+    return _memoize('student', load)
+
+
+def get_current_permissions() -> Dict[str, Any]:
+    """
+    Sub-superadmin page permissions of the current user, resolved once per request.
+    Mirrors SubSuperadmin.get_user_permissions but reuses the cached user document.
+    """
+    def load():
+        user = get_current_user()
+        if not user or user.get('role') != 'sub_superadmin' or not user.get('is_active', False):
+            return {}
+        if 'permissions' in user:
+            return user.get('permissions', {})
+        if user.get('sub_role_id'):
+            sub_role = mongo_db.db.sub_roles.find_one({'_id': ObjectId(user['sub_role_id'])})
+            if sub_role:
+                return sub_role.get('permissions', {})
+        return {}
+    return _memoize('permissions', load)
+
+
+def current_user_has_permission(page: str, required_access: str = 'read') -> bool:
+    """Same rules as SubSuperadmin.has_permission, using the cached permissions"""
+    user_access = get_current_permissions().get(page, 'none')
+    if user_access == 'none':
+        return False
+    if required_access == 'read' and user_access in ['read', 'write']:
+        return True
+    if required_access == 'write' and user_access == 'write':
+        return True
+    return False
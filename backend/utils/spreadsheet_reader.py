@@ -0,0 +1,97 @@
+"""
+Streaming reader for uploaded CSV / Excel files.
+
+Rows are yielded lazily as {header: value} dicts instead of loading the whole file:
+.xlsx sheets are read with openpyxl in read_only mode (values only), and CSV files
+are decoded incrementally from the upload stream. Values are normalized to
+strings ('' for empty cells, integral numbers without a trailing .0, stripped unless
+strip_values=False), and rows that are entirely empty are skipped.
+
+    reader = SpreadsheetReader(request.files['file'])
+    missing = [c for c in required_columns if c not in reader.headers]
+    for chunk in iter_chunks(reader, 500):
+        ...
+"""
+
+import codecs
+import csv
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+import openpyxl
+
+SUPPORTED_EXTENSIONS = ('.csv', '.xlsx')
+
+
+def normalize_cell(value: Any, strip: bool = True) -> str:
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        # Numeric roll / mobile numbers typed into Excel come back as floats
+        return str(int(value))
+    return str(value).strip() if strip else str(value)
+
+
+def iter_chunks(rows: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    """Consecutive lists of up to size items"""
+    iterator = iter(rows)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class SpreadsheetReader:
+    """Lazily iterated rows of an uploaded .csv or .xlsx file (single pass)"""
+
+    def __init__(self, file, filename: Optional[str] = None, strip_values: bool = True):
+        self.filename = (filename or getattr(file, 'filename', '') or '').lower()
+        if not self.filename.endswith(SUPPORTED_EXTENSIONS):
+            raise ValueError('Please upload a valid CSV or Excel file.')
+        self.strip_values = strip_values  # False keeps whitespace that matters, e.g. test case I/O
+        self._stream = getattr(file, 'stream', file)
+        self._workbook = None
+        self._rows: Optional[Iterator[Any]] = None
+        self._headers: Optional[List[str]] = None
+
+    @property
+    def is_excel(self) -> bool:
+        return self.filename.endswith('.xlsx')
+
+    def _open(self) -> None:
+        if self._rows is not None:
+            return
+        if self.is_excel:
+            self._workbook = openpyxl.load_workbook(self._stream, read_only=True, data_only=True)
+            self._rows = self._workbook.active.iter_rows(values_only=True)
+        else:
+            lines = codecs.iterdecode(self._stream, 'utf-8-sig')
+            self._rows = csv.reader(lines)
+        header_row = next(self._rows, None) or ()
+        self._headers = [normalize_cell(value) for value in header_row]
+
+    @property
+    def headers(self) -> List[str]:
+        self._open()
+        return [header for header in self._headers if header]
+
+    def __iter__(self) -> Iterator[Dict[str, str]]:
+        self._open()
+        headers = self._headers
+        try:
+            for values in self._rows:
+                row = {}
+                for position, header in enumerate(headers):
+                    if header:
+                        row[header] = normalize_cell(values[position], self.strip_values) if position < len(values) else ''
+                if any(value.strip() for value in row.values()):
+                    yield row
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        if self._workbook is not None:
+            # read_only workbooks keep the file open until closed
+            self._workbook.close()
+            self._workbook = None
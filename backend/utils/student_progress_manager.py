@@ -3,60 +3,103 @@ Enhanced Student Progress Management System
 Handles score-based unlocking, admin overrides, and progress tracking
 """
 
+import threading
+from collections import OrderedDict
 from datetime import datetime
 from bson import ObjectId
-from config.constants import MODULES, LEVELS
+from config.constants import MODULES
 import logging
+from .level_graph import get_level_graph
 from .progress_monitoring import ProgressMonitoring
 
+# Cap unlock_history to last N entries to prevent unbounded growth
+MAX_UNLOCK_HISTORY = 200
+# Attempts remembered per student to apply each completion only once
+MAX_APPLIED_ATTEMPTS = 200
+# Re-reads when a concurrent completion changed the student's unlocked levels
+MAX_UPDATE_RETRIES = 3
+# Students whose aggregated attempts are kept for the detailed-insights report
+INSIGHTS_CACHE_SIZE = 500
+
+_insights_cache = OrderedDict()
+_insights_cache_lock = threading.Lock()
+
 class StudentProgressManager:
     def __init__(self, mongo_db):
         self.mongo_db = mongo_db
         self.logger = logging.getLogger(__name__)
         self.monitoring = ProgressMonitoring(mongo_db)
     
-    def update_student_progress_on_test_completion(self, student_id, level_id, score, test_id=None):
+    def update_student_progress_on_test_completion(self, student_id, level_id, score, test_id=None, attempt_id=None):
         """
         Update student progress when they complete a test
         This is the main function called after test submission
+
+        Unlocks, module progress and unlock history are computed in memory from one read
+        of the student and written with a single atomic update. With attempt_id the update
+        is applied at most once per attempt, so retried outbox deliveries do not count the
+        same attempt twice.
         """
         try:
-            student = self.mongo_db.students.find_one({'_id': ObjectId(student_id)})
-            if not student:
-                self.logger.error(f"Student not found: {student_id}")
-                return False
-            
-            # Get current authorized levels
-            current_authorized = self._get_current_authorized_levels(student)
-            
-            # Check if this score unlocks new levels
-            new_unlocked_levels = self._check_dependencies_and_thresholds(level_id, score, current_authorized)
-            
-            # Update authorized_levels with score-based unlocks
-            for new_level in new_unlocked_levels:
-                if new_level not in current_authorized:
-                    self._add_authorized_level(
-                        student_id, 
-                        new_level, 
-                        'score', 
-                        score_unlocked=score,
-                        test_id=test_id
-                    )
-            
-            # Update module progress
-            self._update_module_progress(student_id, level_id, score)
-            
-            # Add to unlock history
-            self._add_unlock_history(student_id, level_id, score, 'score', test_id)
+            graph = get_level_graph(self.mongo_db)
+            module_id = graph.module_of(level_id)
+            new_unlocked_levels = []
+            for _ in range(MAX_UPDATE_RETRIES):
+                student = self.mongo_db.students.find_one(
+                    {'_id': ObjectId(student_id)},
+                    {'authorized_levels': 1, 'progress_attempt_ids': 1, 'module_progress': 1}
+                )
+                if not student:
+                    self.logger.error(f"Student not found: {student_id}")
+                    return False
+                self._initialize_progress_fields(student)
+                if attempt_id is not None and attempt_id in student.get('progress_attempt_ids', []):
+                    self.logger.info(f"Progress for attempt {attempt_id} already applied")
+                    return True
+
+                current_authorized = self._get_current_authorized_levels(student)
+                new_unlocked_levels = graph.unlocks(level_id, score, current_authorized)
+                now = datetime.utcnow()
+
+                # Only apply if no concurrent update unlocked the same levels or counted this attempt
+                query = {'_id': ObjectId(student_id)}
+                if new_unlocked_levels:
+                    query['authorized_levels.level_id'] = {'$nin': new_unlocked_levels}
+                push = {
+                    'unlock_history': {
+                        '$each': [self._unlock_history_entry(level_id, score, 'score', test_id, unlocked_at=now)],
+                        '$slice': -MAX_UNLOCK_HISTORY
+                    }
+                }
+                if new_unlocked_levels:
+                    push['authorized_levels'] = {'$each': [
+                        self._authorized_level_entry(new_level, 'score', score_unlocked=score,
+                                                     test_id=test_id, authorized_at=now)
+                        for new_level in new_unlocked_levels
+                    ]}
+                if attempt_id is not None:
+                    query['progress_attempt_ids'] = {'$ne': attempt_id}
+                    push['progress_attempt_ids'] = {'$each': [attempt_id], '$slice': -MAX_APPLIED_ATTEMPTS}
+                update = {'$push': push}
+                if module_id:
+                    prefix = f'module_progress.{module_id}'
+                    update['$set'] = {f'{prefix}.last_attempt': now, f'{prefix}.last_score': score}
+                    update['$max'] = {f'{prefix}.highest_score': score}
+                    update['$inc'] = {f'{prefix}.total_score': score, f'{prefix}.attempts_count': 1}
+
+                if self.mongo_db.students.update_one(query, update).matched_count:
+                    break
+            else:
+                raise RuntimeError(f"progress of student {student_id} kept changing during the update")
             
             self.logger.info(f"Updated progress for student {student_id}: unlocked {len(new_unlocked_levels)} new levels")
             
             # Monitor the progress update
-            for level_id in new_unlocked_levels:
+            for unlocked_level_id in new_unlocked_levels:
                 self.monitoring.log_progress_event(
                     event_type='unlock',
                     student_id=student_id,
-                    level_id=level_id,
+                    level_id=unlocked_level_id,
                     details={
                         'score': score,
                         'test_id': str(test_id) if test_id else None,
@@ -93,22 +136,8 @@ class StudentProgressManager:
             if not module_levels:
                 return False, "No levels found for this module"
             
-            # Add to authorized_levels with admin flag
-            for level_id in module_levels:
-                self._add_authorized_level(
-                    student_id,
-                    level_id,
-                    'admin',
-                    authorized_by_user=admin_user_id,
-                    reason=reason
-                )
-            
-            # Update module progress with admin override
-            self._update_module_progress_admin_override(student_id, module_id)
-            
-            # Add to unlock history
-            for level_id in module_levels:
-                self._add_unlock_history(student_id, level_id, None, 'admin', None, admin_user_id, reason)
+            # Authorized levels, module override and unlock history in one update
+            self._apply_admin_authorization(student_id, module_levels, module_id, admin_user_id, reason)
             
             self.logger.info(f"Admin {admin_user_id} authorized module {module_id} for student {student_id}")
             
@@ -137,23 +166,10 @@ class StudentProgressManager:
         Admin authorizes individual level regardless of score
         """
         try:
-            # Add to authorized_levels with admin flag
-            self._add_authorized_level(
-                student_id,
-                level_id,
-                'admin',
-                authorized_by_user=admin_user_id,
-                reason=reason
+            self._apply_admin_authorization(
+                student_id, [level_id], self._get_level_module(level_id), admin_user_id, reason
             )
             
-            # Update module progress
-            module_id = self._get_level_module(level_id)
-            if module_id:
-                self._update_module_progress_admin_override(student_id, module_id)
-            
-            # Add to unlock history
-            self._add_unlock_history(student_id, level_id, None, 'admin', None, admin_user_id, reason)
-            
             self.logger.info(f"Admin {admin_user_id} authorized level {level_id} for student {student_id}")
             return True, f"Level {level_id} authorized successfully"
             
@@ -226,255 +242,26 @@ class StudentProgressManager:
                 or_clauses.append({'student_email': ident})
                 or_clauses.append({'student_roll_number': ident})
 
-            # Fetch attempts from student_test_attempts and test_results (both possible places)
-            attempts = []
-            try:
-                if hasattr(self.mongo_db, 'student_test_attempts'):
-                    attempts = list(self.mongo_db.student_test_attempts.find({'$or': or_clauses}))
-            except Exception as e:
-                self.logger.warning(f"Failed to read student_test_attempts: {e}")
-
-            # Also try test_results collection which may contain older/stored results
-            try:
-                if hasattr(self.mongo_db, 'test_results'):
-                    test_results = list(self.mongo_db.test_results.find({'$or': or_clauses}))
-                    # Normalize field names to match attempts shape where possible and append
-                    for tr in test_results:
-                        # Ensure we don't duplicate entries with same _id
-                        attempts.append(tr)
-            except Exception as e:
-                self.logger.warning(f"Failed to read test_results: {e}")
-
-            # Deduplicate attempts by their _id
-            unique = {}
-            for att in attempts:
-                try:
-                    key = str(att.get('_id'))
-                except Exception:
-                    key = repr(att)
-                unique[key] = att
-            attempts = list(unique.values())
-
-            # Split practice vs online attempts
-            practice_attempts = [a for a in attempts if a.get('test_type') == 'practice']
-            online_attempts = [a for a in attempts if a.get('test_type') == 'online']
+            # Per-module / per-test aggregates, computed by the server and cached until the next submission
+            summary = self._get_attempt_summary(student, or_clauses)
 
             # Build per-module analytics structure
             module_analysis = {}
             modules_list = ['GRAMMAR', 'VOCABULARY', 'LISTENING', 'SPEAKING', 'READING', 'WRITING']
 
-            # Helper to aggregate attempts list per module
-            def parse_date(v):
-                if not v:
-                    return None
-                if isinstance(v, datetime):
-                    return v
-                # Handle Mongo extended JSON formats and numeric timestamps
-                if isinstance(v, dict):
-                    # { '$date': { '$numberLong': '...' } } or { '$date': 'iso' }
-                    if '$date' in v:
-                        d = v['$date']
-                        if isinstance(d, dict) and '$numberLong' in d:
-                            try:
-                                ms = int(d['$numberLong'])
-                                return datetime.fromtimestamp(ms / 1000.0)
-                            except Exception:
-                                return None
-                        if isinstance(d, (int, float)):
-                            try:
-                                # assume milliseconds
-                                return datetime.fromtimestamp(d / 1000.0)
-                            except Exception:
-                                return None
-                        if isinstance(d, str):
-                            try:
-                                return datetime.fromisoformat(d)
-                            except Exception:
-                                return None
-                    # direct number-long style
-                    if '$numberLong' in v:
-                        try:
-                            ms = int(v['$numberLong'])
-                            return datetime.fromtimestamp(ms / 1000.0)
-                        except Exception:
-                            return None
-                    return None
-                # Numeric timestamps
-                if isinstance(v, (int, float)):
-                    try:
-                        if v > 1e12:
-                            return datetime.fromtimestamp(v / 1000.0)
-                        return datetime.fromtimestamp(v)
-                    except Exception:
-                        return None
-                # String timestamps - try numeric then iso
-                if isinstance(v, str):
-                    try:
-                        num = int(v)
-                        if num > 1e12:
-                            return datetime.fromtimestamp(num / 1000.0)
-                        return datetime.fromtimestamp(num)
-                    except Exception:
-                        try:
-                            return datetime.fromisoformat(v)
-                        except Exception:
-                            return None
-                return None
-
-            def aggregate_attempts(attempts_list):
-                by_test = {}
-                total_attempts = len(attempts_list)
-                total_score = 0
-                score_count = 0
-                highest_score = 0
-                last_attempt = None
-
-                for att in attempts_list:
-                    mod = att.get('module_id') or att.get('module') or 'UNKNOWN'
-                    tid = att.get('test_id')
-                    try:
-                        tid_key = str(tid)
-                    except Exception:
-                        tid_key = tid
-
-                    # per-test bucket
-                    if tid_key not in by_test:
-                        by_test[tid_key] = {
-                            'test_id': tid_key,
-                            'test_name': att.get('test_name') or att.get('name') or 'Unknown Test',
-                            'attempts': 0,
-                            'best_score': 0,
-                            'last_attempt': None
-                        }
-
-                    # Score extraction (support different field names and nested BSON numeric formats)
-                    def extract_numeric(v):
-                        # Handles int/float
-                        if v is None:
-                            return None
-                        if isinstance(v, (int, float)):
-                            return float(v)
-                        # Handle Mongo extended JSON like {'$numberInt': '42'} or {'$numberDouble': '42.0'}
-                        if isinstance(v, dict):
-                            if '$numberDouble' in v:
-                                try:
-                                    return float(v['$numberDouble'])
-                                except Exception:
-                                    return None
-                            if '$numberInt' in v:
-                                try:
-                                    return float(v['$numberInt'])
-                                except Exception:
-                                    return None
-                            # nested $date or others will be ignored
-                            return None
-                        # Strings
-                        if isinstance(v, str):
-                            try:
-                                return float(v)
-                            except Exception:
-                                return None
-                        return None
-
-                    def parse_score(attempt_doc):
-                        # Preferred fields in order
-                        candidates = ['average_score', 'score_percentage', 'percentage', 'score', 'total_score']
-                        for key in candidates:
-                            if key in attempt_doc:
-                                val = attempt_doc.get(key)
-                                num = extract_numeric(val)
-                                if num is not None:
-                                    # If total_score was stored as an integer representing percent*100 or score*100,
-                                    # try to detect a too-large value and normalize by 100 if appropriate.
-                                    if key == 'total_score' and num > 1000:
-                                        # likely stored as percent*100 or score*100; normalize by 100
-                                        try:
-                                            return num / 100.0
-                                        except Exception:
-                                            return num
-                                    return num
-
-                        # If none of the preferred keys found, scan the document for numeric values
-                        for v in attempt_doc.values():
-                            num = extract_numeric(v)
-                            if num is not None:
-                                return num
-                        return 0
-
-                    score_val = parse_score(att) or 0
-
-                    by_test[tid_key]['attempts'] += 1
-                    if score_val > by_test[tid_key]['best_score']:
-                        by_test[tid_key]['best_score'] = score_val
-
-                    # update totals
-                    if score_val is not None and score_val > 0:
-                        total_score += score_val
-                        score_count += 1
-                    if score_val is not None and score_val > highest_score:
-                        highest_score = score_val
-
-                    # last attempt
-                    att_time = att.get('submitted_at') or att.get('end_time') or att.get('created_at')
-                    parsed_time = parse_date(att_time)
-                    if parsed_time:
-                        if not last_attempt or parsed_time > last_attempt:
-                            last_attempt = parsed_time
-
-                    # update per-test last_attempt
-                    if parsed_time:
-                        if not by_test[tid_key].get('last_attempt') or parsed_time > by_test[tid_key].get('last_attempt'):
-                            by_test[tid_key]['last_attempt'] = parsed_time
-
-                # Build list of tests
-                tests_list = list(by_test.values())
-
-                avg_score = (total_score / score_count) if score_count > 0 else 0
-
-                # Convert any datetime objects to ISO strings for JSON-friendly output
-                def iso_or_none(dt):
-                    if isinstance(dt, datetime):
-                        return dt.isoformat()
-                    return None
-
-                for t in tests_list:
-                    t['last_attempt'] = iso_or_none(t.get('last_attempt'))
-
-                return {
-                    'total_attempts': total_attempts,
-                    'distinct_tests': len(by_test),
-                    'average_score': avg_score,
-                    'highest_score': highest_score,
-                    'last_attempt': iso_or_none(last_attempt),
-                    'tests': tests_list
-                }
-
-            # Precompute aggregates grouped by module for practice and online
-            practice_by_module = {}
-            online_by_module = {}
-            for att in practice_attempts:
-                mod = att.get('module_id') or att.get('module') or 'UNKNOWN'
-                practice_by_module.setdefault(mod, []).append(att)
-            for att in online_attempts:
-                mod = att.get('module_id') or att.get('module') or 'UNKNOWN'
-                online_by_module.setdefault(mod, []).append(att)
-
             # For each module, compute both practice and online analytics and combine
             overall_levels_unlocked = 0
             overall_modules_accessed = 0
-            overall_total_attempts = len(attempts)
+            overall_total_attempts = summary['total_attempts']
             overall_score_acc = 0
             overall_score_count = 0
 
             for module_id in modules_list:
-                p_attempts = practice_by_module.get(module_id, [])
-                o_attempts = online_by_module.get(module_id, [])
-
-                p_agg = aggregate_attempts(p_attempts)
-                o_agg = aggregate_attempts(o_attempts)
+                p_agg = summary['modules'].get(('practice', module_id)) or self._empty_attempt_aggregate()
+                o_agg = summary['modules'].get(('online', module_id)) or self._empty_attempt_aggregate()
 
                 # Analyze levels/unlocks using existing helper
-                module_meta = self._analyze_module_progress(student_id, module_id, practice_attempts)
+                module_meta = self._analyze_module_progress(student_id, module_id, None, student=student)
 
                 module_analysis[module_id] = {
                     'practice': p_agg,
@@ -537,8 +324,8 @@ class StudentProgressManager:
                     'student_id': str(student_obj_id)
                 },
                 'module_analysis': module_analysis,
-                'practice_attempts_count': len(practice_attempts),
-                'online_attempts_count': len(online_attempts),
+                'practice_attempts_count': summary['counts'].get('practice', 0),
+                'online_attempts_count': summary['counts'].get('online', 0),
                 'assigned_online_tests_count': len(assigned_online_tests),
                 'assigned_online_tests': [{'_id': str(t.get('_id')), 'test_id': str(t.get('_id')), 'name': t.get('name'), 'module_id': t.get('module_id')} for t in assigned_online_tests],
                 'overall_stats': {
@@ -548,7 +335,7 @@ class StudentProgressManager:
                     'levels_unlocked': overall_levels_unlocked
                 },
                 'unlock_recommendations': [],
-                'admin_actions_taken': self._get_admin_actions_history(student_id)
+                'admin_actions_taken': self._get_admin_actions_history(student_id, student=student)
             }
 
             # Generate simple unlock recommendations based on module_analysis
@@ -582,6 +369,178 @@ class StudentProgressManager:
             self.logger.error(f"Error getting student insights: {e}")
             return None
     
+    def _empty_attempt_aggregate(self):
+        return {
+            'total_attempts': 0,
+            'distinct_tests': 0,
+            'average_score': 0,
+            'highest_score': 0,
+            'last_attempt': None,
+            'tests': []
+        }
+    
+    def _attempt_summary_pipeline(self, or_clauses):
+        """
+        Aggregation over student_test_attempts plus test_results returning only the
+        per-type counts and the per-module / per-test aggregates of the insights report
+        """
+        def number(field):
+            return {'$convert': {'input': f'${field}', 'to': 'double', 'onError': None, 'onNull': None}}
+        
+        # First numeric field in order of preference; total_score above 1000 was stored as percent*100
+        total_score = {'$let': {
+            'vars': {'total': number('total_score')},
+            'in': {'$cond': [{'$gt': ['$$total', 1000]}, {'$divide': ['$$total', 100]}, '$$total']}
+        }}
+        score = 0
+        for candidate in reversed([number('average_score'), number('score_percentage'),
+                                   number('percentage'), number('score'), total_score]):
+            score = {'$ifNull': [candidate, score]}
+        
+        # Dates may be stored as dates, epoch seconds/milliseconds (numbers or strings) or ISO strings
+        epoch_date = {'$toDate': {'$cond': [{'$gt': ['$$epoch', 1e12]}, '$$epoch', {'$multiply': ['$$epoch', 1000.0]}]}}
+        submitted = {'$let': {
+            'vars': {'value': {'$ifNull': ['$submitted_at', {'$ifNull': ['$end_time', '$created_at']}]}},
+            'in': {'$switch': {
+                'branches': [
+                    {'case': {'$eq': [{'$type': '$$value'}, 'date']}, 'then': '$$value'},
+                    {'case': {'$isNumber': '$$value'},
+                     'then': {'$let': {'vars': {'epoch': '$$value'}, 'in': epoch_date}}},
+                    {'case': {'$eq': [{'$type': '$$value'}, 'string']},
+                     'then': {'$let': {
+                         'vars': {'epoch': {'$convert': {'input': '$$value', 'to': 'long', 'onError': None}}},
+                         'in': {'$cond': [
+                             {'$eq': ['$$epoch', None]},
+                             {'$dateFromString': {'dateString': '$$value', 'onError': None}},
+                             epoch_date
+                         ]}
+                     }}}
+                ],
+                'default': None
+            }}
+        }}
+        
+        match = {'$match': {'$or': or_clauses}}
+        graded_types = {'$match': {'test_type': {'$in': ['practice', 'online']}}}
+        return [
+            match,
+            {'$unionWith': {'coll': 'test_results', 'pipeline': [match]}},
+            {'$project': {
+                '_id': 0,
+                # A test_results copy of an attempt carries its attempt_id: count them once
+                'key': {'$ifNull': ['$attempt_id', '$_id']},
+                'test_type': 1,
+                'test_id': 1,
+                'module': {'$ifNull': ['$module_id', {'$ifNull': ['$module', 'UNKNOWN']}]},
+                'test_name': {'$ifNull': ['$test_name', {'$ifNull': ['$name', 'Unknown Test']}]},
+                'score': score,
+                'submitted': submitted
+            }},
+            {'$group': {
+                '_id': '$key',
+                'test_type': {'$first': '$test_type'},
+                'test_id': {'$first': '$test_id'},
+                'module': {'$first': '$module'},
+                'test_name': {'$first': '$test_name'},
+                'score': {'$first': '$score'},
+                'submitted': {'$first': '$submitted'}
+            }},
+            {'$facet': {
+                'counts': [{'$group': {'_id': '$test_type', 'count': {'$sum': 1}}}],
+                'modules': [graded_types, {'$group': {
+                    '_id': {'test_type': '$test_type', 'module': '$module'},
+                    'total_attempts': {'$sum': 1},
+                    'scored_total': {'$sum': {'$cond': [{'$gt': ['$score', 0]}, '$score', 0]}},
+                    'scored_count': {'$sum': {'$cond': [{'$gt': ['$score', 0]}, 1, 0]}},
+                    'highest_score': {'$max': '$score'},
+                    'last_attempt': {'$max': '$submitted'}
+                }}],
+                'tests': [graded_types, {'$group': {
+                    '_id': {'test_type': '$test_type', 'module': '$module', 'test_id': '$test_id'},
+                    'test_name': {'$first': '$test_name'},
+                    'attempts': {'$sum': 1},
+                    'best_score': {'$max': '$score'},
+                    'last_attempt': {'$max': '$submitted'}
+                }}]
+            }}
+        ]
+    
+    def _submission_fingerprint(self, student):
+        """Changes whenever the student submits a test (every submission updates its test summary)"""
+        user_id = student.get('user_id') or student.get('_id')
+        try:
+            user_id = user_id if isinstance(user_id, ObjectId) else ObjectId(str(user_id))
+        except Exception:
+            return None
+        summaries = list(self.mongo_db.student_test_summary.find(
+            {'student_id': user_id}, {'attempt_count': 1, 'updated_at': 1}
+        ))
+        return (
+            sum(s.get('attempt_count', 0) for s in summaries),
+            max((s.get('updated_at') for s in summaries if s.get('updated_at')), default=None)
+        )
+    
+    def _get_attempt_summary(self, student, or_clauses):
+        """Aggregated attempts of a student, reused until the student submits again"""
+        cache_key = str(student['_id'])
+        try:
+            fingerprint = self._submission_fingerprint(student)
+        except Exception as e:
+            self.logger.warning(f"Failed to read submission fingerprint: {e}")
+            fingerprint = None
+        with _insights_cache_lock:
+            cached = _insights_cache.get(cache_key)
+            if cached and fingerprint is not None and cached[0] == fingerprint:
+                _insights_cache.move_to_end(cache_key)
+                return cached[1]
+        
+        summary = {'total_attempts': 0, 'counts': {}, 'modules': {}}
+        try:
+            facets = next(self.mongo_db.student_test_attempts.aggregate(
+                self._attempt_summary_pipeline(or_clauses), allowDiskUse=True
+            ), None) or {}
+        except Exception as e:
+            self.logger.warning(f"Failed to aggregate student attempts: {e}")
+            return summary
+        
+        def iso_or_none(dt):
+            if isinstance(dt, datetime):
+                return dt.isoformat()
+            return None
+        
+        for row in facets.get('counts', []):
+            summary['counts'][row['_id']] = row['count']
+            summary['total_attempts'] += row['count']
+        tests_by_module = {}
+        for row in facets.get('tests', []):
+            group = row['_id']
+            tests_by_module.setdefault((group['test_type'], group['module']), []).append({
+                'test_id': str(group.get('test_id')),
+                'test_name': row.get('test_name'),
+                'attempts': row['attempts'],
+                'best_score': max(row.get('best_score') or 0, 0),
+                'last_attempt': iso_or_none(row.get('last_attempt'))
+            })
+        for row in facets.get('modules', []):
+            key = (row['_id']['test_type'], row['_id']['module'])
+            tests = tests_by_module.get(key, [])
+            summary['modules'][key] = {
+                'total_attempts': row['total_attempts'],
+                'distinct_tests': len(tests),
+                'average_score': (row['scored_total'] / row['scored_count']) if row['scored_count'] > 0 else 0,
+                'highest_score': max(row.get('highest_score') or 0, 0),
+                'last_attempt': iso_or_none(row.get('last_attempt')),
+                'tests': tests
+            }
+        
+        if fingerprint is not None:
+            with _insights_cache_lock:
+                _insights_cache[cache_key] = (fingerprint, summary)
+                _insights_cache.move_to_end(cache_key)
+                while len(_insights_cache) > INSIGHTS_CACHE_SIZE:
+                    _insights_cache.popitem(last=False)
+        return summary
+    
     def _get_current_authorized_levels(self, student):
         """Get current authorized levels as a set"""
         authorized_levels = student.get('authorized_levels', [])
@@ -593,110 +552,72 @@ class StudentProgressManager:
                 return set([level['level_id'] for level in authorized_levels])
         return set()
     
-    def _check_dependencies_and_thresholds(self, completed_level_id, score, current_authorized):
-        """Check if completing this level unlocks new levels"""
-        new_unlocked = []
-        
-        # Find levels that depend on this completed level
-        for level_id, level_info in LEVELS.items():
-            if isinstance(level_info, dict):
-                depends_on = level_info.get('depends_on')
-                if depends_on == completed_level_id:
-                    # Check if already authorized
-                    if level_id not in current_authorized:
-                        # Check threshold
-                        threshold = level_info.get('unlock_threshold', 60)
-                        if score >= threshold:
-                            new_unlocked.append(level_id)
-        
-        return new_unlocked
-    
-    def _add_authorized_level(self, student_id, level_id, authorized_by, score_unlocked=None, 
-                            authorized_by_user=None, test_id=None, reason=None):
-        """Add a level to authorized_levels with metadata"""
-        
-        # Ensure authorized_levels exists and is in new format
-        student = self.mongo_db.students.find_one({'_id': ObjectId(student_id)})
-        if not student.get('authorized_levels'):
-            self.mongo_db.students.update_one(
-                {'_id': ObjectId(student_id)},
-                {'$set': {'authorized_levels': []}}
-            )
-        
-        # Check if level already exists
-        existing_levels = student.get('authorized_levels', [])
-        level_exists = False
-        
-        for level in existing_levels:
-            if isinstance(level, dict) and level.get('level_id') == level_id:
-                level_exists = True
-                break
-            elif isinstance(level, str) and level == level_id:
-                level_exists = True
-                break
-        
-        if not level_exists:
-            level_data = {
-                'level_id': level_id,
-                'authorized_by': authorized_by,
-                'authorized_at': datetime.utcnow(),
-                'is_admin_override': authorized_by == 'admin'
-            }
-            
-            if score_unlocked is not None:
-                level_data['score_unlocked'] = score_unlocked
-            
-            if authorized_by_user:
-                level_data['authorized_by_user'] = authorized_by_user
-            
-            if test_id:
-                level_data['test_id'] = test_id
-            
-            if reason:
-                level_data['reason'] = reason
-            
-            self.mongo_db.students.update_one(
-                {'_id': ObjectId(student_id)},
-                {'$push': {'authorized_levels': level_data}}
-            )
+    def _initialize_progress_fields(self, student):
+        """Replace null progress fields left by old records, so they can be pushed to / set into"""
+        defaults = {'authorized_levels': [], 'module_progress': {}}
+        missing = {field: value for field, value in defaults.items() if field in student and student[field] is None}
+        if missing:
+            self.mongo_db.students.update_one({'_id': student['_id']}, {'$set': missing})
+            student.update(missing)
     
-    def _update_module_progress(self, student_id, level_id, score):
-        """Update module progress tracking"""
-        module_id = self._get_level_module(level_id)
-        if not module_id:
-            return
-        
-        # Initialize module_progress if it doesn't exist
-        student = self.mongo_db.students.find_one({'_id': ObjectId(student_id)})
-        if not student.get('module_progress'):
-            self.mongo_db.students.update_one(
-                {'_id': ObjectId(student_id)},
-                {'$set': {'module_progress': {}}}
-            )
-        
-        # Update specific module progress
-        update_data = {
-            f'module_progress.{module_id}.last_attempt': datetime.utcnow(),
-            f'module_progress.{module_id}.last_score': score
+    def _authorized_level_entry(self, level_id, authorized_by, score_unlocked=None,
+                                authorized_by_user=None, test_id=None, reason=None, authorized_at=None):
+        """authorized_levels entry with metadata"""
+        level_data = {
+            'level_id': level_id,
+            'authorized_by': authorized_by,
+            'authorized_at': authorized_at or datetime.utcnow(),
+            'is_admin_override': authorized_by == 'admin'
         }
         
-        # Update highest score if this is higher
-        current_highest = student.get('module_progress', {}).get(module_id, {}).get('highest_score', 0)
-        if score > current_highest:
-            update_data[f'module_progress.{module_id}.highest_score'] = score
+        if score_unlocked is not None:
+            level_data['score_unlocked'] = score_unlocked
         
-        # Update total score
-        current_total = student.get('module_progress', {}).get(module_id, {}).get('total_score', 0)
-        update_data[f'module_progress.{module_id}.total_score'] = current_total + score
+        if authorized_by_user:
+            level_data['authorized_by_user'] = authorized_by_user
         
-        # Update attempts count
-        current_attempts = student.get('module_progress', {}).get(module_id, {}).get('attempts_count', 0)
-        update_data[f'module_progress.{module_id}.attempts_count'] = current_attempts + 1
+        if test_id:
+            level_data['test_id'] = test_id
         
-        self.mongo_db.students.update_one(
-            {'_id': ObjectId(student_id)},
-            {'$set': update_data}
+        if reason:
+            level_data['reason'] = reason
+        
+        return level_data
+    
+    def _apply_admin_authorization(self, student_id, level_ids, module_id, admin_user_id, reason=None):
+        """Authorize levels, mark the module overridden and record the history in one update"""
+        student = self.mongo_db.students.find_one(
+            {'_id': ObjectId(student_id)}, {'authorized_levels': 1, 'module_progress': 1}
         )
+        if not student:
+            raise ValueError(f"Student not found: {student_id}")
+        self._initialize_progress_fields(student)
+        
+        now = datetime.utcnow()
+        current_authorized = self._get_current_authorized_levels(student)
+        new_levels = [level_id for level_id in level_ids if level_id not in current_authorized]
+        push = {
+            'unlock_history': {
+                '$each': [
+                    self._unlock_history_entry(level_id, None, 'admin', None, admin_user_id, reason, unlocked_at=now)
+                    for level_id in level_ids
+                ],
+                '$slice': -MAX_UNLOCK_HISTORY
+            }
+        }
+        if new_levels:
+            push['authorized_levels'] = {'$each': [
+                self._authorized_level_entry(level_id, 'admin', authorized_by_user=admin_user_id,
+                                             reason=reason, authorized_at=now)
+                for level_id in new_levels
+            ]}
+        update = {'$push': push}
+        if module_id:
+            update['$set'] = {
+                f'module_progress.{module_id}.unlock_status': 'admin_override',
+                f'module_progress.{module_id}.admin_override_at': now
+            }
+        self.mongo_db.students.update_one({'_id': ObjectId(student_id)}, update)
     
     def _update_module_progress_admin_override(self, student_id, module_id):
         """Update module progress when admin overrides"""
@@ -722,20 +643,12 @@ class StudentProgressManager:
             {'$set': update_data}
         )
     
-    def _add_unlock_history(self, student_id, level_id, score, unlock_type, test_id=None, 
-                          admin_user_id=None, reason=None):
-        """Add entry to unlock history"""
-        # Initialize unlock_history if it doesn't exist
-        student = self.mongo_db.students.find_one({'_id': ObjectId(student_id)})
-        if not student.get('unlock_history'):
-            self.mongo_db.students.update_one(
-                {'_id': ObjectId(student_id)},
-                {'$set': {'unlock_history': []}}
-            )
-        
+    def _unlock_history_entry(self, level_id, score, unlock_type, test_id=None,
+                              admin_user_id=None, reason=None, unlocked_at=None):
+        """unlock_history entry"""
         history_entry = {
             'level_id': level_id,
-            'unlocked_at': datetime.utcnow(),
+            'unlocked_at': unlocked_at or datetime.utcnow(),
             'unlocked_by': unlock_type,
             'score': score
         }
@@ -749,20 +662,7 @@ class StudentProgressManager:
         if reason:
             history_entry['reason'] = reason
         
-        # Cap unlock_history to last N entries to prevent unbounded growth
-        MAX_HISTORY = 200
-        try:
-            self.mongo_db.students.update_one(
-                {'_id': ObjectId(student_id)},
-                {'$push': {'unlock_history': {'$each': [history_entry], '$slice': -MAX_HISTORY}}}
-            )
-        except Exception as e:
-            # Fallback to simple push if capped push fails for any reason
-            self.logger.exception(f"Failed to push capped unlock_history, falling back: {e}")
-            self.mongo_db.students.update_one(
-                {'_id': ObjectId(student_id)},
-                {'$push': {'unlock_history': history_entry}}
-            )
+        return history_entry
     
     def _add_lock_history(self, student_id, module_id, admin_user_id, reason=None):
         """Add entry to lock history"""
@@ -799,19 +699,16 @@ class StudentProgressManager:
     
     def _get_module_levels(self, module_id):
         """Get all level IDs for a module"""
-        return [level_id for level_id, level in LEVELS.items() 
-                if isinstance(level, dict) and level.get('module_id') == module_id]
+        return get_level_graph(self.mongo_db).levels_of(module_id)
     
     def _get_level_module(self, level_id):
         """Get module ID for a level"""
-        level_info = LEVELS.get(level_id, {})
-        if isinstance(level_info, dict):
-            return level_info.get('module_id')
-        return None
+        return get_level_graph(self.mongo_db).module_of(level_id)
     
-    def _analyze_module_progress(self, student_id, module_id, attempts):
+    def _analyze_module_progress(self, student_id, module_id, attempts, student=None):
         """Analyze progress for a specific module"""
-        student = self.mongo_db.students.find_one({'_id': ObjectId(student_id)})
+        if student is None:
+            student = self.mongo_db.students.find_one({'_id': ObjectId(student_id)})
         module_progress = student.get('module_progress', {}).get(module_id, {})
         authorized_levels = self._get_current_authorized_levels(student)
         
@@ -835,11 +732,7 @@ class StudentProgressManager:
         # Find next level to unlock
         next_level = None
         if current_level:
-            for level_id, level_info in LEVELS.items():
-                if isinstance(level_info, dict) and level_info.get('depends_on') == current_level:
-                    if level_id not in authorized_levels:
-                        next_level = level_id
-                        break
+            next_level = get_level_graph(self.mongo_db).next_level(current_level, authorized_levels)
         
         # Check if next level is unlocked
         next_level_unlocked = next_level in authorized_levels if next_level else False
@@ -858,9 +751,10 @@ class StudentProgressManager:
             'admin_override_available': current_score < 60 and current_score > 30
         }
     
-    def _get_admin_actions_history(self, student_id):
+    def _get_admin_actions_history(self, student_id, student=None):
         """Get history of admin actions for this student"""
-        student = self.mongo_db.students.find_one({'_id': ObjectId(student_id)})
+        if student is None:
+            student = self.mongo_db.students.find_one({'_id': ObjectId(student_id)})
         
         actions = []
         
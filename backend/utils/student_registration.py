@@ -0,0 +1,376 @@
+"""
+Bulk student registration for uploads.
+
+Passwords of a chunk of rows are bcrypt-hashed in parallel, then the chunk's users
+and students are written with insert_many(ordered=False). Rows whose insert fails
+(e.g. a duplicate roll number that appeared since validation) get an error message
+and never leave a user without its student profile.
+
+bcrypt releases the GIL while hashing, so a thread pool sized to the cores hashes
+in parallel without forking the (multi-threaded) gunicorn worker.
+"""
+
+import logging
+import os
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Set
+
+import bcrypt as bcrypt_lib
+import pytz
+import requests
+from bson import ObjectId
+from pymongo.errors import BulkWriteError
+
+from config.shared import bcrypt
+from mongo import mongo_db
+
+logger = logging.getLogger(__name__)
+
+REGISTRATION_CHUNK_SIZE = int(os.getenv('REGISTRATION_CHUNK_SIZE', '200'))
+# Values per $in query when looking up duplicates of an upload
+DUPLICATE_LOOKUP_CHUNK_SIZE = 1000
+HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', '0')) or (os.cpu_count() or 1)
+
+# Unique index key -> message for the upload row
+DUPLICATE_KEY_MESSAGES = {
+    'username': 'Roll number already exists.',
+    'roll_number': 'Roll number already exists.',
+    'mobile_number': 'Mobile number already exists.',
+    'user_id': 'Student profile already exists for this user.',
+}
+
+_hash_pool = None
+_hash_pool_pid = None
+_hash_pool_lock = threading.Lock()
+
+
+def _get_hash_pool() -> ThreadPoolExecutor:
+    global _hash_pool, _hash_pool_pid
+    with _hash_pool_lock:
+        if _hash_pool is None or _hash_pool_pid != os.getpid():
+            _hash_pool = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix='password-hash')
+            _hash_pool_pid = os.getpid()
+        return _hash_pool
+
+
+def _hash_password(password: str) -> str:
+    # Same output as bcrypt.generate_password_hash (config.shared), rounds and prefix included
+    salt = bcrypt_lib.gensalt(rounds=bcrypt._log_rounds, prefix=bcrypt._prefix.encode('utf-8'))
+    return bcrypt_lib.hashpw(password.encode('utf-8'), salt).decode('utf-8')
+
+
+def hash_passwords(passwords: List[str]) -> List[str]:
+    """bcrypt hashes of passwords, in order, computed in parallel"""
+    if len(passwords) < 2 or HASH_WORKERS < 2:
+        return [_hash_password(password) for password in passwords]
+    return list(_get_hash_pool().map(_hash_password, passwords))
+
+
+def _existing_values(collection, field: str, values) -> Set[str]:
+    """Which of values are already stored in collection.field (indexed $in lookups in chunks)"""
+    values = sorted({value for value in values if value})
+    existing: Set[str] = set()
+    for start in range(0, len(values), DUPLICATE_LOOKUP_CHUNK_SIZE):
+        chunk = values[start:start + DUPLICATE_LOOKUP_CHUNK_SIZE]
+        existing.update(
+            doc[field] for doc in collection.find({field: {'$in': chunk}}, {field: 1, '_id': 0}) if doc.get(field)
+        )
+    return existing
+
+
+def find_existing_roll_numbers(roll_numbers) -> Set[str]:
+    """Roll numbers of an upload that already belong to a student"""
+    return _existing_values(mongo_db.students, 'roll_number', roll_numbers)
+
+
+def find_existing_mobile_numbers(mobile_numbers) -> Set[str]:
+    """Mobile numbers of an upload that already belong to a user"""
+    return _existing_values(mongo_db.users, 'mobile_number', mobile_numbers)
+
+
+def column_values(rows, column: str) -> List[str]:
+    """Stripped string values of a column of parsed upload rows"""
+    return [str(row.get(column, '')).strip() for row in rows]
+
+
+def _write_error_message(error: Dict[str, Any]) -> str:
+    if error.get('code') == 11000:
+        for field in (error.get('keyPattern') or {}):
+            if field in DUPLICATE_KEY_MESSAGES:
+                return DUPLICATE_KEY_MESSAGES[field]
+        return 'Duplicate record already exists.'
+    return f"Database error: {error.get('errmsg', 'write failed')}"
+
+
+def _insert_many(collection, documents: List[Dict[str, Any]]) -> Dict[int, str]:
+    """insert_many(ordered=False); returns error messages by document index"""
+    if not documents:
+        return {}
+    try:
+        collection.insert_many(documents, ordered=False)
+        return {}
+    except BulkWriteError as e:
+        return {error['index']: _write_error_message(error) for error in e.details.get('writeErrors', [])}
+
+
+def _register_chunk(registrations: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    password_hashes = hash_passwords([r['password'] for r in registrations])
+    user_docs = []
+    for registration, password_hash in zip(registrations, password_hashes):
+        user_docs.append({**registration['user'], '_id': ObjectId(), 'password_hash': password_hash})
+
+    results: List[Dict[str, Any]] = [{'user_id': None, 'error': None} for _ in registrations]
+    user_errors = _insert_many(mongo_db.users, user_docs)
+    for index, message in user_errors.items():
+        results[index]['error'] = message
+
+    created = [index for index in range(len(registrations)) if index not in user_errors]
+    student_docs = [{**registrations[index]['student'], 'user_id': user_docs[index]['_id']} for index in created]
+    student_errors = _insert_many(mongo_db.students, student_docs)
+    if student_errors:
+        # Roll back the users whose student profile could not be created
+        orphaned = [user_docs[created[position]]['_id'] for position in student_errors]
+        mongo_db.users.delete_many({'_id': {'$in': orphaned}})
+        for position, message in student_errors.items():
+            results[created[position]]['error'] = message
+
+    registered_ids = []
+    for position, index in enumerate(created):
+        if position not in student_errors:
+            results[index]['user_id'] = user_docs[index]['_id']
+            registered_ids.append(user_docs[index]['_id'])
+
+    try:
+        from models_notification_preferences import NotificationPreferences
+        NotificationPreferences.create_default_preferences_bulk(registered_ids)
+    except Exception as e:
+        # Don't fail user creation if notification preferences creation fails
+        logger.warning(f"⚠️ Failed to create default notification preferences for {len(registered_ids)} students: {e}")
+    return results
+
+
+def register_students(
+    registrations: List[Dict[str, Any]],
+    on_chunk: Optional[Callable[[int, List[Dict[str, Any]]], None]] = None
+) -> List[Dict[str, Any]]:
+    """
+    Create users and student profiles in chunks.
+
+    Each registration is {'password': plain password, 'user': user document without
+    password_hash, 'student': student document without user_id}. Returns, in order,
+    {'user_id': ObjectId or None, 'error': message or None} per registration.
+    on_chunk(done_count, chunk_results) is called after every chunk, e.g. for
+    progress events.
+    """
+    results: List[Dict[str, Any]] = []
+    for start in range(0, len(registrations), REGISTRATION_CHUNK_SIZE):
+        chunk = registrations[start:start + REGISTRATION_CHUNK_SIZE]
+        try:
+            chunk_results = _register_chunk(chunk)
+        except Exception as e:
+            logger.error(f"❌ Registering students {start + 1}-{start + len(chunk)} failed: {e}")
+            chunk_results = [{'user_id': None, 'error': f'Database error: {str(e)}'} for _ in chunk]
+        results.extend(chunk_results)
+        if on_chunk:
+            on_chunk(len(results), chunk_results)
+    return results
+
+
+def new_upload_result() -> Dict[str, Any]:
+    return {
+        'student_name': '',
+        'roll_number': '',
+        'email': '',
+        'mobile_number': '',
+        'database_registered': False,
+        'email_sent': False,
+        'sms_sent': False,
+        'errors': [],
+        'success': False
+    }
+
+
+def prepare_upload_rows(
+    rows: List[Dict[str, Any]],
+    is_v2_format: bool,
+    batch_courses: List[Dict[str, Any]],
+    course_ids: List[str],
+    campus_id,
+    batch_id,
+    existing_roll_numbers: Set[str],
+    existing_mobile_numbers: Set[str],
+    extra_user_fields: Optional[Dict[str, Any]] = None
+):
+    """
+    Validate upload-students rows and build their registrations.
+
+    Returns (detailed_results, registrations, registration_rows): a result per row,
+    the register_students input for the valid rows, and the row index of each
+    registration. Roll and mobile numbers of valid rows are added to the existing_*
+    sets so that later rows repeating them are rejected.
+    """
+    courses_by_name = {c['name']: c for c in batch_courses}
+    courses_by_lower_name = {c['name'].lower(): c for c in batch_courses}
+    seen_emails = set()
+
+    detailed_results = [new_upload_result() for _ in rows]
+    registrations = []
+    registration_rows = []
+    for index, row in enumerate(rows):
+        student_result = detailed_results[index]
+        try:
+            student_name = str(row.get('Student Name', '')).strip()
+            roll_number = str(row.get('Roll Number', '')).strip()
+            email = str(row.get('Email', '')).strip().lower() if row.get('Email') else ''  # Make email optional
+            mobile_number = str(row.get('Mobile Number', '')).strip()
+            if is_v2_format:
+                group_name = str(row.get('Group', '')).strip()
+
+                # Find course by group name (assuming group name matches course name)
+                # Try exact match first, then case-insensitive match
+                course = courses_by_name.get(group_name) or courses_by_lower_name.get(group_name.lower())
+                if not course:
+                    available_names = [c['name'] for c in batch_courses]
+                    student_result['errors'].append(f"Course/Group '{group_name}' not found in this batch. Available courses: {', '.join(available_names)}")
+                    continue
+                course_id = str(course['_id'])
+            else:
+                course_id = course_ids[0]  # Use first course for v1 format
+
+            # Update student result with basic info
+            student_result.update({
+                'student_name': student_name,
+                'roll_number': roll_number,
+                'email': email,
+                'mobile_number': mobile_number
+            })
+
+            # Check for missing required fields (name and roll number)
+            if not student_name or not roll_number:
+                student_result['errors'] = ['Missing required fields.']
+                continue
+
+            validation_errors = []
+            if roll_number in existing_roll_numbers:
+                validation_errors.append('Roll number already exists.')
+            # Email duplicates are allowed at database level, only logged
+            if email and email in seen_emails:
+                logger.warning(f"⚠️ Email {email} already exists for another user, but allowing duplicate")
+            if mobile_number and mobile_number in existing_mobile_numbers:
+                validation_errors.append('Mobile number already exists.')
+            if validation_errors:
+                student_result['errors'] = validation_errors
+                continue
+
+            # Reserve within this upload so later rows with the same values are rejected
+            existing_roll_numbers.add(roll_number)
+            seen_emails.add(email)
+            if mobile_number:
+                existing_mobile_numbers.add(mobile_number)
+
+            username = roll_number
+            password = f"{student_name.split()[0][:4].lower()}{roll_number[-4:]}"
+            student_result['username'] = username
+            student_result['password'] = password
+            registrations.append({
+                'password': password,
+                'user': {
+                    'username': username,
+                    'email': email if email else None,  # Always include email field
+                    'role': 'student',
+                    'name': student_name,
+                    'mobile_number': mobile_number,
+                    'campus_id': campus_id,
+                    'course_id': ObjectId(course_id),
+                    'batch_id': ObjectId(batch_id),
+                    'is_active': True,
+                    'created_at': datetime.now(pytz.utc),
+                    'mfa_enabled': False,
+                    **(extra_user_fields or {})
+                },
+                'student': {
+                    'name': student_name,
+                    'roll_number': roll_number,
+                    'email': email if email else None,  # Always include email field
+                    'mobile_number': mobile_number,
+                    'campus_id': campus_id,
+                    'course_id': ObjectId(course_id),
+                    'batch_id': ObjectId(batch_id),
+                    'created_at': datetime.now(pytz.utc)
+                }
+            })
+            registration_rows.append(index)
+
+        except Exception as e:
+            student_result['errors'].append(f'Database error: {str(e)}')
+            logger.error(f"Database error for student {index + 1}: {e}")
+    return detailed_results, registrations, registration_rows
+
+
+def apply_registration_results(
+    detailed_results: List[Dict[str, Any]],
+    registration_rows: List[int],
+    results: List[Dict[str, Any]]
+) -> Dict[int, str]:
+    """Record register_students results on their rows; returns user ids by row index"""
+    registered = {}
+    for row_index, registration_result in zip(registration_rows, results):
+        student_result = detailed_results[row_index]
+        if registration_result['error']:
+            student_result['errors'].append(registration_result['error'])
+            student_result.pop('username', None)
+            student_result.pop('password', None)
+        else:
+            student_result['database_registered'] = True
+            registered[row_index] = str(registration_result['user_id'])
+    return registered
+
+
+def credentials_notification_students(
+    detailed_results: List[Dict[str, Any]],
+    registered_user_ids: Dict[int, str]
+) -> List[Dict[str, Any]]:
+    """Credentials notification payloads for the registered rows"""
+    return [{
+        'name': student_result['student_name'],
+        'username': student_result['username'],
+        'password': student_result['password'],
+        'email': student_result['email'] or None,
+        'mobile_number': student_result['mobile_number'] or None,
+        'roll_number': student_result['roll_number'],
+        'user_id': registered_user_ids.get(index)  # For push notifications
+    } for index, student_result in enumerate(detailed_results) if student_result['database_registered']]
+
+
+def queue_credentials_notifications(students: List[Dict[str, Any]]) -> bool:
+    """
+    Queue credentials email/SMS for newly registered students: a credentials batch
+    job, and the same students sent to the notification service (fire-and-forget).
+    Returns whether the batch job was created.
+    """
+    if not students:
+        return False
+    try:
+        from utils.batch_processor import create_credentials_batch_job
+
+        batch_result = create_credentials_batch_job(students=students, batch_size=100, interval_minutes=3)
+        logger.info(f"📧📱 Student credentials batch created: {batch_result}")
+    except Exception as e:
+        # Don't fail the upload if notifications fail
+        logger.error(f"❌ Failed to create credentials batch: {e}")
+        return False
+
+    notification_service_url = os.getenv('NOTIFICATION_SERVICE_URL', 'http://localhost:3001')
+    notification_service_url = notification_service_url.rstrip('/api').rstrip('/')
+    logger.info(f"📧📱 Sending {len(students)} students to notification service (batch)")
+    for path, payload in (
+        ('/api/email/send-credentials-batch', {'students': students, 'loginUrl': 'https://crt.pydahsoft.in/login'}),
+        ('/api/sms/send-credentials-batch', {'students': students}),
+    ):
+        try:
+            requests.post(f"{notification_service_url}{path}", json=payload, timeout=1)  # Fire-and-forget
+        except Exception:
+            pass  # Ignore errors
+    return True
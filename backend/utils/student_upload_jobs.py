@@ -0,0 +1,403 @@
+#!/usr/bin/env python3
+"""
+Background Student Upload Jobs
+Large upload-students files are not registered inside the HTTP request. The parsed
+rows are stored as an `upload_jobs` document plus `upload_job_chunks` of
+JOB_CHUNK_SIZE rows, and the request returns the job id right away.
+
+A worker thread in each process claims queued jobs under a lease and processes
+them one chunk at a time (only that chunk's rows are in memory), advancing the
+job's `cursor` after each chunk. A job whose worker died (dropped deploy, worker
+recycle) is picked up again from its cursor once the lease expires. Users created
+by a job carry its `upload_job_id`, so a chunk interrupted half-way is resumed
+without reporting its own students as duplicates.
+
+Progress is emitted on the usual `upload_progress` Socket.IO event (with job_id),
+and the job document backs the upload-jobs status endpoint.
+"""
+
+import logging
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from bson import ObjectId
+from pymongo import ReturnDocument
+
+from mongo import mongo_db
+from utils.spreadsheet_reader import iter_chunks
+from utils.student_registration import (
+    apply_registration_results, column_values, credentials_notification_students,
+    find_existing_mobile_numbers, find_existing_roll_numbers, prepare_upload_rows,
+    queue_credentials_notifications, register_students
+)
+
+logger = logging.getLogger(__name__)
+
+# Files with at least this many rows are processed as background jobs
+UPLOAD_JOB_THRESHOLD = int(os.getenv('UPLOAD_JOB_THRESHOLD', '300'))
+JOB_CHUNK_SIZE = int(os.getenv('UPLOAD_JOB_CHUNK_SIZE', '200'))
+POLL_SECONDS = float(os.getenv('UPLOAD_JOB_POLL_SECONDS', '5'))
+LEASE_SECONDS = 300
+MAX_ATTEMPTS = 5
+
+
+def _storable(value):
+    """Row cell value as stored in a chunk document"""
+    if value is None or isinstance(value, (str, int, float, bool, datetime)):
+        return value
+    return str(value)
+
+
+def create_student_upload_job(
+    rows: Iterable[Dict[str, Any]],
+    batch_id: str,
+    course_ids: List[str],
+    campus_id,
+    is_v2_format: bool,
+    created_by: str
+) -> Tuple[ObjectId, int]:
+    """
+    Store the rows of an upload in chunks (consumed JOB_CHUNK_SIZE at a time, so a
+    streamed file is never fully in memory) and queue the job.
+    Returns (job id, number of rows).
+    """
+    job_id = ObjectId()
+    total = 0
+    chunk_count = 0
+    for chunk_rows in iter_chunks(rows, JOB_CHUNK_SIZE):
+        mongo_db.upload_job_chunks.insert_one({
+            'job_id': job_id,
+            'index': chunk_count,
+            'rows': [{str(k): _storable(v) for k, v in row.items()} for row in chunk_rows],
+            'status': 'pending',
+            'attempts': 0
+        })
+        total += len(chunk_rows)
+        chunk_count += 1
+    now = datetime.utcnow()
+
+    # The job only becomes claimable once all of its chunks are stored
+    mongo_db.upload_jobs.insert_one({
+        '_id': job_id,
+        'type': 'student_upload',
+        'status': 'queued',
+        'created_by': str(created_by),
+        'batch_id': batch_id,
+        'course_ids': list(course_ids),
+        'campus_id': campus_id,
+        'is_v2_format': is_v2_format,
+        'total': total,
+        'chunk_count': chunk_count,
+        'cursor': 0,
+        'counters': {'processed': 0, 'registered': 0, 'failed': 0, 'notifications_queued': 0},
+        'attempts': 0,
+        'next_attempt_at': now,
+        'created_at': now,
+        'updated_at': now
+    })
+    student_upload_jobs.notify()
+    logger.info(f"📦 Queued student upload job {job_id}: {total} rows in {chunk_count} chunks")
+    return job_id, total
+
+
+def job_summary(job: Dict[str, Any]) -> Dict[str, Any]:
+    """upload-students summary for a job, from its counters"""
+    counters = job.get('counters', {})
+    total = job.get('total', 0)
+    registered = counters.get('registered', 0)
+    return {
+        'total_students': total,
+        'database_registered': registered,
+        'emails_queued': counters.get('notifications_queued', 0),
+        'sms_queued': counters.get('notifications_queued', 0),
+        'total_errors': counters.get('failed', 0),
+        'database_only': registered,
+        'complete_failures': counters.get('processed', 0) - registered,
+        'success_rate': round((registered / total * 100), 2) if total > 0 else 0,
+        'email_success_rate': 0,  # No emails sent during upload
+        'sms_success_rate': 0     # No SMS sent during upload
+    }
+
+
+def job_results(job_id: ObjectId) -> List[Dict[str, Any]]:
+    """Per-row results of the processed chunks of a job, in file order"""
+    results = []
+    for chunk in mongo_db.upload_job_chunks.find(
+        {'job_id': job_id, 'status': 'done'}, {'results': 1, 'index': 1}
+    ).sort('index', 1):
+        results.extend(chunk.get('results', []))
+    return results
+
+
+class StudentUploadJobWorker:
+    """Per-worker processor of queued student upload jobs"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._indexes_ready = False
+        self.stats = {'jobs': 0, 'chunks': 0, 'resumed': 0, 'failed': 0}
+
+    def ensure_running(self) -> None:
+        """Start the worker in this process (threads do not survive a gunicorn fork)"""
+        if self._pid == os.getpid() and self._thread and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='student-upload-jobs', daemon=True)
+            self._thread.start()
+            logger.info(f"📦 Student upload job worker started in worker {self._pid}")
+
+    def notify(self) -> None:
+        """Called after queueing a job so it is picked up without waiting for the poll"""
+        self.ensure_running()
+        self._wakeup.set()
+
+    def _run(self) -> None:
+        while True:
+            try:
+                while self.process_next_job():
+                    pass
+            except Exception as e:
+                logger.error(f"❌ Student upload job worker error: {e}")
+            self._wakeup.wait(POLL_SECONDS)
+            self._wakeup.clear()
+
+    def _ensure_indexes(self) -> None:
+        if self._indexes_ready:
+            return
+        mongo_db.upload_jobs.create_index([('status', 1), ('next_attempt_at', 1)])
+        mongo_db.upload_job_chunks.create_index([('job_id', 1), ('index', 1)], unique=True)
+        mongo_db.users.create_index('upload_job_id', sparse=True)
+        self._indexes_ready = True
+
+    def _claim(self) -> Optional[Dict[str, Any]]:
+        """Lease one due job (including jobs whose worker stopped holding the lease)"""
+        now = datetime.utcnow()
+        return mongo_db.upload_jobs.find_one_and_update(
+            {'$or': [
+                {'status': 'queued', 'next_attempt_at': {'$lte': now}},
+                {'status': 'processing', 'lease_until': {'$lte': now}}
+            ]},
+            {'$set': {
+                'status': 'processing',
+                'lease_until': now + timedelta(seconds=LEASE_SECONDS),
+                # A fresh token per claim: a worker that lost its lease can no longer advance the job
+                'lease_token': str(ObjectId()),
+                'updated_at': now
+            }},
+            sort=[('created_at', 1)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    def _emit(self, job: Dict[str, Any], payload: Dict[str, Any]) -> None:
+        from socketio_instance import socketio
+
+        try:
+            socketio.emit('upload_progress', {
+                'user_id': job['created_by'],
+                'job_id': str(job['_id']),
+                'total': job['total'],
+                **payload
+            }, room=job['created_by'])
+        except Exception as e:
+            logger.warning(f"⚠️ Could not emit upload progress for job {job['_id']}: {e}")
+
+    def _recover_registered(self, job_id: ObjectId, rows: List[Dict[str, Any]]) -> Dict[str, ObjectId]:
+        """
+        Users this job already created for these rows before it was interrupted, by
+        username. Users left without a student profile are removed so they are
+        registered again.
+        """
+        users = list(mongo_db.users.find(
+            {'upload_job_id': job_id, 'username': {'$in': column_values(rows, 'Roll Number')}},
+            {'username': 1}
+        ))
+        if not users:
+            return {}
+        with_profile = {s['user_id'] for s in mongo_db.students.find(
+            {'user_id': {'$in': [u['_id'] for u in users]}}, {'user_id': 1}
+        )}
+        orphaned = [u['_id'] for u in users if u['_id'] not in with_profile]
+        if orphaned:
+            mongo_db.users.delete_many({'_id': {'$in': orphaned}})
+        return {u['username']: u['_id'] for u in users if u['_id'] in with_profile}
+
+    def _process_chunk(self, job: Dict[str, Any], chunk: Dict[str, Any]) -> Dict[str, Any]:
+        rows = chunk['rows']
+        course_object_ids = [ObjectId(cid) for cid in job['course_ids']]
+        batch_courses = list(mongo_db.courses.find({'_id': {'$in': course_object_ids}}, {'name': 1}))
+
+        recovered = self._recover_registered(job['_id'], rows) if chunk.get('attempts', 0) > 1 else {}
+        if recovered:
+            self.stats['resumed'] += 1
+        existing_roll_numbers = find_existing_roll_numbers(column_values(rows, 'Roll Number')) - set(recovered)
+        existing_mobile_numbers = find_existing_mobile_numbers(column_values(rows, 'Mobile Number'))
+        if recovered:
+            recovered_mobiles = {
+                u.get('mobile_number') for u in mongo_db.users.find(
+                    {'_id': {'$in': list(recovered.values())}}, {'mobile_number': 1}
+                )
+            }
+            existing_mobile_numbers -= recovered_mobiles
+
+        detailed_results, registrations, registration_rows = prepare_upload_rows(
+            rows, job['is_v2_format'], batch_courses, job['course_ids'], job['campus_id'], job['batch_id'],
+            existing_roll_numbers, existing_mobile_numbers,
+            extra_user_fields={'upload_job_id': job['_id']}
+        )
+
+        registered_user_ids = {}
+        pending, pending_rows = [], []
+        for registration, row_index in zip(registrations, registration_rows):
+            user_id = recovered.get(registration['user']['username'])
+            if user_id:
+                detailed_results[row_index]['database_registered'] = True
+                registered_user_ids[row_index] = str(user_id)
+            else:
+                pending.append(registration)
+                pending_rows.append(row_index)
+        registered_user_ids.update(
+            apply_registration_results(detailed_results, pending_rows, register_students(pending))
+        )
+
+        students_for_notifications = credentials_notification_students(detailed_results, registered_user_ids)
+        notifications_queued = queue_credentials_notifications(students_for_notifications)
+        for student_result in detailed_results:
+            student_result['success'] = student_result['database_registered']
+            if notifications_queued and student_result['database_registered']:
+                student_result['notifications_queued'] = True
+                student_result['email_sent'] = student_result['sms_sent'] = student_result['push_sent'] = True
+            # Credentials are delivered by the notifications, not stored with the job
+            student_result.pop('password', None)
+
+        return {
+            'results': detailed_results,
+            'processed': len(detailed_results),
+            'registered': len(registered_user_ids),
+            'failed': sum(1 for r in detailed_results if not r['database_registered']),
+            'notifications_queued': len(students_for_notifications) if notifications_queued else 0
+        }
+
+    def _run_job(self, job: Dict[str, Any]) -> None:
+        if job['cursor'] == 0 and job.get('attempts', 0) == 0:
+            self._emit(job, {
+                'status': 'started', 'processed': 0, 'percentage': 0,
+                'message': 'Starting student upload...'
+            })
+        while job['cursor'] < job['chunk_count']:
+            cursor = job['cursor']
+            chunk = mongo_db.upload_job_chunks.find_one_and_update(
+                {'job_id': job['_id'], 'index': cursor},
+                {'$inc': {'attempts': 1}},
+                return_document=ReturnDocument.AFTER
+            )
+            if chunk is None:
+                raise RuntimeError(f'Chunk {cursor} of upload job {job["_id"]} is missing')
+            if chunk.get('status') == 'done':
+                # Checkpointed by an earlier run that stopped before moving the cursor
+                outcome = chunk['outcome']
+            else:
+                outcome = self._process_chunk(job, chunk)
+                # The chunk's results are checkpointed before the cursor moves past it
+                mongo_db.upload_job_chunks.update_one(
+                    {'_id': chunk['_id']},
+                    {'$set': {
+                        'status': 'done',
+                        'results': outcome.pop('results'),
+                        'outcome': outcome,
+                        'processed_at': datetime.utcnow()
+                    }, '$unset': {'rows': ''}}
+                )
+            now = datetime.utcnow()
+            # Counters move together with the cursor, so every chunk is counted once
+            job = mongo_db.upload_jobs.find_one_and_update(
+                {'_id': job['_id'], 'cursor': cursor, 'lease_token': job['lease_token']},
+                {'$set': {
+                    'cursor': cursor + 1,
+                    'lease_until': now + timedelta(seconds=LEASE_SECONDS),
+                    'updated_at': now
+                }, '$inc': {
+                    'counters.processed': outcome['processed'],
+                    'counters.registered': outcome['registered'],
+                    'counters.failed': outcome['failed'],
+                    'counters.notifications_queued': outcome['notifications_queued']
+                }},
+                return_document=ReturnDocument.AFTER
+            )
+            if job is None:
+                logger.warning(f"⚠️ Lost the lease of upload job at chunk {cursor}, stopping")
+                return
+            self.stats['chunks'] += 1
+            processed = job['counters']['processed']
+            self._emit(job, {
+                'status': 'processing',
+                'processed': processed,
+                'percentage': int(processed / job['total'] * 100) if job['total'] else 100,
+                'message': f"Uploading: {processed}/{job['total']} rows processed, {job['counters']['registered']} students registered"
+            })
+
+        summary = job_summary(job)
+        mongo_db.upload_jobs.update_one(
+            {'_id': job['_id']},
+            {'$set': {'status': 'completed', 'completed_at': datetime.utcnow(), 'updated_at': datetime.utcnow(), 'summary': summary},
+             '$unset': {'lease_until': '', 'lease_token': ''}}
+        )
+        self.stats['jobs'] += 1
+        with_errors = summary['total_errors'] > 0
+        self._emit(job, {
+            'status': 'completed_with_errors' if with_errors else 'completed',
+            'processed': job['total'],
+            'percentage': 100,
+            'message': (
+                f"Database upload completed with {summary['total_errors']} errors. {summary['database_registered']} students registered."
+                if with_errors else
+                f"Successfully uploaded {job['total']} students to database! Credentials notifications queued for batch processing."
+            ),
+            'summary': summary
+        })
+        logger.info(f"🎉 Student upload job {job['_id']} completed: {summary['database_registered']}/{job['total']} registered")
+
+    def process_next_job(self) -> bool:
+        """Process one due job to completion; returns whether a job was claimed"""
+        self._ensure_indexes()
+        job = self._claim()
+        if job is None:
+            return False
+        try:
+            self._run_job(job)
+        except Exception as e:
+            logger.error(f"❌ Student upload job {job['_id']} failed: {e}")
+            tries = job.get('attempts', 0) + 1
+            gave_up = tries >= MAX_ATTEMPTS
+            mongo_db.upload_jobs.update_one({'_id': job['_id']}, {
+                '$set': {
+                    'status': 'failed' if gave_up else 'queued',
+                    'attempts': tries,
+                    'last_error': str(e),
+                    'next_attempt_at': datetime.utcnow() + timedelta(seconds=min(2 ** tries * 5, 600)),
+                    'updated_at': datetime.utcnow()
+                },
+                '$unset': {'lease_until': '', 'lease_token': ''}
+            })
+            if gave_up:
+                self.stats['failed'] += 1
+                self._emit(job, {
+                    'status': 'failed', 'error': True,
+                    'processed': job.get('counters', {}).get('processed', 0),
+                    'percentage': 100,
+                    'message': f'Student upload failed: {str(e)}'
+                })
+        return True
+
+    def get_stats(self) -> Dict[str, Any]:
+        return dict(self.stats)
+
+
+student_upload_jobs = StudentUploadJobWorker()
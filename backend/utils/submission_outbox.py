@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+"""
+Post-submission Outbox
+Work that follows a graded submission (the test_results projection, level progress
+and unlock history, progress monitoring events) is not done inside the request.
+
+The submission writes a single attempt document that embeds an `outbox` entry. A
+single-document write is atomic in MongoDB (no replica-set transaction needed), so
+an attempt can never exist without its pending follow-up work, or the other way round.
+
+A consumer thread in each worker claims pending entries in batches under a lease,
+runs each step and checkpoints it in `outbox.completed_steps`. A claim records a
+lease token; a worker whose lease expired and was claimed by another worker finds
+its token gone and stops before the next step, and its checkpoints and final status
+update only apply while the token is still its own. Failed entries are
+retried with exponential backoff. Every step is idempotent: the projection is an
+upsert keyed by attempt_id, progress is applied at most once per attempt, and
+monitoring events carry deterministic ids.
+"""
+
+import logging
+import os
+import threading
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from mongo import mongo_db
+
+logger = logging.getLogger(__name__)
+
+STEPS = ('test_results', 'progress', 'monitoring')
+
+BATCH_SIZE = int(os.getenv('OUTBOX_BATCH_SIZE', '50'))
+POLL_SECONDS = float(os.getenv('OUTBOX_POLL_SECONDS', '2'))
+LEASE_SECONDS = 120
+MAX_ATTEMPTS = 8
+
+
+def practice_outbox_entry(test: Dict[str, Any], student: Optional[Dict[str, Any]], user_id) -> Dict[str, Any]:
+    """Outbox entry to embed in a completed practice attempt (student: the students profile, if any)"""
+    now = datetime.utcnow()
+    return {
+        'status': 'pending',
+        'steps': list(STEPS),
+        'completed_steps': [],
+        'attempts': 0,
+        'next_attempt_at': now,
+        'created_at': now,
+        'payload': {
+            'test_name': test.get('name', f"Practice Test - {test.get('module_id', 'Unknown')}"),
+            'test_level_id': test.get('level_id'),
+            'progress_level_id': test.get('level_id') or test.get('subcategory'),
+            'student_profile_id': student['_id'] if student else None,
+            'user_id': str(user_id)
+        }
+    }
+
+
+def _test_results_projection(attempt: Dict[str, Any]) -> Dict[str, Any]:
+    """test_results copy of an attempt, in the shape the results endpoints read"""
+    payload = attempt['outbox']['payload']
+    return {
+        'test_id': attempt['test_id'],
+        'attempt_id': attempt['_id'],
+        'student_id': payload['user_id'],
+        'test_name': payload['test_name'],
+        'test_type': attempt.get('test_type', 'practice'),
+        'module_id': attempt.get('module_id'),
+        'subcategory': attempt.get('subcategory'),
+        'level_id': payload.get('test_level_id'),
+        'score': attempt.get('score', 0),
+        'percentage': attempt.get('percentage', 0),
+        'correct_answers': attempt.get('correct_answers', 0),
+        'total_questions': attempt.get('total_questions', 0),
+        'results': attempt.get('detailed_results', []),
+        'submitted_at': attempt.get('submitted_at'),
+        'time_taken': None,  # Practice tests don't track time
+        'status': 'completed'
+    }
+
+
+class OutboxConsumer:
+    """Per-worker consumer of pending attempt outbox entries"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._indexes_ready = False
+        self.stats = {'batches': 0, 'processed': 0, 'retried': 0, 'failed': 0, 'leases_lost': 0}
+
+    def ensure_running(self) -> None:
+        """Start the consumer in this process (threads do not survive a gunicorn fork)"""
+        if self._pid == os.getpid() and self._thread and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='submission-outbox', daemon=True)
+            self._thread.start()
+            logger.info(f"📮 Submission outbox consumer started in worker {self._pid}")
+
+    def notify(self) -> None:
+        """Called after writing an outbox entry so it is picked up without waiting for the poll"""
+        self.ensure_running()
+        self._wakeup.set()
+
+    def _run(self) -> None:
+        while True:
+            try:
+                while self.process_batch():
+                    pass
+            except Exception as e:
+                logger.error(f"❌ Outbox consumer error: {e}")
+            self._wakeup.wait(POLL_SECONDS)
+            self._wakeup.clear()
+
+    def _ensure_indexes(self) -> None:
+        if self._indexes_ready:
+            return
+        mongo_db.student_test_attempts.create_index(
+            [('outbox.status', 1), ('outbox.next_attempt_at', 1)], sparse=True
+        )
+        mongo_db.test_results.create_index('attempt_id', sparse=True)
+        self._indexes_ready = True
+
+    def _claim(self) -> List[Dict[str, Any]]:
+        """Lease up to BATCH_SIZE due entries (expired leases of crashed workers included)"""
+        now = datetime.utcnow()
+        claimed = []
+        for _ in range(BATCH_SIZE):
+            attempt = mongo_db.student_test_attempts.find_one_and_update(
+                {'$or': [
+                    {'outbox.status': 'pending', 'outbox.next_attempt_at': {'$lte': now}},
+                    {'outbox.status': 'processing', 'outbox.lease_until': {'$lte': now}}
+                ]},
+                {'$set': {
+                    'outbox.status': 'processing',
+                    'outbox.lease_until': now + timedelta(seconds=LEASE_SECONDS),
+                    'outbox.lease_token': uuid.uuid4().hex,
+                    'outbox.owner': os.getpid()
+                }},
+                return_document=ReturnDocument.AFTER
+            )
+            if attempt is None:
+                break
+            claimed.append(attempt)
+        return claimed
+
+    @staticmethod
+    def _leased(attempts: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Filter matching these attempts only while they still carry the lease tokens of our claim"""
+        return {
+            '_id': {'$in': [a['_id'] for a in attempts]},
+            'outbox.lease_token': {'$in': [a['outbox']['lease_token'] for a in attempts]}
+        }
+
+    def _still_leased(self, attempts: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """The attempts whose lease has not been taken over by another worker"""
+        if not attempts:
+            return attempts
+        held = {doc['_id'] for doc in mongo_db.student_test_attempts.find(self._leased(attempts), {'_id': 1})}
+        if len(held) < len(attempts):
+            lost = len(attempts) - len(held)
+            self.stats['leases_lost'] += lost
+            logger.warning(f"⚠️ Lost the outbox lease of {lost} attempts to another worker, leaving them to it")
+        return [a for a in attempts if a['_id'] in held]
+
+    def _checkpoint(self, attempts: List[Dict[str, Any]], step: str) -> None:
+        mongo_db.student_test_attempts.update_many(
+            self._leased(attempts),
+            {'$addToSet': {'outbox.completed_steps': step}}
+        )
+        for attempt in attempts:
+            attempt['outbox'].setdefault('completed_steps', []).append(step)
+
+    def _pending(self, attempts: List[Dict[str, Any]], step: str) -> List[Dict[str, Any]]:
+        return [a for a in attempts if step not in a['outbox'].get('completed_steps', [])]
+
+    def _project_test_results(self, attempts: List[Dict[str, Any]]) -> List[Any]:
+        pending = self._pending(attempts, 'test_results')
+        if not pending:
+            return []
+        mongo_db.test_results.bulk_write([
+            UpdateOne({'attempt_id': a['_id']}, {'$set': _test_results_projection(a)}, upsert=True)
+            for a in pending
+        ], ordered=False)
+        self._checkpoint(pending, 'test_results')
+        return []
+
+    def _apply_progress(self, attempts: List[Dict[str, Any]]) -> List[Any]:
+        """Returns the ids of attempts whose progress update failed"""
+        from utils.student_progress_manager import StudentProgressManager
+
+        failed = []
+        progress_manager = StudentProgressManager(mongo_db)
+        done = []
+        for attempt in self._pending(attempts, 'progress'):
+            payload = attempt['outbox']['payload']
+            if not payload.get('progress_level_id') or not payload.get('student_profile_id'):
+                done.append(attempt)
+                continue
+            score = attempt.get('percentage', 0)
+            if score > 100 and attempt.get('total_questions'):
+                score = attempt.get('score', 0) / attempt['total_questions'] * 100
+            applied = progress_manager.update_student_progress_on_test_completion(
+                student_id=payload['student_profile_id'],
+                level_id=payload['progress_level_id'],
+                score=score,
+                test_id=attempt['test_id'],
+                attempt_id=attempt['_id']
+            )
+            if applied:
+                done.append(attempt)
+            else:
+                failed.append(attempt['_id'])
+        if done:
+            self._checkpoint(done, 'progress')
+        return failed
+
+    def _log_monitoring(self, attempts: List[Dict[str, Any]]) -> List[Any]:
+        pending = self._pending(attempts, 'monitoring')
+        if not pending:
+            return []
+        events = [{
+            '_id': f"test_complete:{a['_id']}",
+            'event_type': 'test_complete',
+            'student_id': a['outbox']['payload']['student_profile_id'],
+            'level_id': a['outbox']['payload'].get('progress_level_id'),
+            'timestamp': datetime.utcnow(),
+            'details': {
+                'test_id': str(a['test_id']),
+                'attempt_id': str(a['_id']),
+                'score': a.get('percentage', 0)
+            },
+            'source': 'progress_system'
+        } for a in pending]
+        try:
+            mongo_db.progress_events.insert_many(events, ordered=False)
+        except BulkWriteError as e:
+            # Events already written by an earlier try keep their deterministic ids
+            if any(error.get('code') != 11000 for error in e.details.get('writeErrors', [])):
+                raise
+        self._checkpoint(pending, 'monitoring')
+        return []
+
+    def _finish(self, attempts: List[Dict[str, Any]], failed_ids: List[Any], error: Optional[str]) -> None:
+        now = datetime.utcnow()
+        operations = []
+        for attempt in attempts:
+            outbox = attempt['outbox']
+            leased = {'_id': attempt['_id'], 'outbox.lease_token': outbox['lease_token']}
+            release = {'outbox.lease_until': '', 'outbox.lease_token': '', 'outbox.owner': ''}
+            if attempt['_id'] not in failed_ids:
+                operations.append(UpdateOne(leased, {
+                    '$set': {'outbox.status': 'done', 'outbox.processed_at': now},
+                    '$unset': release
+                }))
+                continue
+            tries = outbox.get('attempts', 0) + 1
+            gave_up = tries >= MAX_ATTEMPTS
+            operations.append(UpdateOne(leased, {
+                '$set': {
+                    'outbox.status': 'failed' if gave_up else 'pending',
+                    'outbox.attempts': tries,
+                    'outbox.last_error': error or 'step failed',
+                    'outbox.next_attempt_at': now + timedelta(seconds=min(2 ** tries, 600))
+                },
+                '$unset': release
+            }))
+            self.stats['failed' if gave_up else 'retried'] += 1
+        if operations:
+            mongo_db.student_test_attempts.bulk_write(operations, ordered=False)
+
+    def process_batch(self) -> int:
+        """Process one batch of due entries; returns how many were claimed"""
+        self._ensure_indexes()
+        attempts = self._claim()
+        if not attempts:
+            return 0
+        self.stats['batches'] += 1
+
+        claimed = len(attempts)
+        failed_ids: List[Any] = []
+        error = None
+        try:
+            for step in (self._project_test_results, self._apply_progress, self._log_monitoring):
+                # Entries whose lease was taken over are left to the worker that owns them now
+                attempts = self._still_leased(attempts)
+                failed_ids += step(attempts)
+        except Exception as e:
+            # Checkpointed steps are skipped when the whole batch is retried
+            logger.error(f"❌ Outbox batch failed: {e}")
+            failed_ids = [a['_id'] for a in attempts]
+            error = str(e)
+
+        self._finish(attempts, failed_ids, error)
+        self.stats['processed'] += len(attempts) - len(failed_ids)
+        logger.info(f"📮 Outbox batch: {claimed} attempts, {len(failed_ids)} to retry")
+        return claimed
+
+    def get_stats(self) -> Dict[str, Any]:
+        return dict(self.stats)
+
+
+outbox_consumer = OutboxConsumer()
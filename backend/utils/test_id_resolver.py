@@ -8,6 +8,7 @@ import logging
 from typing import Optional, Dict, Any
 from bson import ObjectId
 from mongo import mongo_db
+from utils.exam_surge import surge_manager
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -23,6 +24,16 @@ def resolve_test_id(test_identifier: str) -> Optional[Dict[str, Any]]:
         Dict with test document, _id, and test_id, or None if not found
     """
     try:
+        # Exams about to open are pre-loaded by surge mode
+        test = surge_manager.get_test(test_identifier)
+        if test:
+            return {
+                'test': test,
+                'object_id': str(test['_id']),
+                'test_id': test.get('test_id'),
+                'resolved_by': '_id' if str(test['_id']) == str(test_identifier) else 'test_id'
+            }
+
         # First, try as MongoDB ObjectId
         if ObjectId.is_valid(test_identifier):
             logger.info(f"🔍 Looking up test by MongoDB _id: {test_identifier}")
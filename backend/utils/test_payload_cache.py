@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+Processed Test Payload Cache
+Shuffles a test's questions and MCQ options once per test revision and shares the
+result between the student GET path and every grading path.
+
+The shuffle uses a private random.Random seeded from the test id, so the order is
+identical across workers and restarts and the global `random` state is never touched.
+Entries are keyed by (test id, revision), where the revision is a digest of the
+questions, so editing a test or attaching generated audio yields a fresh entry.
+"""
+
+import hashlib
+import logging
+import random
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+import bson
+from bson import ObjectId
+
+from utils.mcq_grading import compile_answer_key
+
+logger = logging.getLogger(__name__)
+
+MAX_CACHED_TESTS = 256
+
+_cache: "OrderedDict[tuple, Dict[str, Any]]" = OrderedDict()
+_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+
+def _stringify_ids(obj):
+    """Copy of obj with ObjectIds converted to strings (safe for jsonify and caching)"""
+    if isinstance(obj, dict):
+        return {k: _stringify_ids(v) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [_stringify_ids(v) for v in obj]
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    return obj
+
+
+def shuffle_seed(test_id) -> int:
+    """Stable seed for a test id (unlike hash(), not salted per process)"""
+    return int(hashlib.md5(str(test_id).encode('utf-8')).hexdigest(), 16) % 1000000
+
+
+def test_revision(test: Dict[str, Any]) -> str:
+    """Digest of the question content that drives the processed payload"""
+    payload = {'questions': test.get('questions') or [], 'module_id': test.get('module_id')}
+    return hashlib.md5(bson.encode(payload)).hexdigest()
+
+
+def _full_audio_url(audio_url: Optional[str]) -> Optional[str]:
+    """Convert an S3 key to a public URL if it is not one already"""
+    if audio_url and audio_url.startswith('audio/') and not audio_url.startswith('http'):
+        from config.aws_config import S3_BUCKET_NAME
+        return f"https://{S3_BUCKET_NAME}.s3.amazonaws.com/{audio_url}"
+    return audio_url
+
+
+def _shuffle_mcq(q: Dict[str, Any], rng: random.Random):
+    """Shuffle optionA..optionD; returns (new_options, answer_map)"""
+    options = {}
+    for opt_key in ['A', 'B', 'C', 'D']:
+        opt_field = f"option{opt_key}"
+        if q.get(opt_field) is not None:
+            options[opt_key] = q[opt_field]
+
+    items = list(options.items())
+    rng.shuffle(items)
+
+    new_options = {}
+    answer_map = {}
+    for new_idx, (old_key, value) in enumerate(items):
+        new_key = chr(ord('A') + new_idx)
+        new_options[new_key] = value
+        answer_map[old_key] = new_key
+    return new_options, answer_map
+
+
+def _student_question(q: Dict[str, Any], idx: int, module_id: Optional[str], new_options=None) -> Dict[str, Any]:
+    """Student-facing view of one question (never includes the correct answer)"""
+    question_id = str(q.get('_id', f"q_{idx+1}"))
+    question_type = q.get('question_type')
+
+    if question_type == 'mcq':
+        return {
+            "question_id": question_id,
+            "question": q.get('question'),
+            "question_type": question_type,
+            "instructions": q.get('instructions', ''),
+            "options": new_options
+        }
+
+    if question_type in ['compiler', 'technical', 'compiler_integrated']:
+        return {
+            "question_id": question_id,
+            "question": q.get('question'),
+            "questionTitle": q.get('questionTitle', ''),
+            "problemStatement": q.get('problemStatement', ''),
+            "question_type": question_type,
+            "instructions": q.get('instructions', ''),
+            "language": q.get('language', 'python'),
+            "test_cases": q.get('test_cases', q.get('testCases', []))
+        }
+
+    if question_type in ['sentence', 'listening', 'speaking']:
+        has_audio = q.get('has_audio', False) or bool(q.get('audio_url'))
+        if has_audio:
+            audio_url = _full_audio_url(q.get('audio_url'))
+            if module_id == 'LISTENING':
+                # Hide the sentence text from students
+                return {
+                    "question_id": question_id,
+                    "question": "Listen to the audio and record your response",
+                    "question_type": "listening",
+                    "instructions": q.get('instructions', ''),
+                    "audio_url": audio_url,
+                    "has_audio": True,
+                    "audio_config": q.get('audio_config', {}),
+                    "module_id": "LISTENING",
+                    "sentence": q.get('sentence', ''),  # Keep for backend reference
+                    "hidden_sentence": q.get('sentence', '')  # Store original sentence
+                }
+            return {
+                "question_id": question_id,
+                "question": q.get('question') or q.get('sentence', ''),
+                "question_type": question_type,
+                "instructions": q.get('instructions', ''),
+                "audio_url": audio_url,
+                "has_audio": True,
+                "audio_config": q.get('audio_config', {}),
+                "module_id": module_id,
+                "sentence": q.get('sentence', '')
+            }
+
+        if module_id == 'LISTENING':
+            # Check for audio in different possible field names
+            audio_url = (q.get('audio_url') or q.get('audio') or
+                         q.get('audio_file') or q.get('file_url') or
+                         q.get('question_audio'))
+            if audio_url:
+                audio_url = _full_audio_url(audio_url)
+                return {
+                    "question_id": question_id,
+                    "question": "Listen to the audio and record your response",
+                    "question_type": "listening",
+                    "instructions": q.get('instructions', ''),
+                    "audio_url": audio_url,
+                    "has_audio": True,
+                    "audio_config": q.get('audio_config', {}),
+                    "module_id": "LISTENING",
+                    "sentence": q.get('sentence', ''),
+                    "hidden_sentence": q.get('sentence', ''),
+                    "audio_id": f"audio_{q.get('_id', idx)}_{hashlib.md5(audio_url.encode('utf-8')).hexdigest()[:12]}"
+                }
+            return {
+                "question_id": question_id,
+                "question": q.get('question') or q.get('sentence', ''),
+                "question_type": "text_fallback",
+                "instructions": q.get('instructions', '') + " (Audio not available - text mode)",
+                "original_type": question_type,
+                "audio_status": "missing",
+                "module_id": "LISTENING"
+            }
+
+        return {
+            "question_id": question_id,
+            "question": q.get('question') or q.get('sentence', ''),
+            "question_type": "text_fallback",
+            "instructions": q.get('instructions', '') + " (Audio not available - text mode)",
+            "original_type": question_type,
+            "audio_status": "missing"
+        }
+
+    return {
+        "question_id": question_id,
+        "question": q.get('question'),
+        "question_type": question_type,
+        "instructions": q.get('instructions', '')
+    }
+
+
+def build_processed_test(test: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Shuffle and process a test's questions.
+
+    Returns a dict with:
+        questions: student-facing questions in shuffled order
+        shuffled_questions: original question data in the same order, with
+            shuffled_options / answer_mapping / shuffled_answer on MCQs (grading key)
+        answer_key: per question, the correct option text for MCQs, else None
+        mcq_key: compiled MCQ answer key of shuffled_questions (utils.mcq_grading)
+    """
+    questions = test.get('questions')
+    if not isinstance(questions, list):
+        return {'questions': [], 'shuffled_questions': [], 'answer_key': [], 'mcq_key': compile_answer_key([])}
+
+    rng = random.Random(shuffle_seed(test['_id']))
+    ordered = _stringify_ids(questions)
+    rng.shuffle(ordered)
+
+    module_id = test.get('module_id')
+    processed_questions = []
+    shuffled_questions = []
+    answer_key = []
+    for idx, q in enumerate(ordered):
+        shuffled_q = dict(q)
+        if q.get('question_type') == 'mcq':
+            new_options, answer_map = _shuffle_mcq(q, rng)
+            shuffled_q['shuffled_options'] = new_options
+            shuffled_q['answer_mapping'] = answer_map
+            shuffled_q['shuffled_answer'] = answer_map.get(q.get('answer'))
+            answer_key.append(new_options.get(shuffled_q['shuffled_answer'], ''))
+            processed_questions.append(_student_question(q, idx, module_id, new_options))
+        else:
+            answer_key.append(None)
+            processed_questions.append(_student_question(q, idx, module_id))
+        shuffled_questions.append(shuffled_q)
+
+    return {
+        'questions': processed_questions,
+        'shuffled_questions': shuffled_questions,
+        'answer_key': answer_key,
+        'mcq_key': compile_answer_key(shuffled_questions)
+    }
+
+
+def get_processed_test(test: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Cached build_processed_test for the current revision of `test`.
+    The returned structure is shared between requests; treat it as read-only.
+    """
+    key = (str(test['_id']), test_revision(test))
+    with _lock:
+        entry = _cache.get(key)
+        if entry is not None:
+            _cache.move_to_end(key)
+            _stats['hits'] += 1
+            return entry
+        _stats['misses'] += 1
+
+    entry = build_processed_test(test)
+
+    with _lock:
+        _cache[key] = entry
+        _cache.move_to_end(key)
+        while len(_cache) > MAX_CACHED_TESTS:
+            _cache.popitem(last=False)
+            _stats['evictions'] += 1
+    logger.info(f"Processed test payload cached for {key[0]} ({len(entry['questions'])} questions)")
+    return entry
+
+
+def invalidate_test(test_id=None) -> None:
+    """Drop cached payloads for one test (all revisions) or for every test"""
+    with _lock:
+        if test_id is None:
+            _cache.clear()
+            return
+        for key in [k for k in _cache if k[0] == str(test_id)]:
+            del _cache[key]
+
+
+def get_cache_stats() -> Dict[str, Any]:
+    with _lock:
+        return {**_stats, 'size': len(_cache), 'max_size': MAX_CACHED_TESTS}
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Transcript Similarity Scoring
+Scores many (reference, transcript) pairs in one call for listening/speaking grading
+and transcript validation.
+
+SIMILARITY_METRIC selects the score, on a 0-100 scale either way:
+    difflib      (default) 70% difflib SequenceMatcher ratio + 30% share of the
+                 reference's words found in the transcript - the score the listening
+                 (0.8) and speaking (0.7) tolerances were set against
+    levenshtein  70% character-level + 30% word-level Levenshtein similarity, where
+                 similarity = 1 - distance / max(len(reference), len(transcript));
+                 faster on large batches, but scores differ by up to ~20 points, so
+                 tolerances must be recalibrated before enabling it
+                 (scripts/benchmark_similarity.py --from-db compares the two)
+
+The Levenshtein edit distance is computed row by row for a whole batch at once with NumPy: the
+substitution/deletion terms of a DP row are plain vector operations, and the
+insertion term is resolved with a running minimum (minimum.accumulate), so the only
+Python loop is over the rows of the longest reference in the batch.
+"""
+
+import os
+from difflib import SequenceMatcher
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+SIMILARITY_METRIC = os.getenv('SIMILARITY_METRIC', 'difflib').lower()
+CHARACTER_WEIGHT = 0.7
+WORD_WEIGHT = 0.3
+# Pairs are sorted by length and scored in chunks to keep padding small
+CHUNK_SIZE = 256
+
+_PAD_A = -1
+_PAD_B = -2
+
+
+def _normalize(text) -> str:
+    return str(text or '').lower().strip()
+
+
+def _pad(sequences: Sequence[np.ndarray], fill: int) -> Tuple[np.ndarray, np.ndarray]:
+    """(count x longest) matrix of the sequences padded with `fill`, and their lengths"""
+    lengths = np.fromiter((len(s) for s in sequences), dtype=np.int64, count=len(sequences))
+    matrix = np.full((len(sequences), int(lengths.max(initial=0))), fill, dtype=np.int32)
+    if lengths.sum():
+        starts = np.repeat(np.cumsum(lengths) - lengths, lengths)
+        rows = np.repeat(np.arange(len(sequences)), lengths)
+        matrix[rows, np.arange(int(lengths.sum())) - starts] = np.concatenate(sequences)
+    return matrix, lengths
+
+
+def levenshtein_batch(seqs_a: Sequence[Sequence[int]], seqs_b: Sequence[Sequence[int]]) -> np.ndarray:
+    """Edit distances between seqs_a[k] and seqs_b[k] (sequences of ints) for every k"""
+    count = len(seqs_a)
+    distances = np.zeros(count, dtype=np.int32)
+    if count == 0:
+        return distances
+
+    a, len_a = _pad([np.asarray(s, dtype=np.int32) for s in seqs_a], _PAD_A)
+    b, len_b = _pad([np.asarray(s, dtype=np.int32) for s in seqs_b], _PAD_B)
+    width = b.shape[1]
+    columns = np.arange(width + 1, dtype=np.int32)
+    rows = np.arange(count)
+
+    # Row 0: distance from the empty prefix of a
+    previous = np.broadcast_to(columns, (count, width + 1)).copy()
+    current = np.empty_like(previous)
+    distances[len_a == 0] = len_b[len_a == 0]
+
+    for i in range(1, a.shape[1] + 1):
+        current[:, 0] = i
+        # Substitution (free on a match) or deletion
+        np.minimum(previous[:, 1:] + 1, previous[:, :-1] + (b != a[:, i - 1:i]), out=current[:, 1:])
+        # Insertions: D[i][j] = min over k <= j of D[i][k] + (j - k)
+        current -= columns
+        np.minimum.accumulate(current, axis=1, out=current)
+        current += columns
+        finished = len_a == i
+        if finished.any():
+            distances[finished] = current[rows[finished], len_b[finished]]
+        previous, current = current, previous
+    return distances
+
+
+def _encode_characters(texts: Sequence[str]) -> List[np.ndarray]:
+    return [np.frombuffer(text.encode('utf-32-le'), dtype=np.int32) for text in texts]
+
+
+def _encode_words(texts: Sequence[str], vocabulary: Dict[str, int]) -> List[List[int]]:
+    return [[vocabulary.setdefault(word, len(vocabulary)) for word in text.split()] for text in texts]
+
+
+def _similarity(distances: np.ndarray, len_a: np.ndarray, len_b: np.ndarray) -> np.ndarray:
+    longest = np.maximum(np.maximum(len_a, len_b), 1)
+    return 1.0 - distances / longest
+
+
+def difflib_similarity_scores(pairs: Sequence[Tuple[str, str]]) -> np.ndarray:
+    """0-100 SequenceMatcher + word overlap similarity for each pair; 0 when either side is empty"""
+    scores = np.zeros(len(pairs), dtype=np.float64)
+    for k, (reference, transcript) in enumerate(pairs):
+        reference, transcript = _normalize(reference), _normalize(transcript)
+        reference_words = set(reference.split())
+        if not reference_words or not transcript:
+            continue
+        ratio = SequenceMatcher(None, reference, transcript).ratio()
+        word_accuracy = len(reference_words & set(transcript.split())) / len(reference_words)
+        scores[k] = round((ratio * CHARACTER_WEIGHT + word_accuracy * WORD_WEIGHT) * 100, 2)
+    return scores
+
+
+def levenshtein_similarity_scores(pairs: Sequence[Tuple[str, str]]) -> np.ndarray:
+    """0-100 Levenshtein similarity for each (reference, transcript) pair; 0 when either side is empty"""
+    references = [_normalize(reference) for reference, _ in pairs]
+    transcripts = [_normalize(transcript) for _, transcript in pairs]
+    scores = np.zeros(len(pairs), dtype=np.float64)
+
+    order = sorted(
+        (k for k in range(len(pairs)) if references[k] and transcripts[k]),
+        key=lambda k: len(references[k])
+    )
+    vocabulary: Dict[str, int] = {}
+    for start in range(0, len(order), CHUNK_SIZE):
+        chunk = order[start:start + CHUNK_SIZE]
+        chunk_references = [references[k] for k in chunk]
+        chunk_transcripts = [transcripts[k] for k in chunk]
+
+        chars_a = _encode_characters(chunk_references)
+        chars_b = _encode_characters(chunk_transcripts)
+        character_similarity = _similarity(
+            levenshtein_batch(chars_a, chars_b),
+            np.array([len(s) for s in chars_a]), np.array([len(s) for s in chars_b])
+        )
+
+        words_a = _encode_words(chunk_references, vocabulary)
+        words_b = _encode_words(chunk_transcripts, vocabulary)
+        word_similarity = _similarity(
+            levenshtein_batch(words_a, words_b),
+            np.array([len(s) for s in words_a]), np.array([len(s) for s in words_b])
+        )
+
+        scores[chunk] = (character_similarity * CHARACTER_WEIGHT + word_similarity * WORD_WEIGHT) * 100
+    return np.round(scores, 2)
+
+
+def similarity_scores(pairs: Sequence[Tuple[str, str]]) -> np.ndarray:
+    """0-100 similarity for each (reference, transcript) pair with the configured SIMILARITY_METRIC"""
+    if SIMILARITY_METRIC == 'levenshtein':
+        return levenshtein_similarity_scores(pairs)
+    return difflib_similarity_scores(pairs)
+
+
+def similarity_score(reference: str, transcript: str) -> float:
+    """0-100 similarity of a single pair"""
+    return float(similarity_scores([(reference, transcript)])[0])
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Audio Transcription Engine
+Transcribes the recordings of a submission concurrently. Clips are decoded and
+resampled to 16 kHz mono WAV in memory (BytesIO, no temp files) and handed to a
+pluggable recognizer backend inside a bounded process pool.
+
+Backends:
+    google  - speech_recognition's Google Web Speech API (default)
+    stub    - deterministic local recognizer for offline throughput benchmarks
+
+Select the default with TRANSCRIPTION_BACKEND, size the pool with
+TRANSCRIPTION_PROCESSES (0 transcribes inline). Every clip result carries its
+decode / recognize / queue timings in milliseconds.
+"""
+
+import hashlib
+import io
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+try:
+    from pydub import AudioSegment
+    PYDUB_AVAILABLE = True
+except ImportError:
+    PYDUB_AVAILABLE = False
+
+SAMPLE_RATE = 16000
+DEFAULT_BACKEND = os.getenv('TRANSCRIPTION_BACKEND', 'google')
+# Recognition is mostly waiting on the recognizer, so the pool is not limited to the CPU count
+MAX_PROCESSES = int(os.getenv('TRANSCRIPTION_PROCESSES', '4'))
+
+
+class GoogleSpeechBackend:
+    """speech_recognition + Google Web Speech API"""
+
+    name = 'google'
+
+    def __init__(self, ambient_noise_duration: float = 0.5):
+        import speech_recognition as sr
+        self._sr = sr
+        self.ambient_noise_duration = ambient_noise_duration
+
+    def recognize(self, wav_bytes: bytes) -> str:
+        recognizer = self._sr.Recognizer()
+        with self._sr.AudioFile(io.BytesIO(wav_bytes)) as source:
+            if self.ambient_noise_duration:
+                recognizer.adjust_for_ambient_noise(source, duration=self.ambient_noise_duration)
+            audio = recognizer.record(source)
+        try:
+            return recognizer.recognize_google(audio)
+        except self._sr.UnknownValueError:
+            return ""
+
+
+class LocalStubBackend:
+    """
+    Deterministic offline recognizer: the same audio always yields the same words.
+    TRANSCRIPTION_STUB_LATENCY_MS simulates the round trip of a remote recognizer.
+    """
+
+    name = 'stub'
+    VOCABULARY = ('the', 'student', 'reads', 'a', 'short', 'sentence', 'about', 'daily',
+                  'life', 'and', 'speaks', 'clearly', 'during', 'practice', 'test', 'today')
+
+    def __init__(self, latency_ms: Optional[float] = None):
+        if latency_ms is None:
+            latency_ms = float(os.getenv('TRANSCRIPTION_STUB_LATENCY_MS', '0'))
+        self.latency_ms = latency_ms
+
+    def recognize(self, wav_bytes: bytes) -> str:
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000.0)
+        digest = hashlib.sha256(wav_bytes).digest()
+        word_count = 4 + digest[0] % 8
+        return ' '.join(self.VOCABULARY[b % len(self.VOCABULARY)] for b in digest[1:1 + word_count])
+
+
+_BACKEND_FACTORIES: Dict[str, Callable[[], Any]] = {
+    'google': GoogleSpeechBackend,
+    'stub': LocalStubBackend,
+}
+# One instance per backend per process (pool workers build their own)
+_backend_instances: Dict[str, Any] = {}
+
+
+def register_backend(name: str, factory: Callable[[], Any]) -> None:
+    """
+    Add a recognizer backend: factory() returns an object with recognize(wav_bytes) -> str.
+    Register at import time so forked pool workers inherit it.
+    """
+    _BACKEND_FACTORIES[name] = factory
+    _backend_instances.pop(name, None)
+
+
+def get_backend(name: Optional[str] = None):
+    name = name or DEFAULT_BACKEND
+    if name not in _BACKEND_FACTORIES:
+        raise ValueError(f"Unknown transcription backend: {name}")
+    if name not in _backend_instances:
+        _backend_instances[name] = _BACKEND_FACTORIES[name]()
+    return _backend_instances[name]
+
+
+def to_wav_bytes(audio_bytes: bytes, extension: Optional[str] = None) -> bytes:
+    """Decode any pydub-readable clip and resample to 16 kHz mono WAV, in memory"""
+    if not PYDUB_AVAILABLE:
+        if (extension or '').lower() == 'wav':
+            return audio_bytes
+        raise RuntimeError("pydub package not available - cannot convert audio for transcription")
+    segment = AudioSegment.from_file(io.BytesIO(audio_bytes), format=extension or None)
+    segment = segment.set_frame_rate(SAMPLE_RATE).set_channels(1)
+    buffer = io.BytesIO()
+    segment.export(buffer, format='wav')
+    return buffer.getvalue()
+
+
+def transcribe_clip(audio_bytes: bytes, extension: Optional[str] = None,
+                    backend: Optional[str] = None, submitted_at: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Transcribe one clip. Never raises; failures come back as an empty text plus 'error'.
+    Returns {'text', 'error', 'backend', 'timings': {'queue_ms', 'decode_ms', 'recognize_ms', 'total_ms'}}
+    """
+    started = time.time()
+    timings = {
+        'queue_ms': round((started - submitted_at) * 1000, 1) if submitted_at else 0.0,
+        'decode_ms': 0.0,
+        'recognize_ms': 0.0,
+        'total_ms': 0.0
+    }
+    result = {'text': '', 'error': None, 'backend': backend or DEFAULT_BACKEND,
+              'bytes': len(audio_bytes or b''), 'timings': timings}
+    if not audio_bytes:
+        result['error'] = 'empty audio'
+        return result
+    try:
+        wav_bytes = to_wav_bytes(audio_bytes, extension)
+        decoded = time.time()
+        timings['decode_ms'] = round((decoded - started) * 1000, 1)
+        result['text'] = get_backend(backend).recognize(wav_bytes) or ''
+        timings['recognize_ms'] = round((time.time() - decoded) * 1000, 1)
+    except Exception as e:
+        result['error'] = str(e)
+    timings['total_ms'] = round((time.time() - started) * 1000, 1)
+    return result
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> Optional[ProcessPoolExecutor]:
+    global _pool, _pool_pid
+    if MAX_PROCESSES <= 0:
+        return None
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = ProcessPoolExecutor(max_workers=MAX_PROCESSES)
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def _reset_pool() -> None:
+    global _pool
+    with _pool_lock:
+        _pool = None
+
+
+def transcribe_clips(clips: Sequence[Tuple[bytes, Optional[str]]],
+                     backend: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Transcribe (audio_bytes, extension) clips concurrently, results in input order.
+    Falls back to transcribing inline if the process pool is disabled or breaks.
+    """
+    started = time.time()
+    pool = _get_pool() if len(clips) > 1 else None
+    results = None
+    if pool is not None:
+        try:
+            futures = [pool.submit(transcribe_clip, audio, ext, backend, time.time()) for audio, ext in clips]
+            results = [future.result() for future in futures]
+        except BrokenProcessPool as e:
+            logger.warning(f"⚠️ Transcription pool broke, transcribing inline: {e}")
+            _reset_pool()
+    if results is None:
+        results = [transcribe_clip(audio, ext, backend, time.time()) for audio, ext in clips]
+
+    elapsed_ms = (time.time() - started) * 1000
+    failures = sum(1 for r in results if r['error'])
+    logger.info(f"🎙️ Transcribed {len(results)} clips in {elapsed_ms:.0f}ms "
+                f"(clip totals: {[r['timings']['total_ms'] for r in results]}, failures: {failures})")
+    return results
@@ -98,6 +98,22 @@ const TechnicalCodeEditor = ({
     });
   };
 
+  // Rate limited runs (429) are retried after Retry-After instead of being scored as failures
+  const compileCode = async (payload, maxAttempts = 5) => {
+    for (let attempt = 1; ; attempt++) {
+      try {
+        return await api.post('/test-management/technical/compile', payload);
+      } catch (error) {
+        if (error.response?.status !== 429 || attempt >= maxAttempts) {
+          throw error;
+        }
+        const retryAfter = Number(error.response.headers?.['retry-after'] || error.response.data?.retry_after) || 3;
+        toast(`Too many runs, retrying in ${retryAfter} seconds...`, { icon: '⏳' });
+        await new Promise(resolve => setTimeout(resolve, retryAfter * 1000));
+      }
+    }
+  };
+
   // Run code (test with sample input)
   const handleRunCode = async () => {
     if (!code.trim()) {
@@ -109,7 +125,7 @@ const TechnicalCodeEditor = ({
     setOutput(null);
 
     try {
-      const response = await api.post('/test-management/technical/compile', {
+      const response = await compileCode({
         language: selectedLanguage,
         code: code,
         stdin: stdin
@@ -157,7 +173,7 @@ const TechnicalCodeEditor = ({
     setRunningTestCase(testCaseIndex);
 
     try {
-      const response = await api.post('/test-management/technical/compile', {
+      const response = await compileCode({
         language: selectedLanguage,
         code: code,
         stdin: testCase.input || ''
@@ -270,7 +286,7 @@ const TechnicalCodeEditor = ({
         maxScore += testCase.points || 1;
 
         try {
-          const response = await api.post('/test-management/technical/compile', {
+          const response = await compileCode({
             language: selectedLanguage,
             code: code,
             stdin: testCase.input || ''
@@ -379,6 +395,10 @@ const TechnicalCodeEditor = ({
             }));
           }
         } catch (error) {
+          // Still rate limited after retrying: abort the validation rather than score the case as failed
+          if (error.response?.status === 429) {
+            throw error;
+          }
           failedCount++;
           const result = {
             test_case_number: i + 1,
@@ -437,7 +457,9 @@ const TechnicalCodeEditor = ({
 
     } catch (error) {
       console.error('Error validating test cases:', error);
-      toast.error('Failed to validate test cases');
+      toast.error(error.response?.status === 429
+        ? (error.response.data?.message || 'Too many runs. Please validate again in a moment.')
+        : 'Failed to validate test cases');
     } finally {
       setIsValidating(false);
     }
@@ -3,7 +3,7 @@ import { useLocation, useNavigate } from 'react-router-dom';
 import { motion } from 'framer-motion';
 import { Code, Play, CheckCircle, XCircle, TestTube, AlertCircle } from 'lucide-react';
 import LoadingSpinner from '../../components/common/LoadingSpinner';
-import api from '../../services/api';
+import api, { getStudentTestDetails, startStudentTest } from '../../services/api';
 import { useNotification } from '../../contexts/NotificationContext';
 import TechnicalCodeEditor from '../../components/TechnicalCodeEditor';
 
@@ -39,6 +39,8 @@ const OnlineExamTaking = () => {
   const [alreadyAttempted, setAlreadyAttempted] = useState(false);
   const [codeTestResults, setCodeTestResults] = useState({});
   const [runningCode, setRunningCode] = useState(false);
+  // Seconds until the next try while the exam-opening rush holds this student back
+  const [surgeWait, setSurgeWait] = useState(null);
 
   // Security measures for exam taking
   useEffect(() => {
@@ -110,6 +112,7 @@ const OnlineExamTaking = () => {
       // Prevent multiple API calls
       if (isExamFetched) return;
 
+      const onSurgeWait = (seconds) => setSurgeWait(Math.ceil(seconds));
       try {
         setLoading(true);
         setIsExamFetched(true);
@@ -128,7 +131,7 @@ const OnlineExamTaking = () => {
           // Try to start the test - this will give us attempt_id if not already attempted
           // or fail if already attempted
           try {
-            const startRes = await api.post(`/student/tests/${examId}/start`);
+            const startRes = await startStudentTest(examId, { onSurgeWait });
             // Store the attempt_id from the response
             setAttemptId(startRes.data.data.attempt_id);
             console.log('✅ Test started successfully, attempt_id:', startRes.data.data.attempt_id);
@@ -149,7 +152,7 @@ const OnlineExamTaking = () => {
 
         // Get the test details to check if it's a random assignment test
         try {
-          const testRes = await api.get(`/student/test/${examId}`);
+          const testRes = await getStudentTestDetails(examId, { onSurgeWait });
           const testData = testRes.data.data;
 
           // Set exam duration from the test data
@@ -188,6 +191,7 @@ const OnlineExamTaking = () => {
         showError('Failed to load exam.');
         setExam(null);
       } finally {
+        setSurgeWait(null);
         setLoading(false);
       }
     };
@@ -782,7 +786,7 @@ const OnlineExamTaking = () => {
           transition={{ duration: 0.5, delay: 0.3 }}
           className="text-xl font-semibold text-slate-800 mb-2"
         >
-          Loading Exam
+          {surgeWait !== null ? 'Waiting to Start' : 'Loading Exam'}
         </motion.h3>
         <motion.p
           initial={{ opacity: 0, y: 20 }}
@@ -790,7 +794,9 @@ const OnlineExamTaking = () => {
           transition={{ duration: 0.5, delay: 0.4 }}
           className="text-slate-600"
         >
-          Checking access and preparing your test...
+          {surgeWait !== null
+            ? `Many students are starting this exam right now. You will be let in automatically, retrying in ${surgeWait}s...`
+            : 'Checking access and preparing your test...'}
         </motion.p>
       </motion.div>
     </div>
@@ -275,8 +275,8 @@ const PracticeModules = () => {
       transports: ['websocket'],
       auth: { token: localStorage.getItem('token') },
     });
-    // Join a room for this student
-    socket.emit('join', { student_id: user._id });
+    // Join a room for this student (module access changes, grading_complete)
+    socket.emit('join_room', { user_id: user._id });
     // Listen for module access changes
     socket.on('module_access_changed', (data) => {
       if (data.student_id === user._id) {
@@ -1019,7 +1019,7 @@ const ModuleTakingView = ({ module, onSubmit, onBack }) => {
                 showError(res.data.message || 'Failed to submit your answers.');
             }
         } catch (err) {
-            showError(err.response?.data?.message || 'Failed to submit your answers. Please try again.');
+            showError(err.response?.data?.message || (!err.isAxiosError && err.message) || 'Failed to submit your answers. Please try again.');
         }
     };
 
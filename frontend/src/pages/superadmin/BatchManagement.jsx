@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { motion } from 'framer-motion';
 import { toast } from 'react-hot-toast';
 import Papa from 'papaparse';
@@ -47,6 +47,10 @@ const BatchManagement = () => {
   });
   const [socket, setSocket] = useState(null);
   
+  // Background upload jobs are polled as well: their socket events are only seen when the job runs in our worker
+  const uploadJobPollTimer = useRef(null);
+  const finishedUploadJobs = useRef(new Set());
+  
   // Upload results states
   const [uploadResults, setUploadResults] = useState(null);
   const [showUploadResults, setShowUploadResults] = useState(false);
@@ -148,11 +152,19 @@ const BatchManagement = () => {
         error: data.error || false
       });
       
+      // Background upload jobs are finished once, whether the socket or the status poll sees it first
+      if (data.job_id && ['completed', 'completed_with_errors', 'failed'].includes(data.status)) {
+        finishUploadJob(data.job_id, data.status, data.message);
+        return;
+      }
+      
       // Show toast for important status changes
       if (data.status === 'completed') {
         toast.success(data.message);
       } else if (data.status === 'completed_with_errors') {
         toast.error(data.message);
+      } else if (data.status === 'failed') {
+        toast.error(data.message);
       }
     });
     
@@ -215,6 +227,7 @@ const BatchManagement = () => {
     // Cleanup on unmount
     return () => {
       newSocket.disconnect();
+      clearTimeout(uploadJobPollTimer.current);
     };
   }, []);
 
@@ -370,6 +383,86 @@ const BatchManagement = () => {
     }
   };
 
+  const loadUploadJobResults = async (jobId) => {
+    try {
+      const response = await api.get(`/batch-management/upload-jobs/${jobId}`, {
+        params: { include_results: true }
+      });
+      if (response.data.success) {
+        setUploadResults(response.data.data);
+        setShowUploadResults(true);
+        setShowUploadStudents(false);
+        setUploadFile(null);
+        setSelectedBatch(null);
+        setPreviewData([]);
+        fetchBatches();
+      }
+    } catch (error) {
+      console.error('Failed to load upload job results:', error);
+      toast.error('Upload finished, but its results could not be loaded.');
+    }
+  };
+
+  const finishUploadJob = (jobId, status, message) => {
+    if (finishedUploadJobs.current.has(jobId)) {
+      return;
+    }
+    finishedUploadJobs.current.add(jobId);
+    clearTimeout(uploadJobPollTimer.current);
+    
+    if (status === 'completed') {
+      toast.success(message);
+    } else {
+      toast.error(message);
+    }
+    if (status !== 'failed') {
+      loadUploadJobResults(jobId);
+    }
+  };
+
+  const pollUploadJob = (jobId) => {
+    uploadJobPollTimer.current = setTimeout(async () => {
+      if (finishedUploadJobs.current.has(jobId)) {
+        return;
+      }
+      try {
+        const response = await api.get(`/batch-management/upload-jobs/${jobId}`);
+        const job = response.data.data;
+        if (job.status === 'completed') {
+          const errors = job.summary?.total_errors || 0;
+          finishUploadJob(
+            jobId,
+            errors > 0 ? 'completed_with_errors' : 'completed',
+            errors > 0
+              ? `Database upload completed with ${errors} errors. ${job.summary.database_registered} students registered.`
+              : `Successfully uploaded ${job.total} students to database! Credentials notifications queued for batch processing.`
+          );
+          return;
+        }
+        if (job.status === 'failed') {
+          setUploadProgress(prev => ({ ...prev, status: 'failed', error: true }));
+          finishUploadJob(jobId, 'failed', `Student upload failed: ${job.error || 'unknown error'}`);
+          return;
+        }
+        setUploadProgress(prev => ({
+          ...prev,
+          status: job.processed > 0 ? 'processing' : 'started',
+          total: job.total,
+          processed: job.processed,
+          percentage: job.percentage,
+          message: `Uploading: ${job.processed}/${job.total} rows processed, ${job.summary?.database_registered || 0} students registered`
+        }));
+      } catch (error) {
+        // Transient errors: keep polling; a missing job or lost access ends it
+        if ([403, 404].includes(error.response?.status)) {
+          toast.error(error.response.data?.message || 'Upload job is no longer available.');
+          return;
+        }
+      }
+      pollUploadJob(jobId);
+    }, 3000);
+  };
+
   const handleUploadStudents = async (e) => {
     e.preventDefault();
     if (!uploadFile || !selectedBatch) {
@@ -419,6 +512,14 @@ const BatchManagement = () => {
         hasDetailedResults: !!response.data.data?.detailed_results
       });
 
+      // Large files are registered by a background job; follow it until its results are ready
+      if (response.status === 202 && response.data.data?.job_id) {
+        toast.success(response.data.message);
+        clearTimeout(uploadJobPollTimer.current);
+        pollUploadJob(response.data.data.job_id);
+        return;
+      }
+
       // Handle both success and partial success (207 status)
       if (response.data.success || response.status === 207) {
         // Check if we have detailed results (new format)
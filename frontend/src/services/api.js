@@ -56,6 +56,29 @@ const api = axios.create({
 
 console.log('API Service - Created axios instance with baseURL:', api.defaults.baseURL)
 
+// While an exam opens, the server admits a limited number of start/fetch requests per
+// second and turns the rest away with 503 + Retry-After before doing any work. Such
+// requests are retried with exponential backoff capped by Retry-After, for up to the
+// length of the opening window. Pass `onSurgeWait(seconds)` in the request config to be
+// told when the request is waiting for its turn.
+const SURGE_MAX_WAIT_MS = 3 * 60 * 1000;
+
+const surgeRetryDelayMs = (error) => {
+  const config = error.config;
+  const retryAfter = Number(error.response?.headers?.['retry-after']);
+  if (error.response?.status !== 503 || !config || !(retryAfter > 0)) {
+    return null;
+  }
+  const attempt = config._surgeRetries || 0;
+  const delayMs = Math.min(retryAfter, 2 ** attempt * (0.5 + Math.random())) * 1000;
+  if ((config._surgeWaitedMs || 0) + delayMs > SURGE_MAX_WAIT_MS) {
+    return null;
+  }
+  config._surgeRetries = attempt + 1;
+  config._surgeWaitedMs = (config._surgeWaitedMs || 0) + delayMs;
+  return delayMs;
+};
+
 // Request interceptor to add auth token
 api.interceptors.request.use(
   (config) => {
@@ -112,6 +135,13 @@ api.interceptors.response.use(
     
     const originalRequest = error.config
 
+    const surgeDelayMs = surgeRetryDelayMs(error)
+    if (surgeDelayMs !== null) {
+      originalRequest.onSurgeWait?.(surgeDelayMs / 1000)
+      await new Promise(resolve => setTimeout(resolve, surgeDelayMs))
+      return api(originalRequest)
+    }
+
     if (error.response?.status === 401 && !originalRequest._retry) {
       originalRequest._retry = true
 
@@ -426,14 +456,47 @@ export const getStudentTests = async (params = {}) => {
   return api.get('/student/tests', { params });
 };
 
-export const getStudentTestDetails = async (testId) => {
-  return api.get(`/student/test/${testId}`);
+export const getStudentTestDetails = async (testId, options = {}) => {
+  return api.get(`/student/test/${testId}`, options);
+};
+
+export const startStudentTest = async (testId, options = {}) => {
+  return api.post(`/student/tests/${testId}/start`, null, options);
 };
 
+export const getAttemptGradingStatus = async (attemptId) => {
+  return api.get(`/test-management/attempts/${attemptId}/grading-status`);
+};
+
+const GRADING_POLL_INTERVAL_MS = 2000;
+// Longer than the server's stale-grading window (AUDIO_GRADING_STALE_SECONDS), so grading
+// lost with a restarted worker is re-queued while the student is still waiting
+const GRADING_POLL_TIMEOUT_MS = 5 * 60 * 1000;
+
 export const submitPracticeTest = async (formData) => {
-  return api.post('/test-management/submit-practice-test', formData, {
+  const response = await api.post('/test-management/submit-practice-test', formData, {
     headers: { 'Content-Type': 'multipart/form-data' }
   });
+  // Recordings are graded in the background (202): wait for the graded attempt so callers
+  // always receive the score, percentage and results
+  if (response.status !== 202 || response.data.data?.status !== 'grading_pending') {
+    return response;
+  }
+  const attemptId = response.data.data.attempt_id;
+  const deadline = Date.now() + GRADING_POLL_TIMEOUT_MS;
+  while (Date.now() < deadline) {
+    await new Promise(resolve => setTimeout(resolve, GRADING_POLL_INTERVAL_MS));
+    const status = await getAttemptGradingStatus(attemptId);
+    const grading = status.data.data;
+    if (grading.status === 'grading_pending') {
+      continue;
+    }
+    if (grading.status === 'grading_failed') {
+      throw new Error('Your recordings could not be graded. Please try again.');
+    }
+    return { ...status, data: { success: true, message: response.data.message, data: grading } };
+  }
+  throw new Error('Your recordings are still being graded. Check your results again in a few minutes.');
 };
 
 export const getUnlockedModules = async () => {